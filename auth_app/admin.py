@@ -1,7 +1,7 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 from django.contrib import messages
-from .models import User, Session, UserSyncSchedule
+from .models import User, Session, UserSyncSchedule, UserSyncRun, OutboundEmail, WebhookEvent, DelayedRegistration
 
 class CustomUserAdmin(UserAdmin):
     list_display = ('username', 'email', 'is_active', 'email_verified', 'is_staff', 'is_superuser', 'supabase_id', 'date_joined', 'last_login')
@@ -37,16 +37,16 @@ class SessionAdmin(admin.ModelAdmin):
 
 @admin.register(UserSyncSchedule)
 class UserSyncScheduleAdmin(admin.ModelAdmin):
-    list_display = ('id', 'direction', 'frequency', 'is_active', 'next_run', 'last_run')
+    list_display = ('id', 'direction', 'frequency', 'is_active', 'next_run', 'last_run', 'watermark')
     list_filter = ('is_active', 'direction', 'frequency')
     search_fields = ('last_status',)
-    readonly_fields = ('last_run', 'next_run', 'last_status', 'created_at', 'updated_at')
+    readonly_fields = ('last_run', 'next_run', 'last_status', 'watermark', 'last_full_sync', 'locked_until', 'created_at', 'updated_at')
     fieldsets = (
         (None, {
-            'fields': ('is_active', 'direction', 'frequency', 'force_update')
+            'fields': ('is_active', 'direction', 'frequency', 'force_update', 'full_sync_interval')
         }),
         ('Schedule Information', {
-            'fields': ('next_run', 'last_run', 'last_status'),
+            'fields': ('next_run', 'last_run', 'last_status', 'watermark', 'last_full_sync', 'locked_until'),
             'classes': ('collapse',),
         }),
         ('Metadata', {
@@ -58,32 +58,32 @@ class UserSyncScheduleAdmin(admin.ModelAdmin):
     actions = ['run_sync_now']
     
     def run_sync_now(self, request, queryset):
-        from django.core.management import call_command
-        import io
-        from django.utils import timezone
+        from . import sync_scheduler
         
         sync_count = 0
         for schedule in queryset:
             if not schedule.is_active:
                 continue
-                
-            # Capture output
-            output = io.StringIO()
-            try:
-                # Run the sync command based on schedule settings
-                call_command(
-                    'sync_users',
-                    direction=schedule.direction,
-                    force=schedule.force_update,
-                    stdout=output
+            
+            # Take the lease like the scheduler does, so a run in progress elsewhere isn't doubled
+            claimed = sync_scheduler.claim(force=True, ids=[schedule.id])
+            if not claimed:
+                self.message_user(
+                    request,
+                    f"Schedule {schedule.id} is already running elsewhere.",
+                    level=messages.WARNING
                 )
-                
-                # Update the schedule
-                schedule.last_run = timezone.now()
-                schedule.last_status = output.getvalue()
-                schedule.save()
-                sync_count += 1
-                
+                continue
+            try:
+                sync_run = sync_scheduler.run(*claimed[0])
+                if sync_run.status == 'succeeded':
+                    sync_count += 1
+                else:
+                    self.message_user(
+                        request,
+                        f"Sync for schedule {schedule.id} failed; see run {sync_run.pk}.",
+                        level=messages.ERROR
+                    )
             except Exception as e:
                 self.message_user(
                     request,
@@ -100,5 +100,57 @@ class UserSyncScheduleAdmin(admin.ModelAdmin):
     
     run_sync_now.short_description = "Run selected sync schedules now"
 
+@admin.register(UserSyncRun)
+class UserSyncRunAdmin(admin.ModelAdmin):
+    list_display = ('id', 'schedule', 'status', 'worker', 'started_at', 'finished_at')
+    list_filter = ('status', 'schedule')
+    search_fields = ('output', 'worker')
+    readonly_fields = ('schedule', 'status', 'worker', 'started_at', 'finished_at', 'output', 'stats')
+
+    def has_add_permission(self, request):
+        return False
+
+@admin.register(OutboundEmail)
+class OutboundEmailAdmin(admin.ModelAdmin):
+    list_display = ('id', 'subject', 'domain', 'status', 'attempts', 'next_attempt_at', 'created_at', 'sent_at')
+    list_filter = ('status', 'domain')
+    search_fields = ('subject', 'recipients', 'last_error')
+    exclude = ('raw_message',)
+    readonly_fields = ('sender', 'recipients', 'domain', 'subject', 'attempts', 'locked_until', 'last_error', 'created_at', 'sent_at')
+
+    actions = ['requeue']
+
+    def requeue(self, request, queryset):
+        from .outbox import requeue_dead
+
+        count = requeue_dead(list(queryset.values_list('id', flat=True)))
+        self.message_user(request, f"Requeued {count} dead message(s).", level=messages.SUCCESS)
+
+    requeue.short_description = "Requeue selected dead messages"
+
 admin.site.register(User, CustomUserAdmin)
 admin.site.register(Session, SessionAdmin)
+
+@admin.register(WebhookEvent)
+class WebhookEventAdmin(admin.ModelAdmin):
+    list_display = ('id', 'event_type', 'subject', 'status', 'attempts', 'next_attempt_at', 'received_at', 'processed_at')
+    list_filter = ('status', 'event_type')
+    search_fields = ('event_id', 'subject', 'last_error')
+    readonly_fields = ('event_id', 'event_type', 'subject', 'payload', 'attempts', 'locked_until', 'last_error', 'received_at', 'processed_at')
+
+    actions = ['requeue']
+
+    def requeue(self, request, queryset):
+        from .webhook_inbox import requeue_dead
+
+        count = requeue_dead(list(queryset.values_list('id', flat=True)))
+        self.message_user(request, f"Requeued {count} dead event(s).", level=messages.SUCCESS)
+
+    requeue.short_description = "Requeue selected dead events"
+
+@admin.register(DelayedRegistration)
+class DelayedRegistrationAdmin(admin.ModelAdmin):
+    list_display = ('user', 'status', 'attempts', 'next_attempt_at', 'updated_at')
+    list_filter = ('status',)
+    search_fields = ('user__email', 'last_error')
+    readonly_fields = ('user', 'attempts', 'last_error', 'updated_at')
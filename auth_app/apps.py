@@ -4,3 +4,12 @@ from django.apps import AppConfig
 class AuthAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'auth_app'
+
+    def ready(self):
+        from django.contrib.auth.models import update_last_login
+        from django.contrib.auth.signals import user_logged_in
+        from .telemetry import on_user_logged_in
+
+        # Record last_login through the batching accumulator instead of a save() per login
+        user_logged_in.disconnect(update_last_login, dispatch_uid='update_last_login')
+        user_logged_in.connect(on_user_logged_in, dispatch_uid='auth_app_record_login')
@@ -2,10 +2,11 @@ from django.contrib.auth.backends import ModelBackend
 from django.contrib.auth import get_user_model
 from django.conf import settings
 from django.db.models import Q
-from supabase import create_client
 import logging
 from django.utils import timezone
 
+from . import supabase_session
+
 logger = logging.getLogger(__name__)
 User = get_user_model()
 
@@ -77,36 +78,10 @@ class EmailBackend(ModelBackend):
                 # CRITICAL FIX: Check the password BEFORE trying Supabase
                 # This ensures we don't hit Supabase unnecessarily and avoid rate limits  
                 if self.verify_password(user, password):
-                    # If we have a valid local user with correct password, we should NOT fail
-                    # even if Supabase auth fails - this ensures login works even with Supabase issues
-                    try:
-                        # Try Supabase auth if keys are available and configured
-                        supabase_url = getattr(settings, 'SUPABASE_URL', None)
-                        supabase_key = getattr(settings, 'SUPABASE_KEY', None) or getattr(settings, 'SUPABASE_ANON_KEY', None)
-                        
-                        if supabase_url and supabase_key:
-                            # Create Supabase client for v1.0.3
-                            supabase = create_client(supabase_url, supabase_key)
-                            
-                            # Attempt to sign in with Supabase (v1.0.3 format)
-                            auth_response = supabase.auth.sign_in_with_password({
-                                "email": login,
-                                "password": password
-                            })
-                            
-                            # If successful, store the session token
-                            if hasattr(auth_response, 'session') and auth_response.session:
-                                user._supabase_session_token = auth_response.session.access_token
-                                
-                            # Optionally update user info from Supabase
-                            if hasattr(auth_response, 'user') and auth_response.user:
-                                supabase_user = auth_response.user
-                                if not user.supabase_id and hasattr(supabase_user, 'id'):
-                                    user.supabase_id = supabase_user.id
-                                    user.save(update_fields=['supabase_id'])
-                    except Exception as supabase_error:
-                        # Log but don't fail authentication
-                        logger.warning(f"Supabase auth failed but local auth succeeded: {str(supabase_error)}")
+                    # Local success is final. The Supabase session and ID are reconciled
+                    # in the background (or reused from the cache) so a slow or unreachable
+                    # Supabase never delays the login
+                    supabase_session.attach_session(user, user.email or login, password)
                     
                     # Return the authenticated user regardless of Supabase status
                     return user
@@ -114,20 +89,11 @@ class EmailBackend(ModelBackend):
                 logger.info(f"User not found in local database: {login}")
                 
             # If local auth fails, try Supabase auth
-            supabase_url = getattr(settings, 'SUPABASE_URL', None)
-            supabase_key = getattr(settings, 'SUPABASE_KEY', None) or getattr(settings, 'SUPABASE_ANON_KEY', None)
-                
-            if supabase_url and supabase_key:
+            if supabase_session.is_enabled():
                 try:
-                    # Attempt to authenticate with Supabase
+                    # Attempt to authenticate with Supabase (pooled client, bounded wait)
                     logger.info(f"Attempting Supabase authentication for: {login}")
-                    supabase = create_client(supabase_url, supabase_key)
-                    
-                    # Sign in using v1.0.3 format
-                    auth_response = supabase.auth.sign_in_with_password({
-                        "email": login,
-                        "password": password
-                    })
+                    auth_response = supabase_session.remote_sign_in(login, password)
                     
                     # Process the response
                     if auth_response and hasattr(auth_response, 'user') and auth_response.user:
@@ -159,6 +125,7 @@ class EmailBackend(ModelBackend):
                         # Store Supabase session token for later API calls
                         if hasattr(auth_response, 'session') and auth_response.session:
                             user._supabase_session_token = auth_response.session.access_token
+                            supabase_session.store_session(user.pk, auth_response.session)
                             
                         return user
                     else:
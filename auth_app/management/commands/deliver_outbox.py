@@ -0,0 +1,65 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from auth_app import outbox
+
+
+class Command(BaseCommand):
+    help = (
+        'Deliver queued emails from the outbox in batches over a reused connection, '
+        'with retries, dead-lettering and per-domain rate limits'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=outbox.BATCH_SIZE,
+            help=f'Messages claimed per batch (default: {outbox.BATCH_SIZE})',
+        )
+        parser.add_argument('--loop', action='store_true', help='Keep polling for new messages instead of exiting when the outbox is drained')
+        parser.add_argument('--interval', type=float, default=5, help='Seconds to wait between polls with --loop (default: 5)')
+        parser.add_argument('--requeue-dead', action='store_true', help='Give dead-lettered messages a fresh set of attempts first')
+        parser.add_argument(
+            '--prune-days',
+            type=int,
+            default=outbox.KEEP_SENT_DAYS,
+            help=f'Delete sent messages older than this many days (default: {outbox.KEEP_SENT_DAYS})',
+        )
+
+    def handle(self, *args, **options):
+        if options['requeue_dead']:
+            self.stdout.write(f"Requeued {outbox.requeue_dead()} dead message(s)")
+        pruned = outbox.prune_sent(options['prune_days'])
+        if pruned:
+            self.stdout.write(f"Pruned {pruned} sent message(s)")
+
+        connection = outbox.delivery_connection(fail_silently=False)
+        totals = {}
+        try:
+            while True:
+                batch = outbox.deliver(options['batch_size'], connection=connection)
+                for key, count in batch.items():
+                    totals[key] = totals.get(key, 0) + count
+                if batch:
+                    self.stdout.write(', '.join(f"{count} {key}" for key, count in sorted(batch.items())))
+                if batch.get('sent') or batch.get('retried') or batch.get('dead'):
+                    continue
+                if not options['loop']:
+                    break
+                # Nothing sendable right now (empty, backing off or rate limited): don't hold the connection
+                connection.close()
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+        finally:
+            connection.close()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{totals.get('sent', 0)} sent, {totals.get('retried', 0)} to retry, "
+            f"{totals.get('dead', 0)} dead-lettered, {totals.get('deferred', 0)} deferred"
+        ))
+        remaining = outbox.stats()
+        if remaining.get('dead'):
+            self.stdout.write(self.style.WARNING(f"{remaining['dead']} message(s) in the dead-letter queue"))
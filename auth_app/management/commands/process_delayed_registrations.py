@@ -1,20 +1,40 @@
 from django.core.management.base import BaseCommand
 from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
 from django.utils import timezone
+from django.utils.crypto import get_random_string
 from django.contrib.auth import get_user_model
+from concurrent.futures import ThreadPoolExecutor
 import logging
-import requests
-import json
-import os
 import time
 from datetime import timedelta
 
+import requests
+
+from auth_app.models import DelayedRegistration
+from auth_app.supabase_admin import AdminAPIError, AdminClient, is_email_verified
+
 # Configure logger
 logger = logging.getLogger(__name__)
 User = get_user_model()
 
+DEFAULT_WORKERS = 4
+BATCH_SIZE = 200
+MAX_BACKOFF = 24 * 60 * 60
+
+
+def _is_conflict(error):
+    body = error.body.lower()
+    return (error.status == 422 and 'email' in body) or 'already registered' in body or 'already exists' in body
+
+
 class Command(BaseCommand):
-    help = 'Process delayed registrations that encountered rate limits'
+    help = (
+        'Register users that are only in Django (e.g. after hitting rate limits) in Supabase. '
+        'Requests go through a pooled session, a small worker pool and the SUPABASE_ADMIN_RATE '
+        'token bucket; each user\'s attempts and backoff are kept between runs.'
+    )
 
     def add_arguments(self, parser):
         parser.add_argument(
@@ -32,164 +52,188 @@ class Command(BaseCommand):
             '--delay',
             type=int,
             default=5,
-            help='Delay between registration attempts in seconds'
+            help='Seconds before retrying a failed user, doubled after every attempt'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=getattr(settings, 'SUPABASE_ADMIN_WORKERS', DEFAULT_WORKERS),
+            help='Registrations in flight at once'
+        )
+        parser.add_argument(
+            '--rate',
+            type=str,
+            help='Request quota for the admin API, e.g. 120/m (default: SUPABASE_ADMIN_RATE)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BATCH_SIZE,
+            help=f'Users loaded and written per batch (default: {BATCH_SIZE})'
+        )
+        parser.add_argument(
+            '--retry-failed',
+            action='store_true',
+            help='Also retry users that ran out of attempts in earlier runs'
         )
 
     def handle(self, *args, **options):
-        max_attempts = options['max_attempts']
+        self.options = options
         dry_run = options['dry_run']
-        delay = options['delay']
-        
+        batch_size = max(1, options['batch_size'])
+        now = timezone.now()
+
         self.stdout.write(f"Processing delayed registrations (dry-run: {dry_run})")
-        
-        # Get unverified users that need to be registered in Supabase
+
+        if options['retry_failed'] and not dry_run:
+            revived = DelayedRegistration.objects.filter(status='failed').update(
+                status='pending', attempts=0, next_attempt_at=now, updated_at=now,
+            )
+            self.stdout.write(f"Retrying {revived} user(s) that ran out of attempts")
+
         # Users with no supabase_id who have been created more than 5 minutes ago
-        # to avoid race conditions with normal registration
-        cutoff_time = timezone.now() - timedelta(minutes=5)
+        # to avoid race conditions with normal registration; users still backing
+        # off from an earlier run or out of attempts wait
         pending_users = User.objects.filter(
             supabase_id__isnull=True,
             email_verified=False,
-            date_joined__lt=cutoff_time
+            date_joined__lt=now - timedelta(minutes=5),
+        ).exclude(
+            Q(delayed_registration__status='failed') | Q(delayed_registration__next_attempt_at__gt=now)
         )
-        
-        self.stdout.write(f"Found {pending_users.count()} users pending Supabase registration")
-        
-        # Process each user
-        success_count = 0
-        failed_count = 0
-        
-        # Get Supabase URL and key
-        supabase_url = settings.SUPABASE_URL
-        service_key = settings.SUPABASE_SERVICE_KEY
-        
-        if not supabase_url or not service_key:
-            self.stdout.write(self.style.ERROR("Missing Supabase URL or service role key"))
+        total = pending_users.count()
+        self.stdout.write(f"Found {total} users pending Supabase registration")
+        if dry_run:
+            for email in pending_users.values_list('email', flat=True).iterator():
+                self.stdout.write(self.style.SUCCESS(f"[DRY RUN] Would register {email} in Supabase"))
+            self.stdout.write(self.style.SUCCESS(f"[DRY RUN] Completed delayed registration processing: Total: {total}"))
+            return
+        if not total:
+            return
+
+        try:
+            client = AdminClient(workers=max(1, options['workers']), rate=options.get('rate'))
+        except AdminAPIError as e:
+            self.stdout.write(self.style.ERROR(str(e)))
             return
-            
-        # Set up API headers for admin operations
-        headers = {
-            "apikey": service_key,
-            "Authorization": f"Bearer {service_key}",
-            "Content-Type": "application/json"
-        }
-        
-        for user in pending_users:
-            self.stdout.write(f"Processing user: {user.email}")
-            
-            if dry_run:
-                self.stdout.write(self.style.SUCCESS(f"[DRY RUN] Would register {user.email} in Supabase"))
-                continue
-                
-            # Generate a random password for the user
-            from django.utils.crypto import get_random_string
-            temp_password = get_random_string(16)
-            
-            # Determine if we should verify the email directly
-            # Users that have been in the system for a while can be auto-verified
-            auto_verify = (timezone.now() - user.date_joined) > timedelta(days=1)
-            
-            # Try to register the user in Supabase
-            for attempt in range(1, max_attempts + 1):
-                try:
-                    # Create user in Supabase with admin API
-                    create_url = f"{supabase_url}/auth/v1/admin/users"
-                    create_data = {
-                        "email": user.email,
-                        "password": temp_password,
-                        "email_confirm": auto_verify,  # Auto-verify if the user has been around for a while
-                        "user_metadata": {
-                            "username": user.username
-                        }
-                    }
-                    
-                    self.stdout.write(f"Attempt {attempt}/{max_attempts} for {user.email}")
-                    response = requests.post(create_url, headers=headers, json=create_data)
-                    
-                    if response.status_code == 200:
-                        # Success! Update the user's Supabase ID
-                        supabase_data = response.json()
-                        supabase_id = supabase_data.get('id')
-                        
-                        if supabase_id:
-                            user.supabase_id = supabase_id
-                            if auto_verify:
-                                user.email_verified = True
-                            user.save()
-                            success_count += 1
-                            self.stdout.write(self.style.SUCCESS(f"Successfully registered {user.email} in Supabase"))
-                            break
-                    else:
-                        # Check response for specific errors
-                        error_body = response.text
-                        
-                        try:
-                            error_data = json.loads(error_body)
-                            error_message = error_data.get('message', '')
-                            
-                            # If the email is already registered, update the user's Supabase ID
-                            if "already registered" in error_message.lower() or "already exists" in error_message.lower():
-                                # Try to find the user in Supabase by email
-                                self.stdout.write(f"User {user.email} appears to already exist in Supabase")
-                                
-                                # Try to get the user's ID from Supabase
-                                search_url = f"{supabase_url}/auth/v1/admin/users"
-                                search_response = requests.get(search_url, headers=headers)
-                                
-                                if search_response.status_code == 200:
-                                    supabase_users = search_response.json()
-                                    
-                                    # Handle different response formats
-                                    if isinstance(supabase_users, dict) and 'users' in supabase_users:
-                                        supabase_users = supabase_users['users']
-                                    
-                                    # Find the user by email
-                                    for supabase_user in supabase_users:
-                                        if supabase_user.get('email', '').lower() == user.email.lower():
-                                            # Found the user, update the Supabase ID
-                                            supabase_id = supabase_user.get('id')
-                                            if supabase_id:
-                                                user.supabase_id = supabase_id
-                                                
-                                                # Check if email is verified in Supabase
-                                                if (supabase_user.get('email_confirmed_at') or 
-                                                    supabase_user.get('confirmed_at')):
-                                                    user.email_verified = True
-                                                    
-                                                user.save()
-                                                success_count += 1
-                                                self.stdout.write(self.style.SUCCESS(
-                                                    f"User {user.email} already in Supabase, updated ID"
-                                                ))
-                                                break
-                                
-                                # Break the retry loop since we've handled this case
-                                break
-                            
-                            # If we hit rate limits, wait and retry
-                            if "rate limit" in error_message.lower():
-                                if attempt < max_attempts:
-                                    self.stdout.write(f"Rate limit hit for {user.email}, waiting {delay}s before retry...")
-                                    time.sleep(delay)
-                                    continue
-                        except json.JSONDecodeError:
-                            pass
-                        
-                        # If we've reached the max attempts, log the error
-                        if attempt == max_attempts:
-                            self.stdout.write(self.style.ERROR(
-                                f"Failed to register {user.email} after {max_attempts} attempts: {response.status_code} - {error_body}"
-                            ))
-                            failed_count += 1
-                    
-                except Exception as e:
-                    self.stdout.write(self.style.ERROR(f"Error processing {user.email}: {str(e)}"))
-                    if attempt == max_attempts:
-                        failed_count += 1
-                    else:
-                        time.sleep(delay)
-            
-        status = "[DRY RUN] " if dry_run else ""
+
+        self.counts = {'registered': 0, 'linked': 0, 'deferred': 0, 'retrying': 0, 'failed': 0}
+        started = time.monotonic()
+        last_pk = 0
+        with client, ThreadPoolExecutor(max_workers=client.workers, thread_name_prefix='delayed-registration') as pool:
+            while True:
+                users = list(pending_users.filter(pk__gt=last_pk).order_by('pk')[:batch_size])
+                if not users:
+                    break
+                last_pk = users[-1].pk
+                # Remote calls only on the pool; all database writes stay on this thread
+                outcomes = list(pool.map(lambda user: self.register(client, user), users))
+                conflicts = [user for user, outcome in zip(users, outcomes) if outcome[0] == 'conflict']
+                if conflicts:
+                    self.resolve_conflicts(client, conflicts, outcomes, users)
+                self.save_batch(users, outcomes)
+                self.stdout.write(
+                    f"{sum(self.counts.values())}/{total} processed "
+                    f"({self.counts['registered'] + self.counts['linked']} in Supabase)"
+                )
+
+        elapsed = time.monotonic() - started
+        processed = sum(self.counts.values())
         self.stdout.write(self.style.SUCCESS(
-            f"{status}Completed delayed registration processing: "
-            f"Success: {success_count}, Failed: {failed_count}, Total: {pending_users.count()}"
-        )) 
\ No newline at end of file
+            f"Completed delayed registration processing: "
+            f"Success: {self.counts['registered'] + self.counts['linked']}, Failed: {self.counts['failed']}, Total: {total}"
+        ))
+        self.stdout.write(
+            f"{processed} users in {elapsed:.1f}s ({processed / elapsed if elapsed else 0:.1f}/s): "
+            f"{self.counts['registered']} registered, {self.counts['linked']} linked to existing Supabase users, "
+            f"{self.counts['retrying']} to retry, {self.counts['deferred']} deferred by rate limits, "
+            f"{self.counts['failed']} out of attempts; {client.requests_made} requests "
+            f"({client.requests_made / elapsed if elapsed else 0:.1f}/s), {client.rate_limited} rate limited, "
+            f"{client.throttled_seconds:.1f}s waiting for the rate limiter"
+        )
+
+    def register(self, client, user):
+        """Create ``user`` in Supabase. Returns ``(outcome, detail)``; runs on the pool."""
+        # Users that have been in the system for a while can be auto-verified
+        auto_verify = (timezone.now() - user.date_joined) > timedelta(days=1)
+        try:
+            created = client.create_user(
+                user.email, get_random_string(16), metadata={'username': user.username}, email_verified=auto_verify,
+            )
+        except AdminAPIError as e:
+            if e.rate_limited:
+                return 'deferred', str(e)
+            if _is_conflict(e):
+                return 'conflict', str(e)
+            return 'error', str(e)
+        except requests.RequestException as e:
+            return 'error', str(e)
+        if not created.get('id'):
+            return 'error', 'Supabase returned no user ID'
+        return 'registered', (created['id'], auto_verify)
+
+    def resolve_conflicts(self, client, conflicts, outcomes, users):
+        """Link users whose email is already in Supabase, with one listing for the whole batch."""
+        try:
+            found = client.find_users([user.email for user in conflicts])
+        except (AdminAPIError, requests.RequestException) as e:
+            found = {}
+            logger.error(f"Error looking up existing Supabase users: {str(e)}")
+        index = {user.pk: i for i, user in enumerate(users)}
+        for user in conflicts:
+            supabase_user = found.get(user.email.lower())
+            if supabase_user and supabase_user.get('id'):
+                outcomes[index[user.pk]] = ('linked', (supabase_user['id'], is_email_verified(supabase_user)))
+            else:
+                outcomes[index[user.pk]] = ('error', 'Email already registered in Supabase but not found in the user list')
+
+    def save_batch(self, users, outcomes):
+        now = timezone.now()
+        states = {state.user_id: state for state in DelayedRegistration.objects.filter(user__in=users)}
+        changed_users, new_states = [], []
+        for user, (outcome, detail) in zip(users, outcomes):
+            state = states.get(user.pk)
+            if state is None:
+                state = DelayedRegistration(user=user)
+                new_states.append(state)
+            state.updated_at = now
+
+            if outcome in ('registered', 'linked'):
+                supabase_id, verified = detail
+                user.supabase_id = supabase_id
+                user.email_verified = user.email_verified or verified
+                changed_users.append(user)
+                state.status, state.last_error = 'registered', ''
+                state.attempts += 1
+                self.counts[outcome] += 1
+                if self.options['verbosity'] > 1:
+                    self.stdout.write(self.style.SUCCESS(f"{outcome.capitalize()} {user.email} in Supabase"))
+            elif outcome == 'deferred':
+                # The quota, not the user, failed: no attempt used
+                state.last_error = detail[:2000]
+                state.next_attempt_at = now + timedelta(seconds=self.options['delay'])
+                self.counts['deferred'] += 1
+            else:
+                state.attempts += 1
+                state.last_error = detail[:2000]
+                if state.attempts >= self.options['max_attempts']:
+                    state.status = 'failed'
+                    self.counts['failed'] += 1
+                    self.stdout.write(self.style.ERROR(
+                        f"Failed to register {user.email} after {state.attempts} attempts: {detail}"
+                    ))
+                else:
+                    delay = min(MAX_BACKOFF, self.options['delay'] * 2 ** (state.attempts - 1))
+                    state.next_attempt_at = now + timedelta(seconds=delay)
+                    self.counts['retrying'] += 1
+                    logger.warning(f"Registering {user.email} in Supabase failed, retrying in {delay}s: {detail}")
+
+        with transaction.atomic():
+            if changed_users:
+                User.objects.bulk_update(changed_users, ['supabase_id', 'email_verified'])
+            if new_states:
+                DelayedRegistration.objects.bulk_create(new_states)
+            if states:
+                DelayedRegistration.objects.bulk_update(
+                    list(states.values()), ['status', 'attempts', 'next_attempt_at', 'last_error', 'updated_at'],
+                )
@@ -0,0 +1,60 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from auth_app import webhook_inbox
+
+
+class Command(BaseCommand):
+    help = (
+        'Apply Supabase webhook events from the inbox in batches, in order per user, '
+        'with retries and dead-lettering'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=webhook_inbox.BATCH_SIZE,
+            help=f'Events claimed per batch (default: {webhook_inbox.BATCH_SIZE})',
+        )
+        parser.add_argument('--loop', action='store_true', help='Keep polling for new events instead of exiting when the inbox is drained')
+        parser.add_argument('--interval', type=float, default=1, help='Seconds to wait between polls with --loop (default: 1)')
+        parser.add_argument('--requeue-dead', action='store_true', help='Give dead-lettered events a fresh set of attempts first')
+        parser.add_argument(
+            '--prune-days',
+            type=int,
+            default=webhook_inbox.KEEP_DONE_DAYS,
+            help=f'Delete applied events older than this many days (default: {webhook_inbox.KEEP_DONE_DAYS})',
+        )
+
+    def handle(self, *args, **options):
+        if options['requeue_dead']:
+            self.stdout.write(f"Requeued {webhook_inbox.requeue_dead()} dead event(s)")
+        pruned = webhook_inbox.prune_done(options['prune_days'])
+        if pruned:
+            self.stdout.write(f"Pruned {pruned} applied event(s)")
+
+        totals = {}
+        try:
+            while True:
+                batch = webhook_inbox.process(options['batch_size'])
+                for key, count in batch.items():
+                    totals[key] = totals.get(key, 0) + count
+                if batch:
+                    self.stdout.write(', '.join(f"{count} {key}" for key, count in sorted(batch.items())))
+                if batch.get('applied') or batch.get('retried') or batch.get('dead'):
+                    continue
+                if not options['loop']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{totals.get('applied', 0)} applied, {totals.get('retried', 0)} to retry, "
+            f"{totals.get('dead', 0)} dead-lettered, {totals.get('deferred', 0)} deferred"
+        ))
+        remaining = webhook_inbox.stats()
+        if remaining.get('dead'):
+            self.stdout.write(self.style.WARNING(f"{remaining['dead']} event(s) in the dead-letter queue"))
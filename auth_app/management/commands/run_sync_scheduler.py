@@ -0,0 +1,99 @@
+import signal
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils import timezone
+
+from auth_app import sync_scheduler
+
+DEFAULT_WORKERS = 2
+DEFAULT_MAX_SLEEP = 300  # seconds; bounds how long an edited schedule can go unnoticed
+PRUNE_INTERVAL = 3600
+
+
+class Command(BaseCommand):
+    help = (
+        'Run user sync schedules as they fall due. Sleeps until the earliest next_run, leases due '
+        'schedules so several schedulers can run side by side, and runs them on a bounded pool. '
+        'Each run is recorded in the sync run history.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=getattr(settings, 'SYNC_SCHEDULER_WORKERS', DEFAULT_WORKERS),
+            help=f'Schedules run at the same time (default: SYNC_SCHEDULER_WORKERS or {DEFAULT_WORKERS})',
+        )
+        parser.add_argument(
+            '--max-sleep',
+            type=float,
+            default=DEFAULT_MAX_SLEEP,
+            help=f'Longest wait before re-reading the schedules (default: {DEFAULT_MAX_SLEEP})',
+        )
+        parser.add_argument(
+            '--keep-days',
+            type=int,
+            default=sync_scheduler.KEEP_RUNS_DAYS,
+            help=f'Delete run history older than this many days (default: {sync_scheduler.KEEP_RUNS_DAYS})',
+        )
+
+    def handle(self, *args, **options):
+        workers = max(1, options['workers'])
+        stopped = Future()
+        if threading.current_thread() is threading.main_thread():
+            for signum in (signal.SIGINT, signal.SIGTERM):
+                signal.signal(signum, lambda *_: stopped.done() or stopped.set_result(None))
+
+        self.stdout.write(f"Sync scheduler {sync_scheduler.WORKER_ID} started with {workers} worker(s)")
+        running = {}
+        last_prune = None
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='sync-schedule') as pool:
+            while not stopped.done():
+                now = timezone.now()
+                if last_prune is None or (now - last_prune).total_seconds() >= PRUNE_INTERVAL:
+                    pruned = sync_scheduler.prune_runs(options['keep_days'])
+                    if pruned:
+                        self.stdout.write(f"Pruned {pruned} old sync run(s)")
+                    last_prune = now
+
+                free = workers - len(running)
+                if free > 0:
+                    for schedule, token in sync_scheduler.claim(limit=free, now=now):
+                        self.stdout.write(f"Running sync schedule {schedule.id} ({schedule.direction}, {schedule.frequency})")
+                        running[pool.submit(self.run_claimed, schedule, token)] = schedule
+
+                timeout = options['max_sleep']
+                if len(running) < workers:
+                    wakeup = sync_scheduler.next_wakeup()
+                    if wakeup is not None:
+                        timeout = min(timeout, max(1.0, (wakeup - timezone.now()).total_seconds()))
+                close_old_connections()
+                done, _ = wait(set(running) | {stopped}, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future is not stopped:
+                        self.report(running.pop(future), future)
+
+            if running:
+                self.stdout.write(f"Stopping: waiting for {len(running)} running sync(s) to finish")
+            for future in list(running):
+                self.report(running.pop(future), future)
+        self.stdout.write(self.style.SUCCESS("Sync scheduler stopped."))
+
+    def run_claimed(self, schedule, token):
+        try:
+            return sync_scheduler.run(schedule, token)
+        finally:
+            close_old_connections()
+
+    def report(self, schedule, future):
+        try:
+            sync_run = future.result()
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f"Error running sync schedule {schedule.id}: {str(e)}"))
+            return
+        style = self.style.SUCCESS if sync_run.status == 'succeeded' else self.style.ERROR
+        self.stdout.write(style(f"Sync schedule {schedule.id} {sync_run.status} (run {sync_run.pk})"))
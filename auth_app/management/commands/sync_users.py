@@ -1,17 +1,50 @@
 from django.core.management.base import BaseCommand
 from django.contrib.auth import get_user_model
 from django.conf import settings
-from django.db import transaction
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.db.models.functions import Lower
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.crypto import get_random_string
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
 import logging
-import requests
 import json
-from datetime import datetime
+import os
+import time
+
+from auth_app.models import UserProfile, UserSyncSchedule
+from auth_app.supabase_admin import AdminAPIError, AdminClient, changed_at, is_email_verified
 
 logger = logging.getLogger(__name__)
 User = get_user_model()
 
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_WATERMARK_OVERLAP = 300  # seconds re-examined before the watermark, for clock skew and in-flight writes
+USERNAME_MAX_LENGTH = 140  # leaves room for a numeric suffix within the 150 allowed
+
+
+def default_checkpoint_file(schedule_id=None):
+    path = getattr(
+        settings, 'SYNC_USERS_CHECKPOINT_FILE',
+        os.path.join(settings.BASE_DIR, 'logs', 'sync_users.checkpoint.json'),
+    )
+    if schedule_id is None:
+        return path
+    # Schedules may run concurrently; each resumes from its own file
+    root, ext = os.path.splitext(path)
+    return f"{root}.schedule-{schedule_id}{ext}"
+
+
 class Command(BaseCommand):
-    help = 'Synchronize users between Django and Supabase'
+    help = (
+        'Synchronize users between Django and Supabase. Supabase users are listed page by page '
+        'with several pages in flight, local changes are written in fixed-size bulk batches, '
+        'and progress is checkpointed so an interrupted run resumes where it stopped. '
+        'With --since (or --schedule) only users changed after a watermark are applied.'
+    )
 
     def add_arguments(self, parser):
         parser.add_argument(
@@ -36,387 +69,432 @@ class Command(BaseCommand):
             type=str,
             help='Synchronize only the specified email address',
         )
+        parser.add_argument('--page-size', type=int, help='Supabase users fetched per request (default: SUPABASE_ADMIN_PAGE_SIZE)')
+        parser.add_argument('--workers', type=int, help='Concurrent Supabase requests (default: SUPABASE_ADMIN_WORKERS)')
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help=f'Users written per database transaction (default: {DEFAULT_BATCH_SIZE})',
+        )
+        parser.add_argument('--checkpoint', type=str, help='Checkpoint file (default: SYNC_USERS_CHECKPOINT_FILE)')
+        parser.add_argument('--restart', action='store_true', help='Ignore an existing checkpoint and start from the beginning')
+        parser.add_argument('--since', type=str, help='Only apply users changed after this ISO 8601 time (incremental sync)')
+        parser.add_argument(
+            '--schedule',
+            type=int,
+            help='Run the UserSyncSchedule with this ID: incremental from its watermark unless a full '
+                 'reconciliation is due; its watermark and last_status are updated afterwards',
+        )
+        parser.add_argument('--full', action='store_true', help='With --schedule, compare every user even if a full reconciliation is not due')
 
     def handle(self, *args, **options):
         dry_run = options['dry_run']
         direction = options['direction']
         force = options['force']
-        email_filter = options.get('email')
-        
-        self.stdout.write(f"Starting user synchronization (direction: {direction}, dry_run: {dry_run})")
-        
-        # Get Supabase service key and URL
-        supabase_url = settings.SUPABASE_URL
-        service_key = settings.SUPABASE_SERVICE_KEY
-        
-        if not supabase_url or not service_key:
-            self.stdout.write(self.style.ERROR("Missing Supabase URL or service role key."))
+        email_filter = (options.get('email') or '').lower() or None
+        self.batch_size = max(1, options['batch_size'])
+        self.verbosity = options.get('verbosity', 1)
+
+        schedule = None
+        self.since = None
+        if options.get('schedule'):
+            try:
+                schedule = UserSyncSchedule.objects.get(pk=options['schedule'])
+            except UserSyncSchedule.DoesNotExist:
+                self.stdout.write(self.style.ERROR(f"Sync schedule {options['schedule']} does not exist."))
+                return
+            direction, force = schedule.direction, schedule.force_update
+            if not options['full'] and not schedule.full_sync_due():
+                self.since = schedule.watermark
+        elif options.get('since'):
+            self.since = parse_datetime(options['since'])
+            if self.since is None:
+                self.stdout.write(self.style.ERROR(f"Invalid --since time: {options['since']}"))
+                return
+            if timezone.is_naive(self.since):
+                self.since = timezone.make_aware(self.since)
+        overlap = timedelta(seconds=getattr(settings, 'SYNC_USERS_WATERMARK_OVERLAP', DEFAULT_WATERMARK_OVERLAP))
+        self.changed_after = self.since - overlap if self.since else None
+
+        mode = f"incremental since {self.since.isoformat()}" if self.since else "full"
+        self.stdout.write(f"Starting user synchronization (direction: {direction}, {mode}, dry_run: {dry_run})")
+
+        try:
+            client = AdminClient(page_size=options.get('page_size'), workers=options.get('workers'))
+        except AdminAPIError as e:
+            self.stdout.write(self.style.ERROR(str(e)))
             return
-        
-        # Set up API headers
-        headers = {
-            "apikey": service_key,
-            "Authorization": f"Bearer {service_key}",
-            "Content-Type": "application/json"
+
+        self.checkpoint_path = options.get('checkpoint') or default_checkpoint_file(schedule.pk if schedule else None)
+        params = {
+            'direction': direction, 'email': email_filter, 'force': force, 'page_size': client.page_size,
+            'since': self.since.isoformat() if self.since else None,
         }
-        
-        # Get Supabase users
-        supabase_users = self.get_supabase_users(supabase_url, headers)
-        if supabase_users is None:
-            return
-            
-        # Filter by email if specified
-        if email_filter:
-            supabase_users = [user for user in supabase_users if user.get('email', '').lower() == email_filter.lower()]
-            self.stdout.write(f"Filtered Supabase users by email: {email_filter} - found {len(supabase_users)} users")
-            
-        # Get Django users
-        django_query = User.objects.all()
-        if email_filter:
-            django_query = django_query.filter(email__iexact=email_filter)
-            self.stdout.write(f"Filtered Django users by email: {email_filter}")
-        django_users = list(django_query)
-        
-        # Create email-to-object mappings for easy lookup
-        supabase_users_by_email = {user.get('email', '').lower(): user for user in supabase_users if user.get('email')}
-        django_users_by_email = {user.email.lower(): user for user in django_users if user.email}
-        
-        # Create ID-to-object mappings for users with IDs
-        supabase_users_by_id = {user.get('id'): user for user in supabase_users if user.get('id')}
-        django_users_by_id = {user.supabase_id: user for user in django_users if user.supabase_id}
-        
-        self.stdout.write(f"Found {len(supabase_users)} users in Supabase")
-        self.stdout.write(f"Found {len(django_users)} users in Django")
-        
-        # Synchronize from Supabase to Django if needed
+        checkpoint = {} if dry_run else self.load_checkpoint(params, options['restart'])
+        self.stats = Counter(checkpoint.get('stats', {}))
+        self.high_water = parse_datetime(checkpoint['high_water']) if checkpoint.get('high_water') else None
+        started = timezone.now()
+        clock = time.monotonic()
+
+        with client:
+            try:
+                index = self.sync_pages(client, checkpoint, params, direction, email_filter, dry_run)
+                if direction in ['to-supabase', 'both']:
+                    self.sync_to_supabase(client, index, checkpoint, params, email_filter, dry_run, force)
+            except (AdminAPIError, OSError) as e:
+                # requests' ConnectionError and Timeout are OSErrors too
+                logger.error(f"User synchronization interrupted: {str(e)}")
+                self.stdout.write(self.style.ERROR(f"Synchronization interrupted: {str(e)}"))
+                if not dry_run:
+                    self.stdout.write(f"Progress saved to {self.checkpoint_path}; run the command again to resume.")
+                    if schedule:
+                        self.record_run(schedule, started, time.monotonic() - clock, client, error=str(e))
+                return
+
+        if not dry_run:
+            self.clear_checkpoint()
+            if schedule:
+                self.record_run(schedule, started, time.monotonic() - clock, client)
+        s = self.stats
+        self.stdout.write(f"Supabase: {s['fetched']} users in {s['pages']} pages ({client.requests_made} requests)")
         if direction in ['to-django', 'both']:
-            self.sync_to_django(
-                supabase_users, 
-                django_users_by_email, 
-                django_users_by_id,
-                dry_run,
-                force
-            )
-            
-        # Synchronize from Django to Supabase if needed
+            self.stdout.write(self.style.SUCCESS(
+                f"Synchronization to Django completed: {s['created']} created, {s['updated']} updated, "
+                f"{s['in_sync']} in sync, {s['unchanged']} unchanged since watermark, "
+                f"{s['skipped']} skipped, {s['errors']} errors"
+            ))
         if direction in ['to-supabase', 'both']:
-            self.sync_to_supabase(
-                django_users, 
-                supabase_users_by_email, 
-                supabase_users_by_id,
-                supabase_url,
-                headers,
-                dry_run,
-                force
-            )
-            
+            self.stdout.write(self.style.SUCCESS(
+                f"Synchronization to Supabase completed: {s['supabase_created']} created, "
+                f"{s['supabase_updated']} updated, {s['supabase_missing']} missing, {s['supabase_errors']} errors"
+            ))
         self.stdout.write(self.style.SUCCESS("User synchronization completed"))
-        
-    def get_supabase_users(self, supabase_url, headers):
-        """Get all users from Supabase"""
+
+    def record_run(self, schedule, started, duration, client, error=None):
+        """
+        Store this run's stats in ``schedule.last_status`` and, if it
+        completed, advance the watermark (and ``last_full_sync`` for a full run).
+        """
+        status = {
+            'mode': 'incremental' if self.since else 'full',
+            'since': self.since.isoformat() if self.since else None,
+            'started_at': started.isoformat(),
+            'duration_seconds': round(duration, 2),
+            'requests': client.requests_made,
+            'completed': error is None,
+            **self.stats,
+        }
+        fields = {}
+        if error is None:
+            watermark = max(filter(None, [self.high_water, schedule.watermark]), default=None)
+            fields['watermark'] = watermark
+            status['watermark'] = watermark.isoformat() if watermark else None
+            if not self.since:
+                fields['last_full_sync'] = started
+        else:
+            status['error'] = error
+        fields['last_status'] = json.dumps(status, sort_keys=True)
+        # update() rather than save(): save() would also move next_run
+        UserSyncSchedule.objects.filter(pk=schedule.pk).update(updated_at=timezone.now(), **fields)
+
+    # Checkpoints
+
+    def load_checkpoint(self, params, restart):
+        if restart or not os.path.exists(self.checkpoint_path):
+            return {}
         try:
-            # Construct the Auth API URL
-            auth_api_url = f"{supabase_url}/auth/v1/admin/users"
-            response = requests.get(auth_api_url, headers=headers)
-            
-            if response.status_code != 200:
-                self.stdout.write(self.style.ERROR(
-                    f"Failed to list Supabase users: {response.status_code} - {response.text}"
-                ))
-                return None
-            
-            # Parse the response
-            users_data = response.json()
-            
-            # Handle different response structures
-            if isinstance(users_data, dict) and 'users' in users_data:
-                return users_data['users']
-            elif isinstance(users_data, list):
-                return users_data
-            else:
-                self.stdout.write(self.style.ERROR(f"Unexpected response format: {type(users_data)}"))
-                return []
-                
-        except Exception as e:
-            self.stdout.write(self.style.ERROR(f"Error getting Supabase users: {str(e)}"))
-            return None
-            
-    @transaction.atomic
-    def sync_to_django(self, supabase_users, django_users_by_email, django_users_by_id, dry_run, force):
-        """Synchronize users from Supabase to Django"""
-        created_count = 0
-        updated_count = 0
-        error_count = 0
-        
-        self.stdout.write(self.style.SUCCESS("\nSynchronizing from Supabase to Django:"))
-        
+            with open(self.checkpoint_path) as f:
+                checkpoint = json.load(f)
+        except (OSError, ValueError) as e:
+            self.stdout.write(self.style.WARNING(f"Ignoring unreadable checkpoint {self.checkpoint_path}: {str(e)}"))
+            return {}
+        if checkpoint.get('params') != params:
+            self.stdout.write(self.style.WARNING("Ignoring checkpoint from a run with different options"))
+            return {}
+        self.stdout.write(
+            f"Resuming from checkpoint of {checkpoint.get('updated_at')} "
+            f"(phase: {checkpoint.get('phase')}, page: {checkpoint.get('page', 0)})"
+        )
+        return checkpoint
+
+    def save_checkpoint(self, checkpoint, params, **progress):
+        checkpoint.update(
+            progress, params=params, stats=dict(self.stats), updated_at=timezone.now().isoformat(),
+            high_water=self.high_water.isoformat() if self.high_water else None,
+        )
+        os.makedirs(os.path.dirname(os.path.abspath(self.checkpoint_path)), exist_ok=True)
+        tmp_path = f"{self.checkpoint_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(checkpoint, f)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def clear_checkpoint(self):
+        try:
+            os.remove(self.checkpoint_path)
+        except FileNotFoundError:
+            pass
+
+    # Supabase -> Django
+
+    def sync_pages(self, client, checkpoint, params, direction, email_filter, dry_run):
+        """
+        Walk every page of Supabase users, applying each to Django (for
+        to-django/both) and collecting the compact email/ID index that the
+        to-supabase pass needs. Returns the index, or ``None`` if not needed.
+
+        The admin API cannot filter by change time, so an incremental run
+        still lists every page, but only users changed after the watermark
+        are looked up and written locally.
+        """
+        to_django = direction in ['to-django', 'both']
+        index = {'by_email': {}, 'by_id': {}} if direction in ['to-supabase', 'both'] else None
+        # Pages up to here were handled before the interruption; the index is rebuilt by reading them again
+        done_page = checkpoint.get('page', 0)
+        if checkpoint.get('phase') == 'to-supabase':
+            to_django = False
+        self.last_page = done_page
+        start = 1 if index is not None else done_page + 1
+
+        if to_django:
+            self.stdout.write(self.style.SUCCESS("\nSynchronizing from Supabase to Django:"))
+        for page, users in client.iter_pages(start):
+            if email_filter:
+                users = [user for user in users if (user.get('email') or '').lower() == email_filter]
+            for user in users:
+                user_changed_at = changed_at(user)
+                if user_changed_at and (self.high_water is None or user_changed_at > self.high_water):
+                    self.high_water = user_changed_at
+            if index is not None:
+                for user in users:
+                    email, user_id = (user.get('email') or '').lower(), user.get('id')
+                    if email:
+                        index['by_email'][email] = (user_id, is_email_verified(user))
+                    if user_id:
+                        index['by_id'][user_id] = email
+            self.last_page = page
+            if page <= done_page:
+                continue
+
+            self.stats['pages'] += 1
+            self.stats['fetched'] += len(users)
+            if not to_django:
+                continue
+            changed = users
+            if self.changed_after:
+                changed = [user for user in users if (changed_at(user) or self.changed_after) >= self.changed_after]
+                self.stats['unchanged'] += len(users) - len(changed)
+            for i in range(0, len(changed), self.batch_size):
+                self.apply_batch(changed[i:i + self.batch_size], dry_run)
+            self.stdout.write(f"  Page {page}: {len(users)} users, {len(changed)} changed")
+            if not dry_run:
+                self.save_checkpoint(checkpoint, params, phase='to-django', page=page)
+        return index
+
+    def apply_batch(self, supabase_users, dry_run):
+        """Create or update the Django users for one batch of Supabase users in a single transaction."""
+        for attempt in range(2):
+            try:
+                with transaction.atomic():
+                    counts = self._apply_batch(supabase_users, dry_run)
+                break
+            except IntegrityError as e:
+                # A username or email taken concurrently; the retry sees it
+                if attempt:
+                    logger.error(f"Error writing batch of {len(supabase_users)} users: {str(e)}")
+                    self.stdout.write(self.style.ERROR(f"  Error writing batch of {len(supabase_users)} users: {str(e)}"))
+                    self.stats['errors'] += len(supabase_users)
+                    return
+        self.stats.update(counts)
+
+    def _apply_batch(self, supabase_users, dry_run):
+        counts = Counter()
+        records = {}
         for supabase_user in supabase_users:
-            user_id = supabase_user.get('id')
-            email = supabase_user.get('email')
-            
+            email = (supabase_user.get('email') or '').lower()
             if not email:
-                self.stdout.write(self.style.WARNING(f"  Skipping Supabase user with no email (ID: {user_id})"))
+                if self.verbosity >= 2:
+                    self.stdout.write(self.style.WARNING(f"  Skipping Supabase user with no email (ID: {supabase_user.get('id')})"))
+                counts['skipped'] += 1
                 continue
-                
-            email = email.lower()
-            existing_django_user = django_users_by_email.get(email) or django_users_by_id.get(user_id)
-            
-            if existing_django_user:
-                # User already exists in Django, update if needed
-                needs_update = False
-                changes = []
-                
-                # Check if Supabase ID needs updating
-                if existing_django_user.supabase_id != user_id:
-                    changes.append(f"Supabase ID: {existing_django_user.supabase_id} -> {user_id}")
-                    if not dry_run:
-                        existing_django_user.supabase_id = user_id
-                    needs_update = True
-                
-                # Check email verification status
-                email_verified = self._check_email_verified(supabase_user)
-                if email_verified and not existing_django_user.email_verified:
-                    changes.append(f"Email verified: False -> True")
-                    if not dry_run:
-                        existing_django_user.email_verified = True
-                    needs_update = True
-                
-                # Update user info if needed
-                if needs_update:
-                    if dry_run:
-                        self.stdout.write(f"  Would update Django user {email}: {', '.join(changes)}")
-                    else:
-                        try:
-                            existing_django_user.save(update_fields=['supabase_id', 'email_verified'])
-                            self.stdout.write(self.style.SUCCESS(f"  Updated Django user {email}: {', '.join(changes)}"))
-                            updated_count += 1
-                        except Exception as e:
-                            self.stdout.write(self.style.ERROR(f"  Error updating Django user {email}: {str(e)}"))
-                            error_count += 1
-                else:
-                    self.stdout.write(f"  Django user {email} already in sync")
-                    
-            else:
-                # User does not exist in Django, create a new user
-                # Generate random password - user will need to reset it
-                from django.utils.crypto import get_random_string
-                temp_password = get_random_string(16)
-                
-                # Get username from metadata or use email
-                username = email.split('@')[0]
-                user_meta = supabase_user.get('raw_user_meta_data', {})
-                if isinstance(user_meta, dict) and 'username' in user_meta:
-                    username = user_meta.get('username')
-                
-                # Make username unique if needed
-                username_base = username
+            records[email] = supabase_user
+
+        ids = [record['id'] for record in records.values() if record.get('id')]
+        existing = (
+            User.objects.annotate(email_lower=Lower('email'))
+            .filter(Q(email_lower__in=list(records)) | Q(supabase_id__in=ids))
+            .only('id', 'email', 'username', 'supabase_id', 'email_verified')
+        )
+        by_email, by_id = {}, {}
+        for user in existing:
+            by_email.setdefault(user.email_lower, user)
+            if user.supabase_id:
+                by_id.setdefault(user.supabase_id, user)
+
+        to_update, to_create = {}, []
+        for email, supabase_user in records.items():
+            user_id = supabase_user.get('id')
+            email_verified = is_email_verified(supabase_user)
+            django_user = by_email.get(email) or by_id.get(user_id)
+            if django_user is None:
+                to_create.append((email, supabase_user, email_verified))
+                continue
+
+            changes = []
+            if django_user.supabase_id != user_id:
+                changes.append(f"Supabase ID: {django_user.supabase_id} -> {user_id}")
+                django_user.supabase_id = user_id
+            if email_verified and not django_user.email_verified:
+                changes.append("Email verified: False -> True")
+                django_user.email_verified = True
+            if not changes:
+                counts['in_sync'] += 1
+                continue
+            to_update[django_user.pk] = django_user
+            if self.verbosity >= 2:
+                verb = "Would update" if dry_run else "Updated"
+                self.stdout.write(f"  {verb} Django user {email}: {', '.join(changes)}")
+
+        usernames = self._unique_usernames([self._username_for(email, record) for email, record, _ in to_create])
+        new_users = []
+        for (email, supabase_user, email_verified), username in zip(to_create, usernames):
+            user = User(
+                username=username,
+                email=email,
+                supabase_id=supabase_user.get('id'),
+                email_verified=email_verified,
+            )
+            # Same as the random password this used to get: the user resets it
+            user.set_unusable_password()
+            new_users.append(user)
+            if self.verbosity >= 2:
+                verb = "Would create" if dry_run else "Created"
+                self.stdout.write(f"  {verb} Django user: {email} (Supabase ID: {user.supabase_id})")
+
+        if not dry_run:
+            if to_update:
+                User.objects.bulk_update(list(to_update.values()), ['supabase_id', 'email_verified'], batch_size=self.batch_size)
+            if new_users:
+                User.objects.bulk_create(new_users, batch_size=self.batch_size)
+                UserProfile.objects.bulk_create(
+                    [UserProfile(user=user, supabase_uid=user.supabase_id, verified=user.email_verified) for user in new_users],
+                    batch_size=self.batch_size,
+                )
+        counts['updated'] += len(to_update)
+        counts['created'] += len(new_users)
+        return counts
+
+    def _username_for(self, email, supabase_user):
+        user_meta = supabase_user.get('raw_user_meta_data') or supabase_user.get('user_metadata') or {}
+        username = user_meta.get('username') if isinstance(user_meta, dict) else None
+        return (username or email.split('@')[0])[:USERNAME_MAX_LENGTH]
+
+    def _unique_usernames(self, wanted):
+        """``wanted`` made unique against the database and each other, with numeric suffixes as before."""
+        if not wanted:
+            return []
+        taken = set(User.objects.filter(username__in=set(wanted)).values_list('username', flat=True))
+        expanded = set()
+        result = []
+        for base in wanted:
+            username = base
+            if username in taken:
+                if base not in expanded:
+                    taken.update(User.objects.filter(username__startswith=base).values_list('username', flat=True))
+                    expanded.add(base)
                 counter = 1
-                while User.objects.filter(username=username).exists():
-                    username = f"{username_base}{counter}"
+                while f"{base}{counter}" in taken:
                     counter += 1
-                
-                # Check email verification status
-                email_verified = self._check_email_verified(supabase_user)
-                
-                if dry_run:
-                    self.stdout.write(f"  Would create Django user: {email} (Supabase ID: {user_id})")
-                else:
-                    try:
-                        new_user = User.objects.create_user(
-                            username=username,
-                            email=email,
-                            password=temp_password,
-                            supabase_id=user_id,
-                            email_verified=email_verified
-                        )
-                        self.stdout.write(self.style.SUCCESS(f"  Created Django user: {email} (Supabase ID: {user_id})"))
-                        
-                        # Create profile if needed
-                        try:
-                            profile = new_user.profile
-                        except Exception:
-                            # If UserProfile model exists and has a relationship to User
-                            try:
-                                from auth_app.models import UserProfile
-                                UserProfile.objects.create(
-                                    user=new_user,
-                                    supabase_uid=user_id,
-                                    verified=email_verified
-                                )
-                            except Exception:
-                                pass  # Profile model not available or has different structure
-                                
-                        created_count += 1
-                    except Exception as e:
-                        self.stdout.write(self.style.ERROR(f"  Error creating Django user {email}: {str(e)}"))
-                        error_count += 1
-                        
-        self.stdout.write(self.style.SUCCESS(f"\nSynchronization to Django completed: {created_count} created, {updated_count} updated, {error_count} errors"))
-    
-    def sync_to_supabase(self, django_users, supabase_users_by_email, supabase_users_by_id, supabase_url, headers, dry_run, force):
-        """Synchronize users from Django to Supabase"""
-        created_count = 0
-        updated_count = 0
-        error_count = 0
-        
+                username = f"{base}{counter}"
+            taken.add(username)
+            result.append(username)
+        return result
+
+    # Django -> Supabase
+
+    def sync_to_supabase(self, client, index, checkpoint, params, email_filter, dry_run, force):
+        """Confirm emails and (with --force) create missing Supabase users, one batch of Django users at a time."""
         self.stdout.write(self.style.SUCCESS("\nSynchronizing from Django to Supabase:"))
-        
-        for django_user in django_users:
+        last_pk = checkpoint.get('last_pk', 0) if checkpoint.get('phase') == 'to-supabase' else 0
+        queryset = User.objects.exclude(email__isnull=True).exclude(email='').order_by('pk')
+        if self.changed_after:
+            # New local users, and verified ones whose confirmation may not have reached Supabase yet
+            queryset = queryset.filter(Q(date_joined__gte=self.changed_after) | Q(email_verified=True))
+        if email_filter:
+            queryset = queryset.filter(email__iexact=email_filter)
+
+        with ThreadPoolExecutor(max_workers=client.workers, thread_name_prefix='supabase-sync') as pool:
+            while True:
+                batch = list(queryset.filter(pk__gt=last_pk)[:self.batch_size])
+                if not batch:
+                    break
+                self._sync_batch_to_supabase(client, pool, index, batch, dry_run, force)
+                last_pk = batch[-1].pk
+                if not dry_run:
+                    self.save_checkpoint(checkpoint, params, phase='to-supabase', page=self.last_page, last_pk=last_pk)
+
+    def _sync_batch_to_supabase(self, client, pool, index, batch, dry_run, force):
+        confirm, create = [], []
+        for django_user in batch:
             email = django_user.email.lower()
-            supabase_id = django_user.supabase_id
-            
-            if not email:
-                self.stdout.write(self.style.WARNING(f"  Skipping Django user with no email (ID: {django_user.id})"))
-                continue
-                
-            existing_supabase_user = supabase_users_by_email.get(email) or (supabase_id and supabase_users_by_id.get(supabase_id))
-            
-            if existing_supabase_user:
-                # User already exists in Supabase, update if needed
-                needs_update = False
-                changes = []
-                
-                # Check email verification status
-                email_confirmed = self._check_email_verified(existing_supabase_user)
-                if django_user.email_verified and not email_confirmed:
-                    changes.append("Email verification status")
-                    needs_update = True
-                
-                # Update user if needed
-                if needs_update:
-                    if dry_run:
-                        self.stdout.write(f"  Would update Supabase user {email}: {', '.join(changes)}")
-                    else:
-                        try:
-                            # Only update email verification status for now
-                            # More complex updates would require additional API calls
-                            if 'Email verification status' in changes:
-                                supabase_id = existing_supabase_user.get('id')
-                                if supabase_id:
-                                    self._confirm_supabase_email(supabase_url, headers, supabase_id)
-                                    
-                            self.stdout.write(self.style.SUCCESS(f"  Updated Supabase user {email}: {', '.join(changes)}"))
-                            updated_count += 1
-                        except Exception as e:
-                            self.stdout.write(self.style.ERROR(f"  Error updating Supabase user {email}: {str(e)}"))
-                            error_count += 1
-                else:
-                    self.stdout.write(f"  Supabase user {email} already in sync")
-                    
+            existing = index['by_email'].get(email)
+            if existing is None and django_user.supabase_id in index['by_id']:
+                existing = index['by_email'].get(index['by_id'][django_user.supabase_id])
+            if existing:
+                supabase_id, email_confirmed = existing
+                if django_user.email_verified and not email_confirmed and supabase_id:
+                    confirm.append((django_user, supabase_id))
             elif force:
-                # User does not exist in Supabase, create a new user
-                # Generate a random password
-                from django.utils.crypto import get_random_string
-                temp_password = get_random_string(16)
-                
-                # Prepare metadata
-                user_metadata = {
-                    "username": django_user.username,
-                    "created_via": "django_sync"
-                }
-                
-                if dry_run:
-                    self.stdout.write(f"  Would create Supabase user: {email}")
-                else:
-                    try:
-                        # Create user in Supabase
-                        response = self._create_supabase_user(
-                            supabase_url,
-                            headers,
-                            email,
-                            temp_password,
-                            user_metadata,
-                            django_user.email_verified
-                        )
-                        
-                        if response and response.get('id'):
-                            supabase_id = response.get('id')
-                            
-                            # Update Django user with Supabase ID
-                            django_user.supabase_id = supabase_id
-                            django_user.save(update_fields=['supabase_id'])
-                            
-                            self.stdout.write(self.style.SUCCESS(f"  Created Supabase user: {email} (ID: {supabase_id})"))
-                            created_count += 1
-                        else:
-                            self.stdout.write(self.style.ERROR(f"  Failed to create Supabase user {email}"))
-                            error_count += 1
-                    except Exception as e:
-                        self.stdout.write(self.style.ERROR(f"  Error creating Supabase user {email}: {str(e)}"))
-                        error_count += 1
+                create.append(django_user)
             else:
-                self.stdout.write(f"  Django user {email} not found in Supabase (use --force to create)")
-                
-        self.stdout.write(self.style.SUCCESS(f"\nSynchronization to Supabase completed: {created_count} created, {updated_count} updated, {error_count} errors"))
-    
-    def _check_email_verified(self, user_record):
-        """Helper function to check if email is verified based on Supabase user record"""
-        # Check confirmation timestamp
-        if user_record.get('email_confirmed_at'):
-            return True
-            
-        # Check raw user metadata
-        user_meta = user_record.get('raw_user_meta_data', {})
-        if isinstance(user_meta, dict) and user_meta.get('email_verified') is True:
-            return True
-            
-        # Check confirmed_at field  
-        if user_record.get('confirmed_at'):
-            return True
-            
-        return False
-        
-    def _confirm_supabase_email(self, supabase_url, headers, user_id):
-        """Confirm a user's email in Supabase"""
-        try:
-            update_url = f"{supabase_url}/auth/v1/admin/users/{user_id}"
-            now = datetime.utcnow().isoformat()
-            
-            update_data = {
-                "email_confirmed_at": now,
-                "confirmed_at": now
-            }
-            
-            response = requests.put(update_url, headers=headers, json=update_data)
-            
-            if response.status_code != 200:
-                self.stdout.write(self.style.ERROR(
-                    f"Failed to confirm email: {response.status_code} - {response.text}"
-                ))
-                return False
-                
-            return True
-            
-        except Exception as e:
-            self.stdout.write(self.style.ERROR(f"Error confirming email: {str(e)}"))
-            return False
-            
-    def _create_supabase_user(self, supabase_url, headers, email, password, metadata, email_verified):
-        """Create a new user in Supabase"""
-        try:
-            users_url = f"{supabase_url}/auth/v1/admin/users"
-            
-            user_data = {
-                "email": email,
-                "password": password,
-                "email_confirm": email_verified,
-                "user_metadata": metadata
-            }
-            
-            if email_verified:
-                now = datetime.utcnow().isoformat()
-                user_data["email_confirmed_at"] = now
-                user_data["confirmed_at"] = now
-            
-            response = requests.post(users_url, headers=headers, json=user_data)
-            
-            if response.status_code not in (200, 201):
-                self.stdout.write(self.style.ERROR(
-                    f"Failed to create user: {response.status_code} - {response.text}"
-                ))
-                return None
-                
-            return response.json()
-        except Exception as e:
-            self.stdout.write(self.style.ERROR(f"Error creating Supabase user: {str(e)}"))
-            return None 
\ No newline at end of file
+                self.stats['supabase_missing'] += 1
+                if self.verbosity >= 2:
+                    self.stdout.write(f"  Django user {email} not found in Supabase (use --force to create)")
+
+        if dry_run:
+            for django_user, _ in confirm:
+                self.stdout.write(f"  Would update Supabase user {django_user.email}: Email verification status")
+            for django_user in create:
+                self.stdout.write(f"  Would create Supabase user: {django_user.email}")
+            self.stats['supabase_updated'] += len(confirm)
+            self.stats['supabase_created'] += len(create)
+            return
+
+        def create_remote(django_user):
+            return client.create_user(
+                django_user.email.lower(),
+                get_random_string(16),
+                {"username": django_user.username, "created_via": "django_sync"},
+                django_user.email_verified,
+            )
+
+        confirm_futures = [(django_user, pool.submit(client.confirm_email, supabase_id)) for django_user, supabase_id in confirm]
+        create_futures = [(django_user, pool.submit(create_remote, django_user)) for django_user in create]
+
+        for django_user, future in confirm_futures:
+            try:
+                future.result()
+                self.stats['supabase_updated'] += 1
+            except Exception as e:
+                self.stdout.write(self.style.ERROR(f"  Error updating Supabase user {django_user.email}: {str(e)}"))
+                self.stats['supabase_errors'] += 1
+
+        linked = []
+        for django_user, future in create_futures:
+            try:
+                response = future.result()
+            except Exception as e:
+                self.stdout.write(self.style.ERROR(f"  Error creating Supabase user {django_user.email}: {str(e)}"))
+                self.stats['supabase_errors'] += 1
+                continue
+            supabase_id = (response or {}).get('id')
+            if not supabase_id:
+                self.stdout.write(self.style.ERROR(f"  Failed to create Supabase user {django_user.email}"))
+                self.stats['supabase_errors'] += 1
+                continue
+            django_user.supabase_id = supabase_id
+            linked.append(django_user)
+            self.stats['supabase_created'] += 1
+        if linked:
+            with transaction.atomic():
+                User.objects.bulk_update(linked, ['supabase_id'], batch_size=self.batch_size)
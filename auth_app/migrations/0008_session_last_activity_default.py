@@ -0,0 +1,19 @@
+# Generated by Django 4.2 on 2026-10-19 10:05
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth_app', '0007_outboundemail'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='session',
+            name='last_activity',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2 on 2026-10-19 10:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth_app', '0008_session_last_activity_default'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usersyncschedule',
+            name='full_sync_interval',
+            field=models.PositiveIntegerField(default=24, help_text='Hours between full reconciliations (0 compares every user on every run)'),
+        ),
+        migrations.AddField(
+            model_name='usersyncschedule',
+            name='last_full_sync',
+            field=models.DateTimeField(blank=True, help_text='When every user was last compared', null=True),
+        ),
+        migrations.AddField(
+            model_name='usersyncschedule',
+            name='watermark',
+            field=models.DateTimeField(blank=True, help_text='Newest Supabase change seen by the last successful sync; the next run only applies users changed since', null=True),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 4.2 on 2026-10-19 10:19
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth_app', '0009_usersyncschedule_watermark'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usersyncschedule',
+            name='lease_token',
+            field=models.UUIDField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='usersyncschedule',
+            name='locked_until',
+            field=models.DateTimeField(blank=True, help_text='Lease of the scheduler running it', null=True),
+        ),
+        migrations.CreateModel(
+            name='UserSyncRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('running', 'Running'), ('succeeded', 'Succeeded'), ('failed', 'Failed')], default='running', max_length=10)),
+                ('worker', models.CharField(blank=True, help_text='Host and process that ran it', max_length=255)),
+                ('started_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('output', models.TextField(blank=True)),
+                ('stats', models.JSONField(blank=True, null=True)),
+                ('schedule', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='runs', to='auth_app.usersyncschedule')),
+            ],
+            options={
+                'verbose_name': 'User Sync Run',
+                'verbose_name_plural': 'User Sync Runs',
+                'ordering': ['-started_at'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='usersyncrun',
+            index=models.Index(fields=['schedule', 'started_at'], name='auth_app_us_schedul_5b9437_idx'),
+        ),
+    ]
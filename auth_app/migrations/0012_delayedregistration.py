@@ -0,0 +1,32 @@
+# Generated by Django 4.2 on 2026-10-19 10:28
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth_app', '0011_webhookevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DelayedRegistration',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('registered', 'Registered'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_error', models.TextField(blank=True)),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='delayed_registration', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Delayed Registration',
+                'verbose_name_plural': 'Delayed Registrations',
+            },
+        ),
+    ]
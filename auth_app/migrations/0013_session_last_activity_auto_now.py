@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-19 10:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth_app', '0012_delayedregistration'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='session',
+            name='last_activity',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
@@ -21,29 +21,26 @@ class User(AbstractUser):
     recovery_codes = models.TextField(null=True, blank=True)
     verification_tokens = models.JSONField(null=True, blank=True)
     
+    # Login telemetry goes through auth_app.telemetry, which batches the writes;
+    # only lock changes are written immediately
     def update_last_login(self):
-        self.last_login_at = timezone.now()
-        self.save(update_fields=['last_login_at'])
+        from .telemetry import record_login
+        record_login(self)
 
     def increment_failed_attempts(self):
-        self.failed_login_attempts += 1
-        if self.failed_login_attempts >= 5:
-            self.account_locked_until = timezone.now() + timezone.timedelta(minutes=15)
-        self.save(update_fields=['failed_login_attempts', 'account_locked_until'])
+        from .telemetry import record_failure
+        record_failure(self, lock_minutes=15)
 
     def reset_login_attempts(self):
-        self.failed_login_attempts = 0
-        self.account_locked_until = None
-        self.save(update_fields=['failed_login_attempts', 'account_locked_until'])
+        from .telemetry import reset_failures
+        reset_failures(self)
 
     def active_sessions(self):
         return self.session_set.filter(expires_at__gt=timezone.now())
 
     def increment_login_attempts(self):
-        self.failed_login_attempts += 1
-        if self.failed_login_attempts >= 5:
-            self.account_locked_until = timezone.now() + timezone.timedelta(minutes=30)
-        self.save(update_fields=['failed_login_attempts', 'account_locked_until'])
+        from .telemetry import record_failure
+        record_failure(self, lock_minutes=30)
 
     def __str__(self):
         return self.email or self.username
@@ -119,6 +116,13 @@ class UserSyncSchedule(models.Model):
     last_run = models.DateTimeField(null=True, blank=True, help_text="When the sync was last executed")
     next_run = models.DateTimeField(null=True, blank=True, help_text="When the sync is scheduled to run next")
     last_status = models.TextField(blank=True, help_text="Status of the last sync operation")
+    watermark = models.DateTimeField(null=True, blank=True,
+                                     help_text="Newest Supabase change seen by the last successful sync; the next run only applies users changed since")
+    last_full_sync = models.DateTimeField(null=True, blank=True, help_text="When every user was last compared")
+    full_sync_interval = models.PositiveIntegerField(default=24,
+                                                     help_text="Hours between full reconciliations (0 compares every user on every run)")
+    locked_until = models.DateTimeField(null=True, blank=True, help_text="Lease of the scheduler running it")
+    lease_token = models.UUIDField(null=True, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -129,21 +133,152 @@ class UserSyncSchedule(models.Model):
     def __str__(self):
         return f"User Sync ({self.frequency}, {self.direction})"
     
+    def compute_next_run(self, now=None):
+        """The next slot after ``now`` for this schedule's frequency"""
+        import datetime
+        from django.utils import timezone
+
+        now = now or timezone.now()
+        if self.frequency == 'hourly':
+            return now.replace(minute=0, second=0, microsecond=0) + datetime.timedelta(hours=1)
+        if self.frequency == 'weekly':
+            # Next Monday at midnight
+            days_ahead = 7 - now.weekday() if now.weekday() > 0 else 7
+            return now.replace(hour=0, minute=0, second=0, microsecond=0) + datetime.timedelta(days=days_ahead)
+        return now.replace(hour=0, minute=0, second=0, microsecond=0) + datetime.timedelta(days=1)
+
     def save(self, *args, **kwargs):
         # Calculate next run time based on frequency
-        import datetime
         from django.utils import timezone
         
         now = timezone.now()
         
         if not self.next_run or self.next_run < now:
-            if self.frequency == 'hourly':
-                self.next_run = now.replace(minute=0, second=0, microsecond=0) + datetime.timedelta(hours=1)
-            elif self.frequency == 'daily':
-                self.next_run = now.replace(hour=0, minute=0, second=0, microsecond=0) + datetime.timedelta(days=1)
-            elif self.frequency == 'weekly':
-                # Set to next Monday at midnight
-                days_ahead = 7 - now.weekday() if now.weekday() > 0 else 7
-                self.next_run = now.replace(hour=0, minute=0, second=0, microsecond=0) + datetime.timedelta(days=days_ahead)
+            self.next_run = self.compute_next_run(now)
         
         super().save(*args, **kwargs)
+
+    def full_sync_due(self, now=None):
+        """Whether the next run should compare every user instead of only those changed since the watermark"""
+        import datetime
+        from django.utils import timezone
+
+        if self.watermark is None or self.last_full_sync is None or not self.full_sync_interval:
+            return True
+        return self.last_full_sync + datetime.timedelta(hours=self.full_sync_interval) <= (now or timezone.now())
+
+class UserSyncRun(models.Model):
+    """One execution of a UserSyncSchedule, with its captured output"""
+    STATUS_CHOICES = [
+        ('running', 'Running'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+    ]
+
+    schedule = models.ForeignKey(UserSyncSchedule, on_delete=models.CASCADE, related_name='runs')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='running')
+    worker = models.CharField(max_length=255, blank=True, help_text="Host and process that ran it")
+    started_at = models.DateTimeField(default=timezone.now)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    output = models.TextField(blank=True)
+    stats = models.JSONField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "User Sync Run"
+        verbose_name_plural = "User Sync Runs"
+        ordering = ['-started_at']
+        indexes = [
+            models.Index(fields=['schedule', 'started_at']),
+        ]
+
+    def __str__(self):
+        return f"Sync run {self.pk} of schedule {self.schedule_id} ({self.status})"
+
+class DelayedRegistration(models.Model):
+    """Progress of registering a local-only user in Supabase, kept between process_delayed_registrations runs"""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('registered', 'Registered'),
+        ('failed', 'Failed'),
+    ]
+
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='delayed_registration')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name = "Delayed Registration"
+        verbose_name_plural = "Delayed Registrations"
+
+    def __str__(self):
+        return f"Supabase registration of {self.user} ({self.status})"
+
+class OutboundEmail(models.Model):
+    """An email waiting in (or delivered from) the outbox, for the recipients of a single domain"""
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('dead', 'Dead'),
+    ]
+
+    sender = models.CharField(max_length=255)
+    recipients = models.JSONField(default=list)
+    domain = models.CharField(max_length=255, help_text="Recipient domain, used for rate limiting")
+    subject = models.CharField(max_length=255, blank=True)
+    raw_message = models.BinaryField(help_text="The fully rendered MIME message")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    locked_until = models.DateTimeField(null=True, blank=True, help_text="Lease of the worker delivering it")
+    claim_token = models.UUIDField(null=True, blank=True, editable=False)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Outbound Email"
+        verbose_name_plural = "Outbound Emails"
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+            models.Index(fields=['status', 'sent_at', 'domain']),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} -> {', '.join(self.recipients)} ({self.status})"
+
+class WebhookEvent(models.Model):
+    """A Supabase webhook event in the inbox, applied by the process_webhooks worker"""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('done', 'Done'),
+        ('dead', 'Dead'),
+    ]
+
+    event_id = models.CharField(max_length=255, unique=True, help_text="Event or request ID, used to drop redeliveries")
+    event_type = models.CharField(max_length=50)
+    subject = models.CharField(max_length=255, help_text="Supabase user ID (or email) the event is about; events are applied in order per subject")
+    payload = models.JSONField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    locked_until = models.DateTimeField(null=True, blank=True, help_text="Lease of the worker applying it")
+    claim_token = models.UUIDField(null=True, blank=True, editable=False)
+    last_error = models.TextField(blank=True)
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Webhook Event"
+        verbose_name_plural = "Webhook Events"
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+            models.Index(fields=['subject', 'status']),
+        ]
+
+    def __str__(self):
+        return f"{self.event_type} for {self.subject} ({self.status})"
@@ -0,0 +1,292 @@
+"""
+Durable email outbox.
+
+``OutboxEmailBackend`` is the ``EMAIL_BACKEND``: sending a message renders it
+and inserts one ``OutboundEmail`` row per recipient domain, so a request never
+waits on SMTP, and a message sent inside a transaction that rolls back is never
+delivered.
+
+``deliver`` (run by the ``deliver_outbox`` command) claims due rows under a
+lease, sends them over one reused connection of ``OUTBOX_DELIVERY_BACKEND``,
+retries transient failures with exponential backoff and jitter, dead-letters
+permanent failures and rows that ran out of attempts, and keeps every domain
+under its per-minute limit. Delivery is at-least-once: a worker that dies
+mid-batch leaves its rows to be picked up again once the lease expires.
+"""
+import logging
+import random
+import smtplib
+import socket
+import uuid
+from collections import defaultdict
+from datetime import timedelta
+from email.utils import parseaddr
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.mail.message import sanitize_address
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+from .models import OutboundEmail
+
+logger = logging.getLogger(__name__)
+
+DELIVERY_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+BATCH_SIZE = 100
+MAX_ATTEMPTS = 8
+BACKOFF_BASE = 30  # seconds, doubled after every failed attempt
+BACKOFF_MAX = 6 * 60 * 60
+LEASE_SECONDS = 300
+DEFAULT_DOMAIN_RATE = 60  # messages per minute
+CANDIDATE_FACTOR = 5
+KEEP_SENT_DAYS = 7
+
+
+def _setting(name, default):
+    return getattr(settings, f'OUTBOX_{name}', default)
+
+
+def delivery_connection(**kwargs):
+    """A connection of the backend that actually delivers mail (SMTP unless configured otherwise)."""
+    return get_connection(_setting('DELIVERY_BACKEND', DELIVERY_BACKEND), **kwargs)
+
+
+def _domain(address):
+    return parseaddr(address)[1].rpartition('@')[2].lower()
+
+
+def _rows_for(message):
+    recipients = message.recipients()
+    if not recipients:
+        return []
+    encoding = message.encoding or settings.DEFAULT_CHARSET
+    raw = message.message().as_bytes()
+    by_domain = defaultdict(list)
+    for address in recipients:
+        address = sanitize_address(address, encoding)
+        by_domain[_domain(address)].append(address)
+    return [
+        OutboundEmail(
+            sender=sanitize_address(message.from_email, encoding), recipients=addresses, domain=domain,
+            subject=str(message.subject)[:255], raw_message=raw,
+        )
+        for domain, addresses in by_domain.items()
+    ]
+
+
+class OutboxEmailBackend(BaseEmailBackend):
+    """Email backend that stores messages in the outbox instead of sending them."""
+
+    def send_messages(self, email_messages):
+        rows, queued = [], 0
+        for message in email_messages:
+            try:
+                message_rows = _rows_for(message)
+            except Exception:
+                if not self.fail_silently:
+                    raise
+                continue
+            if message_rows:
+                rows.extend(message_rows)
+                queued += 1
+        if not rows:
+            return 0
+        try:
+            OutboundEmail.objects.bulk_create(rows)
+        except Exception:
+            if not self.fail_silently:
+                raise
+            return 0
+        return queued
+
+
+class _RawMIME:
+    """Just enough of a ``SafeMIMEMessage`` for the delivery backends to send a stored message."""
+
+    def __init__(self, raw):
+        self.raw = raw.replace(b'\r\n', b'\n')
+
+    def as_bytes(self, unixfrom=False, linesep='\n'):
+        return self.raw if linesep == '\n' else self.raw.replace(b'\n', linesep.encode())
+
+    def get_charset(self):
+        return None
+
+
+class QueuedEmail(EmailMessage):
+    """An outbox row as an ``EmailMessage`` whose ``message()`` is the stored MIME message."""
+
+    def __init__(self, row):
+        super().__init__(subject=row.subject, from_email=row.sender, to=row.recipients)
+        self.raw_message = bytes(row.raw_message)
+
+    def message(self):
+        return _RawMIME(self.raw_message)
+
+
+def backoff(attempts):
+    """Seconds to wait before retrying after ``attempts`` failures, with jitter."""
+    delay = min(_setting('BACKOFF_MAX', BACKOFF_MAX), _setting('BACKOFF_BASE', BACKOFF_BASE) * 2 ** (attempts - 1))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def _is_permanent(error):
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(code >= 500 for code, _ in error.recipients.values())
+    if isinstance(error, smtplib.SMTPAuthenticationError):
+        return False
+    return isinstance(error, smtplib.SMTPResponseException) and error.smtp_code >= 500
+
+
+def _is_connection_error(error):
+    # Not OSError: every SMTPException is one, including per-message refusals
+    return isinstance(error, (smtplib.SMTPServerDisconnected, ConnectionError, socket.timeout))
+
+
+def _due(now):
+    # Rows left in 'sending' by a worker that died are due again once their lease runs out
+    return (Q(status='queued') | Q(status='sending', locked_until__lte=now)) & Q(next_attempt_at__lte=now)
+
+
+def domain_budgets(domains, now):
+    """How many more messages each of ``domains`` may be sent in the current minute."""
+    limits = _setting('DOMAIN_RATE_LIMITS', {})
+    default = _setting('DEFAULT_DOMAIN_RATE', DEFAULT_DOMAIN_RATE)
+    used = dict(
+        OutboundEmail.objects.filter(domain__in=domains)
+        .filter(Q(status='sent', sent_at__gt=now - timedelta(minutes=1)) | Q(status='sending', locked_until__gt=now))
+        .values('domain').annotate(count=Count('id')).values_list('domain', 'count')
+    )
+    return {domain: max(0, limits.get(domain, default) - used.get(domain, 0)) for domain in domains}
+
+
+def claim(limit=BATCH_SIZE, now=None):
+    """
+    Lease up to ``limit`` due rows, oldest first, without exceeding any
+    domain's budget. Returns the claimed rows.
+    """
+    now = now or timezone.now()
+    candidates = list(
+        OutboundEmail.objects.filter(_due(now)).order_by('next_attempt_at', 'id')
+        .values_list('id', 'domain')[:limit * CANDIDATE_FACTOR]
+    )
+    if not candidates:
+        return []
+    budgets = domain_budgets({domain for _, domain in candidates}, now)
+    picked = []
+    for row_id, domain in candidates:
+        if budgets[domain] > 0:
+            budgets[domain] -= 1
+            picked.append(row_id)
+            if len(picked) >= limit:
+                break
+    if not picked:
+        return []
+    # Compare-and-set: only rows still due are taken, so concurrent workers never share a row
+    token = uuid.uuid4()
+    OutboundEmail.objects.filter(_due(now), id__in=picked).update(
+        status='sending', claim_token=token, locked_until=now + timedelta(seconds=LEASE_SECONDS),
+    )
+    return list(OutboundEmail.objects.filter(claim_token=token, status='sending').order_by('next_attempt_at', 'id'))
+
+
+def _mine(row):
+    return OutboundEmail.objects.filter(pk=row.pk, claim_token=row.claim_token, status='sending')
+
+
+def _mark_sent(row):
+    _mine(row).update(
+        status='sent', sent_at=timezone.now(), attempts=F('attempts') + 1,
+        locked_until=None, claim_token=None, last_error='',
+    )
+
+
+def _mark_failed(row, error):
+    """Schedule a retry of ``row`` or dead-letter it. Returns 'retried' or 'dead'."""
+    attempts = row.attempts + 1
+    dead = _is_permanent(error) or attempts >= _setting('MAX_ATTEMPTS', MAX_ATTEMPTS)
+    _mine(row).update(
+        status='dead' if dead else 'queued', attempts=attempts, last_error=str(error)[:2000],
+        next_attempt_at=timezone.now() + timedelta(seconds=0 if dead else backoff(attempts)),
+        locked_until=None, claim_token=None,
+    )
+    if dead:
+        logger.error(f"Dead-lettered email {row.pk} to {', '.join(row.recipients)} after {attempts} attempt(s): {str(error)}")
+    return 'dead' if dead else 'retried'
+
+
+def _release(rows, error):
+    """Put claimed rows back without using up an attempt (the server, not the message, failed)."""
+    for row in rows:
+        _mine(row).update(
+            status='queued', locked_until=None, claim_token=None, last_error=str(error)[:2000],
+            next_attempt_at=timezone.now() + timedelta(seconds=backoff(1)),
+        )
+
+
+def deliver(batch_size=BATCH_SIZE, connection=None):
+    """
+    Claim and send one batch. ``connection`` (a delivery backend instance)
+    is reused and left open if given. Returns counts of sent, retried, dead
+    and deferred messages.
+    """
+    rows = claim(batch_size)
+    totals = defaultdict(int)
+    if not rows:
+        return dict(totals)
+    own_connection = connection is None
+    if own_connection:
+        connection = delivery_connection(fail_silently=False)
+    try:
+        try:
+            connection.open()
+        except Exception as e:
+            logger.error(f"Could not connect to the mail server: {str(e)}")
+            _release(rows, e)
+            totals['deferred'] += len(rows)
+            return dict(totals)
+
+        for index, row in enumerate(rows):
+            try:
+                connection.send_messages([QueuedEmail(row)])
+            except Exception as e:
+                if not _is_connection_error(e):
+                    totals[_mark_failed(row, e)] += 1
+                    continue
+                _release([row], e)
+                totals['deferred'] += 1
+                connection.close()
+                try:
+                    connection.open()
+                except Exception as e:
+                    logger.error(f"Could not reconnect to the mail server: {str(e)}")
+                    _release(rows[index + 1:], e)
+                    totals['deferred'] += len(rows) - index - 1
+                    break
+                continue
+            _mark_sent(row)
+            totals['sent'] += 1
+    finally:
+        if own_connection:
+            connection.close()
+    return dict(totals)
+
+
+def requeue_dead(ids=None):
+    """Give dead-lettered messages (all, or ``ids``) a fresh set of attempts. Returns how many."""
+    queryset = OutboundEmail.objects.filter(status='dead')
+    if ids is not None:
+        queryset = queryset.filter(id__in=ids)
+    return queryset.update(status='queued', attempts=0, next_attempt_at=timezone.now(), last_error='')
+
+
+def prune_sent(days=KEEP_SENT_DAYS):
+    """Delete sent messages older than ``days``. Returns how many."""
+    deleted, _ = OutboundEmail.objects.filter(status='sent', sent_at__lt=timezone.now() - timedelta(days=days)).delete()
+    return deleted
+
+
+def stats():
+    return dict(OutboundEmail.objects.values('status').annotate(count=Count('id')).values_list('status', 'count'))
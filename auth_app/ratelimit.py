@@ -0,0 +1,202 @@
+"""
+Rate limiting for the auth endpoints.
+
+``RateLimitMiddleware`` applies the rules in ``RATE_LIMITS`` to requests
+whose URL name matches, e.g.::
+
+    RATE_LIMITS = {
+        'login': [
+            {'key': 'ip', 'rate': '20/m', 'methods': ['POST']},
+            {'key': 'post:username', 'rate': '5/m', 'methods': ['POST']},
+        ],
+    }
+
+``key`` is ``'ip'`` (``client_ip``), ``'post:<field>'``, ``'get:<field>'``
+or ``'param:<field>'`` (either); requests without a value for the key are
+not limited by that rule. ``rate`` is ``<count>/<period>`` with the period in
+``s``, ``m``, ``h`` or ``d`` (optionally with a multiplier, ``10/5m``), and
+``burst`` (default: the count) is how many may arrive at once.
+
+Each rule is a GCRA (generic cell rate algorithm) limit, which behaves like
+a sliding window but keeps a single number per key: its theoretical arrival
+time. A decision is one atomic step:
+
+* Redis cache: a Lua script, one round trip;
+* local-memory cache: a read and a write under a process lock, no round trip;
+* any other backend: a fixed-window counter with ``cache.incr``, one round
+  trip (plus an ``add`` the first time a window is used).
+"""
+import re
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.http import HttpResponse, JsonResponse
+
+try:
+    from django.core.cache.backends.redis import RedisCache
+except ImportError:
+    RedisCache = None
+
+KEY_PREFIX = 'ratelimit'
+_RATE_RE = re.compile(r'^\s*(\d+)\s*/\s*(\d*)\s*([smhd])\s*$')
+_PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+_GCRA_SCRIPT = """
+local now = tonumber(ARGV[1])
+local interval = tonumber(ARGV[2])
+local burst = tonumber(ARGV[3])
+local tat = tonumber(redis.call('GET', KEYS[1]) or now)
+if tat < now then tat = now end
+local new_tat = tat + interval
+local allow_at = new_tat - interval * burst
+if now < allow_at then
+    return {0, tostring(allow_at - now)}
+end
+redis.call('SET', KEYS[1], tostring(new_tat), 'PX', math.ceil((new_tat - now) * 1000))
+return {1, '0'}
+"""
+
+_local_lock = threading.Lock()
+_scripts = {}
+
+
+def parse_rate(rate):
+    """``'10/5m'`` -> ``(10, 300)``: count and period in seconds."""
+    match = _RATE_RE.match(rate)
+    if not match:
+        raise ValueError(f"Invalid rate '{rate}'")
+    count, multiplier, unit = match.groups()
+    return int(count), int(multiplier or 1) * _PERIODS[unit]
+
+
+def _cache():
+    return caches[getattr(settings, 'RATE_LIMIT_CACHE_ALIAS', 'default')]
+
+
+def _gcra_local(cache, key, now, interval, burst):
+    with _local_lock:
+        tat = max(cache.get(key) or now, now)
+        new_tat = tat + interval
+        allow_at = new_tat - interval * burst
+        if now < allow_at:
+            return False, allow_at - now
+        cache.set(key, new_tat, timeout=new_tat - now)
+        return True, 0
+
+
+def _gcra_redis(cache, key, now, interval, burst):
+    client = cache._cache.get_client(key, write=True)
+    script = _scripts.get(id(client))
+    if script is None:
+        script = _scripts[id(client)] = client.register_script(_GCRA_SCRIPT)
+    allowed, retry_after = script(keys=[cache.make_key(key)], args=[now, interval, burst])
+    return bool(int(allowed)), float(retry_after)
+
+
+def _fixed_window(cache, key, now, count, period):
+    window = int(now // period)
+    window_key = f'{key}:{window}'
+    try:
+        used = cache.incr(window_key)
+    except ValueError:
+        if cache.add(window_key, 1, timeout=period + 1):
+            used = 1
+        else:
+            used = cache.incr(window_key)
+    if used > count:
+        return False, (window + 1) * period - now
+    return True, 0
+
+
+def hit(key, rate, burst=None, now=None):
+    """
+    Count one request against ``key`` limited to ``rate``. Returns
+    ``(allowed, retry_after_seconds)``.
+    """
+    count, period = parse_rate(rate)
+    burst = burst or count
+    interval = period / count
+    now = time.time() if now is None else now
+    cache = _cache()
+    key = f'{KEY_PREFIX}:{key}'
+    if RedisCache is not None and isinstance(cache, RedisCache):
+        return _gcra_redis(cache, key, now, interval, burst)
+    if isinstance(cache, LocMemCache):
+        return _gcra_local(cache, key, now, interval, burst)
+    return _fixed_window(cache, key, now, count, period)
+
+
+def client_ip(request):
+    """
+    The client address as seen by the outermost of ``RATE_LIMIT_TRUSTED_PROXIES``
+    proxies. Each proxy appends the address it received the request from to
+    ``X-Forwarded-For``, so only the last that many entries can be trusted;
+    anything to their left is whatever the client sent. With no trusted
+    proxies, or fewer entries than proxies, ``REMOTE_ADDR`` is used.
+    """
+    proxies = getattr(settings, 'RATE_LIMIT_TRUSTED_PROXIES', 1)
+    forwarded = [ip.strip() for ip in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if ip.strip()]
+    if proxies > 0 and len(forwarded) >= proxies:
+        return forwarded[-proxies]
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def request_key(request, key):
+    """The value a rule is keyed on for ``request``, or ``None``."""
+    if key == 'ip':
+        return client_ip(request) or None
+    source, _, field = key.partition(':')
+    if source == 'post':
+        value = request.POST.get(field)
+    elif source == 'get':
+        value = request.GET.get(field)
+    elif source == 'param':
+        value = request.POST.get(field) or request.GET.get(field)
+    else:
+        raise ValueError(f"Invalid rate limit key '{key}'")
+    value = (value or '').strip().lower()
+    return value[:254] or None
+
+
+class RateLimitMiddleware:
+    """Reject requests over the ``RATE_LIMITS`` of their route with HTTP 429."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not getattr(settings, 'RATE_LIMIT_ENABLED', True):
+            return None
+        match = request.resolver_match
+        rules = getattr(settings, 'RATE_LIMITS', {}).get(match.url_name if match else None)
+        if not rules:
+            return None
+        for rule in rules:
+            if rule.get('methods') and request.method not in rule['methods']:
+                continue
+            value = request_key(request, rule['key'])
+            if value is None:
+                continue
+            allowed, retry_after = hit(f"{match.url_name}:{rule['key']}:{value}", rule['rate'], rule.get('burst'))
+            if not allowed:
+                return self.limited(request, retry_after)
+        return None
+
+    def limited(self, request, retry_after):
+        message = 'Too many requests. Please wait a moment and try again.'
+        wants_json = (
+            request.headers.get('x-requested-with') == 'XMLHttpRequest'
+            or 'application/json' in request.headers.get('accept', '')
+        )
+        if wants_json:
+            response = JsonResponse({'error': message, 'retry_after': int(retry_after) + 1}, status=429)
+        else:
+            response = HttpResponse(message, status=429, content_type='text/plain')
+        response['Retry-After'] = str(int(retry_after) + 1)
+        return response
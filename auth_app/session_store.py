@@ -0,0 +1,234 @@
+"""
+Write-coalescing database session backend.
+
+With ``SESSION_SAVE_EVERY_REQUEST`` the stock database backend issues one
+UPDATE of ``django_session`` per page view just to push ``expire_date``
+forward, and on SQLite every one of them takes the database write lock.
+
+This backend keeps the database as the source of truth but:
+
+* serves reads from a small in-process tier (entries live for
+  ``SESSION_LOCAL_CACHE_TTL`` seconds) and then from the shared cache
+  (``SESSION_CACHE_ALIAS``) before falling back to the database;
+* writes session *data* changes through immediately, as before;
+* skips a save that only refreshes the expiry unless it moves ``expire_date``
+  by more than ``SESSION_EXPIRY_WRITE_THRESHOLD`` seconds, so a session may
+  expire at most that much earlier than with the stock backend;
+* queues the expiry refreshes that do pass the threshold and writes them in
+  one ``bulk_update`` once ``SESSION_WRITE_BATCH_SIZE`` are pending or
+  ``SESSION_WRITE_FLUSH_INTERVAL`` seconds have passed (and at exit).
+
+A logout in one process can be seen by another only after its in-process
+entry expires, so keep ``SESSION_LOCAL_CACHE_TTL`` short (0 disables it).
+The "shared" tier is only shared if ``SESSION_CACHE_ALIAS`` points at a
+backend every worker can reach, such as Redis. With the default LocMem cache
+(no ``CACHES`` is configured) each process has its own copy: with more than
+one worker, configure ``CACHES``, or a logout is only seen by other workers
+once their cached entry expires, which can take up to the session timeout.
+``stats`` counts what happened, for ``benchmark_session_writes.py``.
+"""
+import atexit
+import logging
+import threading
+from collections import Counter, OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.sessions.backends.base import CreateError, UpdateError
+from django.contrib.sessions.backends.db import SessionStore as DBStore
+from django.core.cache import caches
+from django.db import DatabaseError, IntegrityError, router, transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'auth_app.session_store'
+DEFAULT_EXPIRY_WRITE_THRESHOLD = 3600
+DEFAULT_LOCAL_CACHE_TTL = 2
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_FLUSH_INTERVAL = 10
+LOCAL_CACHE_SIZE = 10000
+
+stats = Counter()
+
+_local = OrderedDict()
+_local_lock = threading.Lock()
+_pending = {}
+_pending_lock = threading.Lock()
+_last_flush = [timezone.now()]
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _shared_cache():
+    return caches[settings.SESSION_CACHE_ALIAS]
+
+
+def _local_get(session_key):
+    with _local_lock:
+        entry = _local.get(session_key)
+        if entry is None:
+            return None
+        stored_at, value = entry
+        if (timezone.now() - stored_at).total_seconds() > _setting('SESSION_LOCAL_CACHE_TTL', DEFAULT_LOCAL_CACHE_TTL):
+            del _local[session_key]
+            return None
+        _local.move_to_end(session_key)
+        return value
+
+
+def _remember(session_key, expire_date, session_data):
+    """Put ``(expire_date, session_data)`` in both cache tiers."""
+    value = (expire_date, session_data)
+    if _setting('SESSION_LOCAL_CACHE_TTL', DEFAULT_LOCAL_CACHE_TTL) > 0:
+        with _local_lock:
+            _local[session_key] = (timezone.now(), value)
+            _local.move_to_end(session_key)
+            while len(_local) > LOCAL_CACHE_SIZE:
+                _local.popitem(last=False)
+    timeout = (expire_date - timezone.now()).total_seconds()
+    if timeout > 0:
+        try:
+            _shared_cache().set(KEY_PREFIX + session_key, value, int(timeout))
+        except Exception as e:
+            logger.warning(f"Session cache unavailable: {str(e)}")
+
+
+def _forget(session_key):
+    with _local_lock:
+        _local.pop(session_key, None)
+    with _pending_lock:
+        _pending.pop(session_key, None)
+    try:
+        _shared_cache().delete(KEY_PREFIX + session_key)
+    except Exception as e:
+        logger.warning(f"Session cache unavailable: {str(e)}")
+
+
+def flush_pending():
+    """Write every queued expiry refresh with one ``bulk_update``. Returns how many."""
+    with _pending_lock:
+        batch = dict(_pending)
+        _pending.clear()
+        _last_flush[0] = timezone.now()
+    if not batch:
+        return 0
+    model = SessionStore.get_model_class()
+    try:
+        with transaction.atomic(using=router.db_for_write(model)):
+            model.objects.bulk_update(
+                [model(session_key=key, expire_date=expire_date) for key, expire_date in batch.items()],
+                ['expire_date'],
+                batch_size=_setting('SESSION_WRITE_BATCH_SIZE', DEFAULT_BATCH_SIZE),
+            )
+    except DatabaseError as e:
+        logger.error(f"Error flushing {len(batch)} session expiry update(s): {str(e)}")
+        with _pending_lock:
+            for key, expire_date in batch.items():
+                _pending.setdefault(key, expire_date)
+        return 0
+    stats['flushes'] += 1
+    stats['db_writes'] += 1
+    return len(batch)
+
+
+def _queue_expiry(session_key, expire_date):
+    with _pending_lock:
+        _pending[session_key] = expire_date
+        due = (
+            len(_pending) >= _setting('SESSION_WRITE_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+            or (timezone.now() - _last_flush[0]).total_seconds() >= _setting('SESSION_WRITE_FLUSH_INTERVAL', DEFAULT_FLUSH_INTERVAL)
+        )
+    if due:
+        flush_pending()
+
+
+atexit.register(flush_pending)
+
+
+class SessionStore(DBStore):
+    """Database sessions with tiered read caching and coalesced expiry writes."""
+
+    def __init__(self, session_key=None):
+        super().__init__(session_key)
+        # (serialized data, expire_date, encoded data) as last read or written
+        self._stored = None
+
+    def _serialize(self, data):
+        return self.serializer().dumps(data)
+
+    def load(self):
+        session_key = self.session_key
+        value = _local_get(session_key) if session_key else None
+        if value is not None:
+            stats['local_hits'] += 1
+        elif session_key:
+            try:
+                value = _shared_cache().get(KEY_PREFIX + session_key)
+            except Exception as e:
+                logger.warning(f"Session cache unavailable: {str(e)}")
+            if value is not None:
+                stats['shared_hits'] += 1
+
+        if value is None or value[0] <= timezone.now():
+            stats['db_reads'] += 1
+            session = self._get_session_from_db()
+            if session is None:
+                self._stored = None
+                return {}
+            value = (session.expire_date, session.session_data)
+            _remember(session.session_key, *value)
+
+        expire_date, session_data = value
+        data = self.decode(session_data)
+        self._stored = (self._serialize(data), expire_date, session_data)
+        return data
+
+    def save(self, must_create=False):
+        if self.session_key is None:
+            return self.create()
+        data = self._get_session(no_load=must_create)
+        expire_date = self.get_expiry_date()
+
+        if not must_create and self._stored is not None and self._serialize(data) == self._stored[0]:
+            # Only the expiry would change
+            stored_expiry = self._stored[1]
+            threshold = _setting('SESSION_EXPIRY_WRITE_THRESHOLD', DEFAULT_EXPIRY_WRITE_THRESHOLD)
+            if expire_date - stored_expiry < timedelta(seconds=threshold):
+                stats['writes_skipped'] += 1
+                return
+            stats['writes_queued'] += 1
+            self._stored = (self._stored[0], expire_date, self._stored[2])
+            _remember(self.session_key, expire_date, self._stored[2])
+            _queue_expiry(self.session_key, expire_date)
+            return
+
+        obj = self.create_model_instance(data)
+        using = router.db_for_write(self.model, instance=obj)
+        try:
+            with transaction.atomic(using=using):
+                obj.save(force_insert=must_create, force_update=not must_create, using=using)
+        except IntegrityError:
+            if must_create:
+                raise CreateError
+            raise
+        except DatabaseError:
+            if not must_create:
+                raise UpdateError
+            raise
+        stats['db_writes'] += 1
+        with _pending_lock:
+            _pending.pop(obj.session_key, None)
+        self._stored = (self._serialize(data), obj.expire_date, obj.session_data)
+        _remember(obj.session_key, obj.expire_date, obj.session_data)
+
+    def delete(self, session_key=None):
+        if session_key is None:
+            if self.session_key is None:
+                return
+            session_key = self.session_key
+        _forget(session_key)
+        self._stored = None
+        super().delete(session_key)
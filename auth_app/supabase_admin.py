@@ -0,0 +1,242 @@
+"""
+Paged access to the Supabase Auth admin API (``/auth/v1/admin/users``).
+
+``AdminClient`` keeps one ``requests.Session`` whose connection pool is sized
+to the number of worker threads, so every request reuses a kept-alive
+connection. Idempotent requests (GET, PUT) are retried with backoff on
+connection errors, 429 and 5xx, honouring ``Retry-After``; creates are not.
+
+``iter_pages`` lists users ``SUPABASE_ADMIN_PAGE_SIZE`` at a time with up to
+``SUPABASE_ADMIN_WORKERS`` pages in flight, and yields them in page order so
+callers can process (and checkpoint) one page at a time instead of holding
+every user in memory.
+
+Every request first takes a slot from a token bucket limited to
+``SUPABASE_ADMIN_RATE`` (bursts of ``SUPABASE_ADMIN_BURST``), kept through
+``auth_app.ratelimit`` in the default cache. The quota is only shared between
+processes that share that cache: no ``CACHES`` is configured, so each
+process has its own LocMem bucket, and with several commands or workers
+calling the admin API at once, configure a shared backend such as Redis
+(or divide the rate between them). A 429 pauses all of the client's threads
+for the ``Retry-After`` it names.
+"""
+import logging
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import requests
+from django.conf import settings
+from django.utils.dateparse import parse_datetime
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from . import ratelimit
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PAGE_SIZE = 1000
+DEFAULT_WORKERS = 4
+DEFAULT_TIMEOUT = (5, 30)  # connect, read
+MAX_RETRIES = 3
+DEFAULT_BURST = 10
+RATE_KEY = 'supabase-admin'
+
+
+class AdminAPIError(Exception):
+    """The admin API answered with an error status or an unexpected body."""
+
+    def __init__(self, message, status=None, body=''):
+        super().__init__(message)
+        self.status = status
+        self.body = body
+
+    @property
+    def rate_limited(self):
+        return self.status == 429 or 'rate limit' in self.body.lower()
+
+
+def is_email_verified(record):
+    """Whether the Supabase user ``record`` has a confirmed email."""
+    if record.get('email_confirmed_at') or record.get('confirmed_at'):
+        return True
+    user_meta = record.get('raw_user_meta_data') or record.get('user_metadata') or {}
+    return isinstance(user_meta, dict) and user_meta.get('email_verified') is True
+
+
+def changed_at(record):
+    """
+    When the Supabase user ``record`` (an admin API dict or a supabase-py
+    ``User``) last changed: the later of ``updated_at`` and ``created_at``,
+    or ``None`` if it has neither.
+    """
+    latest = None
+    for name in ('updated_at', 'created_at'):
+        value = record.get(name) if isinstance(record, dict) else getattr(record, name, None)
+        if isinstance(value, str):
+            value = parse_datetime(value)
+        if isinstance(value, datetime) and (latest is None or value > latest):
+            latest = value
+    return latest
+
+
+class AdminClient:
+    """Pooled, retrying client for the Supabase Auth admin API."""
+
+    def __init__(self, url=None, service_key=None, page_size=None, workers=None, timeout=None, rate=None, burst=None):
+        self.url = (url or settings.SUPABASE_URL or '').rstrip('/')
+        service_key = service_key or settings.SUPABASE_SERVICE_KEY
+        if not self.url or not service_key:
+            raise AdminAPIError("Missing Supabase URL or service role key.")
+        self.users_url = f"{self.url}/auth/v1/admin/users"
+        self.page_size = page_size or getattr(settings, 'SUPABASE_ADMIN_PAGE_SIZE', DEFAULT_PAGE_SIZE)
+        self.workers = workers or getattr(settings, 'SUPABASE_ADMIN_WORKERS', DEFAULT_WORKERS)
+        self.timeout = timeout or DEFAULT_TIMEOUT
+        self.rate = rate or getattr(settings, 'SUPABASE_ADMIN_RATE', None)
+        self.burst = burst or getattr(settings, 'SUPABASE_ADMIN_BURST', DEFAULT_BURST)
+        self.requests_made = 0
+        self.rate_limited = 0
+        self.throttled_seconds = 0.0
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+        retry = Retry(
+            total=MAX_RETRIES,
+            backoff_factor=0.5,
+            status_forcelist=(429, 500, 502, 503, 504),
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.workers, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update({
+            "apikey": service_key,
+            "Authorization": f"Bearer {service_key}",
+            "Content-Type": "application/json",
+        })
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _throttle(self):
+        """Block until the token bucket (and any 429 pause) lets one more request through."""
+        while True:
+            with self._lock:
+                wait = self._paused_until - time.monotonic()
+            if wait <= 0:
+                if not self.rate:
+                    return
+                allowed, wait = ratelimit.hit(RATE_KEY, self.rate, self.burst)
+                if allowed:
+                    return
+            with self._lock:
+                self.throttled_seconds += wait
+            time.sleep(wait)
+
+    def _pause(self, response):
+        try:
+            seconds = float(response.headers.get('Retry-After') or 1)
+        except ValueError:
+            seconds = 1.0
+        with self._lock:
+            self.rate_limited += 1
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def _request(self, method, url, **kwargs):
+        self._throttle()
+        with self._lock:
+            self.requests_made += 1
+        response = self.session.request(method, url, timeout=self.timeout, **kwargs)
+        if response.status_code == 429:
+            self._pause(response)
+        if response.status_code not in (200, 201):
+            raise AdminAPIError(
+                f"{method} {url} failed: {response.status_code} - {response.text[:200]}",
+                status=response.status_code, body=response.text[:2000],
+            )
+        return response
+
+    def fetch_page(self, page):
+        """``(users, total)`` for 1-based ``page``; ``total`` is ``None`` if the API does not report it."""
+        response = self._request('GET', self.users_url, params={'page': page, 'per_page': self.page_size})
+        data = response.json()
+        if isinstance(data, dict) and 'users' in data:
+            users = data['users']
+        elif isinstance(data, list):
+            users = data
+        else:
+            raise AdminAPIError(f"Unexpected response format: {type(data)}")
+        total = response.headers.get('X-Total-Count')
+        return users, int(total) if total and total.isdigit() else None
+
+    def iter_pages(self, start=1):
+        """
+        Yield ``(page, users)`` from ``start`` to the last page, in order,
+        fetching up to ``workers`` pages concurrently.
+        """
+        users, total = self.fetch_page(start)
+        yield start, users
+        if total is None and len(users) < self.page_size:
+            return
+        last = math.ceil(total / self.page_size) if total is not None else None
+
+        in_flight = deque()
+        next_page = start + 1
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='supabase-admin') as pool:
+            try:
+                while True:
+                    while len(in_flight) < self.workers and (last is None or next_page <= last):
+                        in_flight.append((next_page, pool.submit(self.fetch_page, next_page)))
+                        next_page += 1
+                    if not in_flight:
+                        return
+                    page, future = in_flight.popleft()
+                    users, _ = future.result()
+                    yield page, users
+                    if last is None and len(users) < self.page_size:
+                        # Past the end; pages already in flight are empty
+                        return
+            finally:
+                for _, future in in_flight:
+                    future.cancel()
+
+    def find_users(self, emails):
+        """``{email: user}`` for those of ``emails`` registered in Supabase, listing pages only until all are found."""
+        wanted, found = {email.lower() for email in emails}, {}
+        if not wanted:
+            return found
+        for _, users in self.iter_pages():
+            for user in users:
+                email = (user.get('email') or '').lower()
+                if email in wanted:
+                    found[email] = user
+            if len(found) == len(wanted):
+                break
+        return found
+
+    def update_user(self, user_id, data):
+        return self._request('PUT', f"{self.users_url}/{user_id}", json=data).json()
+
+    def confirm_email(self, user_id):
+        now = datetime.utcnow().isoformat()
+        return self.update_user(user_id, {"email_confirmed_at": now, "confirmed_at": now})
+
+    def create_user(self, email, password, metadata=None, email_verified=False):
+        data = {
+            "email": email,
+            "password": password,
+            "email_confirm": email_verified,
+            "user_metadata": metadata or {},
+        }
+        return self._request('POST', self.users_url, json=data).json()
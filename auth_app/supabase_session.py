@@ -0,0 +1,217 @@
+"""
+Supabase sign-in off the login path.
+
+Once the local password check has passed, ``EmailBackend`` no longer waits on
+Supabase: ``schedule_reconcile`` hands the sign-in to a small thread pool.
+Every worker thread keeps one long-lived Supabase client, so its HTTP
+connection is reused across logins and no client ever carries two users'
+sessions at the same time. The worker signs the user in, backfills
+``User.supabase_id`` and caches the session.
+
+``cached_session`` returns that session only while it is younger than
+``SUPABASE_SESSION_MAX_STALENESS`` seconds and not about to expire; a login
+inside that window reuses it without any remote call.
+
+``SUPABASE_LOGIN_SYNC_MODE`` is 'async' (default), 'sync' (wait for the
+reconciliation, as before) or 'off'.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+from django.db.models import Q
+
+from .models import User
+
+try:
+    from supabase import create_client
+except ImportError:
+    print("Warning: supabase is not installed. Logins will not be reconciled with Supabase.")
+    create_client = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODE = 'async'
+DEFAULT_WORKERS = 4
+DEFAULT_MAX_STALENESS = 300  # seconds
+DEFAULT_SIGN_IN_TIMEOUT = 10
+EXPIRY_MARGIN = 60
+MAX_PENDING = 500
+
+_CACHE_KEY = 'supabase:session:{}'
+_local = threading.local()
+_executor = None
+_executor_lock = threading.Lock()
+_pending = set()
+_pending_lock = threading.Lock()
+
+
+def _config():
+    if getattr(settings, 'BYPASS_SUPABASE', False) or create_client is None:
+        return None, None
+    url = getattr(settings, 'SUPABASE_URL', None)
+    key = getattr(settings, 'SUPABASE_KEY', None) or getattr(settings, 'SUPABASE_ANON_KEY', None)
+    return (url, key) if url and key else (None, None)
+
+
+def mode():
+    return getattr(settings, 'SUPABASE_LOGIN_SYNC_MODE', DEFAULT_MODE)
+
+
+def is_enabled():
+    return mode() != 'off' and _config()[0] is not None
+
+
+def _executor_instance():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'SUPABASE_RECONCILE_WORKERS', DEFAULT_WORKERS),
+                thread_name_prefix='supabase-signin',
+            )
+        return _executor
+
+
+def _thread_client():
+    """This worker thread's Supabase client, created on first use."""
+    config = _config()
+    if getattr(_local, 'config', None) != config:
+        _local.client = create_client(*config)
+        _local.config = config
+    return _local.client
+
+
+def _sign_in(email, password):
+    return _thread_client().auth.sign_in_with_password({"email": email, "password": password})
+
+
+def remote_sign_in(email, password, timeout=None):
+    """
+    Sign in to Supabase on a pool thread and wait for the response (raises on
+    failure or timeout). Used when the outcome decides the login.
+    """
+    timeout = timeout or getattr(settings, 'SUPABASE_SIGN_IN_TIMEOUT', DEFAULT_SIGN_IN_TIMEOUT)
+    return _executor_instance().submit(_sign_in, email, password).result(timeout=timeout)
+
+
+def store_session(user_id, session):
+    """Cache ``session`` (a Supabase session) for ``user_id`` for at most the staleness bound."""
+    if not session or not getattr(session, 'access_token', None):
+        return
+    now = time.time()
+    expires_at = getattr(session, 'expires_at', None) or now + (getattr(session, 'expires_in', None) or 3600)
+    timeout = min(getattr(settings, 'SUPABASE_SESSION_MAX_STALENESS', DEFAULT_MAX_STALENESS), expires_at - now - EXPIRY_MARGIN)
+    if timeout <= 0:
+        return
+    cache.set(_CACHE_KEY.format(user_id), {
+        'access_token': session.access_token,
+        'refresh_token': getattr(session, 'refresh_token', None),
+        'expires_at': expires_at,
+        'fetched_at': now,
+    }, timeout=int(timeout))
+
+
+def cached_session(user_id):
+    """The cached session of ``user_id`` if it is still within the staleness bound, else ``None``."""
+    session = cache.get(_CACHE_KEY.format(user_id))
+    if not session:
+        return None
+    now = time.time()
+    max_staleness = getattr(settings, 'SUPABASE_SESSION_MAX_STALENESS', DEFAULT_MAX_STALENESS)
+    if now - session['fetched_at'] > max_staleness or session['expires_at'] - now < EXPIRY_MARGIN:
+        return None
+    return session
+
+
+def cached_token(user_id):
+    session = cached_session(user_id)
+    return session['access_token'] if session else None
+
+
+def forget(user_id):
+    cache.delete(_CACHE_KEY.format(user_id))
+
+
+def _apply(user_id, response):
+    """Cache the session of a sign-in ``response`` and fill in the user's missing ``supabase_id``."""
+    session = getattr(response, 'session', None)
+    store_session(user_id, session)
+    supabase_id = getattr(getattr(response, 'user', None), 'id', None)
+    if supabase_id:
+        # Conditional update: never overwrite an ID set by someone else in the meantime
+        User.objects.filter(Q(supabase_id__isnull=True) | Q(supabase_id=''), pk=user_id).update(supabase_id=supabase_id)
+    return session
+
+
+def reconcile(user_id, email, password):
+    """
+    Sign ``email`` in to Supabase from a pool thread, cache the session and
+    fill in the user's ``supabase_id``. Returns the session, or ``None``.
+    """
+    try:
+        response = _sign_in(email, password)
+    except Exception as e:
+        logger.warning(f"Supabase sign-in failed for {email} (local login unaffected): {str(e)}")
+        return None
+    return _apply(user_id, response)
+
+
+def _run_reconcile(user_id, email, password):
+    try:
+        reconcile(user_id, email, password)
+    except Exception as e:
+        logger.error(f"Error reconciling Supabase session for user {user_id}: {str(e)}")
+    finally:
+        with _pending_lock:
+            _pending.discard(user_id)
+        close_old_connections()
+
+
+def schedule_reconcile(user_id, email, password):
+    """
+    Queue a background ``reconcile`` unless one is already pending for the
+    user, the cached session is still fresh, or the queue is full.
+    Returns whether a job was queued.
+    """
+    if not email or not is_enabled() or cached_session(user_id):
+        return False
+    with _pending_lock:
+        if user_id in _pending or len(_pending) >= MAX_PENDING:
+            return False
+        _pending.add(user_id)
+    try:
+        _executor_instance().submit(_run_reconcile, user_id, email, password)
+    except RuntimeError:
+        # Interpreter shutting down
+        with _pending_lock:
+            _pending.discard(user_id)
+        return False
+    return True
+
+
+def attach_session(user, email, password):
+    """
+    Give ``user`` a ``_supabase_session_token`` after a successful local
+    login, according to ``SUPABASE_LOGIN_SYNC_MODE``. Only 'sync' mode waits
+    for Supabase.
+    """
+    if not is_enabled():
+        return
+    session = cached_session(user.pk)
+    if session:
+        user._supabase_session_token = session['access_token']
+    elif mode() == 'sync':
+        try:
+            session = _apply(user.pk, remote_sign_in(email, password))
+        except Exception as e:
+            logger.warning(f"Supabase sign-in failed for {email} (local login unaffected): {str(e)}")
+            session = None
+        if session:
+            user._supabase_session_token = session.access_token
+    else:
+        schedule_reconcile(user.pk, email, password)
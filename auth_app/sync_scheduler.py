@@ -0,0 +1,167 @@
+"""
+Leases and execution for ``UserSyncSchedule``.
+
+A schedule is run only by the worker holding its lease. ``claim`` takes a
+due schedule with one compare-and-set UPDATE on ``next_run`` and
+``locked_until``, so two schedulers (or a scheduler and a cron-driven
+``run_scheduled_syncs``) never run the same schedule twice. The lease lasts
+``SYNC_SCHEDULE_LEASE_SECONDS`` and is renewed while the sync runs; if the
+worker dies the lease expires and the schedule becomes claimable again.
+
+``run`` executes a claimed schedule through ``sync_users --schedule`` and
+records the captured output in a ``UserSyncRun``, then releases the lease
+and moves ``next_run`` to the next slot.
+
+In deployments the ``scheduler`` process (Procfile and docker-compose) runs
+``run_sync_scheduler``; without it, schedules never run.
+"""
+import io
+import json
+import logging
+import os
+import socket
+import threading
+import traceback
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management import call_command
+from django.db import close_old_connections
+from django.db.models import Min, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import UserSyncRun, UserSyncSchedule
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LEASE_SECONDS = 300
+KEEP_RUNS_DAYS = 30
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+def lease_seconds():
+    return getattr(settings, 'SYNC_SCHEDULE_LEASE_SECONDS', DEFAULT_LEASE_SECONDS)
+
+
+def _unleased(now):
+    return Q(locked_until__isnull=True) | Q(locked_until__lte=now)
+
+
+def claim(limit=1, now=None, force=False, ids=None):
+    """
+    Lease up to ``limit`` active schedules that are due (any active ones with
+    ``force``), earliest first. Returns ``[(schedule, token)]``.
+    """
+    now = now or timezone.now()
+    candidates = UserSyncSchedule.objects.filter(_unleased(now), is_active=True)
+    if not force:
+        candidates = candidates.filter(next_run__lte=now)
+    if ids is not None:
+        candidates = candidates.filter(pk__in=ids)
+    claimed = []
+    for schedule_id, next_run in candidates.order_by('next_run', 'id').values_list('id', 'next_run')[:limit * 2]:
+        token = uuid.uuid4()
+        # Compare-and-set: only taken if nobody claimed or rescheduled it since we looked
+        taken = UserSyncSchedule.objects.filter(_unleased(now), pk=schedule_id, next_run=next_run).update(
+            locked_until=now + timedelta(seconds=lease_seconds()), lease_token=token,
+        )
+        if taken:
+            claimed.append((UserSyncSchedule.objects.get(pk=schedule_id), token))
+            if len(claimed) >= limit:
+                break
+    return claimed
+
+
+def renew(schedule_id, token):
+    """Extend a held lease. Returns ``False`` if it was lost."""
+    return bool(UserSyncSchedule.objects.filter(pk=schedule_id, lease_token=token).update(
+        locked_until=timezone.now() + timedelta(seconds=lease_seconds()),
+    ))
+
+
+def release(schedule, token, started_at):
+    """Give up the lease and move ``next_run`` to the slot after now."""
+    now = timezone.now()
+    released = UserSyncSchedule.objects.filter(pk=schedule.pk, lease_token=token).update(
+        locked_until=None, lease_token=None, last_run=started_at,
+        next_run=schedule.compute_next_run(now), updated_at=now,
+    )
+    if not released:
+        logger.warning(f"Lease on sync schedule {schedule.pk} expired before its run finished")
+    return bool(released)
+
+
+def next_wakeup(now=None):
+    """When the earliest active schedule becomes due or a held lease expires, or ``None``."""
+    now = now or timezone.now()
+    due = UserSyncSchedule.objects.filter(_unleased(now), is_active=True).aggregate(at=Min('next_run'))['at']
+    lease = UserSyncSchedule.objects.filter(is_active=True, locked_until__gt=now).aggregate(at=Min('locked_until'))['at']
+    return min(filter(None, [due, lease]), default=None)
+
+
+def _run_stats(schedule_id, started_at):
+    """The stats ``sync_users`` stored in ``last_status`` for a run begun after ``started_at``, or ``None``."""
+    try:
+        stats = json.loads(UserSyncSchedule.objects.values_list('last_status', flat=True).get(pk=schedule_id))
+    except (ValueError, UserSyncSchedule.DoesNotExist):
+        return None
+    if not isinstance(stats, dict):
+        return None
+    run_started = parse_datetime(stats.get('started_at') or '')
+    return stats if run_started and run_started >= started_at else None
+
+
+def _keep_lease(schedule_id, token, done):
+    while not done.wait(lease_seconds() / 3):
+        try:
+            if not renew(schedule_id, token):
+                return
+        except Exception as e:
+            logger.error(f"Error renewing lease on sync schedule {schedule_id}: {str(e)}")
+        finally:
+            close_old_connections()
+
+
+def run(schedule, token):
+    """
+    Run a claimed schedule, renewing its lease meanwhile, record a
+    ``UserSyncRun`` and release the lease. Returns the run.
+    """
+    started_at = timezone.now()
+    # We hold the lease, so any run still marked running belonged to a worker that died
+    UserSyncRun.objects.filter(schedule=schedule, status='running').update(
+        status='failed', finished_at=started_at, output='Abandoned: the worker stopped before the run finished',
+    )
+    sync_run = UserSyncRun.objects.create(schedule=schedule, worker=WORKER_ID, started_at=started_at)
+    done = threading.Event()
+    heartbeat = threading.Thread(target=_keep_lease, args=(schedule.pk, token, done), daemon=True)
+    heartbeat.start()
+    output = io.StringIO()
+    failed = False
+    try:
+        call_command('sync_users', schedule=schedule.pk, stdout=output, stderr=output)
+    except Exception as e:
+        logger.error(f"Error running sync schedule {schedule.pk}: {str(e)}", exc_info=True)
+        output.write(traceback.format_exc())
+        failed = True
+    finally:
+        done.set()
+        heartbeat.join()
+
+    sync_run.stats = _run_stats(schedule.pk, started_at)
+    # A sync that returned early (missing credentials, unreachable API) records no completed stats
+    failed = failed or not (sync_run.stats and sync_run.stats.get('completed'))
+    sync_run.status = 'failed' if failed else 'succeeded'
+    sync_run.output = output.getvalue()
+    sync_run.finished_at = timezone.now()
+    sync_run.save(update_fields=['status', 'output', 'stats', 'finished_at'])
+    release(schedule, token, started_at)
+    return sync_run
+
+
+def prune_runs(days=KEEP_RUNS_DAYS):
+    """Delete run history older than ``days``. Returns how many runs were removed."""
+    deleted, _ = UserSyncRun.objects.filter(started_at__lt=timezone.now() - timedelta(days=days)).exclude(status='running').delete()
+    return deleted
@@ -0,0 +1,195 @@
+"""
+Login telemetry accumulator.
+
+Last-login times and failed-attempt counters used to be written with one
+``save()`` each, several times per login. They are now collected here and
+written in batches:
+
+* ``record_login`` only remembers the newest timestamp per user; ``flush``
+  writes them with one ``bulk_update``.
+* Failed attempts are counted with an atomic ``cache.incr`` (seeded from
+  the database); ``flush`` mirrors the counts into
+  ``User.failed_login_attempts``.
+
+Anything that decides whether an account is locked is written through
+immediately: reaching the limit writes the count and ``account_locked_until``
+in one UPDATE, and a reset clears both right away when they are set. Lock
+checks therefore read an exact ``account_locked_until``, and
+``failed_attempts`` reads the live count through the cache.
+
+A flush happens once ``LOGIN_TELEMETRY_BATCH_SIZE`` updates are pending or
+``LOGIN_TELEMETRY_FLUSH_INTERVAL`` seconds have passed, and at exit.
+
+The counters are only shared between processes that share the default
+cache. No ``CACHES`` is configured, so each process uses its own LocMem
+cache: with more than one worker, configure a shared backend such as Redis,
+or every worker counts failures separately and an attacker gets up to
+``MAX_FAILED_LOGINS`` attempts per worker before the lock.
+"""
+import atexit
+import logging
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_FLUSH_INTERVAL = 30
+DEFAULT_BATCH_SIZE = 200
+COUNTER_TTL = 24 * 60 * 60
+
+_FAILED_KEY = 'login:failed:{}'
+_lock = threading.Lock()
+_logins = {}
+_failures = set()
+_last_flush = [None]
+
+
+def _setting(name, default):
+    return getattr(settings, f'LOGIN_TELEMETRY_{name}', default)
+
+
+def _pending_count():
+    return len(_logins) + len(_failures)
+
+
+def _maybe_flush():
+    now = timezone.now()
+    with _lock:
+        if _last_flush[0] is None:
+            _last_flush[0] = now
+        due = (
+            _pending_count() >= _setting('BATCH_SIZE', DEFAULT_BATCH_SIZE)
+            or (now - _last_flush[0]).total_seconds() >= _setting('FLUSH_INTERVAL', DEFAULT_FLUSH_INTERVAL)
+        )
+    if due:
+        flush()
+
+
+def record_login(user, at=None):
+    """Note that ``user`` logged in at ``at`` (now by default)."""
+    at = at or timezone.now()
+    user.last_login = user.last_login_at = at
+    with _lock:
+        if _logins.get(user.pk) is None or _logins[user.pk] < at:
+            _logins[user.pk] = at
+    _maybe_flush()
+
+
+def failed_attempts(user):
+    """The current failed-attempt count of ``user``, including attempts not yet flushed."""
+    count = cache.get(_FAILED_KEY.format(user.pk))
+    return user.failed_login_attempts if count is None else count
+
+
+def is_locked(user, now=None):
+    return bool(user.account_locked_until and user.account_locked_until > (now or timezone.now()))
+
+
+def record_failure(user, lock_minutes=15, max_attempts=None):
+    """
+    Count a failed login of ``user``. Reaching ``max_attempts`` locks the
+    account for ``lock_minutes`` with an immediate write. Returns the count,
+    which covers every worker only if the cache is shared (see above).
+    """
+    max_attempts = max_attempts or getattr(settings, 'MAX_FAILED_LOGINS', DEFAULT_MAX_ATTEMPTS)
+    key = _FAILED_KEY.format(user.pk)
+    cache.add(key, user.failed_login_attempts or 0, COUNTER_TTL)
+    try:
+        count = cache.incr(key)
+    except ValueError:
+        # Evicted between add() and incr()
+        count = (user.failed_login_attempts or 0) + 1
+        cache.set(key, count, COUNTER_TTL)
+    user.failed_login_attempts = count
+
+    if count >= max_attempts:
+        user.account_locked_until = timezone.now() + timedelta(minutes=lock_minutes)
+        type(user).objects.filter(pk=user.pk).update(
+            failed_login_attempts=count, account_locked_until=user.account_locked_until,
+        )
+        with _lock:
+            _failures.discard(user.pk)
+    else:
+        with _lock:
+            _failures.add(user.pk)
+        _maybe_flush()
+    return count
+
+
+def reset_failures(user):
+    """Clear the failed-attempt count and any lock of ``user``; writes only if something was set."""
+    key = _FAILED_KEY.format(user.pk)
+    pending = cache.get(key)
+    cache.delete(key)
+    with _lock:
+        _failures.discard(user.pk)
+    if user.failed_login_attempts or user.account_locked_until or pending:
+        type(user).objects.filter(
+            Q(failed_login_attempts__gt=0) | Q(account_locked_until__isnull=False), pk=user.pk,
+        ).update(failed_login_attempts=0, account_locked_until=None)
+    user.failed_login_attempts = 0
+    user.account_locked_until = None
+
+
+def forget_failures(user_id):
+    """Drop the cached count after the database row was reset some other way."""
+    cache.delete(_FAILED_KEY.format(user_id))
+    with _lock:
+        _failures.discard(user_id)
+
+
+def flush():
+    """Write everything pending with batched UPDATEs. Returns the number of rows written."""
+    from .models import User
+
+    with _lock:
+        logins, failures = dict(_logins), set(_failures)
+        _logins.clear()
+        _failures.clear()
+        _last_flush[0] = timezone.now()
+    if not (logins or failures):
+        return 0
+
+    counts = {}
+    if failures:
+        cached = cache.get_many([_FAILED_KEY.format(user_id) for user_id in failures])
+        counts = {
+            user_id: cached[_FAILED_KEY.format(user_id)]
+            for user_id in failures if _FAILED_KEY.format(user_id) in cached
+        }
+    batch_size = _setting('BATCH_SIZE', DEFAULT_BATCH_SIZE)
+    try:
+        with transaction.atomic():
+            if logins:
+                User.objects.bulk_update(
+                    [User(pk=user_id, last_login=at, last_login_at=at) for user_id, at in logins.items()],
+                    ['last_login', 'last_login_at'], batch_size=batch_size,
+                )
+            if counts:
+                User.objects.bulk_update(
+                    [User(pk=user_id, failed_login_attempts=count) for user_id, count in counts.items()],
+                    ['failed_login_attempts'], batch_size=batch_size,
+                )
+    except DatabaseError as e:
+        logger.error(f"Error flushing login telemetry: {str(e)}")
+        with _lock:
+            for user_id, at in logins.items():
+                _logins[user_id] = max(at, _logins.get(user_id, at))
+            _failures.update(failures)
+        return 0
+    return len(logins) + len(counts)
+
+
+def on_user_logged_in(sender, request, user, **kwargs):
+    """Replaces ``django.contrib.auth.models.update_last_login``, which saves on every login."""
+    record_login(user)
+
+
+atexit.register(flush)
@@ -0,0 +1,444 @@
+import hashlib
+import hmac
+import io
+import json
+import os
+import shutil
+import smtplib
+import tempfile
+import time
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest import mock
+
+from django.contrib.sessions.models import Session as DjangoSession
+from django.core import mail
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import outbox, ratelimit, session_store, supabase_admin, supabase_session, sync_scheduler, telemetry, webhook_inbox
+from .backends import EmailBackend
+from .models import DelayedRegistration, OutboundEmail, User, UserSyncRun, UserSyncSchedule, WebhookEvent
+
+
+@override_settings(
+    EMAIL_BACKEND='auth_app.outbox.OutboxEmailBackend',
+    OUTBOX_DELIVERY_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+    OUTBOX_DOMAIN_RATE_LIMITS={'slow.example': 1},
+)
+class EmailOutboxTests(TestCase):
+    def test_queue_rate_limit_retry_and_dead_letter(self):
+        message = mail.EmailMultiAlternatives(
+            'Hello', 'Body', 'Nexus <noreply@example.com>',
+            ['a@example.com', 'b@slow.example', 'c@slow.example'], headers={'X-Test': '1'},
+        )
+        message.attach_alternative('<p>Body</p>', 'text/html')
+        self.assertEqual(message.send(), 1)
+        mail.send_mail('Second', 'Body', 'noreply@example.com', ['d@slow.example'])
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(OutboundEmail.objects.filter(status='queued').count(), 3)
+
+        # slow.example allows one message a minute, so its second message waits
+        self.assertEqual(outbox.deliver(), {'sent': 2})
+        delivered = {tuple(message.to): message for message in mail.outbox}
+        self.assertIn(b'X-Test: 1', delivered[('b@slow.example', 'c@slow.example')].raw_message)
+        self.assertEqual(OutboundEmail.objects.get(subject='Second').status, 'queued')
+        self.assertEqual(outbox.deliver(), {})
+
+        row = OutboundEmail.objects.get(subject='Second')
+        with override_settings(OUTBOX_DOMAIN_RATE_LIMITS={}), \
+                mock.patch.object(outbox.QueuedEmail, 'message', side_effect=smtplib.SMTPDataError(451, 'try later')):
+            self.assertEqual(outbox.deliver(), {'retried': 1})
+            row.refresh_from_db()
+            self.assertEqual((row.status, row.attempts), ('queued', 1))
+            self.assertGreater(row.next_attempt_at, timezone.now())
+
+            OutboundEmail.objects.filter(pk=row.pk).update(next_attempt_at=timezone.now())
+            with mock.patch.object(outbox.QueuedEmail, 'message', side_effect=smtplib.SMTPDataError(550, 'no such user')):
+                self.assertEqual(outbox.deliver(), {'dead': 1})
+        self.assertEqual(outbox.requeue_dead(), 1)
+
+    def test_disconnect_releases_the_message_and_reconnects(self):
+        for recipient in ('a@example.com', 'b@example.com'):
+            mail.send_mail('Hello', 'Body', 'noreply@example.com', [recipient])
+        sent = []
+
+        def send_messages(messages):
+            if not sent:
+                sent.append(None)
+                raise smtplib.SMTPServerDisconnected('Connection unexpectedly closed')
+            sent.extend(messages)
+            return len(messages)
+
+        connection = mock.Mock(send_messages=mock.Mock(side_effect=send_messages))
+        self.assertEqual(outbox.deliver(connection=connection), {'deferred': 1, 'sent': 1})
+        self.assertEqual(connection.open.call_count, 2)
+        released = OutboundEmail.objects.get(status='queued')
+        self.assertEqual(released.attempts, 0)
+        self.assertIn('unexpectedly closed', released.last_error)
+
+        # A refused recipient is that message's failure; the connection is kept
+        OutboundEmail.objects.filter(pk=released.pk).update(next_attempt_at=timezone.now())
+        connection.reset_mock()
+        connection.send_messages.side_effect = smtplib.SMTPRecipientsRefused({'a@example.com': (450, b'busy')})
+        self.assertEqual(outbox.deliver(connection=connection), {'retried': 1})
+        connection.close.assert_not_called()
+
+
+@override_settings(BYPASS_SUPABASE=False, SUPABASE_LOGIN_SYNC_MODE='async', SUPABASE_URL='https://sb.example', SUPABASE_KEY='key')
+class SupabaseLoginReconcileTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='alice', email='alice@example.com', password='pw', email_verified=True)
+        self.response = SimpleNamespace(
+            session=SimpleNamespace(access_token='token', refresh_token='refresh', expires_at=time.time() + 3600),
+            user=SimpleNamespace(id='sb-alice'),
+        )
+
+    def tearDown(self):
+        supabase_session.forget(self.user.pk)
+
+    def test_local_login_does_not_wait_on_supabase(self):
+        with mock.patch.object(supabase_session, '_sign_in', return_value=self.response) as sign_in, \
+                mock.patch.object(supabase_session, '_executor_instance') as executor:
+            user = EmailBackend().authenticate(None, username='alice', password='pw')
+            self.assertEqual(user, self.user)
+            sign_in.assert_not_called()
+            executor.return_value.submit.assert_called_once_with(
+                supabase_session._run_reconcile, self.user.pk, 'alice@example.com', 'pw'
+            )
+            supabase_session._pending.clear()
+
+            supabase_session.reconcile(self.user.pk, 'alice@example.com', 'pw')
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.supabase_id, 'sb-alice')
+
+        # A fresh cached session is reused without scheduling anything
+        with mock.patch.object(supabase_session, '_executor_instance') as executor:
+            user = EmailBackend().authenticate(None, username='alice@example.com', password='pw')
+        executor.assert_not_called()
+        self.assertEqual(user._supabase_session_token, 'token')
+
+        with override_settings(SUPABASE_SESSION_MAX_STALENESS=0):
+            self.assertIsNone(supabase_session.cached_token(self.user.pk))
+
+
+@override_settings(SESSION_EXPIRY_WRITE_THRESHOLD=3600, SESSION_WRITE_BATCH_SIZE=2, SESSION_WRITE_FLUSH_INTERVAL=86400)
+class CoalescingSessionStoreTests(TestCase):
+    def visit(self, key, at):
+        with mock.patch('django.utils.timezone.now', return_value=at):
+            session = session_store.SessionStore(key)
+            session.get('_auth_user_id')
+            session.save()
+        return session
+
+    def expiry(self, key):
+        return DjangoSession.objects.get(session_key=key).expire_date
+
+    def test_expiry_refreshes_are_skipped_or_batched(self):
+        now = timezone.now()
+        session = session_store.SessionStore()
+        session['_auth_user_id'] = '1'
+        session.save()
+        key = session.session_key
+        first_expiry = self.expiry(key)
+
+        # Reads come from the cache tiers; small expiry moves are not written
+        with self.assertNumQueries(0):
+            self.visit(key, now + timedelta(minutes=5))
+            self.assertEqual(self.visit(key, now + timedelta(minutes=10))['_auth_user_id'], '1')
+            # A larger move is queued rather than written
+            self.visit(key, now + timedelta(hours=2))
+        self.assertEqual(self.expiry(key), first_expiry)
+
+        # The second queued refresh fills the batch and both are written together
+        other = self.visit(None, now + timedelta(hours=2)).session_key
+        self.visit(other, now + timedelta(hours=4))
+        self.assertGreater(self.expiry(key), first_expiry + timedelta(hours=1))
+        self.assertGreater(self.expiry(other), self.expiry(key))
+
+        # Data changes are written through
+        changed = session_store.SessionStore(key)
+        changed['cart'] = [1]
+        changed.save()
+        self.assertEqual(DjangoSession.objects.get(session_key=key).get_decoded()['cart'], [1])
+        changed.delete()
+        self.assertEqual(session_store.SessionStore(key).load(), {})
+
+
+@override_settings(
+    MAX_FAILED_LOGINS=3, LOGIN_TELEMETRY_FLUSH_INTERVAL=3600, LOGIN_TELEMETRY_BATCH_SIZE=1000, SUPABASE_LOGIN_SYNC_MODE='off',
+)
+class LoginTelemetryTests(TestCase):
+    def setUp(self):
+        telemetry.flush()
+        self.user = User.objects.create_user(username='alice', email='alice@example.com', password='pw')
+
+    def test_counters_are_batched_but_locks_are_exact(self):
+        with self.assertNumQueries(0):
+            self.user.increment_failed_attempts()
+        # A fresh copy of the row (another request) still sees the live count
+        fresh = User.objects.get(pk=self.user.pk)
+        self.assertEqual(fresh.failed_login_attempts, 0)
+        self.assertEqual(telemetry.failed_attempts(fresh), 1)
+        fresh.increment_failed_attempts()
+        self.assertFalse(telemetry.is_locked(fresh))
+
+        # Reaching the limit is written through
+        fresh.increment_failed_attempts()
+        locked = User.objects.get(pk=self.user.pk)
+        self.assertEqual(locked.failed_login_attempts, 3)
+        self.assertTrue(telemetry.is_locked(locked))
+
+        locked.reset_login_attempts()
+        unlocked = User.objects.get(pk=self.user.pk)
+        self.assertFalse(telemetry.is_locked(unlocked))
+        with self.assertNumQueries(0):
+            unlocked.reset_login_attempts()
+
+        self.client.login(username='alice', password='pw')
+        self.assertIsNone(User.objects.get(pk=self.user.pk).last_login_at)
+        self.assertEqual(telemetry.flush(), 1)
+        self.assertIsNotNone(User.objects.get(pk=self.user.pk).last_login_at)
+
+
+class RateLimitTests(TestCase):
+    def test_gcra_allows_burst_then_spaces_requests(self):
+        now = 1000.0
+        decisions = [ratelimit.hit('test:burst', '6/m', burst=3, now=now)[0] for _ in range(4)]
+        self.assertEqual(decisions, [True, True, True, False])
+        # One request is allowed back every 10 seconds
+        self.assertFalse(ratelimit.hit('test:burst', '6/m', burst=3, now=now + 5)[0])
+        self.assertTrue(ratelimit.hit('test:burst', '6/m', burst=3, now=now + 10)[0])
+        self.assertEqual(ratelimit.parse_rate('10/5m'), (10, 300))
+
+    @override_settings(RATE_LIMITS={'validate_email_domain': [{'key': 'param:email', 'rate': '2/m'}]})
+    def test_middleware_limits_route_per_key(self):
+        url = reverse('validate_email_domain')
+        for _ in range(2):
+            self.assertEqual(self.client.get(url, {'email': 'limited@example.com'}).status_code, 200)
+        response = self.client.get(url, {'email': 'Limited@example.com'}, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+        self.assertEqual(self.client.get(url, {'email': 'other@example.com'}).status_code, 200)
+
+    def test_client_ip_ignores_spoofed_forwarded_entries(self):
+        request = SimpleNamespace(META={'REMOTE_ADDR': '10.0.0.2', 'HTTP_X_FORWARDED_FOR': '1.2.3.4, 203.0.113.7'})
+        with override_settings(RATE_LIMIT_TRUSTED_PROXIES=1):
+            self.assertEqual(ratelimit.client_ip(request), '203.0.113.7')
+        with override_settings(RATE_LIMIT_TRUSTED_PROXIES=2):
+            self.assertEqual(ratelimit.client_ip(request), '1.2.3.4')
+        with override_settings(RATE_LIMIT_TRUSTED_PROXIES=3):
+            self.assertEqual(ratelimit.client_ip(request), '10.0.0.2')
+        with override_settings(RATE_LIMIT_TRUSTED_PROXIES=0):
+            self.assertEqual(ratelimit.client_ip(request), '10.0.0.2')
+
+
+@override_settings(SUPABASE_URL='http://supabase.test', SUPABASE_SERVICE_KEY='service-key')
+class SyncUsersCommandTests(TestCase):
+    def setUp(self):
+        self.remote = [
+            {'id': f'sb-{i}', 'email': f'User{i}@Example.com', 'email_confirmed_at': '2025-01-01T00:00:00Z' if i % 2 else None}
+            for i in range(25)
+        ]
+        User.objects.create_user(username='user3', email='user3@example.com', password='pw')
+        User.objects.create_user(username='user7', email='someone@else.com', password='pw')
+        self.checkpoint = os.path.join(tempfile.mkdtemp(), 'sync.json')
+        self.addCleanup(shutil.rmtree, os.path.dirname(self.checkpoint))
+        self.fetched = []
+        self.fail_on = None
+
+    def fetch_page(self, client, page):
+        if page == self.fail_on:
+            raise supabase_admin.AdminAPIError('503')
+        self.fetched.append(page)
+        return self.remote[(page - 1) * client.page_size:page * client.page_size], len(self.remote)
+
+    def sync(self, **options):
+        options.setdefault('direction', 'to-django')
+        output = io.StringIO()
+        with mock.patch.object(supabase_admin.AdminClient, 'fetch_page', autospec=True, side_effect=self.fetch_page):
+            call_command('sync_users', page_size=10, workers=3, batch_size=4,
+                         checkpoint=self.checkpoint, stdout=output, **options)
+        return output.getvalue()
+
+    def test_interrupted_sync_resumes_from_checkpoint(self):
+        self.fail_on = 3
+        self.assertIn('interrupted', self.sync())
+        with open(self.checkpoint) as f:
+            self.assertEqual(json.load(f)['page'], 2)
+        self.assertEqual(User.objects.exclude(supabase_id=None).count(), 20)
+
+        self.fail_on, self.fetched = None, []
+        output = self.sync()
+        self.assertEqual(self.fetched, [3])
+        self.assertIn('24 created, 1 updated', output)
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+        self.assertEqual(User.objects.count(), 26)
+        existing = User.objects.get(username='user3')
+        self.assertEqual((existing.supabase_id, existing.email_verified), ('sb-3', True))
+        created = User.objects.get(email='user7@example.com')
+        self.assertEqual(created.username, 'user71')
+        self.assertFalse(created.has_usable_password())
+        self.assertEqual(created.profile.supabase_uid, 'sb-7')
+        self.assertIn('0 created, 0 updated, 25 in sync', self.sync())
+
+    def test_scheduled_sync_is_incremental_from_the_watermark(self):
+        start = timezone.now() - timedelta(days=30)
+        for i, record in enumerate(self.remote):
+            record['updated_at'] = (start + timedelta(hours=i)).isoformat()
+        schedule = UserSyncSchedule.objects.create(direction='to-django', full_sync_interval=24)
+
+        self.sync(schedule=schedule.id)
+        schedule.refresh_from_db()
+        status = json.loads(schedule.last_status)
+        self.assertEqual((status['mode'], status['created'], status['completed']), ('full', 24, True))
+        self.assertEqual(schedule.watermark, start + timedelta(hours=24))
+        self.assertIsNotNone(schedule.last_full_sync)
+
+        self.remote[4].update(email_confirmed_at='2025-06-01T00:00:00Z', updated_at=timezone.now().isoformat())
+        self.sync(schedule=schedule.id)
+        schedule.refresh_from_db()
+        status = json.loads(schedule.last_status)
+        # The changed user, plus the newest one inside the overlap window
+        self.assertEqual((status['mode'], status['unchanged'], status['updated'], status['in_sync']), ('incremental', 23, 1, 1))
+        self.assertTrue(User.objects.get(email='user4@example.com').email_verified)
+
+        schedule.last_full_sync -= timedelta(hours=25)
+        schedule.save()
+        self.sync(schedule=schedule.id)
+        schedule.refresh_from_db()
+        self.assertEqual(json.loads(schedule.last_status)['mode'], 'full')
+
+
+@override_settings(SUPABASE_URL='http://supabase.test', SUPABASE_SERVICE_KEY='service-key')
+class SyncSchedulerTests(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        checkpoint = override_settings(SYNC_USERS_CHECKPOINT_FILE=os.path.join(directory, 'sync.json'))
+        checkpoint.enable()
+        self.addCleanup(checkpoint.disable)
+        self.schedule = UserSyncSchedule.objects.create(direction='to-django', frequency='hourly')
+        UserSyncSchedule.objects.filter(pk=self.schedule.pk).update(next_run=timezone.now() - timedelta(minutes=1))
+
+    def test_due_schedule_is_leased_once_and_its_run_recorded(self):
+        now = timezone.now()
+        claimed = sync_scheduler.claim(limit=5, now=now)
+        self.assertEqual([schedule.pk for schedule, _ in claimed], [self.schedule.pk])
+        self.assertEqual(sync_scheduler.claim(limit=5, now=now), [])
+        # An expired lease (dead worker) can be taken over
+        later = now + timedelta(seconds=sync_scheduler.lease_seconds() + 1)
+        self.assertEqual(len(sync_scheduler.claim(limit=5, now=later)), 1)
+
+        schedule, token = sync_scheduler.claim(limit=1, now=later + timedelta(seconds=sync_scheduler.lease_seconds() + 1))[0]
+        remote = [{'id': 'sb-1', 'email': 'one@example.com', 'updated_at': '2025-01-01T00:00:00Z'}]
+        with mock.patch.object(supabase_admin.AdminClient, 'fetch_page', return_value=(remote, 1)):
+            sync_run = sync_scheduler.run(schedule, token)
+
+        self.assertEqual(sync_run.status, 'succeeded')
+        self.assertIn('User synchronization completed', sync_run.output)
+        self.assertEqual(sync_run.stats['created'], 1)
+        schedule.refresh_from_db()
+        self.assertIsNone(schedule.locked_until)
+        self.assertGreater(schedule.next_run, timezone.now())
+        self.assertEqual(sync_scheduler.claim(limit=5), [])
+
+    def test_failed_sync_is_recorded_as_failed_run(self):
+        with mock.patch.object(supabase_admin.AdminClient, 'fetch_page', side_effect=supabase_admin.AdminAPIError('503')):
+            call_command('run_scheduled_syncs', stdout=io.StringIO())
+        sync_run = UserSyncRun.objects.get(schedule=self.schedule)
+        self.assertEqual(sync_run.status, 'failed')
+        self.assertIn('interrupted', sync_run.output)
+        self.assertEqual(json.loads(UserSyncSchedule.objects.get(pk=self.schedule.pk).last_status)['completed'], False)
+
+
+@override_settings(SUPABASE_SYNC_ENABLED=True, SUPABASE_WEBHOOK_SECRET='s3cret')
+class WebhookInboxTests(TestCase):
+    def post(self, event_type, record, request_id):
+        body = json.dumps({'type': event_type, 'record': record}).encode()
+        signature = hmac.new(b's3cret', body, hashlib.sha256).hexdigest()
+        return self.client.post(
+            reverse('supabase_webhook'), body, content_type='application/json',
+            HTTP_X_SUPABASE_SIGNATURE=signature, HTTP_X_REQUEST_ID=request_id,
+        )
+
+    def test_events_are_stored_once_and_applied_in_order_per_user(self):
+        response = self.post('user.created', {'id': 'sb-1', 'email': 'one@example.com'}, 'req-1')
+        self.assertEqual(response.status_code, 202)
+        self.assertTrue(self.post('user.created', {'id': 'sb-1', 'email': 'one@example.com'}, 'req-1').json()['duplicate'])
+        self.post('user.updated', {'id': 'sb-1', 'email': 'one@example.com', 'email_confirmed_at': '2025-01-01T00:00:00Z'}, 'req-2')
+        self.post('user.created', {'id': 'sb-2', 'email': 'two@example.com'}, 'req-3')
+        self.assertEqual(self.client.post(reverse('supabase_webhook'), b'{}', content_type='application/json').status_code, 400)
+        self.assertEqual(WebhookEvent.objects.count(), 3)
+        self.assertFalse(User.objects.exists())
+
+        with mock.patch.dict(webhook_inbox.HANDLERS, {'user.updated': mock.Mock(side_effect=RuntimeError('locked'))}):
+            self.assertEqual(webhook_inbox.process(), {'applied': 2, 'retried': 1})
+        self.assertEqual(set(User.objects.values_list('supabase_id', flat=True)), {'sb-1', 'sb-2'})
+
+        # sb-1's deletion waits behind its failed update
+        self.post('user.deleted', {'id': 'sb-1', 'email': 'one@example.com'}, 'req-4')
+        self.assertEqual(webhook_inbox.process(), {})
+        WebhookEvent.objects.filter(event_id='req-2').update(next_attempt_at=timezone.now())
+        self.assertEqual(webhook_inbox.process(), {'applied': 2})
+        user = User.objects.get(supabase_id='sb-1')
+        self.assertTrue(user.email_verified)
+        self.assertIsNotNone(user.deleted_at)
+        self.assertFalse(user.has_usable_password())
+
+        self.post('user.deleted', {}, 'req-5')
+        self.assertEqual(webhook_inbox.process(), {'dead': 1})
+
+    def test_unhandled_event_types_are_acknowledged_without_storing(self):
+        response = self.post('user.signed_in', {'id': 'sb-1', 'email': 'one@example.com'}, 'req-1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['message'], 'Event user.signed_in ignored')
+        self.assertFalse(WebhookEvent.objects.exists())
+
+
+@override_settings(SUPABASE_URL='https://sb.example', SUPABASE_SERVICE_KEY='key', SUPABASE_ADMIN_RATE=None)
+class DelayedRegistrationTests(TestCase):
+    def test_outcomes_are_saved_per_user_between_runs(self):
+        for name in ('new', 'taken', 'limited', 'broken'):
+            User.objects.create_user(name, f'{name}@example.com', 'pw')
+        User.objects.update(date_joined=timezone.now() - timedelta(hours=1))
+
+        def create_user(client, email, password, metadata=None, email_verified=False):
+            errors = {
+                'taken': supabase_admin.AdminAPIError('422', status=422, body='{"msg": "User already registered"}'),
+                'limited': supabase_admin.AdminAPIError('429', status=429, body='{"msg": "Too many requests"}'),
+                'broken': supabase_admin.AdminAPIError('500', status=500, body='oops'),
+            }
+            if metadata['username'] in errors:
+                raise errors[metadata['username']]
+            return {'id': 'sb-new'}
+
+        remote = [{'id': 'sb-taken', 'email': 'TAKEN@example.com', 'email_confirmed_at': '2025-01-01T00:00:00Z'}]
+        out = io.StringIO()
+        with mock.patch.object(supabase_admin.AdminClient, 'create_user', autospec=True, side_effect=create_user), \
+                mock.patch.object(supabase_admin.AdminClient, 'fetch_page', return_value=(remote, 1)):
+            call_command('process_delayed_registrations', workers=2, stdout=out)
+        self.assertIn('1 registered, 1 linked to existing Supabase users, 1 to retry, 1 deferred by rate limits', out.getvalue())
+
+        self.assertEqual(User.objects.get(username='new').supabase_id, 'sb-new')
+        taken = User.objects.get(username='taken')
+        self.assertEqual((taken.supabase_id, taken.email_verified), ('sb-taken', True))
+        states = {state.user.username: state for state in DelayedRegistration.objects.select_related('user')}
+        self.assertEqual((states['limited'].status, states['limited'].attempts), ('pending', 0))
+        self.assertEqual((states['broken'].status, states['broken'].attempts), ('pending', 1))
+        self.assertIn('500', states['broken'].last_error)
+
+        # Both are backing off, so the next run has nothing to do
+        out = io.StringIO()
+        call_command('process_delayed_registrations', stdout=out)
+        self.assertIn('Found 0 users', out.getvalue())
+
+    def test_admin_client_waits_for_the_token_bucket(self):
+        client = supabase_admin.AdminClient(rate='600/m', burst=1)
+        with mock.patch.object(supabase_admin.ratelimit, 'hit', side_effect=[(False, 0.01), (True, 0)]) as hit:
+            client._throttle()
+        self.assertEqual(hit.call_count, 2)
+        self.assertAlmostEqual(client.throttled_seconds, 0.01)
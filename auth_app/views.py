@@ -7,7 +7,7 @@ from django.core.exceptions import PermissionDenied, ObjectDoesNotExist
 from django.contrib import messages
 from django.utils import timezone
 from django.conf import settings
-from django.core.mail import send_mail, get_connection
+from django.core.mail import send_mail, get_connection, EmailMultiAlternatives
 from django.template.loader import render_to_string
 from django.utils.html import strip_tags
 from django.utils.crypto import get_random_string
@@ -22,6 +22,7 @@ except ImportError:
     SUPABASE_AVAILABLE = False
     
 from .models import User, Session, UserProfile
+from . import supabase_session, telemetry
 # Import the Supabase utility functions
 from .supabase_utils import (
     supabase_client, 
@@ -373,7 +374,7 @@ def login(request):
                 return render(request, 'auth/login.html', {'show_register_link': True})
             
         # Check if account is locked
-        if hasattr(user, 'account_locked_until') and user.account_locked_until and user.account_locked_until > timezone.now():
+        if hasattr(user, 'account_locked_until') and telemetry.is_locked(user):
             lock_time_remaining = user.account_locked_until - timezone.now()
             minutes_remaining = int(lock_time_remaining.total_seconds() / 60) + 1
             messages.error(request, 
@@ -412,22 +413,15 @@ def login(request):
         # Authenticate user
         user_auth = authenticate(request, username=user.username, password=password)
         if user_auth is None:
-            # Failed login - update failed attempts counter
+            # Failed login - count it (batched); reaching the limit locks the account right away
             if hasattr(user, 'failed_login_attempts'):
-                user.failed_login_attempts = (user.failed_login_attempts or 0) + 1
-                
-                # Check if we should lock the account
-                if user.failed_login_attempts >= getattr(settings, 'MAX_FAILED_LOGINS', 5):
-                    # Lock account for 30 minutes
-                    user.account_locked_until = timezone.now() + timezone.timedelta(minutes=30)
+                user.increment_login_attempts()
+                if telemetry.is_locked(user):
                     messages.error(request,
                         "Your account has been temporarily locked due to multiple failed login attempts. "
                         "Please try again in 30 minutes or reset your password."
                     )
-                    user.save()
                     return render(request, 'auth/login.html', {'show_reset': True})
-                
-                user.save()
             
             messages.error(request, "Invalid username or password.")
             return render(request, 'auth/login.html')
@@ -454,14 +448,14 @@ def login(request):
             messages.warning(request, "Your email address has not been verified. If you just clicked the verification link, please wait a few seconds and try again. If you still see this message, click 'Resend Verification Email' or contact support.")
             return render(request, 'auth/login.html', {'email': user_auth.email, 'show_resend': True})
         
-        # Successful login - reset failed login attempts
+        # Successful login - reset failed login attempts (no write unless any were recorded)
         if hasattr(user, 'failed_login_attempts'):
-            user.failed_login_attempts = 0
-            user.account_locked_until = None
-            user.save()
+            user.reset_login_attempts()
         
         # Log the user in
         auth_login(request, user_auth)
+        if getattr(user_auth, '_supabase_session_token', None):
+            request.session['supabase_access_token'] = user_auth._supabase_session_token
         
         # Set session expiry based on remember me
         if remember_me:
@@ -532,6 +526,8 @@ def logout(request):
         supabase.auth.sign_out()
     except Exception as e:
         logger.error(f"Error during logout: {str(e)}")
+    if request.user.is_authenticated:
+        supabase_session.forget(request.user.pk)
     
     auth_logout(request)
     messages.success(request, "Logged out successfully")
@@ -601,16 +597,17 @@ def send_custom_verification_email(request, user, verification_token=None, raw_s
         
         logger.info(f"Sending '{email_subject_type}' email to {user.email}")
         try:
-            send_mail(
+            # Queued in the outbox by EMAIL_BACKEND; delivered by the deliver_outbox command
+            email_message = EmailMultiAlternatives(
                 f'Please Verify Your Email - {site_name} {email_subject_type}',
                 text_email,
                 f'{site_name} <{settings.DEFAULT_FROM_EMAIL}>',
                 [user.email],
-                html_message=html_email,
-                fail_silently=False,
-                # headers=headers # headers arg might not be available in older Django send_mail
+                headers=headers,
             )
-            logger.info(f"Verification email ('{email_subject_type}') sent successfully to {user.email}")
+            email_message.attach_alternative(html_email, 'text/html')
+            email_message.send(fail_silently=False)
+            logger.info(f"Verification email ('{email_subject_type}') queued for {user.email}")
             return True
         except smtplib.SMTPException as e:
             logger.error(f"SMTP error sending custom verification email to {user.email}: {str(e)}. This may be a network or configuration issue. Please check your SMTP settings and connectivity.")
@@ -1200,7 +1197,7 @@ def account_settings(request):
                 try:
                     # Update in Supabase with the correct signature
                     try:
-                        access_token = request.session.get('supabase_access_token')
+                        access_token = request.session.get('supabase_access_token') or supabase_session.cached_token(request.user.pk)
                         if not access_token:
                             # Try to get from current session
                             current_session = supabase.auth.current_session
@@ -1230,7 +1227,7 @@ def account_settings(request):
             try:
                 # Update in Supabase with the correct signature
                 try:
-                    access_token = request.session.get('supabase_access_token')
+                    access_token = request.session.get('supabase_access_token') or supabase_session.cached_token(request.user.pk)
                     if not access_token:
                         # Try to get from current session
                         current_session = supabase.auth.current_session
@@ -1417,18 +1414,18 @@ def password_reset(request):
                 html_email = render_to_string('emails/password_reset_email.html', context)
                 text_email = render_to_string('emails/password_reset_email_text.html', context)
                 
-                # Send the email
-                send_mail(
+                # Queue the email (EMAIL_BACKEND writes it to the outbox)
+                email_message = EmailMultiAlternatives(
                     f'Password Reset Instructions - {site_name}',
                     text_email,
                     f'{site_name} <{settings.DEFAULT_FROM_EMAIL}>',
                     [user.email],
-                    html_message=html_email,
                     headers=headers,
-                    fail_silently=False,
                 )
+                email_message.attach_alternative(html_email, 'text/html')
+                email_message.send(fail_silently=False)
                 
-                logger.info(f"Password reset email sent to: {email}")
+                logger.info(f"Password reset email queued for: {email}")
                 
                 # Store the token in the session for potential reference
                 request.session['password_reset_token'] = reset_token
@@ -1452,9 +1449,8 @@ def password_reset(request):
             "Please check your inbox (and spam folder) for further instructions."
         )
         
-        # Add a slight delay to prevent timing attacks that could reveal user existence
-        time.sleep(random.uniform(0.5, 1.5))
-        
+        # No artificial delay: the email is only queued here, so an existing
+        # account no longer makes the response measurably slower
         return redirect('login')
     
     # GET request - just show the password reset form
@@ -1512,6 +1508,7 @@ def password_reset_confirm(request, uidb64=None, token=None):
                 user.failed_login_attempts = 0
                 user.account_locked_until = None
                 user.save()
+                telemetry.forget_failures(user.pk)
                 
                 logger.info(f"Password reset successful for user: {user.email}")
                 
@@ -1967,21 +1964,24 @@ def setup_custom_smtp(request):
             settings.DEFAULT_FROM_EMAIL = sender_email
             settings.EMAIL_USE_TLS = int(smtp_port) == 587
             settings.EMAIL_USE_SSL = int(smtp_port) == 465
-            settings.EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+            settings.OUTBOX_DELIVERY_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
             
             messages.success(request, "SMTP settings saved successfully!")
             
             # Send test email if requested
             if send_test:
                 from django.core.mail import send_mail
+                from .outbox import delivery_connection
                 
                 try:
+                    # Bypass the outbox so the new SMTP settings are tested right away
                     send_mail(
                         subject=f"Test email from {sender_name}",
                         message="This is a test email from your Nexus application. If you received this, your SMTP settings are working correctly!",
                         from_email=f"{sender_name} <{sender_email}>",
                         recipient_list=[admin_email],
                         fail_silently=False,
+                        connection=delivery_connection(),
                     )
                     messages.success(request, f"Test email sent to {admin_email}. Please check your inbox!")
                 except Exception as email_error:
@@ -2207,15 +2207,13 @@ def test_email_sending(request):
                 headers.update(settings.EMAIL_EXTRA_HEADERS)
             
             logger.info(f"Sending test email to {test_email}")
-            send_result = send_mail(
-                subject=subject,
-                message=message,
-                from_email=from_email,
-                recipient_list=[test_email],
-                html_message=html_message,
-                fail_silently=False,
-                headers=headers
+            # Sent directly over the delivery backend (not the outbox) so SMTP problems show up here
+            from .outbox import delivery_connection
+            email_message = EmailMultiAlternatives(
+                subject, message, from_email, [test_email], headers=headers, connection=delivery_connection(),
             )
+            email_message.attach_alternative(html_message, 'text/html')
+            send_result = email_message.send(fail_silently=False)
             
             if send_result == 1:
                 logger.info(f"Test email sent successfully to {test_email}")
@@ -2823,7 +2821,7 @@ def test_webhook(request):
             # Make the webhook request
             response = requests.post(webhook_url, json=payload, headers=headers)
             
-            if response.status_code == 200:
+            if response.status_code in (200, 202):
                 messages.success(request, f"Webhook test successful! Event: {event_type}, Response: {response.text}")
             else:
                 messages.error(request, f"Webhook test failed. Status: {response.status_code}, Response: {response.text}")
@@ -0,0 +1,335 @@
+"""
+Durable inbox for Supabase webhook events.
+
+``supabase_webhook_handler`` only verifies the signature and ``enqueue``s the
+event, so a burst of webhooks costs one insert each and Supabase gets its
+answer straight away. Redeliveries carry the same event (or request) ID and
+are dropped by the unique ``event_id``.
+
+``process`` (run by the ``process_webhooks`` command) claims pending events
+under a lease and applies them in one transaction per batch. Events about the
+same user are applied in the order they arrived: a user's events are only
+claimed starting from its oldest unfinished one, and when an event fails the
+rest of that user's events wait behind its retry. Failures are retried with
+exponential backoff and dead-lettered after ``WEBHOOK_INBOX_MAX_ATTEMPTS``.
+Applying is at-least-once, so every handler is idempotent.
+"""
+import hashlib
+import logging
+import random
+import uuid
+from collections import defaultdict
+from datetime import timedelta
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, F, Min, Q
+from django.utils import timezone
+
+from .models import User, UserProfile, WebhookEvent
+from .supabase_admin import is_email_verified
+
+logger = logging.getLogger(__name__)
+
+EVENT_TYPES = ('user.created', 'user.updated', 'user.deleted')  # others are answered 'ignored' and not stored
+BATCH_SIZE = 100
+MAX_ATTEMPTS = 8
+BACKOFF_BASE = 5  # seconds, doubled after every failed attempt
+BACKOFF_MAX = 60 * 60
+LEASE_SECONDS = 300
+CANDIDATE_FACTOR = 5
+KEEP_DONE_DAYS = 7
+
+
+class InvalidEvent(Exception):
+    """The event can never be applied (e.g. it names no user); it is dead-lettered at once."""
+
+
+def _setting(name, default):
+    return getattr(settings, f'WEBHOOK_INBOX_{name}', default)
+
+
+@lru_cache(maxsize=None)
+def table_columns(table):
+    """Column names of ``table``, introspected once per process."""
+    with connection.cursor() as cursor:
+        return frozenset(column.name for column in connection.introspection.get_table_description(cursor, table))
+
+
+def _record(payload):
+    record = payload.get('record') or payload.get('old_record') or {}
+    return record if isinstance(record, dict) else {}
+
+
+def event_id_for(payload, headers, body):
+    """The ID a delivery is deduplicated by: the event's own, the request's, or a hash of the body."""
+    for value in (
+        payload.get('event_id'),
+        payload.get('id'),
+        headers.get('webhook-id'),
+        headers.get('X-Request-Id'),
+    ):
+        if value and value != 'unknown':
+            return str(value)[:255]
+    return f"sha256:{hashlib.sha256(body).hexdigest()}"
+
+
+def enqueue(payload, event_id):
+    """Store an event in the inbox. Returns ``(event, created)``; ``created`` is ``False`` for a redelivery."""
+    record = _record(payload)
+    subject = record.get('id') or (record.get('email') or '').lower()
+    return WebhookEvent.objects.get_or_create(
+        event_id=event_id,
+        defaults={'event_type': payload.get('type', ''), 'subject': str(subject)[:255], 'payload': payload},
+    )
+
+
+def _find_users(supabase_id, email):
+    query = Q()
+    if supabase_id:
+        query |= Q(supabase_id=supabase_id)
+    if email:
+        query |= Q(email__iexact=email)
+    return User.objects.filter(query)
+
+
+def apply_user_deleted(record):
+    supabase_id, email = record.get('id'), record.get('email')
+    if not supabase_id and not email:
+        raise InvalidEvent("User deletion event missing user identifiers")
+    users = _find_users(supabase_id, email)
+    if 'deleted_at' in table_columns(User._meta.db_table):
+        count = users.filter(deleted_at__isnull=True).update(deleted_at=timezone.now())
+        return f"Soft-deleted {count} Django user(s)"
+    count, _ = users.delete()
+    return f"Hard-deleted {count} Django user(s)"
+
+
+def _username_for(email, record):
+    user_meta = record.get('raw_user_meta_data') or {}
+    suggested = user_meta.get('username') if isinstance(user_meta, dict) else None
+    if suggested and not User.objects.filter(username=suggested).exists():
+        return suggested
+    base = email.split('@')[0]
+    taken = set(User.objects.filter(username__startswith=base).values_list('username', flat=True))
+    username, suffix = base, 1
+    while username in taken:
+        username = f"{base}_{suffix}"
+        suffix += 1
+    return username
+
+
+def apply_user_created(record):
+    supabase_id, email = record.get('id'), record.get('email')
+    if not supabase_id or not email:
+        raise InvalidEvent("User creation event missing required user identifiers")
+    columns = table_columns(User._meta.db_table)
+    email_verified = is_email_verified(record)
+
+    existing = _find_users(supabase_id, email).order_by('date_joined').first()
+    if existing:
+        updated_fields = []
+        if existing.email != email:
+            existing.email = email
+            updated_fields.append('email')
+        if 'supabase_id' in columns and existing.supabase_id != supabase_id:
+            existing.supabase_id = supabase_id
+            updated_fields.append('supabase_id')
+        if 'email_verified' in columns and email_verified and not existing.email_verified:
+            existing.email_verified = True
+            updated_fields.append('email_verified')
+        if updated_fields:
+            existing.save(update_fields=updated_fields)
+        return "Updated existing Django user"
+
+    user = User(username=_username_for(email, record), email=email)
+    if 'supabase_id' in columns:
+        user.supabase_id = supabase_id
+    if 'email_verified' in columns:
+        user.email_verified = email_verified
+    # The user signed up through Supabase; a local password is only set by a reset
+    user.set_unusable_password()
+    user.save()
+
+    profile_columns = table_columns(UserProfile._meta.db_table)
+    defaults = {}
+    if 'supabase_uid' in profile_columns:
+        defaults['supabase_uid'] = supabase_id
+    if 'verified' in profile_columns:
+        defaults['verified'] = email_verified
+    UserProfile.objects.get_or_create(user=user, defaults=defaults)
+    logger.info(f"Created new Django user {email} from Supabase webhook")
+    return "Created new Django user"
+
+
+def apply_user_updated(record):
+    supabase_id, email = record.get('id'), record.get('email')
+    if not supabase_id and not email:
+        raise InvalidEvent("User update event missing user identifiers")
+    users = list(_find_users(supabase_id, email).order_by('date_joined'))
+    if not users:
+        # Created in Supabase before we heard of it
+        return apply_user_created(record)
+
+    primary = users[0]
+    if email:
+        primary.email = email
+    if supabase_id:
+        primary.supabase_id = supabase_id
+    if is_email_verified(record):
+        primary.email_verified = True
+    primary.save(update_fields=['email', 'supabase_id', 'email_verified'])
+    for duplicate in users[1:]:
+        duplicate.delete()
+        logger.info(f"Deleted duplicate user {duplicate.email} during update")
+    return "Updated Django user" if len(users) == 1 else f"Updated primary user and removed {len(users) - 1} duplicates"
+
+
+HANDLERS = {
+    'user.created': apply_user_created,
+    'user.updated': apply_user_updated,
+    'user.deleted': apply_user_deleted,
+}
+
+
+def apply(event):
+    """Apply one event to the local users. Returns a short description of what changed."""
+    handler = HANDLERS.get(event.event_type)
+    if handler is None:
+        # Only EVENT_TYPES are enqueued; anything else is acknowledged, not dead-lettered
+        return f"Ignored {event.event_type or 'untyped'} event"
+    return handler(_record(event.payload))
+
+
+def backoff(attempts):
+    """Seconds to wait before retrying after ``attempts`` failures, with jitter."""
+    delay = min(_setting('BACKOFF_MAX', BACKOFF_MAX), _setting('BACKOFF_BASE', BACKOFF_BASE) * 2 ** (attempts - 1))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def _due(now):
+    # Events left in 'processing' by a worker that died are due again once their lease runs out
+    return (Q(status='pending') | Q(status='processing', locked_until__lte=now)) & Q(next_attempt_at__lte=now)
+
+
+def _release(events, error=''):
+    """Put claimed events back without using up an attempt."""
+    for event in events:
+        WebhookEvent.objects.filter(pk=event.pk, claim_token=event.claim_token).update(
+            status='pending', locked_until=None, claim_token=None, last_error=str(error)[:2000],
+        )
+
+
+def claim(limit=BATCH_SIZE, now=None):
+    """
+    Lease up to ``limit`` due events, oldest first, taking a user's events
+    only from its oldest unfinished one on. Returns the claimed events.
+    """
+    now = now or timezone.now()
+    candidates = list(
+        WebhookEvent.objects.filter(_due(now)).order_by('id').values_list('id', 'subject')[:limit * CANDIDATE_FACTOR]
+    )
+    if not candidates:
+        return []
+    # A user whose oldest unfinished event is backing off or leased elsewhere has to wait for it
+    heads = dict(
+        WebhookEvent.objects.filter(subject__in={subject for _, subject in candidates}, status__in=('pending', 'processing'))
+        .values('subject').annotate(head=Min('id')).values_list('subject', 'head')
+    )
+    picked, started = [], set()
+    for event_id, subject in candidates:
+        if subject in started or heads.get(subject) == event_id:
+            started.add(subject)
+            picked.append(event_id)
+            if len(picked) >= limit:
+                break
+
+    # Compare-and-set: only events still due are taken, so concurrent workers never share one
+    token = uuid.uuid4()
+    WebhookEvent.objects.filter(_due(now), id__in=picked).update(
+        status='processing', claim_token=token, locked_until=now + timedelta(seconds=_setting('LEASE_SECONDS', LEASE_SECONDS)),
+    )
+    claimed = list(WebhookEvent.objects.filter(claim_token=token, status='processing').order_by('id'))
+    # Another worker won a user's first event: leave the rest of that user's events to it
+    taken = {event.pk for event in claimed}
+    lost = {subject for subject in started if heads[subject] not in taken}
+    if lost:
+        _release([event for event in claimed if event.subject in lost])
+        claimed = [event for event in claimed if event.subject not in lost]
+    return claimed
+
+
+def _mark_failed(event, error):
+    """Schedule a retry of ``event`` or dead-letter it. Returns 'retried' or 'dead'."""
+    attempts = event.attempts + 1
+    dead = isinstance(error, InvalidEvent) or attempts >= _setting('MAX_ATTEMPTS', MAX_ATTEMPTS)
+    WebhookEvent.objects.filter(pk=event.pk, claim_token=event.claim_token).update(
+        status='dead' if dead else 'pending', attempts=attempts, last_error=str(error)[:2000],
+        next_attempt_at=timezone.now() + timedelta(seconds=0 if dead else backoff(attempts)),
+        locked_until=None, claim_token=None,
+    )
+    if dead:
+        logger.error(f"Dead-lettered webhook event {event.event_id} ({event.event_type}) after {attempts} attempt(s): {str(error)}")
+    else:
+        logger.warning(f"Webhook event {event.event_id} ({event.event_type}) failed, will retry: {str(error)}")
+    return 'dead' if dead else 'retried'
+
+
+def process(batch_size=BATCH_SIZE):
+    """
+    Claim and apply one batch in a single transaction, each event under its
+    own savepoint. Returns counts of applied, retried, dead and deferred events.
+    """
+    events = claim(batch_size)
+    totals = defaultdict(int)
+    if not events:
+        return dict(totals)
+
+    applied, failed, deferred, blocked = [], [], [], set()
+    with transaction.atomic():
+        for event in events:
+            if event.subject in blocked:
+                # An earlier event about this user failed; keep the order
+                deferred.append(event)
+                continue
+            try:
+                with transaction.atomic():
+                    result = apply(event)
+            except Exception as e:
+                failed.append((event, e))
+                blocked.add(event.subject)
+                continue
+            logger.info(f"Applied webhook event {event.event_id} ({event.event_type}): {result}")
+            applied.append(event.pk)
+        if applied:
+            WebhookEvent.objects.filter(pk__in=applied, claim_token=events[0].claim_token).update(
+                status='done', processed_at=timezone.now(), attempts=F('attempts') + 1,
+                locked_until=None, claim_token=None, last_error='',
+            )
+    if applied:
+        totals['applied'] += len(applied)
+    for event, error in failed:
+        totals[_mark_failed(event, error)] += 1
+    if deferred:
+        _release(deferred, 'Waiting for an earlier event about the same user')
+        totals['deferred'] += len(deferred)
+    return dict(totals)
+
+
+def requeue_dead(ids=None):
+    """Give dead-lettered events (all, or ``ids``) a fresh set of attempts. Returns how many."""
+    queryset = WebhookEvent.objects.filter(status='dead')
+    if ids is not None:
+        queryset = queryset.filter(id__in=ids)
+    return queryset.update(status='pending', attempts=0, next_attempt_at=timezone.now(), last_error='')
+
+
+def prune_done(days=KEEP_DONE_DAYS):
+    """Delete applied events older than ``days``. Returns how many."""
+    deleted, _ = WebhookEvent.objects.filter(status='done', processed_at__lt=timezone.now() - timedelta(days=days)).delete()
+    return deleted
+
+
+def stats():
+    return dict(WebhookEvent.objects.values('status').annotate(count=Count('id')).values_list('status', 'count'))
@@ -0,0 +1,94 @@
+"""
+Bulk task import throughput, in tasks per minute.
+
+Generates ``--tasks`` records spread over a few projects, tags and assignees
+and imports them with ``tasks.importers.import_tasks`` on a throwaway test
+database, so the figure includes parsing, name resolution and every row the
+importer writes (links, versions, activities, hierarchy, dedupe signatures,
+snapshots and the change log). The target is 100k tasks per minute.
+
+    python benchmark_import.py --tasks 100000 --format csv
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import random
+import time
+import uuid
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mysite.settings')
+os.environ.setdefault('SUPPRESS_EMAIL_WARNINGS', 'true')
+django.setup()
+
+from django.db import connection  # noqa: E402
+
+from auth_app.models import User  # noqa: E402
+from tasks.importers import DEFAULT_BATCH_SIZE, SUPPORTED_FORMATS, import_tasks  # noqa: E402
+
+FIELDS = ['title', 'description', 'priority', 'status', 'project', 'tags', 'assignees', 'due_date', 'estimated_hours']
+WORDS = 'plan draft review ship fix test deploy update migrate audit design write call sync'.split()
+
+
+def make_records(count, assignees):
+    rng = random.Random(42)
+    for i in range(count):
+        yield {
+            'title': f"{' '.join(rng.sample(WORDS, 3)).capitalize()} #{i}",
+            'description': ' '.join(rng.choices(WORDS, k=20)),
+            'priority': rng.choice(['low', 'medium', 'high', 'urgent']),
+            'status': rng.choice(['todo', 'in_progress', 'completed']),
+            'project': f'Project {i % 20}',
+            'tags': ','.join(rng.sample(['docs', 'backend', 'frontend', 'ops', 'bug'], 2)),
+            'assignees': rng.choice(assignees),
+            'due_date': f'2030-{1 + i % 12:02d}-{1 + i % 28:02d}',
+            'estimated_hours': str(rng.randint(1, 16)),
+        }
+
+
+def render(records, fmt):
+    if fmt == 'csv':
+        out = io.StringIO()
+        writer = csv.DictWriter(out, FIELDS)
+        writer.writeheader()
+        writer.writerows(records)
+        return out.getvalue()
+    if fmt == 'ndjson':
+        return '\n'.join(json.dumps(record) for record in records)
+    return json.dumps(list(records))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tasks', type=int, default=100000)
+    parser.add_argument('--format', choices=SUPPORTED_FORMATS, default='csv')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        owner = User.objects.create_user(username='bench-owner', email='owner@bench.invalid')
+        assignees = []
+        for i in range(10):
+            user = User.objects.create_user(username=f'bench-{uuid.uuid4().hex[:8]}', email=f'user{i}@bench.invalid')
+            assignees.append(user.username)
+        data = render(make_records(args.tasks, assignees), args.format)
+
+        started = time.perf_counter()
+        result = import_tasks(io.StringIO(data), args.format, owner, batch_size=args.batch_size)
+        elapsed = time.perf_counter() - started
+
+        print(f"{result.created} tasks from {len(data) / 1e6:.1f} MB of {args.format} "
+              f"in {result.batches} batch(es) of {args.batch_size}, {result.skipped} skipped")
+        print(f"{elapsed:.1f}s, {result.created / elapsed * 60:,.0f} tasks/min "
+              f"({connection.vendor}, {connection.settings_dict['NAME']})")
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+"""
+Tail-latency benchmark for the read endpoints under mixed load.
+
+A few clients keep a slow endpoint busy (by default a chatbot message, which
+waits on the LLM) while many clients hammer the fast read endpoints; the
+script reports p50/p95/p99/max latency of the fast reads.
+
+Run it once against the WSGI deployment and once against the ASGI one with
+the same data and session, e.g.:
+
+    gunicorn mysite.wsgi:application --workers=1 --threads=4 --bind :8000
+    python benchmark_read_latency.py --session <sessionid> --label wsgi
+
+    gunicorn mysite.asgi:application -k uvicorn.workers.UvicornWorker --workers=1 --bind :8000
+    python benchmark_read_latency.py --session <sessionid> --label asgi
+
+With four busy threads the WSGI server queues every read behind the slow
+requests, which shows up directly in p95/p99; under ASGI the async reads
+keep being served from the event loop.
+"""
+import argparse
+import statistics
+import threading
+import time
+from collections import defaultdict
+
+import requests
+
+DEFAULT_FAST_PATHS = [
+    '/tasks/tasks/stats/',
+    '/tasks/api/tasks/',
+    '/tasks/api/projects/',
+    '/chatbot/history/',
+]
+
+
+def percentile(values, pct):
+    if not values:
+        return float('nan')
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def make_session(args):
+    session = requests.Session()
+    session.cookies.set('sessionid', args.session)
+    adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=args.fast_clients + args.slow_clients)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def slow_client(session, args, stop):
+    url = args.base_url.rstrip('/') + args.slow_path
+    while not stop.is_set():
+        try:
+            session.post(url, json={'message': args.slow_message}, timeout=args.timeout)
+        except requests.RequestException:
+            pass
+
+
+def fast_client(session, args, stop, paths, results, errors, lock):
+    base = args.base_url.rstrip('/')
+    i = 0
+    while not stop.is_set():
+        path = paths[i % len(paths)]
+        i += 1
+        started = time.perf_counter()
+        try:
+            response = session.get(base + path, timeout=args.timeout)
+            ok = response.status_code < 400
+        except requests.RequestException:
+            ok = False
+        elapsed = (time.perf_counter() - started) * 1000
+        with lock:
+            if ok:
+                results[path].append(elapsed)
+            else:
+                errors[path] += 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+    parser.add_argument('--session', required=True, help='Value of a logged-in sessionid cookie')
+    parser.add_argument('--label', default='run', help='Name printed with the results')
+    parser.add_argument('--duration', type=float, default=30, help='Seconds to run (default: 30)')
+    parser.add_argument('--fast-clients', type=int, default=16)
+    parser.add_argument('--slow-clients', type=int, default=4)
+    parser.add_argument('--slow-path', default='/chatbot/message/')
+    parser.add_argument('--slow-message', default='Summarize all of my open tasks and suggest priorities')
+    parser.add_argument('--fast-path', action='append', dest='fast_paths',
+                        help='Read endpoint to measure (repeatable)')
+    parser.add_argument('--timeout', type=float, default=120)
+    args = parser.parse_args()
+
+    paths = args.fast_paths or DEFAULT_FAST_PATHS
+    session = make_session(args)
+    stop = threading.Event()
+    lock = threading.Lock()
+    results = defaultdict(list)
+    errors = defaultdict(int)
+
+    threads = [
+        threading.Thread(target=slow_client, args=(session, args, stop), daemon=True)
+        for _ in range(args.slow_clients)
+    ]
+    # Let the slow requests occupy the server before measuring
+    for thread in threads:
+        thread.start()
+    time.sleep(1)
+    fast_threads = [
+        threading.Thread(target=fast_client, args=(session, args, stop, paths, results, errors, lock), daemon=True)
+        for _ in range(args.fast_clients)
+    ]
+    for thread in fast_threads:
+        thread.start()
+
+    time.sleep(args.duration)
+    stop.set()
+    for thread in fast_threads:
+        thread.join(args.timeout)
+
+    print(f"\n[{args.label}] {args.slow_clients} slow clients on {args.slow_path}, "
+          f"{args.fast_clients} read clients, {args.duration:.0f}s")
+    print(f"{'endpoint':<28}{'n':>7}{'err':>6}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}  (ms)")
+    everything = []
+    for path in paths:
+        values = results[path]
+        everything.extend(values)
+        print(f"{path:<28}{len(values):>7}{errors[path]:>6}"
+              f"{percentile(values, 50):>10.1f}{percentile(values, 95):>10.1f}"
+              f"{percentile(values, 99):>10.1f}{max(values, default=float('nan')):>10.1f}")
+    if everything:
+        print(f"{'all reads':<28}{len(everything):>7}{sum(errors.values()):>6}"
+              f"{statistics.median(everything):>10.1f}{percentile(everything, 95):>10.1f}"
+              f"{percentile(everything, 99):>10.1f}{max(everything):>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
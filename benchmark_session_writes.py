@@ -0,0 +1,128 @@
+"""
+Session write benchmark: stock database backend vs ``auth_app.session_store``.
+
+Replays the same simulated traffic against both session engines on a
+throwaway test database and counts the statements that write to
+``django_session``. The traffic mimics the site: every request loads the
+session and, because of ``SESSION_SAVE_EVERY_REQUEST``, saves it; a small
+share of requests actually change session data (logins, messages, form
+state). Users work in bursts of page views a few seconds apart, separated by
+longer idle gaps. Time is simulated, so a run covering a working day of
+traffic takes about a minute.
+
+    python benchmark_session_writes.py --users 200 --hours 8
+
+Only statement counts are compared; wall-clock time on a quiet machine says
+little about contention for the SQLite write lock, which is the point.
+"""
+import argparse
+import os
+import random
+from importlib import import_module
+from datetime import timedelta
+from unittest import mock
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mysite.settings')
+os.environ.setdefault('SUPPRESS_EMAIL_WARNINGS', 'true')
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.utils import timezone  # noqa: E402
+
+ENGINES = ['django.contrib.sessions.backends.db', 'auth_app.session_store']
+
+
+class Clock:
+    def __init__(self):
+        self.now = timezone.now()
+
+    def __call__(self):
+        return self.now
+
+
+def traffic(args):
+    """``[(seconds_since_start, user_index, changes_data)]`` for the whole run, in time order."""
+    rng = random.Random(args.seed)
+    horizon = args.hours * 3600
+    events = []
+    for user in range(args.users):
+        t = rng.uniform(0, args.idle_gap)
+        while t < horizon:
+            for _ in range(1 + int(rng.expovariate(1 / args.burst_length))):
+                events.append((t, user, rng.random() < args.change_ratio))
+                t += rng.expovariate(1 / args.think_time)
+            t += rng.expovariate(1 / args.idle_gap)
+    events.sort()
+    return events
+
+
+def run(engine_path, events):
+    engine = import_module(engine_path)
+    clock = Clock()
+    start = clock.now
+    writes = {'INSERT': 0, 'UPDATE': 0, 'DELETE': 0}
+    reads = [0]
+
+    def count(execute, sql, params, many, context):
+        if 'django_session' in sql:
+            verb = sql.lstrip().split(' ', 1)[0].upper()
+            if verb in writes:
+                writes[verb] += 1
+            elif verb == 'SELECT':
+                reads[0] += 1
+        return execute(sql, params, many, context)
+
+    keys = {}
+    with mock.patch('django.utils.timezone.now', clock), connection.execute_wrapper(count):
+        for seconds, user, changes_data in events:
+            clock.now = start + timedelta(seconds=seconds)
+            session = engine.SessionStore(keys.get(user))
+            session.get('_auth_user_id')  # what AuthenticationMiddleware does
+            if user not in keys or changes_data:
+                session['_auth_user_id'] = str(user)
+                session['last_page'] = seconds
+            # SessionMiddleware with SESSION_SAVE_EVERY_REQUEST
+            session.save()
+            keys[user] = session.session_key
+        if hasattr(engine, 'flush_pending'):
+            engine.flush_pending()
+    return writes, reads[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--hours', type=float, default=8, help='Simulated hours of traffic')
+    parser.add_argument('--think-time', type=float, default=8, help='Mean seconds between page views in a burst')
+    parser.add_argument('--burst-length', type=float, default=12, help='Mean page views per burst')
+    parser.add_argument('--idle-gap', type=float, default=1800, help='Mean seconds between bursts')
+    parser.add_argument('--change-ratio', type=float, default=0.02, help='Share of requests that change session data')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    events = traffic(args)
+    old_name = settings.DATABASES['default']['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        print(f"{len(events)} requests from {args.users} users over {args.hours:g} simulated hours "
+              f"({args.change_ratio:.0%} change session data)")
+        print(f"  threshold={getattr(settings, 'SESSION_EXPIRY_WRITE_THRESHOLD', None)}s "
+              f"batch={getattr(settings, 'SESSION_WRITE_BATCH_SIZE', None)} "
+              f"flush={getattr(settings, 'SESSION_WRITE_FLUSH_INTERVAL', None)}s")
+        print(f"{'engine':<40}{'INSERT':>8}{'UPDATE':>8}{'writes':>8}{'SELECT':>8}")
+        baseline = None
+        for engine_path in ENGINES:
+            writes, reads = run(engine_path, events)
+            total = sum(writes.values())
+            baseline = baseline or total
+            print(f"{engine_path:<40}{writes['INSERT']:>8}{writes['UPDATE']:>8}{total:>8}{reads:>8}"
+                  f"   ({total / baseline:.1%} of baseline writes)")
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
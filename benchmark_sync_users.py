@@ -0,0 +1,162 @@
+"""
+``sync_users`` against a local fake of the Supabase admin API.
+
+Serves ``--users`` generated Supabase users from ``/auth/v1/admin/users``
+(paged with ``page``/``per_page`` and an ``X-Total-Count`` header, like
+GoTrue) on a local port, optionally adding ``--latency`` seconds per request,
+and runs ``sync_users --direction to-django`` against it on a throwaway test
+database. A share of the users already exist locally without a Supabase ID,
+so the run both creates and updates.
+
+With ``--interrupt-after N`` the fake API fails every request after the N-th
+page on the first run; the command is then run again and must resume from
+its checkpoint and finish with every user present exactly once.
+
+    python benchmark_sync_users.py --users 100000 --latency 0.05 --interrupt-after 40
+"""
+import argparse
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mysite.settings')
+os.environ.setdefault('SUPPRESS_EMAIL_WARNINGS', 'true')
+django.setup()
+
+from django.core.management import call_command  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test.utils import override_settings  # noqa: E402
+
+
+class FakeAdminAPI:
+    def __init__(self, count, latency, seed_namespace='sync-bench'):
+        namespace = uuid.uuid5(uuid.NAMESPACE_DNS, seed_namespace)
+        self.users = [
+            {
+                'id': str(uuid.uuid5(namespace, str(i))),
+                'email': f'user{i}@example.com',
+                'email_confirmed_at': '2025-01-01T00:00:00Z' if i % 3 else None,
+                'raw_user_meta_data': {'username': f'user{i}'} if i % 2 else {},
+            }
+            for i in range(count)
+        ]
+        self.latency = latency
+        self.fail_after_page = None
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    def handler(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                query = parse_qs(url.query)
+                page = int(query.get('page', ['1'])[0])
+                per_page = int(query.get('per_page', ['50'])[0])
+                with api.lock:
+                    api.requests += 1
+                if api.latency:
+                    time.sleep(api.latency)
+                if url.path != '/auth/v1/admin/users' or (api.fail_after_page and page > api.fail_after_page):
+                    self.send_response(503 if url.path == '/auth/v1/admin/users' else 404)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                users = api.users[(page - 1) * per_page:page * per_page]
+                body = json.dumps({'users': users, 'aud': 'authenticated'}).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.send_header('X-Total-Count', str(len(api.users)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+
+def run_sync(url, checkpoint, args):
+    output = io.StringIO()
+    with override_settings(SUPABASE_URL=url, SUPABASE_SERVICE_KEY='fake-service-key', SUPABASE_ADMIN_RATE=None):
+        started = time.perf_counter()
+        call_command(
+            'sync_users', direction='to-django', page_size=args.page_size, workers=args.workers,
+            batch_size=args.batch_size, checkpoint=checkpoint, stdout=output, verbosity=0,
+        )
+        elapsed = time.perf_counter() - started
+    lines = output.getvalue().strip().splitlines()
+    return elapsed, [line for line in lines if not line.startswith('  Page ')]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--existing', type=float, default=0.1, help='Share of users that already exist locally')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every API request')
+    parser.add_argument('--page-size', type=int, default=1000)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--interrupt-after', type=int, default=0, help='Fail the first run after this many pages')
+    args = parser.parse_args()
+
+    from auth_app.models import User
+
+    api = FakeAdminAPI(args.users, args.latency)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), api.handler())
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{server.server_port}'
+
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    checkpoint = os.path.join(tempfile.mkdtemp(), 'sync_users.checkpoint.json')
+    try:
+        existing = int(args.users * args.existing)
+        User.objects.bulk_create(
+            [User(username=f'local{i}', email=f'user{i}@example.com') for i in range(0, args.users, max(1, args.users // existing))]
+            if existing else [],
+            batch_size=500,
+        )
+        print(f"{args.users} Supabase users, {User.objects.count()} already local, "
+              f"page size {args.page_size}, {args.workers} workers, {args.latency * 1000:g} ms per request")
+
+        if args.interrupt_after:
+            api.fail_after_page = args.interrupt_after
+            elapsed, lines = run_sync(url, checkpoint, args)
+            with open(checkpoint) as f:
+                saved = json.load(f)
+            print(f"interrupted run: {elapsed:.1f}s, {User.objects.count()} local users, "
+                  f"checkpoint at page {saved['page']}")
+            for line in lines:
+                print(f"  {line}")
+            api.fail_after_page = None
+
+        api.requests = 0
+        elapsed, lines = run_sync(url, checkpoint, args)
+        print(f"{'resumed' if args.interrupt_after else 'full'} run: {elapsed:.1f}s, {api.requests} API requests")
+        for line in lines:
+            print(f"  {line}")
+
+        linked = User.objects.exclude(supabase_id=None).count()
+        duplicates = User.objects.count() - User.objects.values('email').distinct().count()
+        print(f"{linked} of {args.users} users linked, {duplicates} duplicate emails, "
+              f"checkpoint {'left behind' if os.path.exists(checkpoint) else 'removed'}")
+    finally:
+        server.shutdown()
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""
+Task payload benchmark: DRF ``TaskSerializer`` vs the sparse-fieldset batch encoder.
+
+Creates ``--tasks`` tasks with assignees and tags on a throwaway test
+database and reports payload size and best-of-``--repeat`` serialization
+time, both scaled to 1k tasks, for the serializer behind the task API and
+for ``tasks.batch`` with a few field selections.
+
+    python benchmark_task_api.py --tasks 1000 --repeat 5
+"""
+import argparse
+import os
+import random
+import time
+import uuid
+from datetime import timedelta
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mysite.settings')
+os.environ.setdefault('SUPPRESS_EMAIL_WARNINGS', 'true')
+django.setup()
+
+from django.db import connection  # noqa: E402
+from django.utils import timezone  # noqa: E402
+from rest_framework.renderers import JSONRenderer  # noqa: E402
+
+from auth_app.models import User  # noqa: E402
+from tasks import batch  # noqa: E402
+from tasks.models import Task, TaskTag  # noqa: E402
+from tasks.serializers import TaskSerializer  # noqa: E402
+
+
+def make_user():
+    return User.objects.create_user(username=f'bench-{uuid.uuid4().hex[:8]}', email=f'{uuid.uuid4().hex[:8]}@bench.invalid')
+
+
+def seed(count):
+    owner = make_user()
+    assignees = [make_user() for _ in range(5)]
+    tags = [TaskTag.objects.create(name=f'tag{i}', created_by=owner) for i in range(5)]
+    now = timezone.now()
+    tasks = Task.objects.bulk_create([
+        Task(
+            title=f'Benchmark task {i}', description='Lorem ipsum dolor sit amet. ' * 8,
+            owner=owner, priority=random.choice(['low', 'medium', 'high', 'urgent']),
+            due_date=now + timedelta(days=i % 30), estimated_hours=random.randint(1, 16),
+            ai_summary='Summary ' * 40, ai_suggestions='Suggestion ' * 60,
+        )
+        for i in range(count)
+    ])
+    Task.assignees.through.objects.bulk_create([
+        Task.assignees.through(task_id=task.id, user_id=random.choice(assignees).id) for task in tasks
+    ])
+    Task.tags.through.objects.bulk_create([
+        Task.tags.through(task_id=task.id, tasktag_id=random.choice(tags).id) for task in tasks
+    ])
+    return owner, [str(task.id) for task in tasks]
+
+
+def run(count, repeat):
+    owner, ids = seed(count)
+    scale = 1000 / count
+
+    def drf():
+        queryset = Task.objects.filter(pk__in=ids)
+        return JSONRenderer().render(TaskSerializer(queryset, many=True).data)
+
+    def sparse(fields):
+        columns, relations = batch.parse_fields(fields)
+        return lambda: batch.encode({'tasks': batch.fetch_tasks(owner, ids, columns, relations)})
+
+    variants = [
+        ('DRF TaskSerializer (all fields)', drf),
+        ('batch, default fields', sparse(None)),
+        ('batch, default + assignees,tags', sparse(list(batch.DEFAULT_FIELDS) + ['assignees', 'tags'])),
+        ('batch, every column', sparse(list(batch.COLUMN_FIELDS))),
+    ]
+
+    print(f'{count} tasks, best of {repeat} runs, figures per 1k tasks')
+    print(f"{'variant':<36}{'payload KB':>12}{'total ms':>10}")
+    for label, func in variants:
+        payload = func()
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - started)
+        print(f'{label:<36}{len(payload) * scale / 1024:>12.1f}{min(timings) * 1000 * scale:>10.1f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tasks', type=int, default=1000, help='Tasks per run (default: 1000)')
+    parser.add_argument('--repeat', type=int, default=5, help='Timed runs per variant (default: 5)')
+    args = parser.parse_args()
+
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        run(max(1, args.tasks), max(1, args.repeat))
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
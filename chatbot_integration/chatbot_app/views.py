@@ -18,6 +18,7 @@ from django.conf import settings
 from django.shortcuts import render
 from .models import ChatbotConversation, ChatMessage, Conversation, Message
 from tasks.models import Task, Project
+from tasks.decorators import async_login_required
 import logging
 from .task_automation import (
     check_task_statistics_request,
@@ -217,12 +218,12 @@ def process_message(request):
             return JsonResponse({'error': f'An error occurred: {str(e)}'}, status=500)
     return JsonResponse({'error': 'Invalid request method'}, status=405)
 
-@login_required
-def get_conversation_history(request):
+@async_login_required
+async def get_conversation_history(request):
     """Get the conversation history for the current user."""
     try:
         # Get the most recent conversation
-        conversation = Conversation.objects.filter(user=request.user).order_by('-last_updated').first()
+        conversation = await Conversation.objects.filter(user=request.user).order_by('-last_updated').afirst()
         
         if not conversation:
             return JsonResponse({'messages': []})
@@ -236,7 +237,7 @@ def get_conversation_history(request):
                 'is_user': msg.is_user,
                 'timestamp': msg.timestamp.isoformat()
             }
-            for msg in messages
+            async for msg in messages
         ]
         
         return JsonResponse({'messages': message_list})
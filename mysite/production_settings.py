@@ -87,7 +87,9 @@ if not SUPABASE_SERVICE_KEY:
 print(f"PRODUCTION SETTINGS: Supabase is {'ACTIVE' if not BYPASS_SUPABASE else 'BYPASSED'}. Using URL: {SUPABASE_URL}")
 
 # Additional settings needed in production
-EMAIL_BACKEND = os.environ.get('EMAIL_BACKEND', 'django.core.mail.backends.smtp.EmailBackend')
+# Mail is queued in the database outbox and sent by the deliver_outbox command
+EMAIL_BACKEND = os.environ.get('EMAIL_BACKEND', 'auth_app.outbox.OutboxEmailBackend')
+OUTBOX_DELIVERY_BACKEND = os.environ.get('OUTBOX_DELIVERY_BACKEND', 'django.core.mail.backends.smtp.EmailBackend')
 EMAIL_HOST = os.environ.get('EMAIL_HOST', 'smtp.gmail.com')
 EMAIL_PORT = int(os.environ.get('EMAIL_PORT', '465'))
 EMAIL_HOST_USER = os.environ.get('EMAIL_HOST_USER', '')
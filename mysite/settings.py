@@ -38,7 +38,6 @@ INSTALLED_APPS = [
     'auth_app',  # Custom auth app
     'mysite',
     'tasks',  # New tasks app
-    # 'django_ratelimit', # Temporarily disabled due to installation issues
     'rest_framework',
     'rest_framework_simplejwt',
     # 'chatbot_app',  # Original chatbot integration - commented out to avoid conflicts
@@ -56,9 +55,33 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'allauth.account.middleware.AccountMiddleware',
-    # 'django_ratelimit.middleware.RateLimitMiddleware', # Temporarily disabled
+    'auth_app.ratelimit.RateLimitMiddleware',  # Per-route limits from RATE_LIMITS
 ]
 
+# Rate limits by URL name (see auth_app/ratelimit.py). Keys: 'ip' or
+# 'post:<field>' / 'get:<field>' / 'param:<field>'.
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', 'True').lower() in ('true', '1', 't', 'yes')
+# Reverse proxies in front of the app; 'ip' keys use the X-Forwarded-For entry
+# added by the outermost one (0 = use REMOTE_ADDR, the app is reached directly)
+RATE_LIMIT_TRUSTED_PROXIES = int(os.environ.get('RATE_LIMIT_TRUSTED_PROXIES', '1'))
+RATE_LIMITS = {
+    'login': [
+        {'key': 'ip', 'rate': '20/m', 'methods': ['POST']},
+        {'key': 'post:username', 'rate': '10/5m', 'burst': 5, 'methods': ['POST']},
+    ],
+    'register': [
+        {'key': 'ip', 'rate': '10/h', 'burst': 3, 'methods': ['POST']},
+        {'key': 'post:email', 'rate': '3/h', 'methods': ['POST']},
+    ],
+    'password_reset': [
+        {'key': 'ip', 'rate': '10/h', 'burst': 3, 'methods': ['POST']},
+        {'key': 'post:email', 'rate': '3/h', 'methods': ['POST']},
+    ],
+    'validate_email_domain': [
+        {'key': 'ip', 'rate': '60/m', 'burst': 20},
+    ],
+}
+
 
 # Allauth settings
 ACCOUNT_SIGNUP_FIELDS = ['email', 'password1', 'password2']
@@ -89,7 +112,42 @@ SUPABASE_SYNC_ENABLED = os.environ.get('SUPABASE_SYNC_ENABLED', 'True').lower()
 BYPASS_SUPABASE = os.environ.get('BYPASS_SUPABASE', 'False').lower() in ('true', '1', 't', 'yes')
 BYPASS_SUPABASE_RATE_LIMITS = os.environ.get('BYPASS_SUPABASE_RATE_LIMITS', 'False').lower() in ('true', '1', 't', 'yes')
 
-WEBHOOK_MAX_RETRIES = int(os.environ.get('WEBHOOK_MAX_RETRIES', '3'))
+# How a successful local login is mirrored to Supabase: 'async' (in the background),
+# 'sync' (wait for it) or 'off'. Cached Supabase sessions are reused for at most
+# SUPABASE_SESSION_MAX_STALENESS seconds.
+SUPABASE_LOGIN_SYNC_MODE = os.environ.get('SUPABASE_LOGIN_SYNC_MODE', 'async')
+SUPABASE_SESSION_MAX_STALENESS = int(os.environ.get('SUPABASE_SESSION_MAX_STALENESS', '300'))
+SUPABASE_SIGN_IN_TIMEOUT = float(os.environ.get('SUPABASE_SIGN_IN_TIMEOUT', '10'))
+SUPABASE_RECONCILE_WORKERS = 4
+
+# Listing users through the Supabase admin API (sync_users): users per request and
+# requests in flight. An interrupted sync resumes from SYNC_USERS_CHECKPOINT_FILE.
+# Incremental syncs also re-apply users changed up to SYNC_USERS_WATERMARK_OVERLAP
+# seconds before the schedule's watermark.
+SUPABASE_ADMIN_PAGE_SIZE = int(os.environ.get('SUPABASE_ADMIN_PAGE_SIZE', '1000'))
+SUPABASE_ADMIN_WORKERS = int(os.environ.get('SUPABASE_ADMIN_WORKERS', '4'))
+# Quota for admin API requests (token bucket refilled at SUPABASE_ADMIN_RATE, holding
+# SUPABASE_ADMIN_BURST); set it to the project's limit. Kept in the default cache, which
+# is per-process LocMem unless CACHES is configured: use a shared backend such as Redis
+# when more than one process calls the admin API, or each gets the full quota.
+SUPABASE_ADMIN_RATE = os.environ.get('SUPABASE_ADMIN_RATE', '300/m')
+SUPABASE_ADMIN_BURST = int(os.environ.get('SUPABASE_ADMIN_BURST', '10'))
+SYNC_USERS_CHECKPOINT_FILE = os.path.join(BASE_DIR, 'logs', 'sync_users.checkpoint.json')
+SYNC_USERS_WATERMARK_OVERLAP = 300
+# run_sync_scheduler / run_scheduled_syncs: schedules run at once, and how long a
+# schedule's lease lasts before another worker may take it over (renewed while running).
+SYNC_SCHEDULER_WORKERS = 2
+SYNC_SCHEDULE_LEASE_SECONDS = 300
+
+# After a migrate that applied migrations, sync_supabase_users runs in a separate
+# process ('background') or not at all ('off'). mysite.test_runner turns it off, so
+# test databases are never synced.
+SYNC_USERS_AFTER_MIGRATE = os.environ.get('SYNC_USERS_AFTER_MIGRATE', 'background')
+TEST_RUNNER = 'mysite.test_runner.TestRunner'
+
+# Supabase webhooks are stored in an inbox and applied by `process_webhooks --loop`;
+# a failing event is retried with backoff and dead-lettered after this many attempts.
+WEBHOOK_INBOX_MAX_ATTEMPTS = int(os.environ.get('WEBHOOK_INBOX_MAX_ATTEMPTS', '8'))
 
 # OpenAI API key
 OPENAI_API_KEY = os.environ.get('OPENAI_API_KEY', '')
@@ -181,7 +239,12 @@ SESSION_COOKIE_AGE = 1209600  # 2 weeks
 SESSION_COOKIE_SECURE = not DEBUG
 SESSION_COOKIE_HTTPONLY = True
 SESSION_SAVE_EVERY_REQUEST = True
-SESSION_ENGINE = 'django.contrib.sessions.backends.db'
+# Database sessions with cached reads; expiry-only saves are skipped or batched
+SESSION_ENGINE = 'auth_app.session_store'
+SESSION_EXPIRY_WRITE_THRESHOLD = 3600  # seconds an expiry refresh must move before it is written
+SESSION_LOCAL_CACHE_TTL = 2  # seconds a session may be served from the in-process tier
+SESSION_WRITE_BATCH_SIZE = 100
+SESSION_WRITE_FLUSH_INTERVAL = 10  # seconds
 SESSION_EXPIRE_AT_BROWSER_CLOSE = False
 
 # CSRF protection
@@ -271,7 +334,18 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # Email settings
-EMAIL_BACKEND = os.environ.get('EMAIL_BACKEND', 'django.core.mail.backends.smtp.EmailBackend')
+# Mail is queued in the database outbox and sent by the deliver_outbox command
+EMAIL_BACKEND = os.environ.get('EMAIL_BACKEND', 'auth_app.outbox.OutboxEmailBackend')
+OUTBOX_DELIVERY_BACKEND = os.environ.get('OUTBOX_DELIVERY_BACKEND', 'django.core.mail.backends.smtp.EmailBackend')
+OUTBOX_DEFAULT_DOMAIN_RATE = int(os.environ.get('OUTBOX_DEFAULT_DOMAIN_RATE', '60'))  # messages per minute
+OUTBOX_DOMAIN_RATE_LIMITS = {
+    'gmail.com': 30,
+    'googlemail.com': 30,
+    'outlook.com': 30,
+    'hotmail.com': 30,
+    'yahoo.com': 20,
+}
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get('OUTBOX_MAX_ATTEMPTS', '8'))
 EMAIL_HOST = os.environ.get('SMTP_HOST', 'smtp.gmail.com')
 EMAIL_PORT = int(os.environ.get('SMTP_PORT', '465'))
 EMAIL_HOST_USER = os.environ.get('EMAIL_HOST_USER', '')
@@ -0,0 +1,182 @@
+"""
+Batch task reads with sparse fieldsets.
+
+Clients ask for a list of task IDs and a ``fields`` selector. Only the
+requested columns are selected; each requested relation is loaded for the
+whole batch with one query on its through table; and the result is encoded
+with orjson straight from the row dicts instead of going through DRF
+serializers and renderers.
+"""
+import json
+import uuid
+from collections import defaultdict
+from decimal import Decimal
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .calendar_api import visible_tasks
+from .models import Task
+
+try:
+    import orjson
+except ImportError:
+    print("Warning: orjson is not installed. Batch task responses will use the standard json encoder.")
+    orjson = None
+
+MAX_BATCH_SIZE = 500
+
+# Public field name -> column selected with ``values()``
+COLUMN_FIELDS = {
+    'id': 'id',
+    'title': 'title',
+    'description': 'description',
+    'status': 'status',
+    'priority': 'priority',
+    'due_date': 'due_date',
+    'created_at': 'created_at',
+    'updated_at': 'updated_at',
+    'completed_at': 'completed_at',
+    'owner_id': 'owner_id',
+    'owner': 'owner__username',
+    'project_id': 'project_id',
+    'project': 'project__name',
+    'parent_task_id': 'parent_task_id',
+    'estimated_hours': 'estimated_hours',
+    'actual_hours': 'actual_hours',
+    'is_archived': 'is_archived',
+    'position': 'position',
+    'ai_summary': 'ai_summary',
+    'ai_suggestions': 'ai_suggestions',
+    'is_ai_generated': 'is_ai_generated',
+}
+RELATION_FIELDS = ('assignees', 'tags', 'subtask_ids', 'dependency_ids')
+DEFAULT_FIELDS = ('id', 'title', 'status', 'priority', 'due_date', 'project_id', 'updated_at')
+
+
+class BatchQueryError(ValueError):
+    """Raised for unknown fields or oversized batches."""
+
+
+def parse_fields(selector):
+    """
+    Split a ``fields`` selector (comma-separated string or list) into
+    ``(columns, relations)``. ``id`` is always included.
+    """
+    if not selector:
+        names = list(DEFAULT_FIELDS)
+    elif isinstance(selector, str):
+        names = [name.strip() for name in selector.split(',') if name.strip()]
+    elif isinstance(selector, (list, tuple)):
+        names = [str(name).strip() for name in selector]
+    else:
+        raise BatchQueryError('fields must be a comma-separated string or a list')
+    unknown = [name for name in names if name not in COLUMN_FIELDS and name not in RELATION_FIELDS]
+    if unknown:
+        raise BatchQueryError(f"Unknown field(s): {', '.join(unknown)}")
+    columns = ['id'] + [name for name in dict.fromkeys(names) if name in COLUMN_FIELDS and name != 'id']
+    relations = [name for name in dict.fromkeys(names) if name in RELATION_FIELDS]
+    return columns, relations
+
+
+def parse_ids(raw):
+    """Normalize a comma-separated string or list of IDs, keeping the request order."""
+    if isinstance(raw, str):
+        raw = raw.split(',')
+    elif raw is not None and not isinstance(raw, (list, tuple)):
+        raise BatchQueryError('ids must be a comma-separated string or a list')
+    try:
+        ids = list(dict.fromkeys(str(uuid.UUID(str(value).strip())) for value in raw or () if str(value).strip()))
+    except ValueError:
+        raise BatchQueryError('ids must be task UUIDs')
+    if not ids:
+        raise BatchQueryError('ids is required')
+    if len(ids) > MAX_BATCH_SIZE:
+        raise BatchQueryError(f'At most {MAX_BATCH_SIZE} ids per request')
+    return ids
+
+
+def _relation_queries(relation, task_ids):
+    """A ``(task_id, value)`` query for one relation of the batch."""
+    if relation == 'assignees':
+        return (
+            Task.assignees.through.objects.filter(task_id__in=task_ids)
+            .values_list('task_id', 'user_id', 'user__username')
+        )
+    if relation == 'tags':
+        return (
+            Task.tags.through.objects.filter(task_id__in=task_ids)
+            .values_list('task_id', 'tasktag_id', 'tasktag__name', 'tasktag__color')
+        )
+    if relation == 'subtask_ids':
+        return Task.objects.filter(parent_task_id__in=task_ids).values_list('parent_task_id', 'id')
+    return Task.dependencies.through.objects.filter(from_task_id__in=task_ids).values_list('from_task_id', 'to_task_id')
+
+
+def _relation_value(relation, row):
+    if relation == 'assignees':
+        return {'id': row[1], 'username': row[2]}
+    if relation == 'tags':
+        return {'id': row[1], 'name': row[2], 'color': row[3]}
+    return row[1]
+
+
+def _rename(row, columns):
+    """``values()`` keys are column paths; rename them back to the public field names."""
+    return {name: row[COLUMN_FIELDS[name]] for name in columns}
+
+
+def _merge(rows, columns, relations, related, ids):
+    by_id = {str(row['id']): _rename(row, columns) for row in rows}
+    for task_id, task in by_id.items():
+        for relation in relations:
+            task[relation] = related[relation].get(task_id, [])
+    return [by_id[task_id] for task_id in ids if task_id in by_id]
+
+
+def _base_queryset(user, ids, columns):
+    return visible_tasks(user).filter(pk__in=ids).values(*(COLUMN_FIELDS[name] for name in columns))
+
+
+def fetch_tasks(user, ids, columns, relations):
+    """The requested tasks visible to ``user``, in request order; missing IDs are dropped."""
+    rows = list(_base_queryset(user, ids, columns))
+    found = [row['id'] for row in rows]
+    related = {}
+    for relation in relations:
+        grouped = defaultdict(list)
+        for row in _relation_queries(relation, found):
+            grouped[str(row[0])].append(_relation_value(relation, row))
+        related[relation] = grouped
+    return _merge(rows, columns, relations, related, ids)
+
+
+async def afetch_tasks(user, ids, columns, relations):
+    rows = [row async for row in _base_queryset(user, ids, columns)]
+    found = [row['id'] for row in rows]
+    related = {}
+    for relation in relations:
+        grouped = defaultdict(list)
+        async for row in _relation_queries(relation, found):
+            grouped[str(row[0])].append(_relation_value(relation, row))
+        related[relation] = grouped
+    return _merge(rows, columns, relations, related, ids)
+
+
+def _default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError
+
+
+class _FallbackEncoder(DjangoJSONEncoder):
+    def default(self, o):
+        if isinstance(o, Decimal):
+            return float(o)
+        return super().default(o)
+
+
+def encode(payload):
+    """Encode ``payload`` to JSON bytes (UUIDs, datetimes and Decimals included)."""
+    if orjson is not None:
+        return orjson.dumps(payload, default=_default)
+    return json.dumps(payload, cls=_FallbackEncoder, separators=(',', ':')).encode()
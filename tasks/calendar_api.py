@@ -0,0 +1,135 @@
+"""
+Range queries over task due dates for calendar views.
+
+A window ``[start, end)`` is translated into plain ``due_date >= start AND
+due_date < end`` predicates so the ``due_date`` indexes can be used. The
+per-day counts and the top tasks of each day are computed with window
+functions in the same query, so a whole month view costs one round trip.
+"""
+import zoneinfo
+from datetime import datetime, time, timedelta
+
+from django.db.models import Case, Count, F, IntegerField, Q, Value, When, Window
+from django.db.models.functions import RowNumber, TruncDate
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from .models import Task
+
+MAX_RANGE_DAYS = 92
+DEFAULT_TOP_N = 3
+MAX_TOP_N = 20
+
+_PRIORITY_RANK = Case(
+    When(priority='urgent', then=Value(0)),
+    When(priority='high', then=Value(1)),
+    When(priority='medium', then=Value(2)),
+    When(priority='low', then=Value(3)),
+    default=Value(4),
+    output_field=IntegerField(),
+)
+
+
+class CalendarQueryError(ValueError):
+    """Raised for malformed or oversized calendar windows."""
+
+
+def day_bounds(start_date, end_date, tz):
+    """Aware datetimes for midnight at the start of ``start_date`` and ``end_date`` in ``tz``."""
+    return (
+        timezone.make_aware(datetime.combine(start_date, time.min), tz),
+        timezone.make_aware(datetime.combine(end_date, time.min), tz),
+    )
+
+
+def parse_window(params):
+    """
+    Validate ``start``/``end`` (ISO dates, end exclusive), ``tz`` and ``top``
+    query parameters and return ``(start_date, end_date, tz, top_n)``.
+    """
+    try:
+        start_date = parse_date(params.get('start') or '')
+        end_date = parse_date(params.get('end') or '')
+    except ValueError:
+        # Well formed but impossible, e.g. 2030-02-30
+        start_date = end_date = None
+    if not start_date or not end_date:
+        raise CalendarQueryError('start and end must be ISO dates (YYYY-MM-DD)')
+    if end_date <= start_date:
+        raise CalendarQueryError('end must be after start')
+    if (end_date - start_date).days > MAX_RANGE_DAYS:
+        raise CalendarQueryError(f'Range may not exceed {MAX_RANGE_DAYS} days')
+
+    tz_name = params.get('tz')
+    if tz_name:
+        try:
+            tz = zoneinfo.ZoneInfo(tz_name)
+        except (zoneinfo.ZoneInfoNotFoundError, ValueError):
+            raise CalendarQueryError(f'Unknown time zone: {tz_name}')
+    else:
+        tz = timezone.get_current_timezone()
+
+    try:
+        top_n = int(params.get('top', DEFAULT_TOP_N))
+    except (TypeError, ValueError):
+        raise CalendarQueryError('top must be an integer')
+    top_n = max(0, min(top_n, MAX_TOP_N))
+    return start_date, end_date, tz, top_n
+
+
+def visible_tasks(user):
+    """Tasks owned by or assigned to ``user``, without the join-induced duplicates."""
+    assigned = Task.assignees.through.objects.filter(user=user).values('task_id')
+    return Task.objects.filter(Q(owner=user) | Q(pk__in=assigned))
+
+
+def due_buckets(queryset, start_date, end_date, tz, top_n=DEFAULT_TOP_N):
+    """
+    Group ``queryset`` by local due day within ``[start_date, end_date)``.
+
+    Returns a list with one entry per day in the window, each holding the
+    number of tasks due that day and up to ``top_n`` of them, most urgent
+    first.
+    """
+    start, end = day_bounds(start_date, end_date, tz)
+    day = TruncDate('due_date', tzinfo=tz)
+    rows = (
+        queryset
+        .filter(due_date__gte=start, due_date__lt=end)
+        .annotate(
+            day=day,
+            day_count=Window(Count('id'), partition_by=[day]),
+            rank=Window(
+                RowNumber(),
+                partition_by=[day],
+                order_by=[_PRIORITY_RANK.asc(), F('due_date').asc(), F('id').asc()],
+            ),
+        )
+        .filter(rank__lte=max(top_n, 1))
+        .order_by('day', 'rank')
+        .values(
+            'id', 'title', 'status', 'priority', 'due_date', 'project_id',
+            'day', 'day_count', 'rank',
+        )
+    )
+
+    days = {}
+    for offset in range((end_date - start_date).days):
+        current = start_date + timedelta(days=offset)
+        days[current] = {'date': current.isoformat(), 'count': 0, 'tasks': []}
+
+    for row in rows:
+        bucket = days.get(row['day'])
+        if bucket is None:
+            continue
+        bucket['count'] = row['day_count']
+        if row['rank'] <= top_n:
+            bucket['tasks'].append({
+                'id': str(row['id']),
+                'title': row['title'],
+                'status': row['status'],
+                'priority': row['priority'],
+                'due_date': row['due_date'].isoformat(),
+                'project_id': str(row['project_id']) if row['project_id'] else None,
+            })
+    return list(days.values())
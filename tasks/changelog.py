@@ -0,0 +1,186 @@
+"""
+Change log for delta sync of tasks, projects, tags and comments.
+
+Every change is fanned out to the users who can see the entity as one
+``ChangeLogEntry`` per user, replacing that user's previous entry for the
+entity. A client keeps the highest ``seq`` it has applied and asks for the
+entries after it: upserts are returned with the entity's current fields,
+deletions (and entities the user can no longer see) as tombstones. The work
+per sync is proportional to what changed, not to the size of the dataset.
+
+Entries are written in the same transaction as the change. The cursor only
+works if a user's entries become visible in ``seq`` order: otherwise a slow
+transaction could commit a lower ``seq`` after a client has already read past
+it, and that change would never be synced. SQLite serializes writers; on
+PostgreSQL ``record`` takes a per-user advisory lock held until the enclosing
+transaction commits, so appends for one user are serialized while different
+users still write concurrently.
+"""
+from collections import defaultdict
+
+from django.db import connection, transaction
+
+from . import batch
+from .calendar_api import visible_tasks
+from .models import ChangeLogEntry, Project, Task, TaskComment, TaskTag
+from .queries import user_projects
+
+DEFAULT_LIMIT = 500
+MAX_LIMIT = 2000
+RECORD_CHUNK_SIZE = 500
+SYNC_TASK_FIELDS = (
+    'id', 'title', 'description', 'status', 'priority', 'due_date', 'created_at',
+    'updated_at', 'completed_at', 'owner_id', 'project_id', 'parent_task_id',
+    'estimated_hours', 'actual_hours', 'is_archived', 'position',
+    'assignees', 'tags',
+)
+SYNC_PROJECT_FIELDS = (
+    'id', 'name', 'description', 'status', 'color', 'icon', 'is_archived',
+    'start_date', 'end_date', 'owner_id', 'created_at', 'updated_at',
+)
+SYNC_TAG_FIELDS = ('id', 'name', 'color', 'created_at')
+SYNC_COMMENT_FIELDS = ('id', 'task_id', 'user_id', 'content', 'is_ai_generated', 'created_at', 'updated_at')
+# First key of the two-part advisory locks, so they can't collide with other users of pg_advisory_*
+ADVISORY_LOCK_NAMESPACE = 0x6368616e  # 'chan'
+
+
+def _lock_users(user_ids):
+    """
+    Serialize change log appends for ``user_ids`` until the current
+    transaction ends. Locks are taken in ID order to avoid deadlocks
+    between two writers with overlapping audiences.
+    """
+    if connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        for user_id in sorted(user_ids):
+            cursor.execute('SELECT pg_advisory_xact_lock(%s, %s)', [ADVISORY_LOCK_NAMESPACE, user_id])
+
+
+def record(user_ids, entity_type, entity_ids, operation='upsert'):
+    """Record ``operation`` on ``entity_ids`` for each of ``user_ids``."""
+    user_ids = {user_id for user_id in user_ids if user_id is not None}
+    entity_ids = list(entity_ids)
+    if not user_ids or not entity_ids:
+        return
+    with transaction.atomic():
+        # Take the locks before any seq is allocated, so a user's seqs commit in order
+        _lock_users(user_ids)
+        for start in range(0, len(entity_ids), RECORD_CHUNK_SIZE):
+            chunk = entity_ids[start:start + RECORD_CHUNK_SIZE]
+            ChangeLogEntry.objects.filter(
+                user_id__in=user_ids, entity_type=entity_type, entity_id__in=chunk
+            ).delete()
+            ChangeLogEntry.objects.bulk_create(
+                [
+                    ChangeLogEntry(user_id=user_id, entity_type=entity_type, entity_id=entity_id, operation=operation)
+                    for user_id in user_ids
+                    for entity_id in chunk
+                ],
+                batch_size=RECORD_CHUNK_SIZE,
+            )
+
+
+def record_fanout(audiences, entity_type, operation='upsert'):
+    """Record ``operation`` for ``{entity_id: user_ids}``, grouping entities with the same audience."""
+    groups = defaultdict(list)
+    for entity_id, user_ids in audiences.items():
+        groups[frozenset(user_ids)].append(entity_id)
+    for user_ids, entity_ids in groups.items():
+        record(user_ids, entity_type, entity_ids, operation)
+
+
+def project_audience(project):
+    return {project.owner_id, *project.members.values_list('id', flat=True)}
+
+
+def _current(entity_type, user, ids):
+    """Current fields of the entities in ``ids`` that ``user`` can still see, keyed by ID."""
+    if entity_type == 'task':
+        columns, relations = batch.parse_fields(SYNC_TASK_FIELDS)
+        rows = batch.fetch_tasks(user, ids, columns, relations)
+    elif entity_type == 'project':
+        rows = user_projects(user, show_archived=True).filter(pk__in=ids).values(*SYNC_PROJECT_FIELDS)
+    elif entity_type == 'tag':
+        rows = TaskTag.objects.filter(created_by=user, pk__in=ids).values(*SYNC_TAG_FIELDS)
+    else:
+        rows = (
+            TaskComment.objects.filter(pk__in=ids, task__in=visible_tasks(user).values('pk'))
+            .values(*SYNC_COMMENT_FIELDS)
+        )
+    return {str(row['id']): row for row in rows}
+
+
+def changes_since(user, cursor=0, limit=DEFAULT_LIMIT):
+    """
+    Changes for ``user`` after ``cursor``: at most ``limit`` entries, each
+    entity once, grouped by type. Pass the returned ``cursor`` back to
+    continue; ``has_more`` says whether another page is waiting.
+    """
+    limit = max(1, min(int(limit), MAX_LIMIT))
+    entries = list(
+        ChangeLogEntry.objects.filter(user=user, seq__gt=cursor)
+        .order_by('seq')
+        .values_list('seq', 'entity_type', 'entity_id', 'operation')[:limit + 1]
+    )
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+
+    upserts = defaultdict(list)
+    deleted = {entity_type: [] for entity_type, _ in ChangeLogEntry.ENTITY_TYPES}
+    for _, entity_type, entity_id, operation in entries:
+        if operation == 'delete':
+            deleted[entity_type].append(str(entity_id))
+        else:
+            upserts[entity_type].append(str(entity_id))
+
+    changed = {entity_type: [] for entity_type, _ in ChangeLogEntry.ENTITY_TYPES}
+    for entity_type, ids in upserts.items():
+        current = _current(entity_type, user, ids)
+        for entity_id in ids:
+            if entity_id in current:
+                changed[entity_type].append(current[entity_id])
+            else:
+                # Deleted or no longer visible since the entry was written
+                deleted[entity_type].append(entity_id)
+
+    return {
+        'cursor': entries[-1][0] if entries else cursor,
+        'has_more': has_more,
+        'changed': changed,
+        'deleted': deleted,
+    }
+
+
+def backfill(batch_size=2000):
+    """
+    Seed the log with every existing entity so clients can start from
+    cursor 0. Returns the number of entries written.
+    """
+    written = 0
+    task_audiences = defaultdict(set)
+    for task_id, owner_id in Task.objects.values_list('id', 'owner_id').iterator(chunk_size=batch_size):
+        task_audiences[task_id].add(owner_id)
+    assignments = Task.assignees.through.objects.values_list('task_id', 'user_id')
+    for task_id, user_id in assignments.iterator(chunk_size=batch_size):
+        task_audiences[task_id].add(user_id)
+
+    project_audiences = defaultdict(set)
+    for project_id, owner_id in Project.objects.values_list('id', 'owner_id'):
+        project_audiences[project_id].add(owner_id)
+    for project_id, user_id in Project.members.through.objects.values_list('project_id', 'user_id'):
+        project_audiences[project_id].add(user_id)
+
+    tag_audiences = {tag_id: {user_id} for tag_id, user_id in TaskTag.objects.values_list('id', 'created_by_id')}
+    comment_audiences = {
+        comment_id: task_audiences.get(task_id, set())
+        for comment_id, task_id in TaskComment.objects.values_list('id', 'task_id').iterator(chunk_size=batch_size)
+    }
+
+    for entity_type, entity_audiences in (
+        ('project', project_audiences), ('tag', tag_audiences),
+        ('task', task_audiences), ('comment', comment_audiences),
+    ):
+        record_fanout(entity_audiences, entity_type)
+        written += sum(len(users) for users in entity_audiences.values())
+    return written
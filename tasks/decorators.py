@@ -0,0 +1,22 @@
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+
+
+def async_login_required(view_func):
+    """
+    ``login_required`` for ``async def`` views returning JSON.
+
+    Django 4.2's ``login_required`` wraps views in a sync function, which
+    would push async views back onto a worker thread. The session lookup
+    behind ``request.user`` is sync-only, so it is resolved in a thread
+    once and cached on the request.
+    """
+    @wraps(view_func)
+    async def wrapper(request, *args, **kwargs):
+        user = await sync_to_async(lambda: request.user if request.user.is_authenticated else None)()
+        if user is None:
+            return JsonResponse({'status': 'error', 'message': 'Authentication required'}, status=401)
+        return await view_func(request, *args, **kwargs)
+    return wrapper
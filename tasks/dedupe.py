@@ -0,0 +1,252 @@
+"""
+Near-duplicate task detection with MinHash and locality-sensitive hashing.
+
+Each task's title (character trigrams) and description (word bigrams) are
+shingled and summarized by a MinHash signature of ``NUM_HASHES`` values; the
+fraction of positions two signatures agree on estimates the Jaccard
+similarity of their shingle sets. The signature is cut into ``BANDS`` bands
+and every band is stored as a ``TaskLSHBucket`` key, so the duplicate
+candidates of a task are the other tasks of the same owner sharing at least
+one key: one indexed query instead of a comparison with every task.
+
+New tasks are indexed and flagged from ``tasks.signals`` (and by the importer
+for bulk inserts); ``clusters`` groups an entire account with a union-find
+over the buckets for the ``find_duplicate_tasks`` command.
+"""
+import random
+import re
+import zlib
+from array import array
+from collections import defaultdict
+
+from django.db import transaction
+
+from .models import Task, TaskLSHBucket, TaskSignature
+
+try:
+    import numpy as np
+except ImportError:
+    print("Warning: numpy is not installed. Duplicate detection will use the slower pure Python MinHash.")
+    np = None
+
+NUM_HASHES = 64
+BANDS = 16
+ROWS = NUM_HASHES // BANDS
+# With 16 bands of 4 rows, pairs at 0.8 similarity share a bucket 99.97% of
+# the time and pairs at 0.3 only 12% of the time
+DEFAULT_THRESHOLD = 0.8
+DESCRIPTION_CHARS = 2000
+QUERY_CHUNK_SIZE = 500
+
+_MASK64 = (1 << 64) - 1
+_rng = random.Random(0x7A5C)
+# Multiply-shift hash family; fixed seed so stored signatures stay comparable
+_A = [_rng.getrandbits(64) | 1 for _ in range(NUM_HASHES)]
+_B = [_rng.getrandbits(64) for _ in range(NUM_HASHES)]
+if np is not None:
+    _A_ARRAY = np.array(_A, dtype=np.uint64)[:, None]
+    _B_ARRAY = np.array(_B, dtype=np.uint64)[:, None]
+
+_WORD_RE = re.compile(r'\w+')
+
+
+def shingles(title, description=''):
+    """Character trigrams of the normalized title plus word bigrams of the description."""
+    title = ' '.join(_WORD_RE.findall((title or '').lower()))
+    result = {f't:{title[i:i + 3]}' for i in range(max(1, len(title) - 2))} if title else set()
+    words = _WORD_RE.findall((description or '')[:DESCRIPTION_CHARS].lower())
+    result.update(f'd:{a} {b}' for a, b in zip(words, words[1:]))
+    if len(words) == 1:
+        result.add(f'd:{words[0]}')
+    return result
+
+
+def signature(shingle_set):
+    """MinHash signature of ``shingle_set`` as ``NUM_HASHES`` 32-bit ints."""
+    hashes = [zlib.crc32(shingle.encode()) for shingle in shingle_set]
+    if not hashes:
+        return [0xFFFFFFFF] * NUM_HASHES
+    if np is not None:
+        values = (_A_ARRAY * np.array(hashes, dtype=np.uint64) + _B_ARRAY) >> np.uint64(32)
+        return values.min(axis=1).tolist()
+    return [min(((a * h + b) & _MASK64) >> 32 for h in hashes) for a, b in zip(_A, _B)]
+
+
+def task_signature(task):
+    return signature(shingles(task.title, task.description))
+
+
+def band_keys(sig):
+    """The LSH key of every band: band number in the high bits, hash of its rows in the low 32."""
+    return [
+        (band << 32) | zlib.crc32(array('I', sig[band * ROWS:(band + 1) * ROWS]).tobytes())
+        for band in range(BANDS)
+    ]
+
+
+def similarity(a, b):
+    """Estimated Jaccard similarity of two signatures."""
+    return sum(x == y for x, y in zip(a, b)) / NUM_HASHES
+
+
+def pack(sig):
+    return array('I', sig).tobytes()
+
+
+def unpack(data):
+    return array('I', bytes(data)).tolist()
+
+
+def _chunks(values, size=QUERY_CHUNK_SIZE):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def _is_earlier(candidate, entry):
+    """Only an older task can be the original; ties are broken by ID."""
+    return (candidate[0], str(candidate[1])) < (entry[0], str(entry[1]))
+
+
+def index_tasks(tasks, flag=True, threshold=DEFAULT_THRESHOLD):
+    """
+    Store the signatures and bucket keys of ``tasks``, replacing any previous
+    ones, and (with ``flag``) point each at its most similar earlier task of
+    the same owner. Returns the number of tasks flagged as duplicates.
+    """
+    tasks = [task for task in tasks if task.pk]
+    if not tasks:
+        return 0
+    entries = {}
+    for task in tasks:
+        sig = task_signature(task)
+        entries[task.pk] = (task.created_at, task.pk, task.owner_id, sig, band_keys(sig))
+
+    with transaction.atomic():
+        TaskLSHBucket.objects.filter(task_id__in=list(entries)).delete()
+        TaskLSHBucket.objects.bulk_create(
+            [
+                TaskLSHBucket(task_id=task_id, owner_id=owner_id, key=key)
+                for _, task_id, owner_id, _, keys in entries.values()
+                for key in keys
+            ],
+            batch_size=QUERY_CHUNK_SIZE,
+        )
+        matches = _best_matches(entries, threshold) if flag else {}
+        TaskSignature.objects.bulk_create(
+            [
+                TaskSignature(
+                    task_id=task_id, signature=pack(sig),
+                    duplicate_of_id=matches.get(task_id, (None, None))[0],
+                    similarity=matches.get(task_id, (None, None))[1],
+                )
+                for _, task_id, _, sig, _ in entries.values()
+            ],
+            update_conflicts=True,
+            unique_fields=['task'],
+            update_fields=['signature', 'duplicate_of', 'similarity', 'updated_at'],
+        )
+    return len(matches)
+
+
+def _best_matches(entries, threshold):
+    """``{task_id: (duplicate_of_id, similarity)}`` for the entries that have an earlier near-duplicate."""
+    owners = {owner_id for _, _, owner_id, _, _ in entries.values()}
+    keys = {key for *_, entry_keys in entries.values() for key in entry_keys}
+    by_key = defaultdict(set)
+    for chunk in _chunks(keys):
+        rows = TaskLSHBucket.objects.filter(owner_id__in=owners, key__in=chunk).values_list('owner_id', 'key', 'task_id')
+        for owner_id, key, task_id in rows:
+            by_key[owner_id, key].add(task_id)
+
+    candidates = {}
+    for task_id, (_, _, owner_id, _, entry_keys) in entries.items():
+        candidates[task_id] = set().union(*(by_key[owner_id, key] for key in entry_keys)) - {task_id}
+    others = set().union(*candidates.values()) if candidates else set()
+    if not others:
+        return {}
+
+    known = {task_id: (created_at, task_id, sig) for created_at, task_id, _, sig, _ in entries.values()}
+    missing = others - set(known)
+    for chunk in _chunks(missing):
+        rows = TaskSignature.objects.filter(task_id__in=chunk).values_list('task_id', 'task__created_at', 'signature')
+        for task_id, created_at, data in rows:
+            known[task_id] = (created_at, task_id, unpack(data))
+
+    matches = {}
+    for task_id, ids in candidates.items():
+        entry = known[task_id]
+        best = None
+        for other_id in ids:
+            other = known.get(other_id)
+            if other is None or not _is_earlier(other, entry):
+                continue
+            score = similarity(entry[2], other[2])
+            if score >= threshold and (best is None or score > best[1]):
+                best = (other_id, score)
+        if best:
+            matches[task_id] = best
+    return matches
+
+
+def index_missing(owner=None, batch_size=QUERY_CHUNK_SIZE):
+    """Index the tasks (of ``owner``, or everyone) that have no signature yet. Returns how many."""
+    queryset = Task.objects.filter(signature__isnull=True).only('id', 'title', 'description', 'owner_id', 'created_at')
+    if owner is not None:
+        queryset = queryset.filter(owner=owner)
+    indexed = 0
+    while True:
+        tasks = list(queryset[:batch_size])
+        if not tasks:
+            return indexed
+        index_tasks(tasks, flag=False)
+        indexed += len(tasks)
+
+
+def clusters(owner, threshold=DEFAULT_THRESHOLD):
+    """
+    Groups of near-duplicate tasks of ``owner``, largest first, each as a list
+    of task IDs from oldest to newest. Tasks sharing a bucket are only
+    compared with the first member of that bucket, so the work stays linear in
+    the number of bucket rows.
+    """
+    signatures = {
+        task_id: (created_at, task_id, unpack(data))
+        for task_id, created_at, data in TaskSignature.objects.filter(task__owner=owner)
+        .values_list('task_id', 'task__created_at', 'signature').iterator(chunk_size=QUERY_CHUNK_SIZE)
+    }
+    buckets = defaultdict(list)
+    rows = TaskLSHBucket.objects.filter(owner=owner).order_by('key').values_list('key', 'task_id')
+    for key, task_id in rows.iterator(chunk_size=QUERY_CHUNK_SIZE):
+        if task_id in signatures:
+            buckets[key].append(task_id)
+
+    parent = {}
+
+    def find(task_id):
+        root = task_id
+        while parent.get(root, root) != root:
+            root = parent[root]
+        while task_id != root:
+            parent[task_id], task_id = root, parent.get(task_id, task_id)
+        return root
+
+    compared = set()
+    for members in buckets.values():
+        first = members[0]
+        for other in members[1:]:
+            pair = (first, other)
+            if pair in compared:
+                continue
+            compared.add(pair)
+            if similarity(signatures[first][2], signatures[other][2]) >= threshold:
+                a, b = find(first), find(other)
+                if a != b:
+                    parent.setdefault(a, a)
+                    parent[b] = a
+
+    groups = defaultdict(list)
+    for task_id in parent:
+        groups[find(task_id)].append(task_id)
+    result = [sorted(ids, key=lambda task_id: signatures[task_id][:2]) for ids in groups.values() if len(ids) > 1]
+    return sorted(result, key=len, reverse=True)
@@ -0,0 +1,208 @@
+"""
+Deferred deletion of tasks and projects.
+
+Deleting through the ORM makes Django's collector load every related row
+(activities, versions, time entries, comments, attachments, custom field
+values...) into memory and send signals for each of them, which times out
+on large projects. Instead, a delete request only stamps
+``deletion_requested_at`` on the rows, which hides them from the default
+``objects`` managers, and does the bookkeeping the delete signals would have
+done (sync tombstones, live events, snapshots, hierarchy rollups).
+
+``purge`` then removes the stamped rows in bounded chunks with set-based
+deletes that only ever select primary keys, following the models'
+``on_delete`` rules, and deletes attachment files once each chunk commits.
+It is run by the ``purge_deleted`` command, which the ``purger`` process
+(Procfile and docker-compose) keeps running with ``--loop``; without it,
+pending rows and files are never removed.
+"""
+import logging
+from collections import defaultdict
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import models, router, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import changelog, events, hierarchy, snapshots, workload
+from .models import CalendarFeed, Project, ShareLink, Task, TaskClosure, TaskComment, TaskLSHBucket
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 200
+
+
+def _chunks(values, size=CHUNK_SIZE):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def _hide_tasks(task_ids, now, deleted_project_ids=()):
+    """Stamp ``task_ids`` and do the work of the task delete signals, one chunk at a time."""
+    deleted_project_ids = set(deleted_project_ids)
+    project_ids = set()
+    for chunk in _chunks(task_ids):
+        rows = list(Task.objects.filter(pk__in=chunk).values_list('id', 'owner_id', 'project_id', 'status', 'estimated_hours'))
+        if not rows:
+            continue
+        chunk = [row[0] for row in rows]
+        audiences = {task_id: {owner_id} for task_id, owner_id, *_ in rows}
+        for task_id, user_id in Task.assignees.through.objects.filter(task_id__in=chunk).values_list('task_id', 'user_id'):
+            audiences[task_id].add(user_id)
+        comment_audiences = {
+            comment_id: audiences[task_id]
+            for comment_id, task_id in TaskComment.objects.filter(task_id__in=chunk).values_list('id', 'task_id')
+        }
+
+        # Only tasks that are part of a subtree need their rollups adjusted
+        linked = set()
+        for ancestor_id, descendant_id in TaskClosure.objects.filter(
+            Q(ancestor_id__in=chunk) | Q(descendant_id__in=chunk), depth__gt=0
+        ).values_list('ancestor_id', 'descendant_id'):
+            linked.update({ancestor_id, descendant_id})
+        for task in Task.objects.filter(pk__in=linked & set(chunk)):
+            hierarchy.task_deleting(task)
+        Task.objects.filter(parent_task_id__in=chunk).update(parent_task=None)
+        TaskLSHBucket.objects.filter(task_id__in=chunk).delete()
+
+        Task.objects.filter(pk__in=chunk).update(deletion_requested_at=now)
+
+        deltas = None
+        for _, _, project_id, status, estimated_hours in rows:
+            if project_id not in deleted_project_ids:
+                deltas = snapshots.state_delta((project_id, status, estimated_hours), None, deltas)
+        snapshots.apply_deltas(deltas)
+        changelog.record_fanout(audiences, 'task', 'delete')
+        changelog.record_fanout(comment_audiences, 'comment', 'delete')
+        CalendarFeed.bump(set().union(*audiences.values()))
+        for task_id, user_ids in audiences.items():
+            transaction.on_commit(
+                lambda user_ids=user_ids, task_id=task_id: events.broker.publish(user_ids, 'task.deleted', {'id': str(task_id)})
+            )
+        project_ids.update(row[2] for row in rows)
+    workload.invalidate(project_ids)
+
+
+def request_task_deletion(tasks):
+    """Hide the tasks in the ``tasks`` queryset and queue them for purging. Returns how many."""
+    task_ids = list(tasks.values_list('pk', flat=True).distinct())
+    if task_ids:
+        with transaction.atomic():
+            _hide_tasks(task_ids, timezone.now())
+    return len(task_ids)
+
+
+def request_project_deletion(projects):
+    """Hide the projects in the ``projects`` queryset, with all their tasks, and queue them for purging."""
+    projects = list(projects.distinct())
+    if not projects:
+        return 0
+    now = timezone.now()
+    project_ids = [project.pk for project in projects]
+    with transaction.atomic():
+        audiences = {project.pk: changelog.project_audience(project) for project in projects}
+        _hide_tasks(Task.objects.filter(project_id__in=project_ids).values_list('pk', flat=True), now, project_ids)
+        Project.objects.filter(pk__in=project_ids).update(deletion_requested_at=now)
+        changelog.record_fanout(audiences, 'project', 'delete')
+    return len(project_ids)
+
+
+def _file_fields(model):
+    return [field for field in model._meta.concrete_fields if isinstance(field, models.FileField)]
+
+
+def _raw_delete(queryset):
+    # Skips the collector and signals; callers have already handled every relation
+    queryset._raw_delete(queryset.db)
+
+
+def _collect_files(model, queryset, files):
+    for field in _file_fields(model):
+        files.extend(
+            (field.storage, name) for name in queryset.values_list(field.attname, flat=True) if name
+        )
+
+
+def _delete_rows(model, pks, files):
+    """
+    Delete the ``model`` rows with primary keys ``pks`` and everything that
+    depends on them, following ``on_delete`` without instantiating any row.
+    File names are appended to ``files`` for removal after commit.
+    """
+    for rel in model._meta.related_objects:
+        related = rel.related_model
+        if rel.many_to_many:
+            # The reverse side of an M2M declared on another model
+            through = rel.through
+            _raw_delete(through._base_manager.filter(**{f'{rel.field.m2m_reverse_field_name()}__in': pks}))
+            continue
+        queryset = related._base_manager.filter(**{f'{rel.field.name}__in': pks})
+        if rel.on_delete is models.SET_NULL:
+            queryset.update(**{rel.field.name: None})
+        elif rel.on_delete is models.CASCADE:
+            if related._meta.related_objects or related._meta.many_to_many:
+                for chunk in _chunks(queryset.values_list('pk', flat=True)):
+                    _delete_rows(related, chunk, files)
+            else:
+                _collect_files(related, queryset, files)
+                _raw_delete(queryset)
+    for field in model._meta.many_to_many:
+        through = field.remote_field.through
+        _raw_delete(through._base_manager.filter(**{f'{field.m2m_field_name()}__in': pks}))
+
+    queryset = model._base_manager.filter(pk__in=pks)
+    _collect_files(model, queryset, files)
+    ShareLink.objects.filter(content_type=ContentType.objects.get_for_model(model), object_id__in=pks).delete()
+    _raw_delete(queryset)
+
+
+def _remove_files(files):
+    for storage, name in files:
+        try:
+            storage.delete(name)
+        except Exception as e:
+            logger.error(f"Error removing file {name}: {str(e)}")
+
+
+def _purge_chunk(model, pks):
+    files = []
+    with transaction.atomic(using=router.db_for_write(model)):
+        _delete_rows(model, pks, files)
+        transaction.on_commit(lambda: _remove_files(files))
+    return len(files)
+
+
+def purge(chunk_size=CHUNK_SIZE, max_chunks=None):
+    """
+    Purge pending tasks, then pending projects, ``chunk_size`` rows per
+    transaction. Stops after ``max_chunks`` chunks if given, so it can be
+    run repeatedly with bounded work. Returns counts of what was removed.
+    """
+    counts = defaultdict(int)
+    chunks = 0
+
+    # Tasks created in a project after its deletion was requested go too
+    pending_projects = Project.all_objects.filter(deletion_requested_at__isnull=False)
+    Task.all_objects.filter(project__in=pending_projects, deletion_requested_at__isnull=True).update(
+        deletion_requested_at=timezone.now()
+    )
+
+    for model, key in ((Task, 'tasks'), (Project, 'projects')):
+        pending = model.all_objects.filter(deletion_requested_at__isnull=False).order_by('deletion_requested_at')
+        while max_chunks is None or chunks < max_chunks:
+            pks = list(pending.values_list('pk', flat=True)[:chunk_size])
+            if not pks:
+                break
+            counts['files'] += _purge_chunk(model, pks)
+            counts[key] += len(pks)
+            chunks += 1
+            logger.info(f"Purged {len(pks)} {key}")
+    return dict(counts)
+
+
+def pending_counts():
+    return {
+        'tasks': Task.all_objects.filter(deletion_requested_at__isnull=False).count(),
+        'projects': Project.all_objects.filter(deletion_requested_at__isnull=False).count(),
+    }
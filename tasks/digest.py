@@ -0,0 +1,224 @@
+"""
+Daily digest emails.
+
+Recipients are processed in batches. For each batch the due-today, overdue
+and newly-assigned sections of every user are computed with three set-based
+queries and grouped by recipient in memory. The emails are rendered from
+plain dicts in a process pool (template rendering is CPU-bound and needs no
+database) and handed to the email backend with one ``send_messages`` call
+(with the outbox backend, a single bulk insert).
+
+Every handled user gets a ``DigestDelivery`` row for the day once their
+batch has been sent, so re-running the command after an interruption only
+mails the users that were not reached; at most the batch in flight when it
+stopped can be sent twice.
+"""
+import logging
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, time, timedelta
+
+import django
+from django.conf import settings
+from django.contrib.sites.models import Site
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import connections
+from django.db.models import Max, Q
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from auth_app.models import User
+from .models import DigestDelivery, Notification, Task
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 200
+OPEN_STATUSES = ('todo', 'in_progress')
+TASK_FIELDS = ('id', 'title', 'due_date', 'priority', 'project__name')
+MAX_TASKS_PER_SECTION = 25
+
+
+def day_bounds(date):
+    start = timezone.make_aware(datetime.combine(date, time.min))
+    return start, start + timedelta(days=1)
+
+
+def pending_recipients(date):
+    """Active users with an email address who have not opted out and have no digest for ``date`` yet."""
+    return (
+        User.objects.filter(is_active=True)
+        .exclude(email='')
+        .exclude(profile__preferences__daily_digest=False)
+        .exclude(digest_deliveries__date=date)
+        .order_by('id')
+    )
+
+
+def _task_row(row, prefix=''):
+    return {
+        'id': str(row[f'{prefix}id']),
+        'title': row[f'{prefix}title'],
+        'due_date': row[f'{prefix}due_date'],
+        'priority': row[f'{prefix}priority'],
+        'project': row[f'{prefix}project__name'],
+    }
+
+
+def collect_sections(user_ids, date):
+    """
+    ``{user_id: {'due_today': [...], 'overdue': [...], 'new_assignments': [...]}}``
+    for ``user_ids``, from three queries regardless of how many users there are.
+    """
+    start, end = day_bounds(date)
+    sections = {user_id: {'due_today': {}, 'overdue': {}, 'new_assignments': {}} for user_id in user_ids}
+
+    def place(user_id, task):
+        key = 'due_today' if task['due_date'] >= start else 'overdue'
+        sections[user_id][key].setdefault(task['id'], task)
+
+    open_due = Q(status__in=OPEN_STATUSES, due_date__lt=end)
+    for row in Task.objects.filter(open_due, owner_id__in=user_ids).values('owner_id', *TASK_FIELDS):
+        place(row['owner_id'], _task_row(row))
+
+    assignments = Task.assignees.through.objects.filter(
+        user_id__in=user_ids,
+        task__status__in=OPEN_STATUSES,
+        task__due_date__lt=end,
+        task__deletion_requested_at__isnull=True,
+    ).values('user_id', *(f'task__{field}' for field in TASK_FIELDS))
+    for row in assignments:
+        place(row['user_id'], _task_row(row, 'task__'))
+
+    # New assignments since each user's previous digest (or the last 24 hours)
+    since = {
+        row['user_id']: row['last']
+        for row in DigestDelivery.objects.filter(user_id__in=user_ids)
+        .values('user_id').annotate(last=Max('sent_at'))
+    }
+    default_since = start - timedelta(days=1)
+    earliest = min([default_since, *since.values()])
+    assigned = Notification.objects.filter(
+        recipient_id__in=user_ids, notification_type='assigned', created_at__gte=earliest,
+        task__deletion_requested_at__isnull=True, task__isnull=False,
+    ).values('recipient_id', 'created_at', *(f'task__{field}' for field in TASK_FIELDS))
+    for row in assigned:
+        if row['created_at'] >= since.get(row['recipient_id'], default_since):
+            task = _task_row(row, 'task__')
+            sections[row['recipient_id']]['new_assignments'].setdefault(task['id'], task)
+
+    return {
+        user_id: {
+            name: sorted(tasks.values(), key=lambda task: (task['due_date'] is None, task['due_date'] or start))
+            for name, tasks in user_sections.items()
+        }
+        for user_id, user_sections in sections.items()
+    }
+
+
+def _init_worker():
+    # Workers only render templates; make sure Django is configured under the spawn start method too
+    django.setup()
+
+
+def render_digest(context):
+    """``(subject, text, html)`` for one digest. Runs in a worker process, so it only gets plain data."""
+    counts = context['counts']
+    subject = f"{context['site_name']} daily digest: {counts['due_today']} due today, {counts['overdue']} overdue"
+    return (
+        subject,
+        render_to_string('emails/daily_digest_text.html', context),
+        render_to_string('emails/daily_digest.html', context),
+    )
+
+
+def build_contexts(users, sections, date, site_name):
+    contexts = {}
+    for user_id, username, first_name in users:
+        user_sections = sections[user_id]
+        if not any(user_sections.values()):
+            continue
+        contexts[user_id] = {
+            'first_name': first_name or username,
+            'date': date,
+            'site_name': site_name,
+            'site_url': settings.SITE_URL,
+            'counts': {name: len(tasks) for name, tasks in user_sections.items()},
+            **{name: tasks[:MAX_TASKS_PER_SECTION] for name, tasks in user_sections.items()},
+        }
+    return contexts
+
+
+def send_digests(date=None, batch_size=BATCH_SIZE, workers=None, dry_run=False, log=None):
+    """
+    Send the digest for ``date`` (today by default) to every pending
+    recipient. ``workers`` > 1 renders in a process pool. Returns counts of
+    sent, empty and failed digests.
+    """
+    date = date or timezone.localdate()
+    log = log or logger.info
+    site_name = Site.objects.get_current().name
+    from_email = f'{site_name} <{settings.DEFAULT_FROM_EMAIL}>'
+    totals = defaultdict(int)
+
+    pool = None
+    if workers and workers > 1:
+        # Forked workers must not share the parent's database connections
+        connections.close_all()
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
+    connection = None if dry_run else get_connection()
+    try:
+        if connection is not None:
+            connection.open()
+        last_id = 0
+        while True:
+            users = list(
+                pending_recipients(date).filter(id__gt=last_id)
+                .values_list('id', 'username', 'first_name', 'email')[:batch_size]
+            )
+            if not users:
+                break
+            last_id = users[-1][0]
+            emails = {user_id: email for user_id, _, _, email in users}
+            sections = collect_sections(list(emails), date)
+            contexts = build_contexts([user[:3] for user in users], sections, date, site_name)
+
+            ordered = list(contexts)
+            if pool:
+                rendered = list(pool.map(render_digest, [contexts[user_id] for user_id in ordered], chunksize=16))
+            else:
+                rendered = [render_digest(contexts[user_id]) for user_id in ordered]
+            messages = []
+            for user_id, (subject, text, html) in zip(ordered, rendered):
+                message = EmailMultiAlternatives(subject, text, from_email, [emails[user_id]], connection=connection)
+                message.attach_alternative(html, 'text/html')
+                messages.append(message)
+
+            if dry_run:
+                totals['sent'] += len(messages)
+                totals['empty'] += len(users) - len(messages)
+                continue
+            try:
+                connection.send_messages(messages)
+            except Exception as e:
+                # Leave the batch unrecorded so the next run retries it
+                logger.error(f"Error sending digest batch ending at user {last_id}: {str(e)}")
+                totals['failed'] += len(messages)
+                connection.close()
+                connection.open()
+                continue
+            DigestDelivery.objects.bulk_create(
+                [
+                    DigestDelivery(user_id=user_id, date=date, status='sent' if user_id in contexts else 'empty')
+                    for user_id in emails
+                ],
+                ignore_conflicts=True,
+            )
+            totals['sent'] += len(messages)
+            totals['empty'] += len(users) - len(messages)
+            log(f"Digest batch ending at user {last_id}: {len(messages)} sent")
+    finally:
+        if connection is not None:
+            connection.close()
+        if pool is not None:
+            pool.shutdown()
+    return dict(totals)
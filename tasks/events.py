@@ -0,0 +1,186 @@
+"""
+In-process pub/sub for live task updates, delivered as Server-Sent Events.
+
+``tasks.signals`` publishes a small event for every committed task change to
+the users who can see the task. Each open ``/tasks/events/`` stream is an
+``asyncio`` coroutine waiting on its own queue, so idle connections cost a
+few kilobytes rather than a worker thread; this requires serving the site
+through ASGI (see ``Procfile``).
+
+The broker lives in the web process, which matches the single-worker
+deployment. Every user keeps a short history of recent events so a client
+reconnecting with ``Last-Event-ID`` can resume without missing anything; when
+the gap cannot be covered (history overflowed or the process restarted) the
+client receives a ``resync`` event and should re-fetch its view.
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+logger = logging.getLogger(__name__)
+
+HISTORY_SIZE = getattr(settings, 'TASK_EVENTS_HISTORY_SIZE', 200)
+QUEUE_SIZE = 256
+HEARTBEAT_SECONDS = 15
+# Streams end after this long and the browser reconnects with Last-Event-ID,
+# which bounds how long a silently dropped connection can linger
+MAX_STREAM_SECONDS = getattr(settings, 'TASK_EVENTS_MAX_STREAM_SECONDS', 300)
+RETRY_MS = 2000
+
+
+class Subscription:
+    """One open stream: a bounded queue owned by the event loop that serves it."""
+
+    def __init__(self, user_id, loop):
+        self.user_id = user_id
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self.overflowed = False
+
+    def deliver(self, event):
+        """Called on ``self.loop``; a consumer that falls behind is told to resync."""
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+
+class EventBroker:
+    """Thread-safe fan-out of events to per-user asyncio subscribers."""
+
+    def __init__(self, history_size=HISTORY_SIZE):
+        self.epoch = uuid.uuid4().hex[:8]
+        self._seq = 0
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)
+        self._history = defaultdict(lambda: deque(maxlen=history_size))
+        self._evicted = {}
+
+    def subscribe(self, user_id):
+        subscription = Subscription(user_id, asyncio.get_running_loop())
+        with self._lock:
+            self._subscribers[user_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.user_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.user_id]
+
+    def connection_count(self):
+        with self._lock:
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    def publish(self, user_ids, event_type, data):
+        """Send an event to every stream of ``user_ids``. Safe to call from any thread."""
+        with self._lock:
+            self._seq += 1
+            seq = self._seq
+            event = (f'{self.epoch}-{seq}', event_type, json.dumps(data, cls=DjangoJSONEncoder))
+            targets = []
+            for user_id in set(user_ids):
+                if user_id is None:
+                    continue
+                history = self._history[user_id]
+                if len(history) == history.maxlen:
+                    self._evicted[user_id] = history[0][0]
+                history.append((seq, event))
+                targets.extend(self._subscribers.get(user_id, ()))
+        for subscription in targets:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, event)
+            except RuntimeError:
+                logger.debug(f"Dropping task event stream of user {subscription.user_id}: event loop closed")
+                self.unsubscribe(subscription)
+        return event[0]
+
+    def current_id(self):
+        """An event ID that resumes from this point, used for ``resync`` events."""
+        with self._lock:
+            return f'{self.epoch}-{self._seq}'
+
+    def replay(self, user_id, last_event_id):
+        """
+        Events for ``user_id`` published after ``last_event_id``, or ``None``
+        if they are no longer (or were never) all available.
+        """
+        epoch, _, seq = (last_event_id or '').partition('-')
+        if epoch != self.epoch or not seq.isdigit():
+            return None
+        seq = int(seq)
+        with self._lock:
+            if self._evicted.get(user_id, 0) > seq:
+                return None
+            history = list(self._history.get(user_id, ()))
+        return [event for event_seq, event in history if event_seq > seq]
+
+
+broker = EventBroker()
+
+
+def format_event(event_id, event_type, data):
+    return f'id: {event_id}\nevent: {event_type}\ndata: {data}\n\n'
+
+
+async def stream(user_id, last_event_id=None):
+    """Async iterator of SSE frames for ``user_id``, suitable for ``StreamingHttpResponse``."""
+    # Subscribe before replaying so nothing published in between is lost
+    subscription = broker.subscribe(user_id)
+    replayed = set()
+    try:
+        yield f'retry: {RETRY_MS}\n\n'
+        if last_event_id:
+            missed = broker.replay(user_id, last_event_id)
+            if missed is None:
+                yield format_event(broker.current_id(), 'resync', '{}')
+            else:
+                for event in missed:
+                    replayed.add(event[0])
+                    yield format_event(*event)
+
+        deadline = time.monotonic() + MAX_STREAM_SECONDS
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                event = await asyncio.wait_for(
+                    subscription.queue.get(), timeout=min(HEARTBEAT_SECONDS, remaining)
+                )
+            except asyncio.TimeoutError:
+                yield ': keepalive\n\n'
+                continue
+            if event[0] not in replayed:
+                yield format_event(*event)
+            if subscription.overflowed and subscription.queue.empty():
+                # The client fell too far behind; its view has to be rebuilt
+                yield format_event(broker.current_id(), 'resync', '{}')
+                break
+    finally:
+        broker.unsubscribe(subscription)
+
+
+def task_payload(task):
+    """The fields a client needs to patch a task row or card in place."""
+    return {
+        'id': str(task.id),
+        'title': task.title,
+        'status': task.status,
+        'priority': task.priority,
+        'due_date': task.due_date,
+        'project_id': str(task.project_id) if task.project_id else None,
+        'is_archived': task.is_archived,
+        'updated_at': task.updated_at,
+    }
@@ -7,6 +7,7 @@ from .models import (
 from django.contrib.auth import get_user_model
 from django.utils.translation import gettext_lazy as _
 from django.db.models import Q
+from . import hierarchy
 
 User = get_user_model()
 
@@ -171,6 +172,11 @@ class TaskForm(forms.ModelForm):
             if self.instance.pk:
                 available_tasks = available_tasks.exclude(pk=self.instance.pk)
                 
+                # A task can't be moved under one of its own subtasks
+                self.fields['parent_task'].queryset = available_tasks.exclude(
+                    ancestor_links__ancestor=self.instance
+                )
+                
                 # Fetch current dependencies to avoid dependency cycles
                 dependencies = self.instance.dependencies.all()
                 dependent_tasks = self.instance.dependent_tasks.all()
@@ -183,8 +189,7 @@ class TaskForm(forms.ModelForm):
                 )
             else:
                 self.fields['dependencies'].queryset = available_tasks
-                
-            self.fields['parent_task'].queryset = available_tasks
+                self.fields['parent_task'].queryset = available_tasks
             
             # Show only tags created by the user or already associated with the task
             self.fields['tags'].queryset = TaskTag.objects.filter(created_by=user)
@@ -203,6 +208,13 @@ class TaskForm(forms.ModelForm):
                     )
         return dependencies
     
+    def clean_parent_task(self):
+        parent_task = self.cleaned_data.get('parent_task')
+        if parent_task:
+            # Raises forms.ValidationError on a cycle
+            hierarchy.check_parent(self.instance.pk, parent_task.pk)
+        return parent_task
+    
     def clean_due_date(self):
         due_date = self.cleaned_data.get('due_date')
         if due_date and due_date < timezone.now():
@@ -0,0 +1,216 @@
+"""
+Closure-table hierarchy and progress rollups for subtasks.
+
+``TaskClosure`` holds a row for every (ancestor, descendant) pair of the
+``parent_task`` tree, so a whole subtree or ancestor chain is one indexed
+query. ``TaskRollup`` holds, for every task, the number of descendants, how
+many of them are completed, and their summed estimated and actual hours.
+
+Both are maintained incrementally from ``tasks.signals``: creating a task,
+changing its status or hours, moving it under another parent and deleting it
+each touch only the affected ancestor rows. ``rebuild`` recomputes
+everything from ``parent_task`` and is used by the migration and the
+``rebuild_task_hierarchy`` command.
+"""
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import F
+
+from .models import Task, TaskClosure, TaskRollup
+
+ZERO = (0, 0, Decimal(0), Decimal(0))
+REBUILD_BATCH_SIZE = 2000
+
+
+def contribution(status, estimated_hours, actual_hours):
+    """What one task adds to each ancestor's rollup: (total, done, estimated, actual)."""
+    return (
+        1,
+        1 if status == 'completed' else 0,
+        Decimal(str(estimated_hours or 0)),
+        Decimal(str(actual_hours or 0)),
+    )
+
+
+def task_contribution(task):
+    return contribution(task.status, task.estimated_hours, task.actual_hours)
+
+
+def _add(a, b):
+    return tuple(x + y for x, y in zip(a, b))
+
+
+def _sub(a, b):
+    return tuple(x - y for x, y in zip(a, b))
+
+
+def _apply(ancestor_ids, delta):
+    """Add ``delta`` to the rollups of ``ancestor_ids`` with a single UPDATE."""
+    if not ancestor_ids or not any(delta):
+        return
+    total, done, estimated, actual = delta
+    TaskRollup.objects.filter(task_id__in=ancestor_ids).update(
+        total_count=F('total_count') + total,
+        done_count=F('done_count') + done,
+        estimated_hours=F('estimated_hours') + estimated,
+        actual_hours=F('actual_hours') + actual,
+    )
+
+
+def _subtree_totals(task_id, own):
+    """``own`` plus everything below ``task_id``."""
+    rollup = (
+        TaskRollup.objects.filter(task_id=task_id)
+        .values_list('total_count', 'done_count', 'estimated_hours', 'actual_hours')
+        .first()
+    )
+    return _add(own, rollup or ZERO)
+
+
+def _chain(task_id):
+    """``[(ancestor_id, depth)]`` for ``task_id``, including itself at depth 0."""
+    return list(TaskClosure.objects.filter(descendant_id=task_id).values_list('ancestor_id', 'depth'))
+
+
+def ancestors(task):
+    """Ancestors of ``task``, nearest first."""
+    return Task.objects.filter(
+        descendant_links__descendant=task, descendant_links__depth__gt=0
+    ).order_by('descendant_links__depth')
+
+
+def descendants(task, max_depth=None):
+    """All tasks below ``task``, annotated with ``depth`` (1 = direct subtask)."""
+    queryset = Task.objects.filter(ancestor_links__ancestor=task, ancestor_links__depth__gt=0)
+    if max_depth is not None:
+        queryset = queryset.filter(ancestor_links__depth__lte=max_depth)
+    return queryset.annotate(depth=F('ancestor_links__depth')).order_by('depth', 'position', 'created_at')
+
+
+def check_parent(task_id, parent_id):
+    """Raise ``ValidationError`` if making ``parent_id`` the parent of ``task_id`` would create a cycle."""
+    if parent_id is None or task_id is None:
+        return
+    if parent_id == task_id or TaskClosure.objects.filter(ancestor_id=task_id, descendant_id=parent_id).exists():
+        raise ValidationError('A task cannot be moved under itself or one of its subtasks.')
+
+
+def task_created(task):
+    """Add a new task (and its contribution) to the tree."""
+    with transaction.atomic():
+        TaskRollup.objects.get_or_create(task=task)
+        links = [TaskClosure(ancestor_id=task.id, descendant_id=task.id, depth=0)]
+        if task.parent_task_id:
+            chain = _chain(task.parent_task_id)
+            links.extend(
+                TaskClosure(ancestor_id=ancestor_id, descendant_id=task.id, depth=depth + 1)
+                for ancestor_id, depth in chain
+            )
+            _apply([ancestor_id for ancestor_id, _ in chain], task_contribution(task))
+        TaskClosure.objects.bulk_create(links, ignore_conflicts=True)
+
+
+def tasks_bulk_created(tasks):
+    """Register root tasks inserted with ``bulk_create`` (which skips signals)."""
+    TaskRollup.objects.bulk_create([TaskRollup(task_id=task.id) for task in tasks], ignore_conflicts=True)
+    TaskClosure.objects.bulk_create(
+        [TaskClosure(ancestor_id=task.id, descendant_id=task.id, depth=0) for task in tasks],
+        ignore_conflicts=True,
+    )
+
+
+def task_changed(task, old_state):
+    """
+    Apply an update of ``task`` whose stored state was ``old_state``, a
+    ``(parent_task_id, status, estimated_hours, actual_hours)`` tuple.
+    """
+    old_parent_id = old_state[0]
+    old_own = contribution(*old_state[1:])
+    new_own = task_contribution(task)
+
+    with transaction.atomic():
+        old_ancestors = [ancestor_id for ancestor_id, depth in _chain(task.id) if depth > 0]
+        if old_parent_id == task.parent_task_id:
+            _apply(old_ancestors, _sub(new_own, old_own))
+            return
+
+        # Moved: detach the whole subtree from the old ancestors...
+        below = _subtree_totals(task.id, ZERO)
+        _apply(old_ancestors, _sub(ZERO, _add(old_own, below)))
+        subtree = list(TaskClosure.objects.filter(ancestor_id=task.id).values_list('descendant_id', 'depth'))
+        if old_ancestors:
+            TaskClosure.objects.filter(
+                descendant_id__in=[descendant_id for descendant_id, _ in subtree],
+                ancestor_id__in=old_ancestors,
+            ).delete()
+
+        # ...and attach it under every ancestor of the new parent
+        if task.parent_task_id:
+            chain = _chain(task.parent_task_id)
+            TaskClosure.objects.bulk_create([
+                TaskClosure(ancestor_id=ancestor_id, descendant_id=descendant_id, depth=depth + sub_depth + 1)
+                for ancestor_id, depth in chain
+                for descendant_id, sub_depth in subtree
+            ], batch_size=REBUILD_BATCH_SIZE)
+            _apply([ancestor_id for ancestor_id, _ in chain], _add(new_own, below))
+
+
+def task_deleting(task):
+    """
+    Remove ``task``'s subtree totals from its ancestors before it is deleted.
+    Its subtasks become roots (``parent_task`` is ``SET_NULL``), so their
+    links to ``task`` and to its ancestors are dropped as well.
+    """
+    with transaction.atomic():
+        chain = _chain(task.id)
+        old_ancestors = [ancestor_id for ancestor_id, depth in chain if depth > 0]
+        _apply(old_ancestors, _sub(ZERO, _subtree_totals(task.id, task_contribution(task))))
+        below = list(
+            TaskClosure.objects.filter(ancestor_id=task.id, depth__gt=0).values_list('descendant_id', flat=True)
+        )
+        if below:
+            TaskClosure.objects.filter(
+                descendant_id__in=below, ancestor_id__in=old_ancestors + [task.id]
+            ).delete()
+
+
+def rebuild(task_model=Task, closure_model=TaskClosure, rollup_model=TaskRollup, batch_size=REBUILD_BATCH_SIZE):
+    """Recompute the closure table and all rollups from ``parent_task``. Returns the number of links."""
+    parents, own = {}, {}
+    rows = task_model.objects.values_list('id', 'parent_task_id', 'status', 'estimated_hours', 'actual_hours')
+    for task_id, parent_id, status, estimated, actual in rows.iterator(chunk_size=batch_size):
+        parents[task_id] = parent_id
+        own[task_id] = contribution(status, estimated, actual)
+
+    totals = {task_id: ZERO for task_id in parents}
+    links, written = [], 0
+    with transaction.atomic():
+        closure_model.objects.all().delete()
+        rollup_model.objects.all().delete()
+        for task_id in parents:
+            links.append(closure_model(ancestor_id=task_id, descendant_id=task_id, depth=0))
+            seen, current, depth = {task_id}, parents[task_id], 1
+            while current is not None and current in parents and current not in seen:
+                links.append(closure_model(ancestor_id=current, descendant_id=task_id, depth=depth))
+                totals[current] = _add(totals[current], own[task_id])
+                seen.add(current)
+                current, depth = parents[current], depth + 1
+            if len(links) >= batch_size:
+                closure_model.objects.bulk_create(links)
+                written += len(links)
+                links = []
+        closure_model.objects.bulk_create(links)
+        written += len(links)
+        rollup_model.objects.bulk_create(
+            [
+                rollup_model(
+                    task_id=task_id, total_count=total, done_count=done,
+                    estimated_hours=estimated, actual_hours=actual,
+                )
+                for task_id, (total, done, estimated, actual) in totals.items()
+            ],
+            batch_size=batch_size,
+        )
+    return written
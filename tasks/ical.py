@@ -0,0 +1,177 @@
+"""
+iCalendar (RFC 5545) encoding of task due dates.
+
+Feeds are produced from a single streaming query and encoded one event at a
+time, so large feeds never have to be held in memory. While a feed is being
+streamed it is also written to a cache file keyed by the feed's generation;
+later polls for the same generation are served straight from that file.
+"""
+import glob
+import logging
+import os
+import uuid
+from datetime import timezone as dt_timezone
+
+from django.conf import settings
+from django.utils import timezone
+
+from .calendar_api import visible_tasks
+
+logger = logging.getLogger(__name__)
+
+PRODID = '-//Nexus//Task Manager//EN'
+CACHE_DIR = getattr(
+    settings, 'CALENDAR_FEED_CACHE_DIR',
+    os.path.join(settings.BASE_DIR, 'cache', 'calendar_feeds')
+)
+QUERY_CHUNK_SIZE = 2000
+EVENT_DURATION = 'PT30M'
+
+_FEED_COLUMNS = (
+    'id', 'title', 'description', 'status', 'priority', 'due_date', 'updated_at',
+    'project__name', 'reminders__reminder_time', 'reminders__reminder_type',
+    'reminders__is_sent',
+)
+
+
+def escape_text(value):
+    """Escape a TEXT property value."""
+    return (
+        (value or '')
+        .replace('\\', '\\\\')
+        .replace(';', '\\;')
+        .replace(',', '\\,')
+        .replace('\r\n', '\\n')
+        .replace('\n', '\\n')
+        .replace('\r', '\\n')
+    )
+
+
+def fold_line(line):
+    """Fold a content line at 75 octets, as required by RFC 5545."""
+    encoded = line.encode('utf-8')
+    if len(encoded) <= 75:
+        return line + '\r\n'
+    parts = []
+    limit = 75
+    while encoded:
+        cut = min(limit, len(encoded))
+        # Never split a multi-byte UTF-8 sequence
+        while cut < len(encoded) and (encoded[cut] & 0xC0) == 0x80:
+            cut -= 1
+        parts.append(encoded[:cut].decode('utf-8'))
+        encoded = encoded[cut:]
+        limit = 74  # continuation lines start with a space
+    return '\r\n '.join(parts) + '\r\n'
+
+
+def format_datetime(value):
+    return value.astimezone(dt_timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def feed_queryset(user):
+    """All open, non-archived tasks with a due date that ``user`` owns or is assigned to."""
+    return (
+        visible_tasks(user)
+        .filter(due_date__isnull=False, is_archived=False)
+        .exclude(status__in=['completed', 'archived'])
+        .order_by('due_date', 'id')
+        .values_list(*_FEED_COLUMNS)
+    )
+
+
+def _encode_event(row, alarms, dtstamp):
+    (task_id, title, description, status, priority, due_date, updated_at,
+     project_name) = row[:8]
+    summary = title if not project_name else f"{title} [{project_name}]"
+    lines = [
+        'BEGIN:VEVENT',
+        f'UID:{task_id}@nexus-tasks',
+        f'DTSTAMP:{dtstamp}',
+        f'LAST-MODIFIED:{format_datetime(updated_at)}',
+        f'DTSTART:{format_datetime(due_date)}',
+        f'DURATION:{EVENT_DURATION}',
+        f'SUMMARY:{escape_text(summary)}',
+    ]
+    if description:
+        lines.append(f'DESCRIPTION:{escape_text(description)}')
+    lines.append(f'CATEGORIES:{escape_text(priority.upper())},{escape_text(status.upper())}')
+    for reminder_time in alarms:
+        lines.extend([
+            'BEGIN:VALARM',
+            'ACTION:DISPLAY',
+            f'DESCRIPTION:{escape_text(title)}',
+            f'TRIGGER;VALUE=DATE-TIME:{format_datetime(reminder_time)}',
+            'END:VALARM',
+        ])
+    lines.append('END:VEVENT')
+    return ''.join(fold_line(line) for line in lines)
+
+
+def iter_feed(user, calendar_name=None):
+    """Yield the encoded feed for ``user`` one chunk (header or event) at a time."""
+    dtstamp = format_datetime(timezone.now())
+    header = [
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        f'PRODID:{PRODID}',
+        'CALSCALE:GREGORIAN',
+        'METHOD:PUBLISH',
+        f'X-WR-CALNAME:{escape_text(calendar_name or f"Tasks - {user.username}")}',
+    ]
+    yield ''.join(fold_line(line) for line in header)
+
+    # Rows arrive ordered by task, one per reminder (LEFT JOIN), so events are
+    # emitted as soon as the next task id shows up.
+    current, alarms = None, []
+    for row in feed_queryset(user).iterator(chunk_size=QUERY_CHUNK_SIZE):
+        if current is not None and row[0] != current[0]:
+            yield _encode_event(current, alarms, dtstamp)
+            alarms = []
+        current = row
+        reminder_time, reminder_type, is_sent = row[8:11]
+        if reminder_time and reminder_type in ('notification', 'both') and not is_sent:
+            alarms.append(reminder_time)
+    if current is not None:
+        yield _encode_event(current, alarms, dtstamp)
+
+    yield fold_line('END:VCALENDAR')
+
+
+def cached_feed_path(feed):
+    return os.path.join(CACHE_DIR, f'{feed.token.hex}-{feed.generation}.ics')
+
+
+def stream_and_cache(feed):
+    """
+    Yield the encoded feed for ``feed`` while teeing it into the cache file.
+
+    The file is written under a temporary name and only moved into place once
+    the whole feed has been produced, so an interrupted download never leaves
+    a truncated cache entry behind.
+    """
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    final_path = cached_feed_path(feed)
+    tmp_path = f'{final_path}.{uuid.uuid4().hex}.tmp'
+    completed = False
+    try:
+        with open(tmp_path, 'wb') as cache_file:
+            for chunk in iter_feed(feed.user):
+                data = chunk.encode('utf-8')
+                cache_file.write(data)
+                yield data
+        os.replace(tmp_path, final_path)
+        completed = True
+        _remove_stale_files(feed, keep=final_path)
+    finally:
+        if not completed and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _remove_stale_files(feed, keep):
+    for path in glob.glob(os.path.join(CACHE_DIR, f'{feed.token.hex}-*.ics')):
+        if path != keep:
+            try:
+                os.remove(path)
+            except OSError as e:
+                logger.warning(f"Could not remove stale calendar feed {path}: {e}")
@@ -0,0 +1,470 @@
+"""
+Bulk import of tasks from CSV, JSON and NDJSON sources.
+
+Records are parsed lazily from the source file and written in fixed-size
+batches. Projects, tags and assignees referenced by name are resolved with a
+single query per batch, and tasks, their M2M links, initial versions and
+creation activities are all inserted through ``bulk_create``.
+
+Because ``bulk_create`` does not fire model signals, the importer writes the
+same rows that ``task_create`` and ``tasks.signals`` would otherwise produce.
+"""
+import csv
+import io
+import json
+import logging
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, time
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from auth_app.models import User
+from .models import Task, TaskTag, Project, TaskVersion, TaskActivity, CalendarFeed
+from . import changelog, dedupe, hierarchy, snapshots, workload
+
+logger = logging.getLogger(__name__)
+
+SUPPORTED_FORMATS = ('csv', 'json', 'ndjson')
+DEFAULT_BATCH_SIZE = 2000
+
+_VALID_PRIORITIES = {value for value, _ in Task.PRIORITY_CHOICES}
+_VALID_STATUSES = {value for value, _ in Task.STATUS_CHOICES}
+
+
+class RecordError(ValueError):
+    """Raised when a single record cannot be converted into a task."""
+
+
+def detect_format(filename, default='csv'):
+    """Guess the import format from a file name's extension."""
+    name = (filename or '').lower()
+    if name.endswith(('.ndjson', '.jsonl')):
+        return 'ndjson'
+    if name.endswith('.json'):
+        return 'json'
+    if name.endswith('.csv'):
+        return 'csv'
+    return default
+
+
+def _iter_csv(stream):
+    for record in csv.DictReader(stream):
+        yield record
+
+
+def _iter_ndjson(stream):
+    for line in stream:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def _iter_json_array(stream, chunk_size=64 * 1024):
+    """Yield the elements of a top-level JSON array without loading it whole."""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    pos = 0
+    eof = False
+    started = False
+    # What may come next: a value or ']' after '[', a value after ',', ',' or ']' after a value
+    expect = 'first'
+
+    def fill():
+        nonlocal buffer, pos, eof
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            eof = True
+        buffer = buffer[pos:] + chunk
+        pos = 0
+
+    while True:
+        while pos < len(buffer) and buffer[pos] in ' \t\r\n':
+            pos += 1
+        if pos >= len(buffer):
+            if eof:
+                raise ValueError('Unexpected end of JSON input')
+            fill()
+            continue
+
+        char = buffer[pos]
+        if not started:
+            if char != '[':
+                raise ValueError('JSON import expects a top-level array of task objects')
+            started = True
+            pos += 1
+            continue
+        if char == ']':
+            if expect == 'value':
+                raise ValueError('Trailing comma in JSON array')
+            return
+        if char == ',':
+            if expect != 'separator':
+                raise ValueError('Unexpected comma in JSON array')
+            expect = 'value'
+            pos += 1
+            continue
+        if expect == 'separator':
+            raise ValueError("Expected ',' or ']' between JSON array elements")
+
+        try:
+            value, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            fill()
+            continue
+        # A value ending exactly at the buffer edge might be truncated
+        # (e.g. a bare number), so only accept it once more data is seen.
+        if end == len(buffer) and not eof:
+            fill()
+            continue
+        pos = end
+        expect = 'separator'
+        yield value
+
+
+def iter_records(stream, fmt):
+    """Return an iterator of raw record dicts for ``stream`` in format ``fmt``."""
+    if fmt == 'csv':
+        return _iter_csv(stream)
+    if fmt == 'ndjson':
+        return _iter_ndjson(stream)
+    if fmt == 'json':
+        return _iter_json_array(stream)
+    raise ValueError(f"Unsupported import format: {fmt}")
+
+
+def _split_names(value):
+    """Normalise a list or a comma/semicolon separated string of names."""
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = value.replace(';', ',').split(',')
+    return [str(v).strip() for v in value if str(v).strip()]
+
+
+def _parse_due_date(value):
+    if not value:
+        return None
+    if isinstance(value, datetime):
+        parsed = value
+    else:
+        value = str(value).strip()
+        parsed = parse_datetime(value)
+        if parsed is None:
+            day = parse_date(value)
+            if day is None:
+                raise RecordError(f"Invalid due_date '{value}'")
+            parsed = datetime.combine(day, time.min)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def _parse_hours(value):
+    if value in (None, ''):
+        return None
+    try:
+        hours = Decimal(str(value)).quantize(Decimal('0.01'))
+    except InvalidOperation:
+        raise RecordError(f"Invalid estimated_hours '{value}'")
+    if hours < 0 or hours >= 1000:
+        raise RecordError(f"estimated_hours out of range: {value}")
+    return hours
+
+
+@dataclass
+class ImportResult:
+    """Summary of a finished import run."""
+    created: int = 0
+    skipped: int = 0
+    batches: int = 0
+    projects_created: int = 0
+    tags_created: int = 0
+    errors: list = field(default_factory=list)
+
+    def as_dict(self):
+        return {
+            'created': self.created,
+            'skipped': self.skipped,
+            'batches': self.batches,
+            'projects_created': self.projects_created,
+            'tags_created': self.tags_created,
+            'errors': self.errors,
+        }
+
+
+class TaskImporter:
+    """
+    Import tasks for ``user`` in batches of ``batch_size`` records.
+
+    Unknown projects and tags are created on the fly (owned by ``user``)
+    unless ``create_missing`` is False. In that case a row naming an unknown
+    project is skipped, and unknown tags are dropped from the task. Assignees
+    must already exist and are matched by username or email; unknown ones are
+    dropped. Skipped rows and dropped references are both listed in
+    ``errors``, but only skipped rows count towards ``skipped``.
+    """
+
+    max_reported_errors = 100
+
+    def __init__(self, user, batch_size=DEFAULT_BATCH_SIZE, default_project=None,
+                 create_missing=True):
+        self.user = user
+        self.batch_size = max(1, int(batch_size))
+        self.default_project = default_project
+        self.create_missing = create_missing
+        self.result = ImportResult()
+        # Name caches survive across batches so each name hits the DB once
+        self._projects = {}
+        self._tags = {}
+        self._users = {}
+
+    def run(self, records):
+        batch = []
+        for row_number, record in enumerate(records, start=1):
+            batch.append((row_number, record))
+            if len(batch) >= self.batch_size:
+                self._import_batch(batch)
+                batch = []
+        if batch:
+            self._import_batch(batch)
+        return self.result
+
+    def _error(self, row_number, message, skipped=True):
+        if skipped:
+            self.result.skipped += 1
+        if len(self.result.errors) < self.max_reported_errors:
+            self.result.errors.append({'row': row_number, 'error': message})
+
+    def _resolve_projects(self, names):
+        missing = names - self._projects.keys()
+        if not missing:
+            return
+        existing = Project.objects.filter(
+            Q(owner=self.user) | Q(members=self.user),
+            name__in=missing
+        ).distinct().only('id', 'name', 'owner_id')
+        for project in existing:
+            # Prefer the user's own project when a member project shares the name
+            current = self._projects.get(project.name)
+            if current is None or project.owner_id == self.user.id:
+                self._projects[project.name] = project
+        still_missing = missing - self._projects.keys()
+        if still_missing and self.create_missing:
+            new_projects = [Project(name=name, owner=self.user) for name in sorted(still_missing)]
+            Project.objects.bulk_create(new_projects)
+            changelog.record({self.user.id}, 'project', [project.id for project in new_projects])
+            for project in new_projects:
+                self._projects[project.name] = project
+            self.result.projects_created += len(new_projects)
+
+    def _resolve_tags(self, names):
+        missing = names - self._tags.keys()
+        if not missing:
+            return
+        for tag in TaskTag.objects.filter(created_by=self.user, name__in=missing).only('id', 'name'):
+            self._tags[tag.name] = tag
+        still_missing = missing - self._tags.keys()
+        if still_missing and self.create_missing:
+            new_tags = [TaskTag(name=name, created_by=self.user) for name in sorted(still_missing)]
+            TaskTag.objects.bulk_create(new_tags)
+            changelog.record({self.user.id}, 'tag', [tag.id for tag in new_tags])
+            for tag in new_tags:
+                self._tags[tag.name] = tag
+            self.result.tags_created += len(new_tags)
+
+    def _resolve_users(self, names):
+        missing = names - self._users.keys()
+        if not missing:
+            return
+        lowered = {name.lower() for name in missing}
+        matches = User.objects.filter(
+            Q(username__in=missing) | Q(email__in=lowered) | Q(email__in=missing)
+        ).values_list('id', 'username', 'email')
+        for user_id, username, email in matches:
+            self._users[username] = user_id
+            if email:
+                self._users[email] = user_id
+                self._users[email.lower()] = user_id
+        for name in missing:
+            self._users.setdefault(name, self._users.get(name.lower()))
+
+    def _build_task(self, record):
+        title = (record.get('title') or '').strip()
+        if not title:
+            raise RecordError('Missing title')
+        if len(title) > 255:
+            raise RecordError('Title longer than 255 characters')
+
+        priority = (record.get('priority') or 'medium').strip().lower()
+        if priority not in _VALID_PRIORITIES:
+            raise RecordError(f"Invalid priority '{priority}'")
+        status = (record.get('status') or 'todo').strip().lower()
+        if status not in _VALID_STATUSES:
+            raise RecordError(f"Invalid status '{status}'")
+
+        now = timezone.now()
+        task = Task(
+            id=uuid.uuid4(),
+            title=title,
+            description=record.get('description') or '',
+            owner=self.user,
+            priority=priority,
+            status=status,
+            due_date=_parse_due_date(record.get('due_date')),
+            estimated_hours=_parse_hours(record.get('estimated_hours')),
+            is_ai_generated=str(record.get('is_ai_generated', '')).lower() in ('1', 'true', 'yes'),
+        )
+        if status == 'completed':
+            task.completed_at = now
+        elif status == 'archived':
+            task.is_archived = True
+            task.archived_at = now
+        return task
+
+    def _import_batch(self, batch):
+        parsed = []
+        project_names, tag_names, user_names = set(), set(), set()
+        for row_number, record in batch:
+            if not isinstance(record, dict):
+                self._error(row_number, 'Record is not an object')
+                continue
+            try:
+                task = self._build_task(record)
+            except RecordError as e:
+                self._error(row_number, str(e))
+                continue
+            project_name = (record.get('project') or '').strip()
+            tags = _split_names(record.get('tags'))
+            assignees = _split_names(record.get('assignees'))
+            if project_name:
+                project_names.add(project_name)
+            tag_names.update(tags)
+            user_names.update(assignees)
+            parsed.append((row_number, task, project_name, tags, assignees))
+
+        if not parsed:
+            self.result.batches += 1
+            return
+
+        with transaction.atomic():
+            self._resolve_projects(project_names)
+            self._resolve_tags(tag_names)
+            self._resolve_users(user_names)
+
+            tasks, assignee_links, tag_links = [], [], []
+            AssigneeLink = Task.assignees.through
+            TagLink = Task.tags.through
+            for row_number, task, project_name, tags, assignees in parsed:
+                if project_name:
+                    project = self._projects.get(project_name)
+                    if project is None:
+                        self._error(row_number, f"Unknown project '{project_name}'")
+                        continue
+                    task.project = project
+                elif self.default_project is not None:
+                    task.project = self.default_project
+
+                user_ids, unknown_users = set(), []
+                for name in assignees:
+                    user_id = self._users.get(name)
+                    if user_id is None:
+                        unknown_users.append(name)
+                    else:
+                        user_ids.add(user_id)
+                if unknown_users:
+                    self._error(row_number, f"Unknown assignee(s) dropped: {', '.join(unknown_users)}", skipped=False)
+                tag_ids = {self._tags[name].id for name in tags if name in self._tags}
+                unknown_tags = [name for name in tags if name not in self._tags]
+                if unknown_tags:
+                    self._error(row_number, f"Unknown tag(s) dropped: {', '.join(unknown_tags)}", skipped=False)
+
+                tasks.append(task)
+                task._import_assignees = sorted(user_ids)
+                task._import_tags = sorted(tag_ids)
+                assignee_links.extend(AssigneeLink(task_id=task.id, user_id=uid) for uid in user_ids)
+                tag_links.extend(TagLink(task_id=task.id, tasktag_id=tid) for tid in tag_ids)
+
+            Task.objects.bulk_create(tasks, batch_size=self.batch_size)
+            AssigneeLink.objects.bulk_create(assignee_links, batch_size=self.batch_size)
+            TagLink.objects.bulk_create(tag_links, batch_size=self.batch_size)
+            TaskVersion.objects.bulk_create(
+                [self._initial_version(task) for task in tasks], batch_size=self.batch_size
+            )
+            TaskActivity.objects.bulk_create(
+                [
+                    TaskActivity(
+                        task=task,
+                        activity_type='create',
+                        user=self.user,
+                        description=f'Task "{task.title}" imported by {self.user.username}',
+                        metadata={'source': 'import'},
+                    )
+                    for task in tasks
+                ],
+                batch_size=self.batch_size,
+            )
+            # bulk_create bypasses the signals that invalidate calendar feeds
+            CalendarFeed.bump({self.user.id, *(link.user_id for link in assignee_links)})
+            workload.invalidate({task.project_id for task in tasks})
+            hierarchy.tasks_bulk_created(tasks)
+            dedupe.index_tasks(tasks)
+            deltas = None
+            for task in tasks:
+                deltas = snapshots.state_delta(None, snapshots.task_state(task), deltas)
+            snapshots.apply_deltas(deltas)
+            changelog.record_fanout(
+                {task.id: {self.user.id, *task._import_assignees} for task in tasks}, 'task'
+            )
+
+        self.result.created += len(tasks)
+        self.result.batches += 1
+        logger.debug(f"Imported batch of {len(tasks)} tasks for {self.user.username}")
+
+    def _initial_version(self, task):
+        """Equivalent of ``Task.create_version`` for a freshly imported task."""
+        data = {
+            'title': task.title,
+            'description': task.description,
+            'priority': task.priority,
+            'status': task.status,
+            'due_date': task.due_date.isoformat() if task.due_date else None,
+            'assignees': task._import_assignees,
+            'tags': [str(tag_id) for tag_id in task._import_tags],
+            'project_id': str(task.project.id) if task.project else None,
+            'parent_task_id': None,
+            'estimated_hours': float(task.estimated_hours) if task.estimated_hours else None,
+            'actual_hours': None,
+        }
+        return TaskVersion(
+            task=task,
+            version_number=1,
+            title=task.title,
+            description=task.description,
+            status=task.status,
+            priority=task.priority,
+            due_date=task.due_date,
+            modified_by=self.user,
+            data_snapshot=data,
+        )
+
+
+def import_tasks(stream, fmt, user, **options):
+    """
+    Import tasks from a text ``stream`` for ``user``.
+
+    ``stream`` may also be a binary file object (such as an uploaded file),
+    in which case it is decoded as UTF-8 on the fly.
+    """
+    if fmt not in SUPPORTED_FORMATS:
+        raise ValueError(f"Unsupported import format: {fmt}")
+    if not isinstance(stream, io.TextIOBase):
+        stream = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    importer = TaskImporter(user, **options)
+    return importer.run(iter_records(stream, fmt))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from tasks.changelog import backfill
+
+
+class Command(BaseCommand):
+    help = 'Seed the delta-sync change log with every existing task, project, tag and comment'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=2000,
+            help='Rows read per query chunk (default: 2000)',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write('Backfilling change log...')
+        written = backfill(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'{written} change log entries written'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from tasks.notifications import deliver_due_reminders
+
+
+class Command(BaseCommand):
+    help = 'Deliver due in-app task reminders to the notification inbox (run every minute)'
+
+    def handle(self, *args, **options):
+        delivered = deliver_due_reminders()
+        self.stdout.write(self.style.SUCCESS(f'{delivered} reminder(s) delivered'))
@@ -0,0 +1,55 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+
+from auth_app.models import User
+from tasks import dedupe
+from tasks.models import Task
+
+
+class Command(BaseCommand):
+    help = (
+        'Cluster the near-duplicate tasks of an account using the MinHash/LSH index. '
+        'Tasks without a signature are indexed first.'
+    )
+
+    def add_arguments(self, parser):
+        target = parser.add_mutually_exclusive_group(required=True)
+        target.add_argument('--user', help='Username or email of the account to scan')
+        target.add_argument('--all', action='store_true', help='Scan every account')
+        parser.add_argument(
+            '--threshold',
+            type=float,
+            default=dedupe.DEFAULT_THRESHOLD,
+            help=f'Minimum estimated similarity (default: {dedupe.DEFAULT_THRESHOLD})',
+        )
+        parser.add_argument('--limit', type=int, default=20, help='Clusters to list per account (default: 20)')
+
+    def handle(self, *args, **options):
+        if not 0 < options['threshold'] <= 1:
+            raise CommandError('--threshold must be between 0 and 1')
+        if options['all']:
+            users = User.objects.filter(owned_tasks__deletion_requested_at__isnull=True).distinct()
+        else:
+            users = User.objects.filter(Q(username=options['user']) | Q(email=options['user']))
+            if not users.exists():
+                raise CommandError(f"User '{options['user']}' not found")
+
+        for user in users:
+            started = time.perf_counter()
+            indexed = dedupe.index_missing(owner=user)
+            groups = dedupe.clusters(user, options['threshold'])
+            elapsed = time.perf_counter() - started
+            duplicates = sum(len(group) - 1 for group in groups)
+            self.stdout.write(
+                f'{user.username}: {len(groups)} cluster(s), {duplicates} likely duplicate(s) '
+                f'({indexed} task(s) indexed, {elapsed:.2f}s)'
+            )
+            shown = groups[:options['limit']]
+            titles = dict(
+                Task.objects.filter(pk__in=[task_id for group in shown for task_id in group]).values_list('id', 'title')
+            )
+            for group in shown:
+                self.stdout.write(f'  [{len(group)}] ' + ' | '.join(titles.get(task_id, '?') for task_id in group))
+        self.stdout.write(self.style.SUCCESS('Done'))
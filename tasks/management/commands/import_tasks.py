@@ -0,0 +1,84 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+
+from auth_app.models import User
+from tasks.importers import (
+    DEFAULT_BATCH_SIZE, SUPPORTED_FORMATS, detect_format, import_tasks
+)
+from tasks.models import Project
+
+
+class Command(BaseCommand):
+    help = 'Bulk import tasks from a CSV, JSON or NDJSON file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Path to the file to import')
+        parser.add_argument(
+            '--user',
+            required=True,
+            help='Username or email of the user who will own the imported tasks',
+        )
+        parser.add_argument(
+            '--format',
+            choices=SUPPORTED_FORMATS,
+            help='Input format (detected from the file extension by default)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help=f'Number of records inserted per transaction (default: {DEFAULT_BATCH_SIZE})',
+        )
+        parser.add_argument(
+            '--project',
+            help='Project name used for records that do not specify one',
+        )
+        parser.add_argument(
+            '--no-create-missing',
+            action='store_true',
+            help='Do not create projects or tags that do not exist yet',
+        )
+
+    def handle(self, *args, **options):
+        identifier = options['user']
+        user = User.objects.filter(Q(username=identifier) | Q(email__iexact=identifier)).first()
+        if not user:
+            raise CommandError(f"User '{identifier}' not found")
+
+        default_project = None
+        if options['project']:
+            default_project = Project.objects.filter(
+                Q(owner=user) | Q(members=user), name=options['project']
+            ).first()
+            if not default_project:
+                raise CommandError(f"Project '{options['project']}' not found for {user.username}")
+
+        fmt = options['format'] or detect_format(options['path'])
+        self.stdout.write(f"Importing {fmt.upper()} tasks from {options['path']} for {user.username}")
+
+        started = time.monotonic()
+        try:
+            with open(options['path'], 'r', encoding='utf-8-sig', newline='') as stream:
+                result = import_tasks(
+                    stream,
+                    fmt,
+                    user,
+                    batch_size=options['batch_size'],
+                    default_project=default_project,
+                    create_missing=not options['no_create_missing'],
+                )
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Import failed: {e}")
+        elapsed = time.monotonic() - started
+
+        for error in result.errors:
+            self.stdout.write(self.style.WARNING(f"Row {error['row']}: {error['error']}"))
+
+        rate = result.created / elapsed * 60 if elapsed > 0 else result.created
+        self.stdout.write(self.style.SUCCESS(
+            f"Import completed: {result.created} created, {result.skipped} skipped, "
+            f"{result.projects_created} projects and {result.tags_created} tags created "
+            f"in {elapsed:.2f}s ({rate:,.0f} tasks/min)"
+        ))
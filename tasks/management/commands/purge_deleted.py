@@ -0,0 +1,52 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from tasks.deletion import CHUNK_SIZE, pending_counts, purge
+
+
+class Command(BaseCommand):
+    help = (
+        'Purge tasks and projects whose deletion was requested, in bounded chunks. Run it with '
+        '--loop as a worker process (the "purger" Procfile entry), or from cron every few minutes'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=CHUNK_SIZE,
+            help=f'Rows deleted per transaction (default: {CHUNK_SIZE})',
+        )
+        parser.add_argument(
+            '--max-chunks',
+            type=int,
+            help='Stop after this many chunks; the rest is left for the next run',
+        )
+        parser.add_argument('--loop', action='store_true', help='Keep purging new deletion requests instead of exiting when none are left')
+        parser.add_argument('--interval', type=float, default=60, help='Seconds to wait between passes with --loop (default: 60)')
+
+    def handle(self, *args, **options):
+        pending = pending_counts()
+        self.stdout.write(f"Pending deletion: {pending['tasks']} task(s), {pending['projects']} project(s)")
+        totals = {}
+        try:
+            while True:
+                counts = purge(chunk_size=options['chunk_size'], max_chunks=options['max_chunks'])
+                for key, count in counts.items():
+                    totals[key] = totals.get(key, 0) + count
+                if counts and options['loop']:
+                    self.stdout.write(
+                        f"Purged {counts.get('tasks', 0)} task(s) and {counts.get('projects', 0)} project(s)"
+                    )
+                if not options['loop']:
+                    break
+                # --max-chunks bounds each pass; keep going while it leaves work behind
+                if not counts:
+                    time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS(
+            f"Purged {totals.get('tasks', 0)} task(s) and {totals.get('projects', 0)} project(s), "
+            f"removed {totals.get('files', 0)} file(s)"
+        ))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from tasks.hierarchy import REBUILD_BATCH_SIZE, rebuild
+
+
+class Command(BaseCommand):
+    help = 'Recompute the subtask closure table and progress rollups from parent_task'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=REBUILD_BATCH_SIZE,
+            help=f'Rows written per insert (default: {REBUILD_BATCH_SIZE})',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write('Rebuilding task hierarchy...')
+        written = rebuild(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'{written} closure links written'))
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from tasks.digest import BATCH_SIZE, send_digests
+
+
+class Command(BaseCommand):
+    help = (
+        'Email every user their daily digest of due, overdue and newly assigned tasks. '
+        'Safe to re-run: users who already got the digest for the day are skipped.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Digest day as YYYY-MM-DD (default: today)')
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BATCH_SIZE,
+            help=f'Users per query batch and SMTP send (default: {BATCH_SIZE})',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Processes used to render the emails; 1 renders in this process (default: 4)',
+        )
+        parser.add_argument('--dry-run', action='store_true', help='Build and render the digests without sending them')
+
+    def handle(self, *args, **options):
+        date = None
+        if options['date']:
+            date = parse_date(options['date'])
+            if not date:
+                raise CommandError(f"Invalid date '{options['date']}'")
+
+        totals = send_digests(
+            date=date,
+            batch_size=options['batch_size'],
+            workers=options['workers'],
+            dry_run=options['dry_run'],
+            log=self.stdout.write,
+        )
+        verb = 'would be sent' if options['dry_run'] else 'sent'
+        self.stdout.write(self.style.SUCCESS(
+            f"{totals.get('sent', 0)} digest(s) {verb}, {totals.get('empty', 0)} user(s) with nothing due"
+        ))
+        if totals.get('failed'):
+            self.stdout.write(self.style.WARNING(f"{totals['failed']} digest(s) failed; re-run to retry them"))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from tasks.snapshots import roll_forward
+
+
+class Command(BaseCommand):
+    help = 'Write the daily burndown snapshot of every active project (run nightly)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--date',
+            help='Day to snapshot as YYYY-MM-DD (default: today)',
+        )
+        parser.add_argument(
+            '--recount',
+            action='store_true',
+            help='Recount every project from its tasks instead of carrying the last snapshot forward',
+        )
+
+    def handle(self, *args, **options):
+        date = None
+        if options['date']:
+            date = parse_date(options['date'])
+            if not date:
+                raise CommandError(f"Invalid date '{options['date']}'")
+
+        written = roll_forward(date=date, recount=options['recount'])
+        mode = 'recounted' if options['recount'] else 'carried forward'
+        self.stdout.write(self.style.SUCCESS(f'{written} project snapshot(s) {mode}'))
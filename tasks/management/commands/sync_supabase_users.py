@@ -1,12 +1,22 @@
 import logging
-from django.core.management.base import BaseCommand
-from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from auth_app.models import User
-from datetime import datetime
-from mysite.settings import get_supabase_admin_client
+from auth_app.supabase_admin import AdminAPIError, AdminClient, changed_at, is_email_verified
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+USERNAME_MAX_LENGTH = 140
+
 
 class Command(BaseCommand):
-    help = 'Syncs users from Supabase to Django'
+    help = (
+        'Syncs users from Supabase to Django. Local users are loaded once into hash maps; '
+        'Supabase users are diffed against them in memory and written with bulk inserts and updates.'
+    )
 
     def add_arguments(self, parser):
         parser.add_argument(
@@ -14,102 +24,147 @@ class Command(BaseCommand):
             action='store_true',
             help='Force update all users even if they are already synced',
         )
+        parser.add_argument(
+            '--since',
+            type=str,
+            help='Only process users created or updated in Supabase after this ISO 8601 time',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BATCH_SIZE,
+            help=f'Rows per bulk write and transaction (default: {BATCH_SIZE})',
+        )
 
     def handle(self, *args, **options):
         force_update = options.get('force', False)
-        supabase_admin = get_supabase_admin_client()
-
-        if not supabase_admin:
-            self.stderr.write(self.style.ERROR('Failed to initialize Supabase admin client'))
+        batch_size = max(1, options['batch_size'])
+        since = parse_datetime(options['since']) if options.get('since') else None
+        if options.get('since') and since is None:
+            self.stderr.write(self.style.ERROR(f"Invalid --since time: {options['since']}"))
             return
+        if since and timezone.is_naive(since):
+            since = timezone.make_aware(since)
+
+        try:
+            client = AdminClient()
+        except AdminAPIError as e:
+            raise CommandError(f'Failed to initialize Supabase admin client: {str(e)}')
 
         self.stdout.write(self.style.SUCCESS('Starting user sync from Supabase to Django'))
-        
+
+        # One query for everything the diff needs
+        by_supabase_id, by_email, usernames = {}, {}, set()
+        for pk, email, supabase_id, username, email_verified, is_active, last_login in User.objects.values_list(
+            'pk', 'email', 'supabase_id', 'username', 'email_verified', 'is_active', 'last_login',
+        ).iterator(chunk_size=2000):
+            row = (pk, supabase_id, email_verified, is_active, last_login)
+            if supabase_id:
+                by_supabase_id[supabase_id] = pk
+            if email:
+                by_email.setdefault(email.lower(), row)
+            usernames.add(username)
+        self.stdout.write(f'Loaded {len(by_email)} Django users')
+
+        to_create, to_update = [], {}
+        counts = {'found': 0, 'created': 0, 'updated': 0, 'unchanged': 0, 'skipped': 0}
+        error = None
         try:
-            # Get all users from Supabase
-            response = supabase_admin.auth.admin.list_users()
-            supabase_users = response.users if hasattr(response, 'users') else []
-            
-            if not supabase_users:
-                self.stdout.write(self.style.WARNING('No users found in Supabase'))
+            with client:
+                for _, page in client.iter_pages():
+                    counts['found'] += len(page)
+                    for supabase_user in page:
+                        if since and (changed_at(supabase_user) or since) < since:
+                            counts['skipped'] += 1
+                            continue
+                        self.diff(supabase_user, force_update, by_supabase_id, by_email, usernames, to_create, to_update, counts)
+                    if len(to_create) >= batch_size:
+                        self.write(to_create, {}, batch_size)
+                        to_create = []
+        except (AdminAPIError, OSError) as e:
+            logger.error(f'Error in sync_supabase_users command: {str(e)}')
+            # Users diffed so far are still written below
+            error = e
+
+        self.write(to_create, to_update, batch_size)
+
+        if error is not None:
+            raise CommandError(
+                f"Error listing Supabase users after {counts['found']} users "
+                f"({counts['created']} created, {counts['updated']} updated): {str(error)}"
+            )
+        if not counts['found']:
+            self.stdout.write(self.style.WARNING('No users found in Supabase'))
+        self.stdout.write(self.style.SUCCESS(
+            f"Sync completed: {counts['found']} in Supabase, {counts['created']} created, "
+            f"{counts['updated']} updated, {counts['unchanged']} unchanged, {counts['skipped']} skipped"
+        ))
+
+    def diff(self, supabase_user, force_update, by_supabase_id, by_email, usernames, to_create, to_update, counts):
+        supabase_id = supabase_user.get('id')
+        email = (supabase_user.get('email') or '').lower()
+        if not email:
+            counts['skipped'] += 1
+            return
+        if supabase_id in by_supabase_id and not force_update:
+            # Already linked
+            counts['skipped'] += 1
+            return
+
+        email_verified = is_email_verified(supabase_user)
+        banned_until = parse_datetime(supabase_user.get('banned_until') or '')
+        is_active = not (banned_until and banned_until > timezone.now())
+        last_sign_in = parse_datetime(supabase_user.get('last_sign_in_at') or '')
+
+        existing = by_email.get(email)
+        if existing and existing[0] is None:
+            # Created earlier in this run
+            counts['skipped'] += 1
+            return
+        if existing:
+            pk, current_id, current_verified, current_active, current_login = existing
+            user = User(
+                pk=pk,
+                supabase_id=current_id or supabase_id,
+                email_verified=email_verified,
+                is_active=is_active,
+                last_login=last_sign_in or current_login,
+            )
+            if (user.supabase_id, user.email_verified, user.is_active, user.last_login) == existing[1:]:
+                counts['unchanged'] += 1
                 return
+            to_update[pk] = user
+            by_email[email] = (pk, user.supabase_id, email_verified, is_active, user.last_login)
+            counts['updated'] += 1
+            return
+
+        base = email.split('@')[0][:USERNAME_MAX_LENGTH]
+        username, counter = base, 1
+        while username in usernames:
+            username = f"{base}{counter}"
+            counter += 1
+        usernames.add(username)
+        user = User(
+            username=username,
+            email=email,
+            supabase_id=supabase_id,
+            email_verified=email_verified,
+            is_active=is_active,
+            last_login=last_sign_in,
+        )
+        user.set_unusable_password()
+        to_create.append(user)
+        by_email[email] = (None, supabase_id, email_verified, is_active, last_sign_in)
+        if supabase_id:
+            by_supabase_id[supabase_id] = None
+        counts['created'] += 1
 
-            self.stdout.write(f'Found {len(supabase_users)} users in Supabase')
-            
-            # Process each user
-            created_count = 0
-            updated_count = 0
-            skipped_count = 0
-            
-            for supabase_user in supabase_users:
-                supabase_id = supabase_user.id
-                email = supabase_user.email
-                
-                if not email:
-                    self.stdout.write(self.style.WARNING(f'Skipping user with no email: {supabase_id}'))
-                    skipped_count += 1
-                    continue
-                    
-                # Check if user already exists
-                user_exists = User.objects.filter(supabase_id=supabase_id).exists()
-                email_exists = User.objects.filter(email=email).exists()
-                
-                if user_exists and not force_update:
-                    self.stdout.write(f'User already exists and is synced: {email}')
-                    skipped_count += 1
-                    continue
-                    
-                # Get or create user
-                if email_exists:
-                    # Update existing user
-                    user = User.objects.get(email=email)
-                    if not user.supabase_id:
-                        user.supabase_id = supabase_id
-                    
-                    # Update user fields
-                    user.email_verified = supabase_user.email_confirmed_at is not None
-                    user.is_active = not supabase_user.banned
-                    
-                    # Update last login if available
-                    if hasattr(supabase_user, 'last_sign_in_at') and supabase_user.last_sign_in_at:
-                        user.last_login = datetime.fromisoformat(supabase_user.last_sign_in_at.replace('Z', '+00:00'))
-                    
-                    user.save()
-                    self.stdout.write(f'Updated user: {email}')
-                    updated_count += 1
-                else:
-                    # Create new user
-                    username = email.split('@')[0]
-                    base_username = username
-                    counter = 1
-                    
-                    # Ensure username is unique
-                    while User.objects.filter(username=username).exists():
-                        username = f"{base_username}{counter}"
-                        counter += 1
-                    
-                    user = User(
-                        username=username,
-                        email=email,
-                        supabase_id=supabase_id,
-                        email_verified=supabase_user.email_confirmed_at is not None,
-                        is_active=not supabase_user.banned,
-                    )
-                    
-                    # Set last login if available
-                    if hasattr(supabase_user, 'last_sign_in_at') and supabase_user.last_sign_in_at:
-                        user.last_login = datetime.fromisoformat(supabase_user.last_sign_in_at.replace('Z', '+00:00'))
-                    
-                    # Save without triggering validation
-                    user.save()
-                    self.stdout.write(self.style.SUCCESS(f'Created user: {email}'))
-                    created_count += 1
-            
-            # Summary
-            self.stdout.write(self.style.SUCCESS(
-                f'Sync completed: {created_count} created, {updated_count} updated, {skipped_count} skipped'
-            ))
-            
-        except Exception as e:
-            self.stderr.write(self.style.ERROR(f'Error syncing users: {str(e)}'))
-            logging.exception('Error in sync_supabase_users command') 
\ No newline at end of file
+    def write(self, to_create, to_update, batch_size):
+        """Bulk-insert and bulk-update in transactions of ``batch_size`` rows."""
+        for i in range(0, len(to_create), batch_size):
+            with transaction.atomic():
+                User.objects.bulk_create(to_create[i:i + batch_size])
+        updates = list(to_update.values())
+        for i in range(0, len(updates), batch_size):
+            with transaction.atomic():
+                User.objects.bulk_update(updates[i:i + batch_size], ['supabase_id', 'email_verified', 'is_active', 'last_login'])
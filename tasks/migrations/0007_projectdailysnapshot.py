@@ -0,0 +1,35 @@
+# Generated by Django 4.2 on 2026-10-19 09:31
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0006_task_due_date_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProjectDailySnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('todo_count', models.IntegerField(default=0)),
+                ('in_progress_count', models.IntegerField(default=0)),
+                ('completed_count', models.IntegerField(default=0)),
+                ('archived_count', models.IntegerField(default=0)),
+                ('remaining_hours', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('completed_hours', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_snapshots', to='tasks.project')),
+            ],
+            options={
+                'verbose_name': 'Project Daily Snapshot',
+                'verbose_name_plural': 'Project Daily Snapshots',
+                'ordering': ['project', 'date'],
+                'unique_together': {('project', 'date')},
+            },
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.2 on 2026-10-19 09:39
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('tasks', '0007_projectdailysnapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeLogEntry',
+            fields=[
+                ('seq', models.BigAutoField(primary_key=True, serialize=False)),
+                ('entity_type', models.CharField(choices=[('task', 'Task'), ('project', 'Project'), ('tag', 'Tag'), ('comment', 'Comment')], max_length=10)),
+                ('entity_id', models.UUIDField()),
+                ('operation', models.CharField(choices=[('upsert', 'Created or Updated'), ('delete', 'Deleted')], max_length=6)),
+                ('changed_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='change_log', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Change Log Entry',
+                'verbose_name_plural': 'Change Log Entries',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='changelogentry',
+            index=models.Index(fields=['user', 'seq'], name='tasks_chang_user_id_1a573d_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='changelogentry',
+            unique_together={('user', 'entity_type', 'entity_id')},
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 4.2 on 2026-10-19 09:41
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def build_hierarchy(apps, schema_editor):
+    from tasks.hierarchy import rebuild
+
+    rebuild(
+        apps.get_model('tasks', 'Task'),
+        apps.get_model('tasks', 'TaskClosure'),
+        apps.get_model('tasks', 'TaskRollup'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0008_changelogentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaskRollup',
+            fields=[
+                ('task', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='rollup', serialize=False, to='tasks.task')),
+                ('total_count', models.PositiveIntegerField(default=0)),
+                ('done_count', models.PositiveIntegerField(default=0)),
+                ('estimated_hours', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('actual_hours', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TaskClosure',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.PositiveIntegerField()),
+                ('ancestor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='descendant_links', to='tasks.task')),
+                ('descendant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ancestor_links', to='tasks.task')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='taskclosure',
+            index=models.Index(fields=['descendant', 'depth'], name='tasks_taskc_descend_1f1622_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='taskclosure',
+            unique_together={('ancestor', 'descendant')},
+        ),
+        migrations.RunPython(build_hierarchy, migrations.RunPython.noop),
+    ]
@@ -8,6 +8,12 @@ from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
 
 # Create your models here.
+class LiveManager(models.Manager):
+    """Hides rows that are waiting to be purged by ``tasks.deletion``."""
+
+    def get_queryset(self):
+        return super().get_queryset().filter(deletion_requested_at__isnull=True)
+
 class Category(models.Model):
     name = models.CharField(max_length=100)
     description = models.TextField(blank=True, null=True)
@@ -89,6 +95,11 @@ class Project(models.Model):
     supabase_id = models.CharField(max_length=255, blank=True, null=True)
     is_synced = models.BooleanField(default=False)
     last_synced_at = models.DateTimeField(null=True, blank=True)
+    # Set when deletion is requested; the row is purged in the background
+    deletion_requested_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    
+    objects = LiveManager()
+    all_objects = models.Manager()
     
     def __str__(self):
         return self.name
@@ -169,6 +180,11 @@ class Task(models.Model):
     supabase_id = models.CharField(max_length=255, blank=True, null=True)
     is_synced = models.BooleanField(default=False)
     last_synced_at = models.DateTimeField(null=True, blank=True)
+    # Set when deletion is requested; the row is purged in the background
+    deletion_requested_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    
+    objects = LiveManager()
+    all_objects = models.Manager()
     
     def mark_completed(self):
         self.status = 'completed'
@@ -280,6 +296,10 @@ class Task(models.Model):
         ordering = ['-created_at']
         verbose_name = 'Task'
         verbose_name_plural = 'Tasks'
+        indexes = [
+            models.Index(fields=['due_date']),
+            models.Index(fields=['owner', 'due_date']),
+        ]
 
 class TaskActivity(models.Model):
     ACTIVITY_TYPES = [
@@ -564,3 +584,234 @@ class ProjectAttachment(models.Model):
     
     def __str__(self):
         return self.file.name
+
+class CalendarFeed(models.Model):
+    """
+    Per-user tokenized iCalendar feed of task due dates.
+
+    ``generation`` is bumped whenever one of the user's tasks or reminders
+    changes, so the feed only has to be re-encoded when it moves.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='calendar_feed')
+    token = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    generation = models.PositiveBigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Calendar feed for {self.user}"
+
+    def rotate_token(self):
+        self.token = uuid.uuid4()
+        self.save(update_fields=['token'])
+
+    @property
+    def etag(self):
+        return f'"{self.token.hex}-{self.generation}"'
+
+    @classmethod
+    def bump(cls, user_ids):
+        """Invalidate the feeds of ``user_ids`` (users without a feed are ignored)."""
+        user_ids = {user_id for user_id in user_ids if user_id is not None}
+        if user_ids:
+            cls.objects.filter(user_id__in=user_ids).update(generation=models.F('generation') + 1)
+
+    class Meta:
+        verbose_name = 'Calendar Feed'
+        verbose_name_plural = 'Calendar Feeds'
+
+class ProjectDailySnapshot(models.Model):
+    """
+    End-of-day totals for a project, used for burndown and velocity charts.
+
+    Today's row is kept current by applying per-task deltas as tasks change
+    (see ``tasks.snapshots``); earlier rows are frozen history.
+    """
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name='daily_snapshots')
+    date = models.DateField()
+    todo_count = models.IntegerField(default=0)
+    in_progress_count = models.IntegerField(default=0)
+    completed_count = models.IntegerField(default=0)
+    archived_count = models.IntegerField(default=0)
+    remaining_hours = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    completed_hours = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.project} on {self.date}"
+
+    @property
+    def total_count(self):
+        return self.todo_count + self.in_progress_count + self.completed_count + self.archived_count
+
+    class Meta:
+        unique_together = ['project', 'date']
+        ordering = ['project', 'date']
+        verbose_name = 'Project Daily Snapshot'
+        verbose_name_plural = 'Project Daily Snapshots'
+
+class ChangeLogEntry(models.Model):
+    """
+    Latest change of one entity as seen by one user, for delta sync.
+
+    ``seq`` only ever grows, and recording a change replaces the user's
+    previous entry for the entity, so the rows after a client's cursor are
+    exactly the entities it has to refresh or drop.
+    """
+    ENTITY_TYPES = [
+        ('task', 'Task'),
+        ('project', 'Project'),
+        ('tag', 'Tag'),
+        ('comment', 'Comment'),
+    ]
+    OPERATIONS = [
+        ('upsert', 'Created or Updated'),
+        ('delete', 'Deleted'),
+    ]
+
+    seq = models.BigAutoField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='change_log')
+    entity_type = models.CharField(max_length=10, choices=ENTITY_TYPES)
+    entity_id = models.UUIDField()
+    operation = models.CharField(max_length=6, choices=OPERATIONS)
+    changed_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"#{self.seq} {self.operation} {self.entity_type} {self.entity_id} for {self.user}"
+
+    class Meta:
+        unique_together = ['user', 'entity_type', 'entity_id']
+        indexes = [models.Index(fields=['user', 'seq'])]
+        verbose_name = 'Change Log Entry'
+        verbose_name_plural = 'Change Log Entries'
+
+class TaskClosure(models.Model):
+    """
+    Closure table over ``Task.parent_task``: one row for every
+    (ancestor, descendant) pair, including each task paired with itself at
+    depth 0, so whole subtrees and ancestor chains are single queries.
+    """
+    ancestor = models.ForeignKey(Task, on_delete=models.CASCADE, related_name='descendant_links')
+    descendant = models.ForeignKey(Task, on_delete=models.CASCADE, related_name='ancestor_links')
+    depth = models.PositiveIntegerField()
+
+    def __str__(self):
+        return f"{self.ancestor_id} -> {self.descendant_id} ({self.depth})"
+
+    class Meta:
+        unique_together = ['ancestor', 'descendant']
+        indexes = [models.Index(fields=['descendant', 'depth'])]
+
+class TaskRollup(models.Model):
+    """Totals over all of a task's descendants (not the task itself), kept current incrementally."""
+    task = models.OneToOneField(Task, on_delete=models.CASCADE, primary_key=True, related_name='rollup')
+    total_count = models.PositiveIntegerField(default=0)
+    done_count = models.PositiveIntegerField(default=0)
+    estimated_hours = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    actual_hours = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    def __str__(self):
+        return f"Rollup for {self.task_id}"
+
+    @property
+    def percent_complete(self):
+        return round(self.done_count / self.total_count * 100) if self.total_count else 0
+
+class TaskSignature(models.Model):
+    """
+    MinHash signature of a task's title and description, and the earlier task
+    of the same owner it most likely duplicates (if any).
+    """
+    task = models.OneToOneField(Task, on_delete=models.CASCADE, primary_key=True, related_name='signature')
+    signature = models.BinaryField()
+    duplicate_of = models.ForeignKey(
+        Task, on_delete=models.SET_NULL, null=True, blank=True, related_name='possible_duplicates'
+    )
+    similarity = models.FloatField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Signature for {self.task_id}"
+
+class TaskLSHBucket(models.Model):
+    """
+    One LSH band of a task's signature. Tasks of the same owner that share a
+    ``key`` are duplicate candidates; the key packs the band number with the
+    hash of that band's rows.
+    """
+    task = models.ForeignKey(Task, on_delete=models.CASCADE, related_name='lsh_buckets')
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    key = models.BigIntegerField()
+
+    def __str__(self):
+        return f"{self.task_id} in bucket {self.key}"
+
+    class Meta:
+        indexes = [models.Index(fields=['owner', 'key'])]
+
+class Notification(models.Model):
+    """
+    One in-app notification for one recipient. Notifications are fanned out
+    on write, so a user's inbox is a single indexed range scan, and paged by
+    ``id``, which only ever grows.
+    """
+    TYPE_CHOICES = [
+        ('assigned', 'Assigned to Task'),
+        ('comment', 'New Comment'),
+        ('mention', 'Mentioned'),
+        ('project_task', 'New Task in Project'),
+        ('reminder', 'Reminder'),
+    ]
+
+    id = models.BigAutoField(primary_key=True)
+    recipient = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notifications')
+    actor = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    notification_type = models.CharField(max_length=20, choices=TYPE_CHOICES)
+    message = models.CharField(max_length=255)
+    # SET_NULL keeps the unread counters exact when a task or project is deleted
+    task = models.ForeignKey(Task, on_delete=models.SET_NULL, null=True, blank=True, related_name='notifications')
+    project = models.ForeignKey(Project, on_delete=models.SET_NULL, null=True, blank=True, related_name='notifications')
+    is_read = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    read_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.get_notification_type_display()} for {self.recipient}: {self.message}"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['recipient', 'id']),
+            models.Index(fields=['recipient', 'is_read', 'id']),
+        ]
+        verbose_name = 'Notification'
+        verbose_name_plural = 'Notifications'
+
+class NotificationCounter(models.Model):
+    """Denormalized unread count per user, so the header badge is a single-row read."""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='notification_counter')
+    unread_count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.unread_count} unread for {self.user}"
+
+class DigestDelivery(models.Model):
+    """
+    Record that a user's daily digest for ``date`` was handled, so an
+    interrupted run can be resumed without emailing anyone twice.
+    """
+    STATUS_CHOICES = [
+        ('sent', 'Sent'),
+        ('empty', 'Nothing to Send'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='digest_deliveries')
+    date = models.DateField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES)
+    sent_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Digest for {self.user} on {self.date} ({self.status})"
+
+    class Meta:
+        unique_together = ['user', 'date']
+        verbose_name = 'Digest Delivery'
+        verbose_name_plural = 'Digest Deliveries'
@@ -0,0 +1,153 @@
+"""
+In-app notification inbox.
+
+Notifications are fanned out on write: an event inserts one row per
+recipient with a single ``bulk_create`` and bumps each recipient's
+``NotificationCounter`` with a single UPDATE, so reading the unread badge is
+one primary-key lookup and reading the inbox is one range scan on
+``(recipient, id)``. Marking as read is a single UPDATE whose row count is
+subtracted from the counter, which keeps it exact under concurrent writes.
+"""
+import re
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import events
+from .models import Notification, NotificationCounter, Task, TaskReminder
+from auth_app.models import User
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+MAX_MARK_READ = 500
+MENTION_RE = re.compile(r'(?<![\w.])@([\w.@+-]+)')
+PAYLOAD_FIELDS = ('id', 'notification_type', 'message', 'task_id', 'project_id', 'actor_id', 'is_read', 'created_at')
+
+
+def mentioned_user_ids(text):
+    """IDs of the users whose usernames are @-mentioned in ``text``."""
+    usernames = {name.rstrip('.') for name in MENTION_RE.findall(text or '')}
+    if not usernames:
+        return set()
+    return set(User.objects.filter(username__in=usernames, is_active=True).values_list('id', flat=True))
+
+
+def notify(recipient_ids, notification_type, message, actor=None, task=None, project=None):
+    """
+    Deliver one notification to each of ``recipient_ids`` (the actor is
+    skipped). Returns the number of notifications created.
+    """
+    actor_id = getattr(actor, 'pk', actor)
+    recipient_ids = {user_id for user_id in recipient_ids if user_id is not None and user_id != actor_id}
+    if not recipient_ids:
+        return 0
+    task_id = getattr(task, 'pk', task)
+    project_id = getattr(project, 'pk', project)
+    message = message[:255]
+    with transaction.atomic():
+        created = Notification.objects.bulk_create([
+            Notification(
+                recipient_id=user_id, actor_id=actor_id, notification_type=notification_type,
+                message=message, task_id=task_id, project_id=project_id,
+            )
+            for user_id in recipient_ids
+        ])
+        NotificationCounter.objects.bulk_create(
+            [NotificationCounter(user_id=user_id) for user_id in recipient_ids], ignore_conflicts=True
+        )
+        NotificationCounter.objects.filter(user_id__in=recipient_ids).update(unread_count=F('unread_count') + 1)
+    payload = {
+        'notification_type': notification_type, 'message': message,
+        'task_id': str(task_id) if task_id else None, 'project_id': str(project_id) if project_id else None,
+    }
+    transaction.on_commit(lambda: events.broker.publish(recipient_ids, 'notification.created', payload))
+    return len(created)
+
+
+def unread_count(user):
+    return NotificationCounter.objects.filter(user=user).values_list('unread_count', flat=True).first() or 0
+
+
+async def aunread_count(user):
+    return await NotificationCounter.objects.filter(user=user).values_list('unread_count', flat=True).afirst() or 0
+
+
+def inbox(user, cursor=None, limit=DEFAULT_PAGE_SIZE, unread_only=False):
+    """
+    One page of ``user``'s notifications, newest first. Pass the returned
+    ``next_cursor`` back as ``cursor`` to get the next (older) page.
+    """
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    queryset = Notification.objects.filter(recipient=user)
+    if unread_only:
+        queryset = queryset.filter(is_read=False)
+    if cursor:
+        queryset = queryset.filter(id__lt=cursor)
+    rows = list(queryset.order_by('-id').values(*PAYLOAD_FIELDS)[:limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return {
+        'notifications': rows,
+        'next_cursor': rows[-1]['id'] if has_more else None,
+        'unread_count': unread_count(user),
+    }
+
+
+def mark_read(user, ids=None, up_to=None):
+    """
+    Mark ``ids`` (at most ``MAX_MARK_READ``), or everything up to and
+    including ``up_to``, or the whole inbox, as read with one UPDATE.
+    Returns the number of notifications that were unread.
+    """
+    queryset = Notification.objects.filter(recipient=user, is_read=False)
+    if ids is not None:
+        queryset = queryset.filter(id__in=list(ids)[:MAX_MARK_READ])
+    elif up_to is not None:
+        queryset = queryset.filter(id__lte=up_to)
+    with transaction.atomic():
+        changed = queryset.update(is_read=True, read_at=timezone.now())
+        if changed:
+            NotificationCounter.objects.filter(user=user).update(unread_count=F('unread_count') - changed)
+    return changed
+
+
+def recount(user_ids=None):
+    """Recompute the unread counters from the notifications (repair tool)."""
+    users = User.objects.all() if user_ids is None else User.objects.filter(id__in=user_ids)
+    for user_id in users.values_list('id', flat=True).iterator():
+        count = Notification.objects.filter(recipient_id=user_id, is_read=False).count()
+        NotificationCounter.objects.update_or_create(user_id=user_id, defaults={'unread_count': count})
+
+
+def deliver_due_reminders(now=None):
+    """
+    Turn due in-app reminders into notifications for the task's owner and
+    assignees, and mark them sent. Returns the number of reminders delivered.
+    """
+    now = now or timezone.now()
+    due = list(
+        TaskReminder.objects.filter(
+            is_sent=False, reminder_time__lte=now, reminder_type__in=('notification', 'both'),
+            task__deletion_requested_at__isnull=True,
+        ).select_related('task')
+    )
+    if not due:
+        return 0
+    assignees = {}
+    for task_id, user_id in Task.assignees.through.objects.filter(
+        task_id__in={reminder.task_id for reminder in due}
+    ).values_list('task_id', 'user_id'):
+        assignees.setdefault(task_id, set()).add(user_id)
+    delivered = 0
+    for reminder in due:
+        with transaction.atomic():
+            # update() instead of mark_as_sent(): TaskReminder.save() rejects past reminder times
+            if not TaskReminder.objects.filter(pk=reminder.pk, is_sent=False).update(is_sent=True, sent_at=now):
+                continue
+            notify(
+                {reminder.task.owner_id, *assignees.get(reminder.task_id, ())}, 'reminder',
+                f'Reminder: "{reminder.task.title}"', task=reminder.task, project=reminder.task.project_id,
+            )
+        delivered += 1
+    return delivered
@@ -0,0 +1,138 @@
+"""
+Query layer shared by the sync (template) views and the async JSON endpoints.
+
+Each helper only builds a queryset or the aggregate expressions for one, so
+the sync views evaluate it as usual while the async views use Django's async
+ORM interface (``async for``, ``aaggregate``, ``aget``) on the same query.
+"""
+import uuid
+
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from .calendar_api import visible_tasks
+from .models import Project, Task
+
+OPEN_STATUSES = ('todo', 'in_progress')
+TASK_LIST_FIELDS = (
+    'id', 'title', 'status', 'priority', 'due_date', 'created_at', 'updated_at',
+    'project_id', 'project__name', 'owner_id', 'is_archived', 'estimated_hours',
+)
+TASK_LIST_SORTS = {
+    'created_at', '-created_at', 'due_date', '-due_date', 'priority', '-priority',
+    'title', '-title', 'status', '-status', 'updated_at', '-updated_at',
+}
+DEFAULT_PAGE_SIZE = 10
+MAX_PAGE_SIZE = 100
+
+
+class InvalidFilter(ValueError):
+    """A filter parameter that can never match, e.g. a malformed ID."""
+
+
+def parse_uuid(value):
+    """``value`` as a UUID, or ``None`` if it is not one."""
+    try:
+        return uuid.UUID(str(value))
+    except ValueError:
+        return None
+
+
+def user_tasks(user, show_archived=False):
+    """Tasks the user owns or is assigned to."""
+    tasks = visible_tasks(user)
+    if not show_archived:
+        tasks = tasks.filter(is_archived=False)
+    return tasks
+
+
+def filter_tasks(tasks, params):
+    """
+    Apply the simple ``status``/``priority``/``project``/``search`` filters
+    from ``params``. Raises ``InvalidFilter`` for a malformed project ID.
+    """
+    if params.get('status'):
+        tasks = tasks.filter(status=params['status'])
+    if params.get('priority'):
+        tasks = tasks.filter(priority=params['priority'])
+    if params.get('project'):
+        if parse_uuid(params['project']) is None:
+            raise InvalidFilter('project must be a project ID')
+        tasks = tasks.filter(project_id=params['project'])
+    if params.get('search'):
+        search = params['search']
+        tasks = tasks.filter(Q(title__icontains=search) | Q(description__icontains=search))
+    sort_by = params.get('sort_by')
+    return tasks.order_by(sort_by if sort_by in TASK_LIST_SORTS else '-created_at', 'id')
+
+
+def _count_expressions():
+    return {
+        'total': Count('id'),
+        'todo': Count('id', filter=Q(status='todo')),
+        'in_progress': Count('id', filter=Q(status='in_progress')),
+        'completed': Count('id', filter=Q(status='completed')),
+        'overdue': Count('id', filter=Q(due_date__lt=timezone.now(), status__in=OPEN_STATUSES)),
+    }
+
+
+def _with_percentage(counts):
+    total = counts['total']
+    counts['completion_percentage'] = round(counts['completed'] / total * 100) if total else 0
+    return counts
+
+
+def task_counts(tasks):
+    """Status, overdue and completion counts for ``tasks`` in a single query."""
+    return _with_percentage(tasks.order_by().aggregate(**_count_expressions()))
+
+
+async def atask_counts(tasks):
+    return _with_percentage(await tasks.order_by().aaggregate(**_count_expressions()))
+
+
+def page_bounds(params):
+    """``(page, page_size, offset)`` from ``page``/``page_size`` query parameters."""
+    try:
+        page = max(1, int(params.get('page', 1)))
+        page_size = int(params.get('page_size', DEFAULT_PAGE_SIZE))
+    except (TypeError, ValueError):
+        page, page_size = 1, DEFAULT_PAGE_SIZE
+    page_size = max(1, min(page_size, MAX_PAGE_SIZE))
+    return page, page_size, (page - 1) * page_size
+
+
+def task_rows(tasks, offset, limit):
+    """The list columns of one page of ``tasks``; fetches one extra row to detect a next page."""
+    return tasks.values(*TASK_LIST_FIELDS)[offset:offset + limit + 1]
+
+
+def task_detail_queryset(user):
+    return user_tasks(user, show_archived=True).select_related('project', 'owner', 'parent_task')
+
+
+def user_projects(user, show_archived=False, search=None):
+    """Projects the user owns or is a member of."""
+    member_of = Project.members.through.objects.filter(user=user).values('project_id')
+    projects = Project.objects.filter(Q(owner=user) | Q(pk__in=member_of))
+    if not show_archived:
+        projects = projects.filter(is_archived=False)
+    if search:
+        projects = projects.filter(Q(name__icontains=search) | Q(description__icontains=search))
+    return projects.order_by('-created_at')
+
+
+def project_rows(projects, offset, limit):
+    # Joins skip LiveManager, so tasks waiting to be purged are excluded here
+    live = Q(tasks__deletion_requested_at__isnull=True)
+    return (
+        projects
+        .annotate(
+            task_count=Count('tasks', filter=live, distinct=True),
+            completed_count=Count('tasks', filter=live & Q(tasks__status='completed'), distinct=True),
+        )
+        .values(
+            'id', 'name', 'description', 'status', 'color', 'icon', 'is_archived',
+            'start_date', 'end_date', 'created_at', 'owner_id', 'task_count', 'completed_count',
+        )[offset:offset + limit + 1]
+    )
@@ -1,9 +1,14 @@
-from django.db.models.signals import post_save, post_delete, m2m_changed, post_migrate
+from django.db.models.signals import pre_save, post_save, post_delete, pre_delete, m2m_changed, post_migrate
 from django.dispatch import receiver
-from .models import Task, TaskActivity, TaskReminder
+from django.db import transaction
+from .models import Task, TaskActivity, TaskReminder, CalendarFeed, Project, TaskTag, TaskComment, TaskSignature
+from . import changelog, dedupe, events, hierarchy, notifications, snapshots, workload
+from django.conf import settings
 from django.utils import timezone
 import logging
-from django.core.management import call_command
+import os
+import subprocess
+import sys
 
 logger = logging.getLogger(__name__)
 
@@ -148,16 +153,390 @@ def reminder_post_delete(sender, instance, **kwargs):
     except Exception as e:
         logger.error(f"Error in reminder_post_delete signal: {str(e)}")
 
+def _task_audience(task):
+    """IDs of the users whose view of ``task`` changes when it does."""
+    return {task.owner_id, *task.assignees.values_list('id', flat=True)}
+
+@receiver(post_save, sender=Task)
+@receiver(pre_delete, sender=Task)
+def task_bump_calendar_feeds(sender, instance, **kwargs):
+    """Invalidate calendar feeds that include this task."""
+    try:
+        CalendarFeed.bump(_task_audience(instance))
+    except Exception as e:
+        logger.error(f"Error in task_bump_calendar_feeds signal: {str(e)}")
+
+@receiver(m2m_changed, sender=Task.assignees.through)
+def task_assignees_bump_calendar_feeds(sender, instance, action, pk_set, **kwargs):
+    """Invalidate calendar feeds of users added to or removed from a task."""
+    try:
+        if action in ('post_add', 'post_remove') and pk_set:
+            CalendarFeed.bump(pk_set)
+        elif action == 'pre_clear':
+            CalendarFeed.bump(_task_audience(instance))
+    except Exception as e:
+        logger.error(f"Error in task_assignees_bump_calendar_feeds signal: {str(e)}")
+
+@receiver(post_save, sender=TaskReminder)
+@receiver(post_delete, sender=TaskReminder)
+def reminder_bump_calendar_feeds(sender, instance, **kwargs):
+    """Reminders are rendered as alarms, so they invalidate the feed too."""
+    try:
+        CalendarFeed.bump(_task_audience(instance.task))
+    except Exception as e:
+        logger.error(f"Error in reminder_bump_calendar_feeds signal: {str(e)}")
+
+@receiver(post_save, sender=Task)
+@receiver(post_delete, sender=Task)
+def task_invalidate_workload(sender, instance, **kwargs):
+    """Drop cached workload arrays that may include this task, in its old and new project."""
+    try:
+        # Runs before task_update_snapshot consumes the pre_save state
+        old = getattr(instance, '_snapshot_state', None)
+        workload.invalidate([instance.project_id, old[0] if old else None])
+    except Exception as e:
+        logger.error(f"Error in task_invalidate_workload signal: {str(e)}")
+
+@receiver(m2m_changed, sender=Task.assignees.through)
+def task_assignees_invalidate_workload(sender, instance, action, **kwargs):
+    """Assignee changes move hours between users."""
+    try:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            workload.invalidate([instance.project_id])
+    except Exception as e:
+        logger.error(f"Error in task_assignees_invalidate_workload signal: {str(e)}")
+
+@receiver(post_save, sender=Project)
+@receiver(post_delete, sender=Project)
+def project_invalidate_workload(sender, instance, **kwargs):
+    """Archiving or deleting a project changes who and what the team views cover."""
+    try:
+        workload.invalidate([instance.pk])
+    except Exception as e:
+        logger.error(f"Error in project_invalidate_workload signal: {str(e)}")
+
+@receiver(m2m_changed, sender=Project.members.through)
+def project_members_invalidate_workload(sender, instance, action, reverse, pk_set, **kwargs):
+    """Membership decides whose team a project's tasks show up in."""
+    try:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            workload.invalidate((pk_set or ()) if reverse else [instance.pk])
+    except Exception as e:
+        logger.error(f"Error in project_members_invalidate_workload signal: {str(e)}")
+
+@receiver(pre_save, sender=Task)
+def task_remember_snapshot_state(sender, instance, **kwargs):
+    """
+    Remember the stored state of the task so post_save can apply only the
+    difference to today's project snapshot and to the ancestors' rollups.
+    Nested saves (e.g. the completed_at fix-up above) keep the outermost state.
+    """
+    if hasattr(instance, '_snapshot_state'):
+        return
+    stored = None
+    try:
+        if not instance._state.adding:
+            stored = (
+                Task.objects.filter(pk=instance.pk)
+                .values_list('project_id', 'status', 'estimated_hours', 'actual_hours', 'parent_task_id')
+                .first()
+            )
+        instance._snapshot_state = stored[:3] if stored else None
+        instance._hierarchy_state = (stored[4], *stored[1:4]) if stored else None
+    except Exception as e:
+        logger.error(f"Error in task_remember_snapshot_state signal: {str(e)}")
+    # Outside the try: a parent that would create a cycle must abort the save
+    if instance.parent_task_id and (stored is None or stored[4] != instance.parent_task_id):
+        hierarchy.check_parent(instance.pk, instance.parent_task_id)
+
+@receiver(post_save, sender=Task)
+def task_update_snapshot(sender, instance, **kwargs):
+    """Apply the task's change to today's project snapshot."""
+    try:
+        if hasattr(instance, '_snapshot_state'):
+            old = instance.__dict__.pop('_snapshot_state')
+            snapshots.apply_deltas(snapshots.state_delta(old, snapshots.task_state(instance)))
+    except Exception as e:
+        logger.error(f"Error in task_update_snapshot signal: {str(e)}")
+
+@receiver(post_delete, sender=Task)
+def task_delete_snapshot(sender, instance, **kwargs):
+    """Remove a deleted task from today's project snapshot."""
+    try:
+        # Deferred so that tasks removed by a project's cascade delete don't
+        # seed a snapshot row for the project being deleted
+        deltas = snapshots.state_delta(snapshots.task_state(instance), None)
+        transaction.on_commit(lambda: snapshots.apply_deltas(deltas))
+    except Exception as e:
+        logger.error(f"Error in task_delete_snapshot signal: {str(e)}")
+
+@receiver(post_save, sender=Task)
+def task_update_hierarchy(sender, instance, created, **kwargs):
+    """Keep the closure table and the ancestors' rollups in step with the task."""
+    try:
+        if created:
+            instance.__dict__.pop('_hierarchy_state', None)
+            hierarchy.task_created(instance)
+        elif getattr(instance, '_hierarchy_state', None) is not None:
+            hierarchy.task_changed(instance, instance.__dict__.pop('_hierarchy_state'))
+    except Exception as e:
+        logger.error(f"Error in task_update_hierarchy signal: {str(e)}")
+
+@receiver(pre_delete, sender=Task)
+def task_detach_from_hierarchy(sender, instance, **kwargs):
+    """Subtract the task's subtree from its ancestors while the links still exist."""
+    try:
+        hierarchy.task_deleting(instance)
+    except Exception as e:
+        logger.error(f"Error in task_detach_from_hierarchy signal: {str(e)}")
+
+@receiver(post_save, sender=Task)
+def task_index_signature(sender, instance, created, **kwargs):
+    """
+    Index new tasks for duplicate detection and flag likely duplicates.
+    Updates are re-indexed only when the title or description changed the
+    signature; tasks never indexed are left to ``find_duplicate_tasks``.
+    """
+    try:
+        if not created:
+            stored = TaskSignature.objects.filter(task=instance).values_list('signature', flat=True).first()
+            if stored is None or dedupe.unpack(stored) == dedupe.task_signature(instance):
+                return
+        dedupe.index_tasks([instance])
+    except Exception as e:
+        logger.error(f"Error in task_index_signature signal: {str(e)}")
+
+def _publish_on_commit(user_ids, event_type, data):
+    """Publish a live event once the change is visible to other connections."""
+    transaction.on_commit(lambda: events.broker.publish(user_ids, event_type, data))
+
+@receiver(post_save, sender=Task)
+def task_publish_event(sender, instance, created, **kwargs):
+    """Push the saved task to the streams of everyone who can see it."""
+    try:
+        _publish_on_commit(
+            _task_audience(instance),
+            'task.created' if created else 'task.updated',
+            events.task_payload(instance),
+        )
+    except Exception as e:
+        logger.error(f"Error in task_publish_event signal: {str(e)}")
+
+@receiver(pre_delete, sender=Task)
+def task_publish_delete_event(sender, instance, **kwargs):
+    """The audience has to be read before the assignee rows are deleted."""
+    try:
+        _publish_on_commit(_task_audience(instance), 'task.deleted', {'id': str(instance.id)})
+    except Exception as e:
+        logger.error(f"Error in task_publish_delete_event signal: {str(e)}")
+
+@receiver(m2m_changed, sender=Task.assignees.through)
+def task_assignees_publish_event(sender, instance, action, pk_set, **kwargs):
+    """New assignees receive the task; removed ones are told to drop it."""
+    try:
+        if action == 'post_add' and pk_set:
+            _publish_on_commit(_task_audience(instance), 'task.updated', events.task_payload(instance))
+        elif action == 'post_remove' and pk_set:
+            _publish_on_commit(pk_set - {instance.owner_id}, 'task.removed', {'id': str(instance.id)})
+        elif action == 'pre_clear':
+            removed = set(instance.assignees.values_list('id', flat=True)) - {instance.owner_id}
+            _publish_on_commit(removed, 'task.removed', {'id': str(instance.id)})
+    except Exception as e:
+        logger.error(f"Error in task_assignees_publish_event signal: {str(e)}")
+
+@receiver(post_save, sender=Task)
+def task_record_change(sender, instance, **kwargs):
+    """Log the task for delta sync of everyone who can see it."""
+    try:
+        changelog.record(_task_audience(instance), 'task', [instance.id])
+    except Exception as e:
+        logger.error(f"Error in task_record_change signal: {str(e)}")
+
+@receiver(pre_delete, sender=Task)
+def task_remember_sync_audience(sender, instance, **kwargs):
+    """Assignee rows are gone by post_delete, so read the audience now."""
+    try:
+        instance._sync_audience = _task_audience(instance)
+    except Exception as e:
+        logger.error(f"Error in task_remember_sync_audience signal: {str(e)}")
+
+@receiver(post_delete, sender=Task)
+def task_record_tombstone(sender, instance, **kwargs):
+    """Leave a tombstone so synced clients drop the task."""
+    try:
+        audience = getattr(instance, '_sync_audience', {instance.owner_id})
+        changelog.record(audience, 'task', [instance.id], 'delete')
+    except Exception as e:
+        logger.error(f"Error in task_record_tombstone signal: {str(e)}")
+
+@receiver(m2m_changed, sender=Task.assignees.through)
+def task_assignees_record_change(sender, instance, action, pk_set, **kwargs):
+    """
+    Users who gain the task receive it with its comments; users who lose it
+    get tombstones for both. Everyone else sees the new assignee list.
+    """
+    try:
+        if action == 'pre_clear':
+            instance._sync_cleared = set(instance.assignees.values_list('id', flat=True))
+            return
+        if action == 'post_clear':
+            pk_set = getattr(instance, '_sync_cleared', set())
+        elif action not in ('post_add', 'post_remove') or not pk_set:
+            return
+        comment_ids = list(instance.comments.values_list('id', flat=True))
+        if action == 'post_add':
+            changelog.record(pk_set, 'comment', comment_ids)
+        else:
+            lost = set(pk_set) - {instance.owner_id}
+            changelog.record(lost, 'task', [instance.id], 'delete')
+            changelog.record(lost, 'comment', comment_ids, 'delete')
+        changelog.record(_task_audience(instance), 'task', [instance.id])
+    except Exception as e:
+        logger.error(f"Error in task_assignees_record_change signal: {str(e)}")
+
+@receiver(m2m_changed, sender=Task.tags.through)
+def task_tags_record_change(sender, instance, action, **kwargs):
+    """Tag lists are part of the synced task."""
+    try:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            changelog.record(_task_audience(instance), 'task', [instance.id])
+    except Exception as e:
+        logger.error(f"Error in task_tags_record_change signal: {str(e)}")
+
+@receiver(post_save, sender=Project)
+def project_record_change(sender, instance, **kwargs):
+    try:
+        changelog.record(changelog.project_audience(instance), 'project', [instance.id])
+    except Exception as e:
+        logger.error(f"Error in project_record_change signal: {str(e)}")
+
+@receiver(pre_delete, sender=Project)
+def project_remember_sync_audience(sender, instance, **kwargs):
+    try:
+        instance._sync_audience = changelog.project_audience(instance)
+    except Exception as e:
+        logger.error(f"Error in project_remember_sync_audience signal: {str(e)}")
+
+@receiver(post_delete, sender=Project)
+def project_record_tombstone(sender, instance, **kwargs):
+    try:
+        audience = getattr(instance, '_sync_audience', {instance.owner_id})
+        changelog.record(audience, 'project', [instance.id], 'delete')
+    except Exception as e:
+        logger.error(f"Error in project_record_tombstone signal: {str(e)}")
+
+@receiver(m2m_changed, sender=Project.members.through)
+def project_members_record_change(sender, instance, action, pk_set, **kwargs):
+    """New members receive the project; removed members get a tombstone."""
+    try:
+        if action == 'pre_clear':
+            instance._sync_cleared = set(instance.members.values_list('id', flat=True))
+        elif action in ('post_remove', 'post_clear'):
+            removed = pk_set if action == 'post_remove' else getattr(instance, '_sync_cleared', set())
+            changelog.record(set(removed or ()) - {instance.owner_id}, 'project', [instance.id], 'delete')
+        elif action == 'post_add':
+            changelog.record(changelog.project_audience(instance), 'project', [instance.id])
+    except Exception as e:
+        logger.error(f"Error in project_members_record_change signal: {str(e)}")
+
+@receiver(post_save, sender=TaskTag)
+@receiver(post_delete, sender=TaskTag)
+def tag_record_change(sender, instance, **kwargs):
+    """Tags are private to their creator."""
+    try:
+        operation = 'upsert' if kwargs.get('created') is not None else 'delete'
+        changelog.record({instance.created_by_id}, 'tag', [instance.id], operation)
+    except Exception as e:
+        logger.error(f"Error in tag_record_change signal: {str(e)}")
+
+@receiver(post_save, sender=TaskComment)
+def comment_record_change(sender, instance, **kwargs):
+    try:
+        changelog.record(_task_audience(instance.task), 'comment', [instance.id])
+    except Exception as e:
+        logger.error(f"Error in comment_record_change signal: {str(e)}")
+
+@receiver(pre_delete, sender=TaskComment)
+def comment_remember_sync_audience(sender, instance, **kwargs):
+    try:
+        instance._sync_audience = _task_audience(instance.task)
+    except Exception as e:
+        logger.error(f"Error in comment_remember_sync_audience signal: {str(e)}")
+
+@receiver(post_delete, sender=TaskComment)
+def comment_record_tombstone(sender, instance, **kwargs):
+    try:
+        changelog.record(getattr(instance, '_sync_audience', ()), 'comment', [instance.id], 'delete')
+    except Exception as e:
+        logger.error(f"Error in comment_record_tombstone signal: {str(e)}")
+
+@receiver(m2m_changed, sender=Task.assignees.through)
+def task_assignees_notify(sender, instance, action, pk_set, **kwargs):
+    """Tell new assignees about the task."""
+    try:
+        if action == 'post_add' and pk_set:
+            notifications.notify(
+                pk_set, 'assigned', f'You were assigned to "{instance.title}"',
+                actor=instance.owner_id, task=instance, project=instance.project_id,
+            )
+    except Exception as e:
+        logger.error(f"Error in task_assignees_notify signal: {str(e)}")
+
+@receiver(post_save, sender=Task)
+def task_notify_project_members(sender, instance, created, **kwargs):
+    """Tell the members of the task's project that it was added."""
+    try:
+        if created and instance.project_id:
+            notifications.notify(
+                changelog.project_audience(instance.project), 'project_task',
+                f'New task "{instance.title}" in {instance.project.name}',
+                actor=instance.owner_id, task=instance, project=instance.project_id,
+            )
+    except Exception as e:
+        logger.error(f"Error in task_notify_project_members signal: {str(e)}")
+
+@receiver(post_save, sender=TaskComment)
+def comment_notify(sender, instance, created, **kwargs):
+    """Mentioned users get a mention; everyone else on the task gets a comment notification."""
+    try:
+        if not created:
+            return
+        task = instance.task
+        audience = _task_audience(task)
+        # Only people who can already see the task can be mentioned on it
+        visible_to = audience | (changelog.project_audience(task.project) if task.project_id else set())
+        mentioned = notifications.mentioned_user_ids(instance.content) & visible_to
+        notifications.notify(
+            mentioned, 'mention', f'{instance.user.username} mentioned you on "{task.title}"',
+            actor=instance.user_id, task=task, project=task.project_id,
+        )
+        notifications.notify(
+            audience - mentioned, 'comment', f'{instance.user.username} commented on "{task.title}"',
+            actor=instance.user_id, task=task, project=task.project_id,
+        )
+    except Exception as e:
+        logger.error(f"Error in comment_notify signal: {str(e)}")
+
 @receiver(post_migrate)
-def sync_users_after_migrate(sender, **kwargs):
+def sync_users_after_migrate(sender, plan=None, **kwargs):
     """
-    Run the sync_supabase_users management command after migrations
-    to ensure users are up to date in Django admin.
+    Start sync_supabase_users in a separate process after migrations that
+    changed something, so `migrate` itself never waits on Supabase.
+    Controlled by SYNC_USERS_AFTER_MIGRATE ('background' or 'off').
     """
-    if sender.name == 'tasks':
-        logger.info("Running post-migration user sync...")
-        try:
-            call_command('sync_supabase_users')
-            logger.info("User sync completed successfully after migration")
-        except Exception as e:
-            logger.error(f"Error during post-migration user sync: {str(e)}") 
\ No newline at end of file
+    if sender.name != 'tasks' or not plan:
+        return
+    if getattr(settings, 'SYNC_USERS_AFTER_MIGRATE', 'background') != 'background' or getattr(settings, 'BYPASS_SUPABASE', False):
+        return
+    try:
+        log_path = os.path.join(settings.BASE_DIR, 'logs', 'sync_supabase_users.log')
+        os.makedirs(os.path.dirname(log_path), exist_ok=True)
+        with open(log_path, 'a') as log_file:
+            subprocess.Popen(
+                [sys.executable, os.path.join(settings.BASE_DIR, 'manage.py'), 'sync_supabase_users'],
+                stdin=subprocess.DEVNULL, stdout=log_file, stderr=subprocess.STDOUT,
+                cwd=settings.BASE_DIR, start_new_session=True,
+            )
+        logger.info(f"Started post-migration user sync in the background (output in {log_path})")
+    except Exception as e:
+        logger.error(f"Error starting post-migration user sync: {str(e)}")
@@ -0,0 +1,226 @@
+"""
+Daily per-project burndown and velocity snapshots.
+
+Every task contributes to exactly one status counter of its project and,
+depending on its status, to either the remaining or the completed hours.
+When a task is created, changes status, estimate or project, or is deleted,
+the difference between its old and new contribution is applied to today's
+``ProjectDailySnapshot`` row with ``F()`` updates, so keeping the series
+current never requires rescanning the project's tasks.
+
+Today's row is seeded by carrying the latest earlier row forward. Only a
+project that has no snapshot at all is counted from scratch, once. The
+``snapshot_projects`` command rolls rows forward nightly and can recount
+everything to correct drift from writes that bypass model signals.
+"""
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, F, Sum, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+
+from .models import Project, ProjectDailySnapshot, Task
+
+STATUS_FIELDS = {
+    'todo': 'todo_count',
+    'in_progress': 'in_progress_count',
+    'completed': 'completed_count',
+    'archived': 'archived_count',
+}
+OPEN_STATUSES = ('todo', 'in_progress')
+COUNTER_FIELDS = (*STATUS_FIELDS.values(), 'remaining_hours', 'completed_hours')
+MAX_SERIES_DAYS = 366
+
+
+def task_state(task):
+    """The part of ``task`` that snapshots depend on."""
+    return task.project_id, task.status, task.estimated_hours
+
+
+def _contribution(status, estimated_hours, count=1):
+    hours = Decimal(str(estimated_hours or 0))
+    values = {}
+    if status in STATUS_FIELDS:
+        values[STATUS_FIELDS[status]] = count
+    if status in OPEN_STATUSES:
+        values['remaining_hours'] = hours
+    elif status == 'completed':
+        values['completed_hours'] = hours
+    return values
+
+
+def state_delta(old, new, deltas=None):
+    """
+    Accumulate the change from state ``old`` to ``new`` (either may be
+    ``None``) into ``deltas``, a ``{project_id: {field: delta}}`` mapping.
+    """
+    deltas = deltas if deltas is not None else defaultdict(lambda: defaultdict(int))
+    if old == new:
+        return deltas
+    if old and old[0]:
+        for field, value in _contribution(old[1], old[2]).items():
+            deltas[old[0]][field] -= value
+    if new and new[0]:
+        for field, value in _contribution(new[1], new[2]).items():
+            deltas[new[0]][field] += value
+    return deltas
+
+
+def count_projects(project_ids=None):
+    """Count the current totals of ``project_ids`` (all projects if ``None``) from their tasks."""
+    tasks = Task.objects.filter(project__isnull=False)
+    if project_ids is not None:
+        tasks = tasks.filter(project_id__in=project_ids)
+    totals = defaultdict(lambda: dict.fromkeys(COUNTER_FIELDS, 0))
+    rows = (
+        tasks.values('project_id', 'status')
+        .annotate(n=Count('id'), hours=Sum('estimated_hours'))
+        .order_by()
+    )
+    for row in rows:
+        counters = totals[row['project_id']]
+        for field, value in _contribution(row['status'], row['hours'], row['n']).items():
+            counters[field] += value
+    return totals
+
+
+def _latest_rows(project_ids, before):
+    """The most recent snapshot before ``before`` for each of ``project_ids``."""
+    rows = (
+        ProjectDailySnapshot.objects
+        .filter(project_id__in=project_ids, date__lt=before)
+        .annotate(rank=Window(RowNumber(), partition_by=[F('project_id')], order_by=F('date').desc()))
+        .filter(rank=1)
+        .values('project_id', *COUNTER_FIELDS)
+    )
+    return {row.pop('project_id'): row for row in rows}
+
+
+def ensure_rows(project_ids, date=None):
+    """
+    Make sure every project in ``project_ids`` has a row for ``date``
+    (today by default), carrying the latest earlier row forward where one
+    exists and counting the project's tasks where none does.
+
+    Returns ``(created, counted)``: the number of rows created and the IDs
+    of the projects whose new row was counted from their current tasks.
+    """
+    date = date or timezone.localdate()
+    existing = set(
+        ProjectDailySnapshot.objects.filter(project_id__in=project_ids, date=date)
+        .values_list('project_id', flat=True)
+    )
+    missing = set(project_ids) - existing
+    if missing:
+        missing = set(Project.objects.filter(id__in=missing).values_list('id', flat=True))
+    if not missing:
+        return 0, set()
+    seeds = _latest_rows(missing, date)
+    counted = missing - seeds.keys()
+    if counted:
+        seeds.update(count_projects(counted))
+    rows = [
+        ProjectDailySnapshot(project_id=project_id, date=date, **seeds.get(project_id, {}))
+        for project_id in missing
+    ]
+    # A concurrent request may have seeded the same day; its row is as good as ours
+    ProjectDailySnapshot.objects.bulk_create(rows, ignore_conflicts=True)
+    return len(rows), counted
+
+
+def apply_deltas(deltas, date=None):
+    """
+    Apply ``{project_id: {field: delta}}`` to the snapshots for ``date``
+    (today by default). Must be called after the change is written, since a
+    project without any snapshot yet is counted as it stands instead.
+    """
+    deltas = {
+        project_id: {field: value for field, value in fields.items() if value}
+        for project_id, fields in (deltas or {}).items()
+    }
+    deltas = {project_id: fields for project_id, fields in deltas.items() if fields}
+    if not deltas:
+        return
+    date = date or timezone.localdate()
+    with transaction.atomic():
+        _, counted = ensure_rows(list(deltas), date)
+        for project_id, fields in deltas.items():
+            if project_id in counted:
+                continue
+            ProjectDailySnapshot.objects.filter(project_id=project_id, date=date).update(
+                **{field: F(field) + value for field, value in fields.items()},
+                updated_at=timezone.now(),
+            )
+
+
+def roll_forward(date=None, recount=False):
+    """
+    Create ``date``'s row (today by default) for every active project.
+
+    With ``recount`` the rows are recomputed from the tasks instead of
+    carried forward, overwriting any existing row for that day.
+    Returns the number of rows written.
+    """
+    date = date or timezone.localdate()
+    project_ids = list(Project.objects.filter(is_archived=False).values_list('id', flat=True))
+    if not recount:
+        return ensure_rows(project_ids, date)[0]
+
+    totals = count_projects(project_ids)
+    empty = dict.fromkeys(COUNTER_FIELDS, 0)
+    rows = [
+        ProjectDailySnapshot(project_id=project_id, date=date, **totals.get(project_id, empty))
+        for project_id in project_ids
+    ]
+    with transaction.atomic():
+        ProjectDailySnapshot.objects.bulk_create(
+            rows,
+            update_conflicts=True,
+            unique_fields=['project', 'date'],
+            update_fields=list(COUNTER_FIELDS),
+        )
+    return len(rows)
+
+
+def series(project, days=30, end=None):
+    """
+    Daily snapshot series for ``project`` over the ``days`` days ending at
+    ``end`` (today by default). Days without a row repeat the previous day,
+    and ``velocity_hours`` is the change in completed hours since then.
+    """
+    end = end or timezone.localdate()
+    days = max(1, min(int(days), MAX_SERIES_DAYS))
+    start = end - timedelta(days=days - 1)
+    if end == timezone.localdate():
+        ensure_rows([project.id], end)
+
+    rows = {
+        row['date']: row
+        for row in ProjectDailySnapshot.objects
+        .filter(project=project, date__gte=start, date__lte=end)
+        .values('date', *COUNTER_FIELDS)
+    }
+    previous = _latest_rows([project.id], start).get(project.id)
+
+    points = []
+    for offset in range(days):
+        day = start + timedelta(days=offset)
+        row = rows.get(day) or previous
+        if row is None:
+            continue
+        prior_completed = previous['completed_hours'] if previous else row['completed_hours']
+        points.append({
+            'date': day.isoformat(),
+            'todo': row['todo_count'],
+            'in_progress': row['in_progress_count'],
+            'completed': row['completed_count'],
+            'archived': row['archived_count'],
+            'remaining_hours': float(row['remaining_hours']),
+            'completed_hours': float(row['completed_hours']),
+            'velocity_hours': float(row['completed_hours'] - prior_completed),
+        })
+        previous = row
+    return points
@@ -1,3 +1,648 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core import mail
+from django.core.management import CommandError, call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from auth_app import supabase_admin
+from auth_app.models import User
+from . import changelog, dedupe, deletion, digest, events, hierarchy, ical, notifications, queries, snapshots, workload
+from .importers import _iter_json_array, import_tasks
+from .models import (
+    Task, TaskActivity, TaskVersion, TaskTag, TaskComment, Project, CalendarFeed, ProjectDailySnapshot,
+    TaskRollup, TaskSignature, TaskAttachment, Notification, DigestDelivery,
+)
+
+
+class TaskImportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', email='owner@example.com', password='pw')
+        self.assignee = User.objects.create_user(username='alice', email='alice@example.com', password='pw')
+
+    def test_csv_import_creates_tasks_links_versions_and_activities(self):
+        data = (
+            "title,priority,status,project,tags,assignees,due_date,estimated_hours\n"
+            "Write spec,high,todo,Onboarding,docs;urgent,alice,2030-01-15,3.5\n"
+            "Review spec,low,in_progress,Onboarding,docs,alice@example.com,,\n"
+            ",low,todo,,,,,\n"
+        )
+        result = import_tasks(io.StringIO(data), 'csv', self.user, batch_size=2)
+
+        self.assertEqual(result.created, 2)
+        self.assertEqual(result.skipped, 1)
+        self.assertEqual(result.projects_created, 1)
+        self.assertEqual(result.tags_created, 2)
+
+        project = Project.objects.get(name='Onboarding', owner=self.user)
+        task = Task.objects.get(title='Write spec')
+        self.assertEqual(task.project, project)
+        self.assertEqual(set(task.tags.values_list('name', flat=True)), {'docs', 'urgent'})
+        self.assertEqual(list(task.assignees.all()), [self.assignee])
+        self.assertEqual(TaskTag.objects.filter(created_by=self.user).count(), 2)
+        self.assertEqual(TaskVersion.objects.filter(version_number=1).count(), 2)
+        self.assertEqual(TaskActivity.objects.filter(activity_type='create').count(), 2)
+        self.assertEqual(Task.objects.get(title='Review spec').assignees.get(), self.assignee)
+
+    def test_json_array_is_streamed_across_chunks(self):
+        records = [{'title': f'Task {i}', 'description': 'x' * 50} for i in range(20)]
+        stream = io.StringIO(json.dumps(records))
+        parsed = list(_iter_json_array(stream, chunk_size=7))
+        self.assertEqual(parsed, records)
+
+    def test_json_array_requires_separators(self):
+        for data in ('[{"a": 1} {"b": 2}]', '[{"a": 1},]', '[, {"a": 1}]', '[{"a": 1},, {"b": 2}]'):
+            with self.assertRaises(ValueError, msg=data):
+                list(_iter_json_array(io.StringIO(data), chunk_size=4))
+        self.assertEqual(list(_iter_json_array(io.StringIO('[ ]'))), [])
+
+    def test_dropped_references_are_reported(self):
+        Project.objects.create(name='Known', owner=self.user)
+        records = [
+            {'title': 'Kept', 'project': 'Known', 'tags': 'missing', 'assignees': 'alice,nobody'},
+            {'title': 'Skipped', 'project': 'Unknown'},
+        ]
+        result = import_tasks(io.StringIO(json.dumps(records)), 'json', self.user, create_missing=False)
+        self.assertEqual((result.created, result.skipped), (1, 1))
+        self.assertEqual(result.errors, [
+            {'row': 1, 'error': 'Unknown assignee(s) dropped: nobody'},
+            {'row': 1, 'error': 'Unknown tag(s) dropped: missing'},
+            {'row': 2, 'error': "Unknown project 'Unknown'"},
+        ])
+        self.assertFalse(Task.objects.get(title='Kept').tags.exists())
+
+    def test_ndjson_import(self):
+        lines = '\n'.join(json.dumps({'title': f'Item {i}', 'status': 'completed'}) for i in range(5))
+        result = import_tasks(io.BytesIO(lines.encode()), 'ndjson', self.user)
+        self.assertEqual(result.created, 5)
+        self.assertFalse(Task.objects.filter(completed_at__isnull=True).exists())
+
+    def test_upload_rejects_malformed_project_id(self):
+        self.client.force_login(self.user)
+        upload = SimpleUploadedFile('tasks.csv', b'title\nOne\n', content_type='text/csv')
+        response = self.client.post(reverse('tasks:task_import'), {'file': upload, 'project': 'not-a-uuid'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get(reverse('tasks:task_create'), {'project': 'not-a-uuid'}).status_code, 200)
+
+
+class CalendarFeedTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', email='owner@example.com', password='pw')
+        self.feed = CalendarFeed.objects.create(user=self.user)
+        self.cache_dir = tempfile.mkdtemp()
+        self._original_cache_dir = ical.CACHE_DIR
+        ical.CACHE_DIR = self.cache_dir
+        Task.objects.create(
+            title='Ship release, v2; final', owner=self.user,
+            due_date=timezone.now() + timedelta(days=1),
+        )
+        Task.objects.create(title='No due date', owner=self.user)
+
+    def tearDown(self):
+        ical.CACHE_DIR = self._original_cache_dir
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def test_feed_is_encoded_and_revalidated_by_etag(self):
+        url = reverse('tasks:calendar_feed', args=[self.feed.token])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        body = b''.join(response.streaming_content).decode()
+        self.assertEqual(body.count('BEGIN:VEVENT'), 1)
+        self.assertIn('SUMMARY:Ship release\\, v2\\; final', body)
+
+        self.feed.refresh_from_db()
+        etag = response['ETag']
+        self.assertEqual(etag, self.feed.etag)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        Task.objects.create(title='Another', owner=self.user, due_date=timezone.now())
+        self.feed.refresh_from_db()
+        self.assertNotEqual(self.feed.etag, etag)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_long_lines_are_folded(self):
+        folded = ical.fold_line('DESCRIPTION:' + 'é' * 100)
+        for line in folded.split('\r\n')[:-1]:
+            self.assertLessEqual(len(line.encode('utf-8')), 75)
+
+
+class TaskCalendarTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', email='owner@example.com', password='pw')
+        self.client.force_login(self.user)
+        base = timezone.make_aware(timezone.datetime(2030, 3, 10, 9, 0))
+        for i, priority in enumerate(['low', 'urgent', 'medium', 'high']):
+            Task.objects.create(title=f'Day one {i}', owner=self.user, priority=priority, due_date=base)
+        Task.objects.create(title='Day two', owner=self.user, due_date=base + timedelta(days=1))
+        Task.objects.create(title='Outside', owner=self.user, due_date=base + timedelta(days=7))
+
+    def test_buckets_count_and_rank_tasks_per_day(self):
+        response = self.client.get(
+            reverse('tasks:task_calendar'), {'start': '2030-03-10', 'end': '2030-03-13', 'top': 2}
+        )
+        self.assertEqual(response.status_code, 200)
+        days = response.json()['days']
+        self.assertEqual([d['count'] for d in days], [4, 1, 0])
+        self.assertEqual([t['priority'] for t in days[0]['tasks']], ['urgent', 'high'])
+        self.assertEqual(days[1]['tasks'][0]['title'], 'Day two')
+
+    def test_rejects_oversized_window(self):
+        response = self.client.get(reverse('tasks:task_calendar'), {'start': '2030-01-01', 'end': '2031-01-01'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_rejects_impossible_dates_and_bad_project_ids(self):
+        url = reverse('tasks:task_calendar')
+        self.assertEqual(self.client.get(url, {'start': '2030-02-30', 'end': '2030-03-05'}).status_code, 400)
+        response = self.client.get(url, {'start': '2030-03-01', 'end': '2030-03-05', 'project': 'nope'})
+        self.assertEqual(response.status_code, 400)
+
+
+class WorkloadTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(username='owner', email='owner@example.com', password='pw')
+        self.member = User.objects.create_user(username='bob', email='bob@example.com', password='pw')
+        self.project = Project.objects.create(name='Launch', owner=self.owner)
+        self.project.members.add(self.member)
+        self.client.force_login(self.owner)
+
+    def test_estimate_is_split_between_assignees_and_spread_to_due_date(self):
+        today = timezone.localdate()
+        due = timezone.make_aware(timezone.datetime.combine(today + timedelta(days=3), timezone.datetime.min.time()))
+        task = Task.objects.create(
+            title='Build', owner=self.owner, project=self.project,
+            estimated_hours=16, due_date=due,
+        )
+        task.assignees.add(self.owner, self.member)
+
+        response = self.client.get(reverse('tasks:task_workload'), {'project': self.project.id, 'days': 7})
+        self.assertEqual(response.status_code, 200)
+        users = {u['id']: u for u in response.json()['users']}
+        self.assertEqual(users[self.member.id]['hours'], [2.0, 2.0, 2.0, 2.0, 0.0, 0.0, 0.0])
+        self.assertEqual(users[self.owner.id]['total_hours'], 8.0)
+
+        task.assignees.remove(self.member)
+        users = {u['id']: u for u in workload.workload_heatmap(
+            Task.objects.filter(project=self.project), ('project', str(self.project.id)),
+            self.project.id, users={self.owner.id: 'owner', self.member.id: 'bob'}, horizon=7,
+        )['users']}
+        self.assertEqual(users[self.owner.id]['total_hours'], 16.0)
+        self.assertEqual(users[self.member.id]['total_hours'], 0.0)
+
+    def test_moving_a_task_invalidates_its_old_project(self):
+        other = Project.objects.create(name='Other', owner=self.owner)
+        task = Task.objects.create(title='Build', owner=self.owner, project=self.project)
+        before = workload.current_version(self.project.id)
+        task.project = other
+        task.save()
+        self.assertGreater(workload.current_version(self.project.id), before)
+        self.assertGreater(workload.current_version(other.id), 0)
+
+        team = workload.current_version()
+        self.project.members.remove(self.member)
+        self.assertGreater(workload.current_version(), team)
+
+    def test_impossible_dates_and_project_ids_are_rejected(self):
+        url = reverse('tasks:task_workload')
+        self.assertEqual(self.client.get(url, {'start': '2030-02-30'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'project': 'not-a-uuid'}).status_code, 400)
+
+
+class ProjectSnapshotTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', email='owner@example.com', password='pw')
+        self.project = Project.objects.create(name='Launch', owner=self.user)
+        self.client.force_login(self.user)
+
+    def test_status_changes_update_todays_snapshot_incrementally(self):
+        first = Task.objects.create(title='A', owner=self.user, project=self.project, estimated_hours=5)
+        second = Task.objects.create(title='B', owner=self.user, project=self.project, estimated_hours=3)
+        first.mark_completed()
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+
+        snapshot = ProjectDailySnapshot.objects.get(project=self.project, date=timezone.localdate())
+        self.assertEqual((snapshot.todo_count, snapshot.completed_count), (0, 1))
+        self.assertEqual((snapshot.remaining_hours, snapshot.completed_hours), (0, 5))
+
+        recounted = snapshots.count_projects([self.project.id])[self.project.id]
+        self.assertEqual(recounted['completed_count'], snapshot.completed_count)
+        self.assertEqual(recounted['completed_hours'], snapshot.completed_hours)
+
+    def test_burndown_series_carries_days_forward(self):
+        today = timezone.localdate()
+        ProjectDailySnapshot.objects.create(
+            project=self.project, date=today - timedelta(days=3), todo_count=4, remaining_hours=10,
+        )
+        Task.objects.create(title='A', owner=self.user, project=self.project, status='completed', estimated_hours=2)
+
+        response = self.client.get(reverse('tasks:project_burndown', args=[self.project.id]), {'days': 4})
+        series = response.json()['series']
+        self.assertEqual([p['todo'] for p in series], [4, 4, 4, 4])
+        self.assertEqual([p['velocity_hours'] for p in series], [0.0, 0.0, 0.0, 2.0])
+
+    def test_project_detail_counts_are_exact_when_snapshots_drift(self):
+        Task.objects.create(title='A', owner=self.user, project=self.project)
+        Task.objects.create(title='B', owner=self.user, project=self.project)
+        # QuerySet.update bypasses the signals that maintain the snapshot
+        Task.objects.filter(title='A').update(status='completed')
+        response = self.client.get(reverse('tasks:project_detail', args=[self.project.id]))
+        self.assertEqual((response.context['total_tasks'], response.context['completion_rate']), (2, 50))
+        self.assertEqual(self.client.get(reverse('tasks:project_burndown', args=[self.project.id]), {'end': '2030-02-30'}).status_code, 400)
+
+
+class TaskEventTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(username='owner', email='owner@example.com', password='pw')
+        self.assignee = User.objects.create_user(username='alice', email='alice@example.com', password='pw')
+
+    def test_committed_changes_are_published_to_the_task_audience(self):
+        start = events.broker.current_id()
+        with self.captureOnCommitCallbacks(execute=True):
+            task = Task.objects.create(title='Shared', owner=self.owner)
+        with self.captureOnCommitCallbacks(execute=True):
+            task.assignees.add(self.assignee)
+
+        owner_events = events.broker.replay(self.owner.id, start)
+        self.assertEqual([e[1] for e in owner_events], ['task.created', 'task.updated'])
+        self.assertEqual(
+            [e[1] for e in events.broker.replay(self.assignee.id, start)], ['task.updated', 'notification.created']
+        )
+        self.assertIsNone(events.broker.replay(self.owner.id, 'stale-1'))
+
+    def test_stream_replays_missed_events_then_delivers_live_ones(self):
+        async def consume():
+            last_id = events.broker.current_id()
+            events.broker.publish([self.owner.id], 'task.updated', {'id': 'missed'})
+            stream = events.stream(self.owner.id, last_id)
+            frames = [await stream.__anext__(), await stream.__anext__()]
+            events.broker.publish([self.owner.id], 'task.deleted', {'id': 'live'})
+            frames.append(await stream.__anext__())
+            await stream.aclose()
+            return frames
+
+        frames = asyncio.run(consume())
+        self.assertTrue(frames[0].startswith('retry:'))
+        self.assertIn('"missed"', frames[1])
+        self.assertIn('event: task.deleted', frames[2])
+        self.assertEqual(events.broker.connection_count(), 0)
+
+
+class AsyncReadEndpointTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', email='owner@example.com', password='pw')
+        self.other = User.objects.create_user(username='bob', email='bob@example.com', password='pw')
+        self.client.force_login(self.user)
+        for i in range(3):
+            Task.objects.create(title=f'Mine {i}', owner=self.user, status='completed' if i == 0 else 'todo')
+        shared = Task.objects.create(title='Shared', owner=self.other, status='in_progress')
+        shared.assignees.add(self.user)
+        Task.objects.create(title='Not mine', owner=self.other)
+
+    def test_stats_and_paginated_task_list(self):
+        stats = self.client.get(reverse('tasks:task_stats')).json()
+        self.assertEqual(stats['total_tasks'], 4)
+        self.assertEqual((stats['completed_tasks'], stats['in_progress_tasks']), (1, 1))
+
+        data = self.client.get(reverse('tasks:task_list_data'), {'page_size': 3, 'sort_by': 'title'}).json()
+        self.assertEqual([t['title'] for t in data['tasks']], ['Mine 0', 'Mine 1', 'Mine 2'])
+        self.assertTrue(data['has_next'])
+        self.assertEqual(data['counts']['todo'], 2)
+
+    def test_detail_is_limited_to_visible_tasks(self):
+        hidden = Task.objects.get(title='Not mine')
+        response = self.client.get(reverse('tasks:task_detail_data', args=[hidden.id]))
+        self.assertEqual(response.status_code, 404)
+        shared = Task.objects.get(title='Shared')
+        data = self.client.get(reverse('tasks:task_detail_data', args=[shared.id])).json()
+        self.assertEqual(data['assignees'], [{'id': self.user.id, 'username': 'owner'}])
+
+    def test_malformed_project_filter_is_rejected(self):
+        response = self.client.get(reverse('tasks:task_list_data'), {'project': 'not-a-uuid'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_requires_login(self):
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse('tasks:project_list_data')).status_code, 401)
+
+
+class TaskBatchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', email='owner@example.com', password='pw')
+        other = User.objects.create_user(username='bob', email='bob@example.com', password='pw')
+        self.client.force_login(self.user)
+        self.first = Task.objects.create(title='First', owner=self.user, estimated_hours=2, ai_summary='long')
+        self.second = Task.objects.create(title='Second', owner=self.user)
+        self.second.assignees.add(other)
+        self.hidden = Task.objects.create(title='Hidden', owner=other)
+
+    def test_sparse_fields_in_request_order(self):
+        ids = [self.second.id, self.hidden.id, self.first.id]
+        response = self.client.get(reverse('tasks:task_batch'), {
+            'ids': ','.join(str(i) for i in ids), 'fields': 'title,estimated_hours,assignees',
+        })
+        self.assertEqual(response.status_code, 200)
+        tasks = response.json()['tasks']
+        self.assertEqual([t['title'] for t in tasks], ['Second', 'First'])
+        self.assertEqual(set(tasks[1]), {'id', 'title', 'estimated_hours', 'assignees'})
+        self.assertEqual(tasks[1]['estimated_hours'], 2.0)
+        self.assertEqual([a['username'] for a in tasks[0]['assignees']], ['bob'])
+
+    def test_rejects_unknown_fields(self):
+        response = self.client.post(
+            reverse('tasks:task_batch'),
+            data=json.dumps({'ids': [str(self.first.id)], 'fields': ['title', 'supabase_id']}),
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_rejects_malformed_json_bodies(self):
+        for body in ([str(self.first.id)], {'ids': 5}, {'ids': {str(self.first.id): 1}}, {'ids': [str(self.first.id)], 'fields': 3}):
+            response = self.client.post(reverse('tasks:task_batch'), data=json.dumps(body), content_type='application/json')
+            self.assertEqual(response.status_code, 400, body)
+
+
+class DeltaSyncTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', email='owner@example.com', password='pw')
+        self.assignee = User.objects.create_user(username='alice', email='alice@example.com', password='pw')
+        self.client.force_login(self.assignee)
+
+    def sync(self, cursor):
+        return self.client.get(reverse('tasks:sync_changes'), {'cursor': cursor}).json()
+
+    def test_changes_and_tombstones_since_cursor(self):
+        task = Task.objects.create(title='Shared', owner=self.user)
+        task.assignees.add(self.assignee)
+        comment = TaskComment.objects.create(task=task, user=self.user, content='hi')
+
+        first = self.sync(0)
+        self.assertEqual([t['title'] for t in first['changed']['task']], ['Shared'])
+        self.assertEqual([c['id'] for c in first['changed']['comment']], [str(comment.id)])
+
+        self.assertEqual(self.sync(first['cursor'])['changed']['task'], [])
+
+        task.title = 'Renamed'
+        task.save()
+        other = Task.objects.create(title='Other', owner=self.user)
+        other.assignees.add(self.assignee)
+        other.assignees.remove(self.assignee)
+        second = self.sync(first['cursor'])
+        self.assertEqual([t['title'] for t in second['changed']['task']], ['Renamed'])
+        self.assertEqual(second['deleted']['task'], [str(other.id)])
+
+        task_id = str(task.id)
+        task.delete()
+        third = self.sync(second['cursor'])
+        self.assertEqual(third['deleted']['task'], [task_id])
+        self.assertEqual(third['deleted']['comment'], [str(comment.id)])
+
+    def test_appends_lock_each_audience_member_in_id_order_on_postgres(self):
+        connection = mock.MagicMock(vendor='postgresql')
+        with mock.patch.object(changelog, 'connection', connection):
+            changelog.record({self.assignee.id, self.user.id}, 'task', [])
+            connection.cursor.assert_not_called()
+            task = Task.objects.create(title='Locked', owner=self.user)
+            connection.reset_mock()
+            changelog.record({self.assignee.id, self.user.id}, 'task', [task.id])
+        execute = connection.cursor.return_value.__enter__.return_value.execute
+        self.assertEqual(
+            [call.args[1][1] for call in execute.call_args_list],
+            sorted([self.user.id, self.assignee.id]),
+        )
+
+
+class TaskHierarchyTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', email='owner@example.com', password='pw')
+        self.root = Task.objects.create(title='Root', owner=self.user)
+        self.child = Task.objects.create(title='Child', owner=self.user, parent_task=self.root, estimated_hours=2)
+        self.leaf = Task.objects.create(title='Leaf', owner=self.user, parent_task=self.child, estimated_hours=3)
+
+    def rollup(self, task):
+        return TaskRollup.objects.get(task=task)
+
+    def test_rollups_follow_status_moves_and_deletes(self):
+        self.assertEqual([t.title for t in hierarchy.descendants(self.root)], ['Child', 'Leaf'])
+        self.assertEqual(self.rollup(self.root).estimated_hours, 5)
+
+        self.leaf.status = 'completed'
+        self.leaf.save()
+        self.assertEqual(self.rollup(self.root).done_count, 1)
+        self.assertEqual(self.rollup(self.child).percent_complete, 100)
+        self.client.force_login(self.user)
+        subtree = self.client.get(reverse('tasks:task_subtree', args=[self.root.id])).json()
+        self.assertEqual([(t['title'], t['depth']) for t in subtree['descendants']], [('Child', 1), ('Leaf', 2)])
+        self.assertEqual(subtree['rollup']['percent_complete'], 50)
+
+        other = Task.objects.create(title='Other', owner=self.user)
+        self.child.parent_task = other
+        self.child.save()
+        self.assertEqual(self.rollup(self.root).total_count, 0)
+        self.assertEqual((self.rollup(other).total_count, self.rollup(other).done_count), (2, 1))
+        self.assertEqual([t.title for t in hierarchy.ancestors(self.leaf)], ['Child', 'Other'])
+
+        self.child.delete()
+        self.assertEqual(self.rollup(other).total_count, 0)
+        self.assertEqual(list(hierarchy.ancestors(self.leaf)), [])
+
+    def test_cycles_are_rejected(self):
+        self.root.parent_task = self.leaf
+        with self.assertRaises(ValidationError):
+            self.root.save()
+
+    def test_rebuild_matches_incremental_state(self):
+        before = sorted(TaskRollup.objects.values_list('task_id', 'total_count', 'estimated_hours'))
+        hierarchy.rebuild()
+        after = sorted(TaskRollup.objects.values_list('task_id', 'total_count', 'estimated_hours'))
+        self.assertEqual(before, after)
+
+
+class TaskDedupeTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='owner', email='owner@example.com', password='pw')
+
+    def test_new_task_is_flagged_as_duplicate(self):
+        original = Task.objects.create(title='Prepare quarterly budget report', owner=self.user)
+        Task.objects.create(title='Plan team offsite', owner=self.user)
+        copy = Task.objects.create(title='Prepare quarterly budget report!', owner=self.user)
+        self.assertEqual(TaskSignature.objects.get(task=copy).duplicate_of_id, original.id)
+        self.assertIsNone(TaskSignature.objects.get(task=original).duplicate_of_id)
+
+        other = User.objects.create_user(username='other', email='other@example.com', password='pw')
+        theirs = Task.objects.create(title='Prepare quarterly budget report', owner=other)
+        self.assertIsNone(TaskSignature.objects.get(task=theirs).duplicate_of_id)
+
+    def test_clusters_group_an_account(self):
+        for title in ['Fix login bug', 'Fix the signup form', 'Write release notes', 'fix login bug!']:
+            Task.objects.create(title=title, description='Users cannot sign in with email', owner=self.user)
+        TaskSignature.objects.all().delete()
+        self.assertEqual(dedupe.index_missing(owner=self.user), 4)
+        groups = dedupe.clusters(self.user)
+        self.assertEqual(len(groups), 1)
+        titles = set(Task.objects.filter(pk__in=groups[0]).values_list('title', flat=True))
+        self.assertEqual(titles, {'Fix login bug', 'fix login bug!'})
+
+
+class DeferredDeletionTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.user = User.objects.create_user(username='owner', email='owner@example.com', password='pw')
+        self.client.force_login(self.user)
+        self.project = Project.objects.create(name='Big', owner=self.user)
+        self.tasks = [Task.objects.create(title=f'Task {i}', owner=self.user, project=self.project) for i in range(3)]
+        TaskComment.objects.create(task=self.tasks[0], user=self.user, content='hi')
+
+    def tearDown(self):
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def test_project_is_hidden_then_purged_with_its_files(self):
+        with override_settings(MEDIA_ROOT=self.media_root):
+            attachment = TaskAttachment.objects.create(
+                task=self.tasks[0], uploaded_by=self.user, file_name='notes.txt', file_type='text/plain', file_size=5,
+                file=SimpleUploadedFile('notes.txt', b'notes'),
+            )
+            path = attachment.file.path
+            keep = Task.objects.create(title='Elsewhere', owner=self.user, parent_task=self.tasks[1])
+
+            self.client.post(reverse('tasks:project_delete', args=[self.project.id]))
+            self.assertFalse(Project.objects.filter(pk=self.project.pk).exists())
+            self.assertEqual(Task.objects.filter(project=self.project).count(), 0)
+            self.assertEqual(Task.all_objects.filter(project=self.project).count(), 3)
+            keep.refresh_from_db()
+            self.assertIsNone(keep.parent_task_id)
+
+            with self.captureOnCommitCallbacks(execute=True):
+                counts = deletion.purge(chunk_size=2)
+            self.assertEqual((counts['tasks'], counts['projects'], counts['files']), (3, 1, 1))
+            self.assertFalse(Project.all_objects.filter(pk=self.project.pk).exists())
+            self.assertFalse(TaskComment.objects.exists())
+            self.assertFalse(TaskActivity.objects.filter(task_id__in=[t.id for t in self.tasks]).exists())
+            self.assertFalse(os.path.exists(path))
+            self.assertTrue(Task.objects.filter(pk=keep.pk).exists())
+
+    def test_project_counts_skip_tasks_pending_deletion(self):
+        self.tasks[0].status = 'completed'
+        self.tasks[0].save()
+        deletion.request_task_deletion(Task.objects.filter(pk__in=[self.tasks[0].pk, self.tasks[1].pk]))
+        row = queries.project_rows(Project.objects.filter(pk=self.project.pk), 0, 10)[0]
+        self.assertEqual((row['task_count'], row['completed_count']), (1, 0))
+
+    def test_purge_worker_loops_until_stopped(self):
+        deletion.request_task_deletion(Task.objects.filter(pk=self.tasks[0].pk))
+        out = io.StringIO()
+        # The first idle sleep stands in for the process being stopped
+        with mock.patch('tasks.management.commands.purge_deleted.time.sleep', side_effect=KeyboardInterrupt) as sleep:
+            call_command('purge_deleted', '--loop', '--max-chunks', '1', '--chunk-size', '1', stdout=out)
+        sleep.assert_called_once()
+        self.assertFalse(Task.all_objects.filter(pk=self.tasks[0].pk).exists())
+        self.assertIn('Purged 1 task(s) and 0 project(s)', out.getvalue())
+
+
+class NotificationInboxTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(username='owner', email='owner@example.com', password='pw')
+        self.alice = User.objects.create_user(username='alice', email='alice@example.com', password='pw')
+        self.bob = User.objects.create_user(username='bob', email='bob@example.com', password='pw')
+        self.client.force_login(self.alice)
+
+    def test_fan_out_counters_pagination_and_mark_read(self):
+        task = Task.objects.create(title='Launch', owner=self.owner)
+        task.assignees.add(self.alice, self.bob)
+        TaskComment.objects.create(task=task, user=self.owner, content='@alice can you check?')
+        self.assertEqual(notifications.unread_count(self.alice), 2)
+        self.assertEqual(
+            set(Notification.objects.filter(recipient=self.bob).values_list('notification_type', flat=True)),
+            {'assigned', 'comment'},
+        )
+        self.assertEqual(Notification.objects.get(recipient=self.alice, notification_type='mention').task_id, task.id)
+
+        first = self.client.get(reverse('tasks:notification_list'), {'limit': 1}).json()
+        self.assertEqual(first['notifications'][0]['notification_type'], 'mention')
+        second = self.client.get(reverse('tasks:notification_list'), {'limit': 1, 'cursor': first['next_cursor']}).json()
+        self.assertEqual(second['notifications'][0]['notification_type'], 'assigned')
+        self.assertIsNone(second['next_cursor'])
+
+        response = self.client.post(
+            reverse('tasks:notification_mark_read'),
+            data=json.dumps({'ids': [first['notifications'][0]['id']]}), content_type='application/json',
+        )
+        self.assertEqual(response.json()['unread_count'], 1)
+        self.client.post(reverse('tasks:notification_mark_read'), data='{"all": true}', content_type='application/json')
+        self.assertEqual(self.client.get(reverse('tasks:notification_unread_count')).json(), {'unread_count': 0})
+
+
+class DailyDigestTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(username='owner', email='owner@example.com', password='pw')
+        self.alice = User.objects.create_user(username='alice', email='alice@example.com', password='pw')
+        User.objects.create_user(username='idle', email='idle@example.com', password='pw')
+        now = timezone.now()
+        Task.objects.create(title='Late report', owner=self.owner, due_date=now - timedelta(days=2))
+        shared = Task.objects.create(title='Review', owner=self.owner, due_date=now + timedelta(days=5))
+        shared.assignees.add(self.alice)
+
+    def test_digests_are_batched_and_resumable(self):
+        totals = digest.send_digests(batch_size=2, workers=1)
+        self.assertEqual((totals['sent'], totals['empty']), (2, 1))
+        by_recipient = {message.to[0]: message for message in mail.outbox}
+        self.assertIn('Late report', by_recipient['owner@example.com'].body)
+        self.assertIn('Review', by_recipient['alice@example.com'].body)
+        self.assertIn('Newly assigned', by_recipient['alice@example.com'].alternatives[0][0])
+        self.assertEqual(DigestDelivery.objects.count(), 3)
+
+        self.assertEqual(digest.send_digests(workers=1), {})
+        self.assertEqual(len(mail.outbox), 2)
+
+
+@override_settings(SUPABASE_URL='http://supabase.test', SUPABASE_SERVICE_KEY='service-key')
+class SyncSupabaseUsersTests(TestCase):
+    def test_diff_is_set_based_and_bulk_written(self):
+        User.objects.create_user(username='carol', email='carol@example.com', password='pw')
+        User.objects.create_user(username='dave', email='dave@example.com', password='pw', supabase_id='sb-dave')
+        User.objects.create_user(username='erin', email='someone@else.com', password='pw')
+        remote = [
+            {'id': 'sb-carol', 'email': 'Carol@example.com', 'email_confirmed_at': '2025-01-01T00:00:00Z'},
+            {'id': 'sb-dave', 'email': 'dave@example.com'},
+            {'id': 'sb-erin', 'email': 'erin@example.com', 'banned_until': '2999-01-01T00:00:00Z'},
+            {'id': 'sb-erin2', 'email': 'erin@example.org'},
+            {'id': 'sb-none', 'email': ''},
+        ]
+        output = io.StringIO()
+        with mock.patch.object(supabase_admin.AdminClient, 'fetch_page', return_value=(remote, len(remote))), \
+                self.assertNumQueries(7):
+            # One load, then (savepoint, INSERT, release) and (savepoint, UPDATE, release)
+            call_command('sync_supabase_users', stdout=output)
+        self.assertIn('2 created, 1 updated, 0 unchanged, 2 skipped', output.getvalue())
+
+        carol = User.objects.get(username='carol')
+        self.assertEqual((carol.supabase_id, carol.email_verified), ('sb-carol', True))
+        erin = User.objects.get(email='erin@example.com')
+        self.assertEqual((erin.username, erin.is_active), ('erin1', False))
+        self.assertEqual(User.objects.get(email='erin@example.org').username, 'erin2')
+
+    def test_listing_failure_is_a_command_error(self):
+        output = io.StringIO()
+        with mock.patch.object(supabase_admin.AdminClient, 'fetch_page', side_effect=OSError('Name or service not known')), \
+                self.assertRaisesMessage(CommandError, 'Name or service not known'):
+            call_command('sync_supabase_users', stdout=output)
+        self.assertNotIn('Sync completed', output.getvalue())
+
+    def test_migrate_does_not_run_the_sync_inline(self):
+        with mock.patch('tasks.signals.subprocess.Popen') as popen, \
+                override_settings(SYNC_USERS_AFTER_MIGRATE='background', BYPASS_SUPABASE=False):
+            call_command('migrate', verbosity=0)
+            popen.assert_not_called()  # nothing to apply
+            from tasks.signals import sync_users_after_migrate
+            from django.apps import apps
+            sync_users_after_migrate(apps.get_app_config('tasks'), plan=[('migration', False)])
+        self.assertIn('sync_supabase_users', popen.call_args.args[0])
@@ -37,8 +37,10 @@ urlpatterns = [
     path('projects/<uuid:project_id>/archive/', views.project_archive, name='project_archive'),
     path('projects/<uuid:project_id>/unarchive/', views.project_unarchive, name='project_unarchive'),
     path('projects/<uuid:project_id>/delete/', views.project_delete, name='project_delete'),
+    path('projects/<uuid:project_id>/burndown/', views.project_burndown, name='project_burndown'),
     
     # Bulk actions
+    path('import/', views.task_import, name='task_import'),
     path('bulk/<str:action>/', views.bulk_action, name='bulk_action'),
     path('projects/bulk/<str:action>/', views.bulk_project_action, name='bulk_project_action'),
     
@@ -51,6 +53,26 @@ urlpatterns = [
     # Task stats
     path('tasks/stats/', views.task_stats, name='task_stats'),
     path('tasks_list/', TaskListView.as_view(), name='task-list'),
+    path('events/', views.task_events, name='task_events'),
+    
+    # Async JSON read endpoints
+    path('api/tasks/', views.task_list_data, name='task_list_data'),
+    path('api/tasks/batch/', views.task_batch, name='task_batch'),
+    path('api/tasks/<uuid:task_id>/', views.task_detail_data, name='task_detail_data'),
+    path('api/tasks/<uuid:task_id>/subtree/', views.task_subtree, name='task_subtree'),
+    path('api/projects/', views.project_list_data, name='project_list_data'),
+    path('api/sync/', views.sync_changes, name='sync_changes'),
+    path('api/notifications/', views.notification_list, name='notification_list'),
+    path('api/notifications/unread/', views.notification_unread_count, name='notification_unread_count'),
+    path('api/notifications/read/', views.notification_mark_read, name='notification_mark_read'),
+    
+    # Workload
+    path('workload/', views.task_workload, name='task_workload'),
+    
+    # Calendar
+    path('calendar/', views.task_calendar, name='task_calendar'),
+    path('calendar/feed/', views.calendar_feed_settings, name='calendar_feed_settings'),
+    path('calendar/<uuid:token>.ics', views.calendar_feed, name='calendar_feed'),
     
     # Public share link
     path('share/<uuid:token>/', views.shared_resource_view, name='shared_resource_view'),
@@ -1,6 +1,6 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required, user_passes_test
-from django.http import JsonResponse, HttpResponseForbidden
+from django.http import JsonResponse, HttpResponseForbidden, HttpResponse, FileResponse, StreamingHttpResponse, Http404
 from django.contrib import messages
 from django.db.models import Q, Sum, Count
 from django.utils import timezone
@@ -8,7 +8,8 @@ from django.views.decorators.http import require_POST
 from django.core.paginator import Paginator
 from .models import (
     Task, TaskAttachment, TaskReminder, TaskTag, TaskComment, 
-    TaskActivity, Project, TimeEntry, CustomField, CustomFieldValue, ShareLink, ProjectAttachment
+    TaskActivity, Project, TimeEntry, CustomField, CustomFieldValue, ShareLink, ProjectAttachment,
+    CalendarFeed, TaskRollup, TaskSignature
 )
 from .forms import (
     TaskForm, TaskAttachmentForm, TaskReminderForm, 
@@ -23,12 +24,20 @@ from django.core.management import call_command
 from django.db import transaction
 import io
 import uuid
+from django.core.exceptions import ValidationError
 from rest_framework import generics
 from .models import Task
 from .serializers import TaskSerializer
+from .importers import SUPPORTED_FORMATS, detect_format, import_tasks
+from . import ical
+from . import batch, changelog, deletion, events, hierarchy, notifications, queries, snapshots, workload
+from .decorators import async_login_required
+from .calendar_api import CalendarQueryError, day_bounds, due_buckets, parse_window, visible_tasks
+import os
 from django.contrib.contenttypes.models import ContentType
 from django.urls import reverse
 from django.views.decorators.http import require_http_methods
+from django.utils.dateparse import parse_date
 
 logger = logging.getLogger(__name__)
 
@@ -78,21 +87,24 @@ def task_list(request):
                 search_query |= Q(comments__content__icontains=search)
             tasks = tasks.filter(search_query).distinct()
         
-        # Filter by due date range
+        # Filter by due date range (half-open datetime ranges keep the
+        # due_date index usable, unlike __date lookups)
         due_date_filter = form.cleaned_data.get('due_date')
         if due_date_filter:
-            today = timezone.now().date()
+            today = timezone.localdate()
             if due_date_filter == 'today':
-                tasks = tasks.filter(due_date__date=today)
+                start, end = day_bounds(today, today + timezone.timedelta(days=1), timezone.get_current_timezone())
+                tasks = tasks.filter(due_date__gte=start, due_date__lt=end)
             elif due_date_filter == 'tomorrow':
                 tomorrow = today + timezone.timedelta(days=1)
-                tasks = tasks.filter(due_date__date=tomorrow)
+                start, end = day_bounds(tomorrow, tomorrow + timezone.timedelta(days=1), timezone.get_current_timezone())
+                tasks = tasks.filter(due_date__gte=start, due_date__lt=end)
             elif due_date_filter == 'week':
-                end_of_week = today + timezone.timedelta(days=7)
-                tasks = tasks.filter(due_date__date__range=[today, end_of_week])
+                start, end = day_bounds(today, today + timezone.timedelta(days=8), timezone.get_current_timezone())
+                tasks = tasks.filter(due_date__gte=start, due_date__lt=end)
             elif due_date_filter == 'month':
-                end_of_month = today + timezone.timedelta(days=30)
-                tasks = tasks.filter(due_date__date__range=[today, end_of_month])
+                start, end = day_bounds(today, today + timezone.timedelta(days=31), timezone.get_current_timezone())
+                tasks = tasks.filter(due_date__gte=start, due_date__lt=end)
             elif due_date_filter == 'overdue':
                 tasks = tasks.filter(due_date__lt=timezone.now(), status__in=['todo', 'in_progress'])
             elif due_date_filter == 'none':
@@ -177,36 +189,14 @@ def task_list(request):
     # Get all task tags for this user
     tags = TaskTag.objects.filter(created_by=request.user).order_by('name')
     
-    # Calculate stats before pagination
-    # Get all tasks before filtering for stats
-    all_tasks = Task.objects.filter(
-        Q(owner=request.user) | Q(assignees=request.user)
-    ).distinct()
-    
-    if not show_archived:
-        all_tasks = all_tasks.filter(is_archived=False)
-    
-    total_tasks = all_tasks.count()
-    todo_tasks = all_tasks.filter(status='todo')
-    in_progress_tasks = all_tasks.filter(status='in_progress')
-    completed_tasks = all_tasks.filter(status='completed')
-    
-    todo_count = todo_tasks.count()
-    in_progress_count = in_progress_tasks.count()
-    completed_count = completed_tasks.count()
-    
-    # Calculate overdue tasks
-    now = timezone.now()
-    overdue_count = all_tasks.filter(
-        due_date__lt=now,
-        status__in=['todo', 'in_progress']
-    ).count()
-    
-    # Calculate completion percentage
-    if total_tasks > 0:
-        completion_percentage = (completed_count / total_tasks) * 100
-    else:
-        completion_percentage = 0
+    # Calculate stats before pagination, over all of the user's tasks
+    counts = queries.task_counts(queries.user_tasks(request.user, show_archived))
+    total_tasks = counts['total']
+    todo_count = counts['todo']
+    in_progress_count = counts['in_progress']
+    completed_count = counts['completed']
+    overdue_count = counts['overdue']
+    completion_percentage = (completed_count / total_tasks) * 100 if total_tasks else 0
     
     # Get choices for dropdown filters
     status_choices = Task.STATUS_CHOICES
@@ -343,7 +333,8 @@ def task_create(request):
                 pk=project_id
             )
             initial_data['project'] = project
-        except Project.DoesNotExist:
+        except (Project.DoesNotExist, ValidationError):
+            # Unknown or malformed project ID: nothing to pre-fill
             pass
     
     # Pre-fill parent task if specified
@@ -355,7 +346,7 @@ def task_create(request):
                 pk=parent_id
             )
             initial_data['parent_task'] = parent_task
-        except Task.DoesNotExist:
+        except (Task.DoesNotExist, ValidationError):
             pass
     
     if request.method == 'POST':
@@ -380,6 +371,12 @@ def task_create(request):
             )
             
             messages.success(request, 'Task created successfully!')
+            duplicate = (
+                TaskSignature.objects.filter(task=task, duplicate_of__isnull=False)
+                .values_list('duplicate_of__title', flat=True).first()
+            )
+            if duplicate:
+                messages.warning(request, f'This task looks like a duplicate of "{duplicate}".')
             return redirect('tasks:task_detail', task_id=task.id)
     else:
         form = TaskForm(initial=initial_data, user=request.user)
@@ -630,14 +627,9 @@ def bulk_action(request, action):
                 messages.error(request, 'You can only delete tasks that you own')
                 return redirect('tasks:task_list')
                 
-            for task in owner_tasks:
-                TaskActivity.objects.create(
-                    task=task,
-                    activity_type='delete',
-                    user=request.user,
-                    description=f'Task "{task.title}" deleted by {request.user.username} (bulk action)'
-                )
-                task.delete()
+            # Hidden now, purged in the background by purge_deleted
+            deletion.request_task_deletion(owner_tasks)
+            logger.info(f"{count} task(s) queued for deletion by {request.user.username} (bulk action)")
                 
             messages.success(request, f'{count} task(s) deleted')
             
@@ -659,6 +651,40 @@ def bulk_action(request, action):
         messages.error(request, 'An error occurred while processing your request')
         return redirect('tasks:task_list')
 
+@login_required
+@require_POST
+def task_import(request):
+    """Bulk import tasks from an uploaded CSV, JSON or NDJSON file."""
+    upload = request.FILES.get('file')
+    if not upload:
+        return JsonResponse({'status': 'error', 'message': 'No file uploaded'}, status=400)
+
+    fmt = request.POST.get('format') or detect_format(upload.name)
+    if fmt not in SUPPORTED_FORMATS:
+        return JsonResponse({'status': 'error', 'message': f'Unsupported format: {fmt}'}, status=400)
+
+    default_project = None
+    project_id = request.POST.get('project')
+    if project_id:
+        if queries.parse_uuid(project_id) is None:
+            return JsonResponse({'status': 'error', 'message': 'project must be a project ID'}, status=400)
+        default_project = Project.objects.filter(
+            Q(owner=request.user) | Q(members=request.user),
+            pk=project_id
+        ).first()
+        if not default_project:
+            return JsonResponse({'status': 'error', 'message': 'Project not found'}, status=404)
+
+    try:
+        result = import_tasks(upload.file, fmt, request.user, default_project=default_project)
+    except (ValueError, UnicodeDecodeError) as e:
+        return JsonResponse({'status': 'error', 'message': f'Could not parse file: {e}'}, status=400)
+    except Exception as e:
+        logger.error(f"Error importing tasks: {str(e)}")
+        return JsonResponse({'status': 'error', 'message': 'An error occurred during import'}, status=500)
+
+    return JsonResponse({'status': 'success', **result.as_dict()})
+
 @login_required
 def manage_tags(request):
     """Manage user's tags."""
@@ -840,7 +866,6 @@ def user_stats(request):
 @login_required
 @user_passes_test(is_staff)
 @csrf_protect
-@transaction.atomic
 def sync_users(request):
     """Sync users from Supabase to Django"""
     if request.method != 'POST':
@@ -868,23 +893,10 @@ def sync_users(request):
 @login_required
 def project_list(request):
     """View to list all projects for the logged-in user."""
-    # Get projects where user is owner or member
-    projects = Project.objects.filter(
-        Q(owner=request.user) | Q(members=request.user)
-    ).distinct().order_by('-created_at')
-    
-    # Filter out archived projects unless specifically requested
+    # Projects where user is owner or member, optionally archived or searched
     show_archived = request.GET.get('show_archived') == '1'
-    if not show_archived:
-        projects = projects.filter(is_archived=False)
-    
-    # Search functionality
     search = request.GET.get('search')
-    if search:
-        projects = projects.filter(
-            Q(name__icontains=search) | 
-            Q(description__icontains=search)
-        )
+    projects = queries.user_projects(request.user, show_archived, search)
     
     # Pagination
     paginator = Paginator(projects, 10)  # Show 10 projects per page
@@ -912,9 +924,10 @@ def project_detail(request, project_id):
     )
     # Get tasks for this project
     tasks = Task.objects.filter(project=project).order_by('-created_at')
-    # Calculate project stats
-    total_tasks = tasks.count()
-    completed_tasks = tasks.filter(status='completed').count()
+    # Exact counts in one query; snapshots only back the burndown/velocity series
+    counts = queries.task_counts(tasks)
+    total_tasks = counts['total']
+    completed_tasks = counts['completed']
     completion_rate = 0
     if total_tasks > 0:
         completion_rate = int((completed_tasks / total_tasks) * 100)
@@ -946,6 +959,33 @@ def project_detail(request, project_id):
     }
     return render(request, 'tasks/project_detail.html', context)
 
+@login_required
+def project_burndown(request, project_id):
+    """Daily burndown and velocity series for a project, read from its snapshots."""
+    project = get_object_or_404(
+        Project.objects.filter(
+            Q(owner=request.user) | Q(members=request.user)
+        ).distinct(),
+        pk=project_id
+    )
+    end = timezone.localdate()
+    if request.GET.get('end'):
+        try:
+            end = parse_date(request.GET['end'])
+        except ValueError:
+            end = None
+        if not end:
+            return JsonResponse({'status': 'error', 'message': 'end must be an ISO date'}, status=400)
+    try:
+        days = int(request.GET.get('days', 30))
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'days must be an integer'}, status=400)
+
+    return JsonResponse({
+        'project_id': str(project.id),
+        'series': snapshots.series(project, days=days, end=end),
+    })
+
 @login_required
 def project_create(request):
     """View to create a new project."""
@@ -1043,7 +1083,8 @@ def project_delete(request, project_id):
     
     if request.method == 'POST':
         project_name = project.name
-        project.delete()
+        # Hidden now, purged in the background by purge_deleted
+        deletion.request_project_deletion(Project.objects.filter(pk=project.pk))
         
         messages.success(request, f'Project "{project_name}" deleted successfully!')
         return redirect('tasks:project_list')
@@ -1090,8 +1131,7 @@ def bulk_project_action(request, action):
             message = f'{projects.count()} project(s) unarchived'
             
         elif action == 'delete':
-            count = projects.count()
-            projects.delete()
+            count = deletion.request_project_deletion(projects)
             message = f'{count} project(s) deleted'
             
         else:
@@ -1227,38 +1267,372 @@ def task_unarchive(request, task_id):
     messages.success(request, f'Task "{task.title}" unarchived successfully!')
     return redirect('tasks:task_detail', task_id=task.id)
 
-@login_required
-def task_stats(request):
+@async_login_required
+async def task_stats(request):
     """Return task statistics for the current user as JSON."""
-    today = timezone.now().date()
-    
-    # Get all non-archived tasks for the current user
-    user_tasks = Task.objects.filter(
-        Q(assignees=request.user) | Q(created_by=request.user),
-        is_archived=False
-    ).distinct()
-    
-    # Count tasks by status
-    total_tasks = user_tasks.count()
-    completed_tasks = user_tasks.filter(status='Completed').count()
-    in_progress_tasks = user_tasks.filter(status='In Progress').count()
-    overdue_tasks = user_tasks.filter(
-        status__in=['Todo', 'In Progress'],
-        due_date__lt=today
-    ).count()
-    
-    # Calculate completion percentage
-    completion_percentage = round((completed_tasks / total_tasks) * 100) if total_tasks > 0 else 0
-    
-    # Return JSON response
+    counts = await queries.atask_counts(queries.user_tasks(request.user))
     return JsonResponse({
-        'total_tasks': total_tasks,
-        'completed_tasks': completed_tasks,
-        'in_progress_tasks': in_progress_tasks,
-        'overdue_tasks': overdue_tasks,
-        'completion_percentage': completion_percentage
+        'total_tasks': counts['total'],
+        'completed_tasks': counts['completed'],
+        'in_progress_tasks': counts['in_progress'],
+        'overdue_tasks': counts['overdue'],
+        'completion_percentage': counts['completion_percentage'],
+    })
+
+@async_login_required
+async def task_list_data(request):
+    """One page of the user's tasks plus their status counts, as JSON."""
+    show_archived = request.GET.get('show_archived') == '1'
+    tasks = queries.user_tasks(request.user, show_archived)
+    page, page_size, offset = queries.page_bounds(request.GET)
+
+    try:
+        filtered = queries.filter_tasks(tasks, request.GET)
+    except queries.InvalidFilter as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+    rows = [row async for row in queries.task_rows(filtered, offset, page_size)]
+    return JsonResponse({
+        'tasks': rows[:page_size],
+        'page': page,
+        'page_size': page_size,
+        'has_next': len(rows) > page_size,
+        'counts': await queries.atask_counts(tasks),
+    })
+
+@async_login_required
+async def task_detail_data(request, task_id):
+    """A task with its assignees, tags, subtasks, latest comments and activity, as JSON."""
+    try:
+        task = await queries.task_detail_queryset(request.user).aget(pk=task_id)
+    except Task.DoesNotExist:
+        return JsonResponse({'status': 'error', 'message': 'Task not found'}, status=404)
+
+    return JsonResponse({
+        'task': {
+            **events.task_payload(task),
+            'description': task.description,
+            'owner': {'id': task.owner_id, 'username': task.owner.username},
+            'project_name': task.project.name if task.project else None,
+            'parent_task_id': str(task.parent_task_id) if task.parent_task_id else None,
+            'estimated_hours': task.estimated_hours,
+            'actual_hours': task.actual_hours,
+            'completed_at': task.completed_at,
+            'created_at': task.created_at,
+            'possible_duplicate_of': await TaskSignature.objects.filter(task=task)
+            .values_list('duplicate_of_id', flat=True).afirst(),
+        },
+        'assignees': [a async for a in task.assignees.values('id', 'username')],
+        'tags': [t async for t in task.tags.values('id', 'name', 'color')],
+        'subtasks': [
+            s async for s in task.subtasks.order_by('position', '-created_at').values('id', 'title', 'status')
+        ],
+        'comments': [
+            c async for c in task.comments.order_by('-created_at')
+            .values('id', 'content', 'user__username', 'created_at')[:20]
+        ],
+        'activities': [
+            a async for a in task.activities.order_by('-created_at')
+            .values('activity_type', 'description', 'created_at')[:10]
+        ],
+    })
+
+@async_login_required
+async def task_batch(request):
+    """
+    Several tasks in one request, with only the requested fields.
+
+    GET ``?ids=<uuid>,<uuid>&fields=title,status,assignees`` or POST a JSON
+    body ``{"ids": [...], "fields": [...]}`` for long lists. Tasks that don't
+    exist or aren't visible are left out of ``tasks``.
+    """
+    if request.method == 'POST':
+        try:
+            body = json.loads(request.body or b'{}')
+        except ValueError:
+            return JsonResponse({'status': 'error', 'message': 'Invalid JSON body'}, status=400)
+        if not isinstance(body, dict):
+            return JsonResponse({'status': 'error', 'message': 'Body must be a JSON object'}, status=400)
+        raw_ids, selector = body.get('ids'), body.get('fields')
+    else:
+        raw_ids, selector = request.GET.get('ids'), request.GET.get('fields')
+
+    try:
+        ids = batch.parse_ids(raw_ids)
+        columns, relations = batch.parse_fields(selector)
+    except batch.BatchQueryError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+
+    tasks = await batch.afetch_tasks(request.user, ids, columns, relations)
+    return HttpResponse(batch.encode({'tasks': tasks}), content_type='application/json')
+
+@login_required
+def sync_changes(request):
+    """
+    Delta sync: tasks, projects, tags and comments changed after ``cursor``,
+    plus tombstones for the ones deleted or no longer visible. Start with
+    ``cursor=0`` and keep passing back the returned cursor while ``has_more``.
+    """
+    try:
+        cursor = int(request.GET.get('cursor', 0))
+        limit = int(request.GET.get('limit', changelog.DEFAULT_LIMIT))
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'cursor and limit must be integers'}, status=400)
+    if cursor < 0:
+        return JsonResponse({'status': 'error', 'message': 'cursor must not be negative'}, status=400)
+
+    changes = changelog.changes_since(request.user, cursor, limit)
+    return HttpResponse(batch.encode(changes), content_type='application/json')
+
+@login_required
+def task_subtree(request, task_id):
+    """
+    A task's ancestors (nearest first), every task below it with its depth,
+    and the progress rolled up over the whole subtree.
+    """
+    task = get_object_or_404(visible_tasks(request.user), pk=task_id)
+    try:
+        max_depth = int(request.GET['depth']) if request.GET.get('depth') else None
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'depth must be an integer'}, status=400)
+
+    rollup = TaskRollup.objects.filter(task=task).first() or TaskRollup(task=task)
+    return JsonResponse({
+        'task_id': str(task.id),
+        'ancestors': list(hierarchy.ancestors(task).values('id', 'title', 'status')),
+        'descendants': list(
+            hierarchy.descendants(task, max_depth).values('id', 'title', 'status', 'parent_task_id', 'depth')
+        ),
+        'rollup': {
+            'total_count': rollup.total_count,
+            'done_count': rollup.done_count,
+            'estimated_hours': rollup.estimated_hours,
+            'actual_hours': rollup.actual_hours,
+            'percent_complete': rollup.percent_complete,
+        },
+    })
+
+@login_required
+def notification_list(request):
+    """
+    One page of the user's notifications, newest first. Pass ``next_cursor``
+    back as ``cursor`` for older ones; ``unread=1`` lists only unread ones.
+    """
+    try:
+        cursor = int(request.GET['cursor']) if request.GET.get('cursor') else None
+        limit = int(request.GET.get('limit', notifications.DEFAULT_PAGE_SIZE))
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'cursor and limit must be integers'}, status=400)
+    return JsonResponse(notifications.inbox(request.user, cursor, limit, request.GET.get('unread') == '1'))
+
+@async_login_required
+async def notification_unread_count(request):
+    """The header badge: a single-row read of the user's unread counter."""
+    return JsonResponse({'unread_count': await notifications.aunread_count(request.user)})
+
+@login_required
+@require_POST
+def notification_mark_read(request):
+    """
+    Mark notifications as read: ``{"ids": [...]}``, ``{"up_to": <id>}`` for
+    everything up to an ID, or ``{"all": true}``.
+    """
+    try:
+        data = json.loads(request.body or '{}')
+        ids = [int(i) for i in data['ids']] if data.get('ids') is not None else None
+        up_to = int(data['up_to']) if data.get('up_to') is not None else None
+    except (json.JSONDecodeError, TypeError, ValueError):
+        return JsonResponse({'status': 'error', 'message': 'ids and up_to must be notification IDs'}, status=400)
+    if ids is None and up_to is None and not data.get('all'):
+        return JsonResponse({'status': 'error', 'message': 'Pass ids, up_to or all'}, status=400)
+
+    marked = notifications.mark_read(request.user, ids=ids, up_to=up_to)
+    return JsonResponse({
+        'status': 'success',
+        'marked': marked,
+        'unread_count': notifications.unread_count(request.user),
+    })
+
+@async_login_required
+async def project_list_data(request):
+    """One page of the user's projects with task counts, as JSON."""
+    projects = queries.user_projects(
+        request.user, request.GET.get('show_archived') == '1', request.GET.get('search')
+    )
+    page, page_size, offset = queries.page_bounds(request.GET)
+    rows = [row async for row in queries.project_rows(projects, offset, page_size)]
+    return JsonResponse({
+        'projects': rows[:page_size],
+        'page': page,
+        'page_size': page_size,
+        'has_next': len(rows) > page_size,
+    })
+
+@async_login_required
+async def task_events(request):
+    """
+    Server-Sent Events stream of changes to the requester's tasks.
+
+    Events are ``task.created``, ``task.updated``, ``task.deleted``,
+    ``task.removed`` (no longer visible) and ``resync`` (re-fetch the view).
+    Must be served through ASGI so idle streams don't hold a worker thread.
+    """
+    last_event_id = request.headers.get('Last-Event-ID') or request.GET.get('last_event_id')
+    response = StreamingHttpResponse(
+        events.stream(request.user.id, last_event_id), content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+@login_required
+def task_calendar(request):
+    """
+    Return per-day due-date buckets for ``[start, end)`` as JSON.
+
+    Each day carries the number of tasks due and the ``top`` most urgent of
+    them, so a week or month view loads in a single request.
+    """
+    try:
+        start_date, end_date, tz, top_n = parse_window(request.GET)
+    except CalendarQueryError as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+
+    tasks = visible_tasks(request.user)
+    if request.GET.get('show_archived') != '1':
+        tasks = tasks.filter(is_archived=False)
+    project_id = request.GET.get('project')
+    if project_id:
+        try:
+            uuid.UUID(project_id)
+        except ValueError:
+            return JsonResponse({'status': 'error', 'message': 'project must be a project ID'}, status=400)
+        tasks = tasks.filter(project_id=project_id)
+    statuses = request.GET.getlist('status')
+    if statuses:
+        tasks = tasks.filter(status__in=statuses)
+
+    try:
+        days = due_buckets(tasks, start_date, end_date, tz, top_n)
+    except Exception as e:
+        logger.error(f"Error in task_calendar: {str(e)}")
+        return JsonResponse({'status': 'error', 'message': 'An error occurred'}, status=500)
+
+    return JsonResponse({
+        'start': start_date.isoformat(),
+        'end': end_date.isoformat(),
+        'timezone': str(tz),
+        'days': days,
     })
 
+@login_required
+def task_workload(request):
+    """
+    Capacity heatmap of open, estimated work per assignee per day.
+
+    Scope is either ``project=<id>`` (the project's owner and members) or the
+    requester's team: everyone sharing a non-archived project with them,
+    optionally narrowed with ``users=<id>,<id>``.
+    """
+    if not workload.is_available():
+        return JsonResponse({'status': 'error', 'message': 'Workload engine unavailable'}, status=503)
+
+    start = None
+    if request.GET.get('start'):
+        try:
+            # None for a malformed value, ValueError for an impossible date like 2030-02-30
+            start = parse_date(request.GET['start'])
+        except ValueError:
+            start = None
+        if not start:
+            return JsonResponse({'status': 'error', 'message': 'start must be an ISO date'}, status=400)
+    try:
+        horizon = int(request.GET.get('days', workload.DEFAULT_HORIZON_DAYS))
+        capacity = float(request.GET.get('capacity', workload.DEFAULT_CAPACITY_HOURS))
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'days and capacity must be numbers'}, status=400)
+    if capacity <= 0:
+        return JsonResponse({'status': 'error', 'message': 'capacity must be positive'}, status=400)
+
+    visible_projects = Project.objects.filter(
+        Q(owner=request.user) | Q(members=request.user)
+    ).distinct()
+
+    project_id = request.GET.get('project')
+    if project_id:
+        try:
+            uuid.UUID(project_id)
+        except ValueError:
+            return JsonResponse({'status': 'error', 'message': 'project must be a project ID'}, status=400)
+        project = get_object_or_404(visible_projects, pk=project_id)
+        member_ids = {project.owner_id, *project.members.values_list('id', flat=True)}
+        tasks = Task.objects.filter(project=project)
+        scope_key = ('project', str(project.id))
+        cache_project_id = project.id
+    else:
+        projects = visible_projects.filter(is_archived=False)
+        member_ids = {request.user.id}
+        member_ids.update(projects.values_list('owner_id', flat=True))
+        member_ids.update(projects.values_list('members', flat=True))
+        member_ids.discard(None)
+        requested = request.GET.get('users')
+        if requested:
+            try:
+                member_ids &= {int(uid) for uid in requested.split(',') if uid.strip()}
+            except ValueError:
+                return JsonResponse({'status': 'error', 'message': 'users must be a list of IDs'}, status=400)
+        tasks = Task.objects.filter(project__in=projects.values('pk'))
+        scope_key = ('team', request.user.id)
+        cache_project_id = None
+
+    users = dict(User.objects.filter(id__in=member_ids).values_list('id', 'username'))
+    heatmap = workload.workload_heatmap(
+        tasks, scope_key, cache_project_id, users=users,
+        start=start, horizon=horizon, capacity=capacity,
+    )
+    return JsonResponse(heatmap)
+
+@login_required
+@require_http_methods(["GET", "POST"])
+def calendar_feed_settings(request):
+    """Return the user's calendar feed URL, creating it on first use. POST rotates the token."""
+    feed, created = CalendarFeed.objects.get_or_create(user=request.user)
+    if request.method == 'POST' and not created:
+        feed.rotate_token()
+    url = request.build_absolute_uri(
+        reverse('tasks:calendar_feed', args=[str(feed.token)])
+    )
+    return JsonResponse({'url': url, 'created': created})
+
+def calendar_feed(request, token):
+    """
+    Public iCalendar feed of the feed owner's due tasks.
+
+    Calendar clients poll this aggressively, so requests carrying the current
+    ETag get a 304 without touching the task tables, and a feed generation that
+    has already been encoded is served from its cache file.
+    """
+    try:
+        feed = CalendarFeed.objects.select_related('user').get(token=token)
+    except CalendarFeed.DoesNotExist:
+        raise Http404("Calendar feed not found")
+    if not feed.user.is_active:
+        raise Http404("Calendar feed not found")
+
+    etag = feed.etag
+    if etag in request.headers.get('If-None-Match', ''):
+        response = HttpResponse(status=304)
+    else:
+        cached_path = ical.cached_feed_path(feed)
+        if os.path.exists(cached_path):
+            response = FileResponse(open(cached_path, 'rb'))
+        else:
+            response = StreamingHttpResponse(ical.stream_and_cache(feed))
+        response['Content-Type'] = 'text/calendar; charset=utf-8'
+        response['Content-Disposition'] = 'inline; filename="tasks.ics"'
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, max-age=300'
+    return response
+
 class TaskListView(generics.ListAPIView):
     queryset = Task.objects.all()
     serializer_class = TaskSerializer
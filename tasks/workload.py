@@ -0,0 +1,228 @@
+"""
+Assignee workload and capacity engine.
+
+The open, estimated tasks of a project or team are loaded as column arrays
+with a single query. Each task's estimate is split evenly between its
+assignees and spread over the days between today (or the day the task was
+created, if later) and its due date. Per-user, per-day totals are then
+accumulated with a difference array and a cumulative sum, so the cost is
+linear in the number of assignments plus the size of the heatmap.
+
+Loaded arrays are kept in a small per-process cache keyed by a version
+number that ``tasks.signals`` bumps whenever a task or its assignees change,
+so repeated heatmap requests skip the database entirely.
+"""
+import threading
+from collections import Counter, OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.utils import timezone
+
+from .models import Task
+
+try:
+    import numpy as np
+except ImportError:
+    print("Warning: numpy is not installed. Workload heatmaps will be unavailable.")
+    np = None
+
+DEFAULT_CAPACITY_HOURS = getattr(settings, 'WORKLOAD_DAILY_CAPACITY_HOURS', 8.0)
+DEFAULT_HORIZON_DAYS = 28
+MAX_HORIZON_DAYS = 180
+OPEN_STATUSES = ('todo', 'in_progress')
+ARRAY_CACHE_SIZE = 32
+
+_VERSION_KEY = 'workload:version:{}'
+_array_cache = OrderedDict()
+_array_cache_lock = threading.Lock()
+
+
+def is_available():
+    return np is not None
+
+
+def _version_key(project_id):
+    return _VERSION_KEY.format(project_id or 'all')
+
+
+def current_version(project_id=None):
+    return cache.get_or_set(_version_key(project_id), 0, timeout=None)
+
+
+def invalidate(project_ids=()):
+    """Mark cached arrays stale for ``project_ids`` and for every team-wide view."""
+    for key in {_version_key(pid) for pid in project_ids if pid} | {_version_key(None)}:
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, timeout=None)
+
+
+def _open_assignment_rows(tasks):
+    """
+    Fetch ``(task_id, user_id, estimated_hours, due_date, created_at)`` for
+    every assignment of an open, estimated, due task in ``tasks``.
+
+    The query is built with the ORM but executed on a raw cursor: skipping
+    the per-row UUID/Decimal converters roughly halves the cost for large
+    projects, and the columns go straight into NumPy anyway.
+    """
+    Assignment = Task.assignees.through
+    open_tasks = tasks.filter(
+        status__in=OPEN_STATUSES,
+        is_archived=False,
+        due_date__isnull=False,
+        estimated_hours__gt=0,
+    )
+    queryset = (
+        Assignment.objects
+        .filter(task__in=open_tasks.values('pk'))
+        .values_list('task_id', 'user_id', 'task__estimated_hours', 'task__due_date', 'task__created_at')
+        .order_by()
+    )
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def _day_numbers(values, tz, n):
+    """
+    Local day ordinals for ``values``.
+
+    SQLite hands back naive UTC datetimes; those are shifted by the zone's
+    current UTC offset rather than converted one by one, which is an order of
+    magnitude faster and only differs around DST changes, well within the
+    resolution of a daily heatmap.
+    """
+    if values[0].tzinfo is None:
+        offset = timezone.now().astimezone(tz).utcoffset()
+        return np.fromiter(((v + offset).toordinal() for v in values), dtype=np.int64, count=n)
+    return np.fromiter((v.astimezone(tz).toordinal() for v in values), dtype=np.int64, count=n)
+
+
+def load_arrays(rows, tz):
+    """
+    Convert assignment rows into ``(user_ids, hours, due_days, created_days)``,
+    with each task's estimate already divided between its assignees.
+    """
+    n = len(rows)
+    if not n:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, np.empty(0, dtype=np.float64), empty, empty
+    task_ids, user_ids, hours, due, created = zip(*rows)
+    assignee_counts = Counter(task_ids)
+    counts = np.fromiter((assignee_counts[t] for t in task_ids), dtype=np.float64, count=n)
+    user_ids = np.fromiter(user_ids, dtype=np.int64, count=n)
+    hours = np.fromiter(hours, dtype=np.float64, count=n) / counts
+    return user_ids, hours, _day_numbers(due, tz, n), _day_numbers(created, tz, n)
+
+
+def cached_arrays(tasks, scope_key, project_id=None):
+    """Arrays for ``tasks``, reused until the scope's version is bumped."""
+    tz = timezone.get_current_timezone()
+    key = (scope_key, str(tz), current_version(project_id))
+    with _array_cache_lock:
+        arrays = _array_cache.get(key)
+        if arrays is not None:
+            _array_cache.move_to_end(key)
+            return arrays
+    arrays = load_arrays(_open_assignment_rows(tasks), tz)
+    with _array_cache_lock:
+        _array_cache[key] = arrays
+        while len(_array_cache) > ARRAY_CACHE_SIZE:
+            _array_cache.popitem(last=False)
+    return arrays
+
+
+def compute_load(user_ids, hours, due_days, created_days, today, start, horizon):
+    """
+    Return ``(users, load)`` where ``load[i, d]`` is the hours ``users[i]``
+    is expected to spend on day ``start + d``.
+
+    Work is spread over ``[max(today, created), due]``; overdue work lands
+    entirely on ``today``. Only the part of each span that falls inside the
+    ``horizon`` days starting at ``start`` is counted.
+    """
+    users, user_index = np.unique(user_ids, return_inverse=True)
+    if not len(users):
+        return users, np.zeros((0, horizon))
+
+    today_ord = today.toordinal()
+    start_ord = start.toordinal()
+    span_end = np.maximum(due_days, today_ord)
+    span_start = np.minimum(np.maximum(created_days, today_ord), span_end)
+    rate = hours / (span_end - span_start + 1)
+
+    # Positions relative to the window, clipped to [0, horizon]
+    first = np.clip(span_start - start_ord, 0, horizon)
+    last = np.clip(span_end - start_ord + 1, 0, horizon)
+    visible = last > first
+
+    width = horizon + 1
+    size = len(users) * width
+    base = user_index[visible] * width
+    diff = (
+        np.bincount(base + first[visible], weights=rate[visible], minlength=size)
+        - np.bincount(base + last[visible], weights=rate[visible], minlength=size)
+    )
+    load = np.cumsum(diff.reshape(len(users), width), axis=1)[:, :horizon]
+    return users, load
+
+
+def workload_heatmap(tasks, scope_key, project_id=None, users=None, start=None,
+                     horizon=DEFAULT_HORIZON_DAYS, capacity=DEFAULT_CAPACITY_HOURS):
+    """
+    Build a capacity heatmap for the open tasks in ``tasks``.
+
+    ``scope_key`` identifies ``tasks`` for caching (pass ``project_id`` when
+    the scope is a single project so that only its changes invalidate it).
+    ``users`` optionally maps user IDs to display names; when given, exactly
+    those users are reported, including ones with no load.
+    """
+    today = timezone.localdate()
+    start = start or today
+    horizon = max(1, min(int(horizon), MAX_HORIZON_DAYS))
+
+    user_ids, hours, due_days, created_days = cached_arrays(tasks, scope_key, project_id)
+    if users is not None:
+        wanted = np.fromiter(users.keys(), dtype=np.int64, count=len(users))
+        mask = np.isin(user_ids, wanted)
+        user_ids, hours, due_days, created_days = (
+            user_ids[mask], hours[mask], due_days[mask], created_days[mask]
+        )
+    loaded_ids, load = compute_load(user_ids, hours, due_days, created_days, today, start, horizon)
+
+    if users is not None:
+        full = np.zeros((len(wanted), horizon))
+        if len(loaded_ids):
+            pos = np.minimum(np.searchsorted(loaded_ids, wanted), len(loaded_ids) - 1)
+            found = loaded_ids[pos] == wanted
+            full[found] = load[pos[found]]
+        loaded_ids, load = wanted, full
+
+    totals = load.sum(axis=1)
+    peak = load.max(axis=1) / capacity
+    overloaded = (load > capacity).sum(axis=1)
+    order = np.argsort(-totals, kind='stable')
+    names = users or {}
+
+    return {
+        'start': start.isoformat(),
+        'days': [(start + timedelta(days=d)).isoformat() for d in range(horizon)],
+        'capacity_hours': capacity,
+        'users': [
+            {
+                'id': int(loaded_ids[i]),
+                'name': names.get(int(loaded_ids[i])),
+                'total_hours': round(float(totals[i]), 2),
+                'peak_utilization': round(float(peak[i]), 3),
+                'overloaded_days': int(overloaded[i]),
+                'hours': np.round(load[i], 2).tolist(),
+            }
+            for i in order
+        ],
+    }